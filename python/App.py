@@ -1,9 +1,45 @@
-from flask import Flask, request, jsonify
-import requests
+from flask import Flask, Response, g, request, jsonify
+import hmac
 import os
 from dotenv import load_dotenv
 import sys
-from bot_simples import bot_simples
+import time
+from concurrent.futures import Future
+from bot_simples import bot_simples, opcoes_notion
+from cobrancas_pendentes import registro_cobrancas
+import json_codec
+from pools import FilaPorChave, PoolSaturado, encadear, pool_envios, pool_pagamentos, pool_respostas, status_pools
+from coalescencia import CoalescedorMensagens, fim_da_rajada, juntar_texto_livre
+from prazo import PRAZO_MENSAGEM_SEGUNDOS, RESERVA_RESPOSTA, Prazo, PrazoEsgotado, contador_estouros, estourou
+from supressao import supressor_respostas
+from conexao import estado_do_evento, estado_instancia, saida_pausavel
+from outbox import outbox
+from filtro_eventos import contador_descartes, deve_ignorar, evento_da_rota, ler_corpo_filtrado, normalizar_evento
+from saude import monitor_saude
+from rastreamento import ativar, finalizar_com_futuro, novo_rastro, rastreador
+from perfilador import perfilador
+from gravador import gravador
+from memoria import AGRUPAMENTOS, MEMORIA_TOP, contabilidade, instantaneos, memoria_processo
+from metricas import TIPO_CONTEUDO, ChamadaExterna, latencia_http, registro_metricas, requisicoes_http
+from nucleo import (
+    ADMIN_TOKEN,
+    ROTAS_PERFILAVEIS,
+    _coletar_itens,
+    _descrever_conversa,
+    _enviar_resposta,
+    _normalize_number,
+    _partes_da_resposta,
+    _safe_dump,
+    _saude_evolution,
+    _saude_notion,
+    criar_checkout_cli,
+    extract_text_and_number,
+    iniciar_servicos,
+    registrar_fila,
+    send_media,
+    send_text,
+)
+from extracao_streaming import CorpoGrandeDemais, LIMITE_CORPO, verificar_tamanho_declarado
 
 # Agente IA desativado. Usando bot_simples para todas as respostas.
 
@@ -13,6 +49,24 @@ app = Flask(__name__)
 
 # Garantir que respostas JSON mantenham Unicode e evitar erros de encoding
 app.config['JSON_AS_ASCII'] = False
+# Limite de tamanho de corpo (rotas do webhook checam também durante o streaming)
+app.config['MAX_CONTENT_LENGTH'] = LIMITE_CORPO or None
+
+# jsonify/request.get_json passam pelo codec (orjson quando instalado)
+try:
+    from flask.json.provider import DefaultJSONProvider
+except Exception:  # Flask < 2.2
+    DefaultJSONProvider = None
+
+if DefaultJSONProvider:
+    class CodecJSONProvider(DefaultJSONProvider):
+        def dumps(self, obj, **kwargs):
+            return json_codec.dumps(obj, default=self.default)
+
+        def loads(self, s, **kwargs):
+            return json_codec.loads(s)
+
+    app.json = CodecJSONProvider(app)
 
 # Forçar saída UTF-8 segura no Windows para evitar UnicodeEncodeError ao imprimir emojis
 try:
@@ -23,39 +77,42 @@ except Exception:
     # Fallback: definir variável de ambiente para I/O UTF-8
     os.environ.setdefault('PYTHONIOENCODING', 'utf-8')
 
-# Configurações
-EVOLUTION_API = os.getenv("EVOLUTION_API_URL")
-INSTANCE_NAME = os.getenv("EVOLUTION_INSTANCE_NAME")
-API_KEY = os.getenv("API_KEY_EVOLUTION")
-
-# Cache simples de endpoints que retornaram 404 previamente
-EVOLUTION_DISABLED_ENDPOINTS: set[str] = set()
-# Cache de números inválidos (não estão no WhatsApp ou bloqueados pelo servidor)
-EVOLUTION_INVALID_NUMBERS: set[str] = set()
-
-def _normalize_number(number: str | None) -> str | None:
-    """Normaliza número para formato E.164 sem sufixos de JID.
-    - Remove qualquer sufixo após '@' (incluindo @lid, @s.whatsapp.net, @c.us)
-    - Remove espaços e caracteres não numéricos
-    - Mantém apenas dígitos (sem '+')
-    - Para @lid: extrai apenas os dígitos antes do @
-    """
-    if not number:
-        return None
-    s = str(number).strip()
 
-    # Remover QUALQUER sufixo JID (incluindo @lid)
-    if '@' in s:
-        s = s.split('@', 1)[0]
+def _admin_autorizado() -> bool:
+    """X-Admin-Token confere com ADMIN_TOKEN (comparação em tempo constante)."""
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+@app.before_request
+def _marcar_inicio():
+    g.inicio_requisicao = time.perf_counter()
+    if request.url_rule is not None and request.url_rule.rule in ROTAS_PERFILAVEIS:
+        pedido_admin = request.headers.get('X-Perfil') == '1' and _admin_autorizado()
+        if perfilador.deve_perfilar(pedido_admin):
+            g.sessao_perfil = perfilador.iniciar(request.url_rule.rule)
+
 
-    import re
-    s = ''.join(re.findall(r'\d+', s))
+@app.after_request
+def _medir_requisicao(resp):
+    """Latência e status por rota (pelo padrão da rota, para não explodir os rótulos)."""
+    inicio = g.get("inicio_requisicao")
+    if inicio is not None:
+        rota = request.url_rule.rule if request.url_rule else "<sem rota>"
+        latencia_http.observar(time.perf_counter() - inicio, rota, request.method)
+        requisicoes_http.inc(rota, request.method, resp.status_code)
+    sessao = g.pop("sessao_perfil", None)
+    if sessao is not None:
+        arquivo = perfilador.finalizar(sessao, resp.status_code)
+        if arquivo:
+            resp.headers['X-Perfil-Arquivo'] = arquivo
+    return resp
 
-    # Validar se é um número de telefone válido (pelo menos 10 dígitos)
-    if len(s) < 10:
-        return None
 
-    return s or None
+@app.teardown_request
+def _encerrar_perfil(erro=None):
+    # Requisição que terminou em exceção não passa pelo after_request
+    perfilador.finalizar(g.pop("sessao_perfil", None), "erro")
 
 
 @app.route('/health', methods=['GET'])
@@ -64,52 +121,27 @@ def health():
 
 @app.route('/evolution-health', methods=['GET'])
 def evolution_health():
-    """Diagnóstico básico da Evolution API e instância."""
-    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
-        return jsonify({
-            "ok": False,
-            "error": "EVOLUTION_API_URL/INSTANCE_NAME/API_KEY_EVOLUTION ausentes",
-            "env": {
-                "EVOLUTION_API_URL": bool(EVOLUTION_API),
-                "EVOLUTION_INSTANCE_NAME": bool(INSTANCE_NAME),
-                "API_KEY_EVOLUTION": bool(API_KEY)
-            }
-        }), 500
-    headers = {"apikey": API_KEY, "Authorization": f"Bearer {API_KEY}"}
-    endpoints = [
-        ("GET", f"{EVOLUTION_API}/health"),
-        ("GET", f"{EVOLUTION_API}/instances/{INSTANCE_NAME}/status"),
-        ("GET", f"{EVOLUTION_API}/instance/info/{INSTANCE_NAME}"),
-    ]
-    results = []
-    for method, url in endpoints:
-        try:
-            resp = requests.request(method, url, headers=headers, timeout=8)
-            results.append({
-                "url": url,
-                "code": resp.status_code,
-                "body": (resp.text or "")[:400]
-            })
-        except Exception as e:
-            results.append({
-                "url": url,
-                "error": str(e)
-            })
-    return jsonify({"ok": True, "checks": results}), 200
+    """Saúde da Evolution API e da instância (último resultado do monitor, ver saude.py)."""
+    corpo, status = _saude_evolution()
+    return jsonify(corpo), status
 
 
 @app.route('/notion-health', methods=['GET'])
 def notion_health():
     """Teste de conexão com a API do Notion.
-    - GET /notion-health            -> testa busca genérica (search)
-    - GET /notion-health?page_id=ID -> testa leitura de blocos da página
+    - GET /notion-health            -> último resultado do monitor de saúde (sem chamada ao Notion)
+    - GET /notion-health?query=...  -> testa busca agora (search)
+    - GET /notion-health?page_id=ID -> testa leitura de blocos da página agora
     """
+    if not (request.args.get('page_id') or request.args.get('query')):
+        corpo, status = _saude_notion()
+        return jsonify(corpo), status
     try:
         api_key = os.getenv("NOTION_API_KEY") or os.getenv("Notion_API_Key")
         if not api_key:
             return jsonify({"ok": False, "error": "Missing NOTION_API_KEY"}), 500
         from notion_client import Client
-        client = Client(auth=api_key)
+        client = Client(**opcoes_notion(api_key))
 
         page_id = (request.args.get('page_id') or '').strip()
         query = (request.args.get('query') or '').strip()
@@ -156,12 +188,47 @@ def notion_health():
         return jsonify({"ok": False, "error": str(e)}), 200
 
 
+def _ler_payload(endpoint: str | None = None):
+    """Lê o JSON da requisição, descartando eventos ignorados antes do parse
+    e podando thumbnails/base64 durante a leitura.
+    Retorna (payload, None) ou (None, evento_descartado).
+    """
+    verificar_tamanho_declarado(request.content_length)
+    evento, corpo = ler_corpo_filtrado(request.stream, endpoint)
+    if evento:
+        return None, evento
+    gravador.registrar(request.path, corpo)
+    try:
+        return (json_codec.loads(corpo) if corpo and corpo.strip() else {}), None
+    except ValueError:
+        return {}, None
+
+
+def _resposta_descartado(evento: str):
+    return jsonify({"status": "ignored", "event": evento}), 200
+
+
+def _resposta_grande_demais(e: CorpoGrandeDemais):
+    print(f"⛔ Corpo rejeitado: {e}")
+    return jsonify({"status": "error", "message": str(e)}), 413
+
+
+@app.route('/eventos-descartados', methods=['GET'])
+def eventos_descartados():
+    """Contagem de eventos descartados pelo filtro rápido, por tipo."""
+    return jsonify(contador_descartes.snapshot()), 200
+
+
 @app.route('/webhook', methods=['POST'])
 def webhook():
     """Endpoint genérico para receber eventos Evolution diretamente."""
     try:
-        payload = request.get_json(force=True, silent=True) or {}
+        payload, descartado = _ler_payload()
+        if descartado:
+            return _resposta_descartado(descartado)
         return handle_evolution_event(payload, source_path='webhook')
+    except CorpoGrandeDemais as e:
+        return _resposta_grande_demais(e)
     except Exception as e:
         print(f"❌ Erro no /webhook: {e}")
         return jsonify({"status": "error", "message": str(e)}), 200
@@ -171,8 +238,12 @@ def webhook():
 def process_event():
     """Endpoint para receber eventos encaminhados pelo webhook.py."""
     try:
-        payload = request.get_json(force=True, silent=True) or {}
+        payload, descartado = _ler_payload()
+        if descartado:
+            return _resposta_descartado(descartado)
         return handle_evolution_event(payload, source_path='process-event')
+    except CorpoGrandeDemais as e:
+        return _resposta_grande_demais(e)
     except Exception as e:
         print(f"❌ Erro no /process-event: {e}")
         return jsonify({"status": "error", "message": str(e)}), 200
@@ -183,85 +254,19 @@ def bot_simples_route():
     """Usa o bot simples (fluxo por estados) e gera PIX quando apropriado."""
     try:
         payload = request.get_json(force=True, silent=True) or {}
+        gravador.registrar(request.path, request.get_data(cache=True))
     except Exception as e:
         print(f"❌ Erro ao ler JSON no /bot-simples: {e}")
         return jsonify({"status": "error", "message": str(e)}), 200
 
-    event_type = (payload or {}).get('event')
-    data = (payload or {}).get('data', payload or {})
-    items = _iter_event_items(event_type, data)
-
-    processed = False
-    last_reply = None
-    last_number = None
-
-    for entry in items:
-        text, number = extract_text_and_number(event_type, entry)
-        if text and number:
-            processed = True
-            try:
-                from bot_simples import bot_simples
-                reply = bot_simples.processar_mensagem_com_pix(number, text)
-                print(f"🤖[bot_simples] Número: {number} | Texto: {text} | Resposta: {reply[:150]}")
-
-                # Mensagem 1: Informações do PIX
-                send_text_web(number, reply)
-
-                # Se PIX foi gerado, enviar mensagens 2 e 3
-                if number in bot_simples.conversas:
-                    conv = bot_simples.conversas[number]
-                    print(f"🔍 Debug - Conversa keys: {list(conv.keys())}")
-                    print(f"🔍 Debug - enviar_pix: {conv.get('enviar_pix')}")
-
-                    if conv.get("enviar_pix"):
-                        pix_code = conv.get("pix_code")
-                        qr_base64 = conv.get("qr_base64")
-
-                        print(f"🔍 Debug - pix_code existe: {bool(pix_code)}")
-                        print(f"🔍 Debug - qr_base64 existe: {bool(qr_base64)}")
-
-                        # Mensagem 2: Código PIX copia e cola (sem formatação)
-                        if pix_code:
-                            print(f"📋 Enviando código PIX copia e cola ({len(pix_code)} chars)")
-                            send_text_web(number, pix_code)
-                        else:
-                            print("⚠️ pix_code está vazio ou None")
-
-                        # Mensagem 3: Imagem do QR Code (base64)
-                        if qr_base64:
-                            print(f"📸 Enviando QR Code como imagem (base64): {qr_base64[:80]}...")
-                            valor = conv.get("prato", {}).get("preco", 0) / 100
-                            ok_media = send_media_web(
-                                number=number,
-                                media_type="image",
-                                file_name="qrcode_pix.png",
-                                caption=f"Escaneie o QR Code para pagar R$ {valor:.2f}",
-                                media=qr_base64
-                            )
-                            print(f"📸 Resultado envio mídia: {ok_media}")
-                            if ok_media and not str(number).startswith('web-'):
-                                conv.pop("qr_base64", None)
-                                conv.pop("pix_code", None)
-                                conv.pop("enviar_pix", None)
-                        else:
-                            print("⚠️ qr_base64 está vazio ou None")
-                    else:
-                        print("ℹ️ Flag enviar_pix não está ativa")
-
-                last_reply = reply
-                last_number = number
-            except Exception as e:
-                print(f"❌ Erro no bot_simples: {e}")
-        else:
-            print("ℹ️ /bot-simples: item sem texto/número processáveis.")
-            print(f"📦 Dump: {_safe_dump(entry)}")
+    resultado = _processar_lote(payload)
+    last_number = resultado["number"]
 
     # Incluir dados de PIX no retorno quando disponíveis (web)
     extra = {}
     try:
-        from bot_simples import bot_simples as _bs
-        if last_number and last_number in _bs.conversas:
-            conv = _bs.conversas.get(last_number, {})
+        if last_number and last_number in bot_simples.conversas:
+            conv = bot_simples.conversas.get(last_number, {})
             if conv.get("enviar_pix"):
                 pix_code = conv.get("pix_code")
                 qr_base64 = conv.get("qr_base64")
@@ -276,13 +281,7 @@ def bot_simples_route():
     except Exception:
         pass
 
-    return jsonify({
-        "status": "success",
-        "processed": processed,
-        "reply": last_reply,
-        "number": last_number,
-        **extra
-    }), 200
+    return jsonify({"status": "success", **resultado, **extra}), 200
 
 
 @app.route('/messages-upsert', methods=['POST'])
@@ -291,24 +290,44 @@ def messages_upsert():
     print("\n" + "=" * 60)
     print("🔔 MESSAGES-UPSERT ENDPOINT CHAMADO!")
     print("=" * 60)
-    return process_event('/messages-upsert')
+    return process_event()
 
 
 @app.route('/connection-update', methods=['POST'])
 def connection_update():
-    """Endpoint para CONNECTION_UPDATE"""
-    print("\n⚠️ CONNECTION-UPDATE recebido (será ignorado)")
-    return jsonify({"status": "ignored", "event": "connection.update"}), 200
+    """Endpoint para CONNECTION_UPDATE: alimenta o estado da instância (pausa/retoma envios)."""
+    try:
+        payload, descartado = _ler_payload('connection-update')
+        if descartado:
+            return _resposta_descartado(descartado)
+        return _atualizar_conexao(payload)
+    except CorpoGrandeDemais as e:
+        return _resposta_grande_demais(e)
+
+
+def _atualizar_conexao(payload: dict | list):
+    """connection.update -> EstadoInstancia (ver conexao.py)."""
+    estado = estado_do_evento(payload)
+    mudou = estado_instancia.atualizar(estado)
+    return jsonify({"status": "success", "event": "connection.update", "state": estado, "changed": mudou}), 200
+
+
+@app.route('/conexao', methods=['GET'])
+def conexao_status():
+    """Estado da instância na Evolution e fila de envios pausados."""
+    return jsonify({"instancia": estado_instancia.status(), "fila_pausada": saida_pausavel.status()}), 200
 
 
 @app.route('/<path:endpoint>', methods=['POST', 'GET'])
 def dynamic_routes(endpoint: str):
     """Captura rotas como /messages-upsert, /chats-update, /contacts-update diretamente."""
-    print(f"\n📥 Requisição recebida em: /{endpoint}")
-    print(f"Método: {request.method}")
-
     try:
-        payload = request.get_json(force=True, silent=True) or {}
+        payload, descartado = _ler_payload(endpoint)
+        if descartado:
+            return _resposta_descartado(descartado)
+
+        print(f"\n📥 Requisição recebida em: /{endpoint}")
+        print(f"Método: {request.method}")
         print(f"Payload keys: {list(payload.keys()) if payload else 'vazio'}")
 
         # Deriva o tipo de evento a partir do caminho
@@ -317,360 +336,364 @@ def dynamic_routes(endpoint: str):
             'chats-update': 'chats.update',
             'contacts-update': 'contacts.update',
         }
-        derived_event = event_map.get(endpoint.strip().lower(), endpoint)
+        derived_event = event_map.get(endpoint.strip().lower()) or evento_da_rota(endpoint) or endpoint
         # Injeta event se não existir
         if 'event' not in payload:
             payload['event'] = derived_event
         return handle_evolution_event(payload, source_path=endpoint)
+    except CorpoGrandeDemais as e:
+        return _resposta_grande_demais(e)
     except Exception as e:
         print(f"❌ Erro em /{endpoint}: {e}")
         return jsonify({"status": "error", "message": str(e)}), 200
 
+# Remetentes diferentes andam em paralelo; o mesmo remetente, em ordem (sem prender thread)
+_fila_por_numero = FilaPorChave()
+# Debounce opcional (COALESCENCIA_MS) antes da fila do número; ver coalescencia.py
+_coalescedor = CoalescedorMensagens(
+    lambda number, mensagens: _processar_remetente(number, mensagens),
+    deve_esperar=bot_simples.aceita_texto_livre,
+)
+registrar_fila("coalescencia", lambda: _coalescedor.status()["numeros_esperando"])
+registrar_fila("numeros_em_andamento", _fila_por_numero.tamanho)
+contabilidade.registrar("coalescencia", lambda: _coalescedor._pendentes)
+
+
 def handle_evolution_event(payload: dict | list, source_path: str = ''):
     """
     Normaliza e processa eventos da Evolution API.
     - Suporta: message, messages.upsert, chats.update, contacts.update
-    - Extrai texto e número do remetente para responder via Agente e enviar pelo Evolution.
+    - Aceita lotes: lista de eventos e/ou messages.upsert com vários itens em data.messages
+    - Extrai texto e número do remetente para responder via bot_simples e enviar pelo Evolution.
     """
-    if isinstance(payload, list):
-        for item in payload:
-            handle_evolution_event(item, source_path)
-        return
+    event_type = payload.get('event') if isinstance(payload, dict) else 'lote'
+
+    if normalizar_evento(event_type) == 'connection.update':
+        return _atualizar_conexao(payload)
 
-    event_type = (payload or {}).get('event')
-    data = (payload or {}).get('data', payload or {})
+    # Ignorar eventos que não contêm mensagens processáveis (quando o filtro rápido não pegou)
+    if deve_ignorar(event_type):
+        contador_descartes.registrar(event_type)
+        return jsonify({"status": "ignored", "event": event_type}), 200
 
     print("\n" + "=" * 60)
     print(f"📡 Fonte: {source_path} | 🎯 Evento: {event_type}")
     print("=" * 60)
 
-    # Ignorar eventos que não contêm mensagens processáveis
-    EVENTOS_IGNORA = ['contacts.update', 'chats.update', 'connection.update', 'qr.updated']
-    if event_type in EVENTOS_IGNORA:
-        print(f"ℹ️ Evento {event_type} ignorado (não contém mensagens processáveis)")
-        return jsonify({"status": "ignored", "event": event_type}), 200
+    resultado = _processar_lote(payload)
+    if not resultado["processed"]:
+        print("ℹ️ Evento sem itens processáveis.")
 
-    # Normalizar itens de evento (suporta listas e formatos Baileys com data.messages)
-    items = _iter_event_items(event_type, data)
-    processed = False
-    last_reply = None
-    last_number = None
-    for entry in items:
+    return jsonify({"status": "success", **resultado}), 200
+
+
+def _processar_lote(payload: dict | list) -> dict:
+    """Processa todos os itens do payload e retorna o resultado agregado com status por item.
+    Itens são agrupados por remetente; grupos distintos rodam em paralelo e cada grupo
+    roda em ordem de chegada.
+    """
+    itens = _coletar_itens(payload)
+    status_itens: list[dict | None] = [None] * len(itens)
+    grupos: dict[str, list[tuple[int, str, Prazo]]] = {}
+
+    for idx, (event_type, entry) in enumerate(itens):
+        if deve_ignorar(event_type):
+            status_itens[idx] = {"index": idx, "status": "ignored", "event": event_type}
+            continue
         # Processar somente quando houver texto e número claro
         text, number = extract_text_and_number(event_type, entry)
-
         if text and number:
-            processed = True
-            print(f"💬 Texto: {text}")
-            print(f"👤 Número: {number}")
-            try:
-                reply = bot_simples.processar_mensagem_com_pix(number, text)
-                print(f"🤖 Resposta (bot_simples): {reply}")
-
-                # Mensagem 1: Informações do PIX
-                send_text(number, reply)
-
-                # Se PIX foi gerado, enviar mensagens 2 e 3
-                if number in bot_simples.conversas:
-                    conv = bot_simples.conversas[number]
-                    print(f"🔍 Debug - Conversa keys: {list(conv.keys())}")
-                    print(f"🔍 Debug - enviar_pix: {conv.get('enviar_pix')}")
-
-                    if conv.get("enviar_pix"):
-                        pix_code = conv.get("pix_code")
-                        qr_base64 = conv.get("qr_base64")
-
-                        print(f"🔍 Debug - pix_code existe: {bool(pix_code)}")
-                        print(f"🔍 Debug - qr_base64 existe: {bool(qr_base64)}")
-
-                        # Mensagem 2: Código PIX copia e cola (sem formatação)
-                        if pix_code:
-                            print(f"📋 Enviando código PIX copia e cola ({len(pix_code)} chars)")
-                            send_text(number, pix_code)
-                        else:
-                            print("⚠️ pix_code está vazio ou None")
-
-                        # Mensagem 3: Imagem do QR Code (base64)
-                        if qr_base64:
-                            print(f"📸 Enviando QR Code como imagem (base64): {qr_base64[:80]}...")
-                            valor = conv.get("prato", {}).get("preco", 0) / 100
-                            ok_media = send_media(
-                                number=number,
-                                media_type="image",
-                                file_name="qrcode_pix.png",
-                                caption=f"Escaneie o QR Code para pagar R$ {valor:.2f}",
-                                media=qr_base64
-                            )
-                            print(f"📸 Resultado envio mídia: {ok_media}")
-                            if ok_media:
-                                # Limpar dados do QR após envio bem-sucedido
-                                conv.pop("qr_base64", None)
-                                conv.pop("pix_code", None)
-                                conv.pop("enviar_pix", None)
-                        else:
-                            print("⚠️ qr_base64 está vazio ou None")
-                    else:
-                        print("ℹ️ Flag enviar_pix não está ativa")
-
-                last_reply = reply
-                last_number = number
-            except Exception as e:
-                print(f"❌ Erro ao gerar/enviar resposta: {e}")
+            # O prazo da mensagem começa a contar na entrada (inclui a espera na fila do número)
+            grupos.setdefault(number, []).append((idx, text, Prazo()))
         else:
+            status_itens[idx] = {"index": idx, "status": "skipped"}
             try:
                 print(f"ℹ️ Item sem texto/número para resposta. Registrado. Keys: {list((entry or {}).keys())}")
                 print(f"📦 Dump: {_safe_dump(entry)}")
             except Exception:
                 print("ℹ️ Item sem texto/número para resposta. (dump indisponível)")
 
-    if not processed:
-        print("ℹ️ Evento sem itens processáveis.")
+    futuros = [_coalescedor.submeter(number, mensagens) for number, mensagens in grupos.items()]
+    resultados = [f.result() for f in futuros]
 
-    return jsonify({
-        "status": "success",
-        "processed": processed,
+    for resultado_grupo in resultados:
+        for item in resultado_grupo:
+            status_itens[item["index"]] = item
+
+    last_reply = None
+    last_number = None
+    for item in status_itens:
+        if item and item["status"] == "processed":
+            last_reply = item["reply"]
+            last_number = item["number"]
+
+    return {
+        "processed": last_number is not None,
         "reply": last_reply,
-        "number": last_number
-    }), 200
+        "number": last_number,
+        "items": status_itens,
+    }
 
 
-def extract_text_and_number(event_type: str | None, item: dict):
-    """Extrai texto e número do payload conforme o tipo de evento, cobrindo variações comuns da Evolution/Baileys."""
-    if not item:
-        return None, None
-
-    # Helpers de leitura
-    def clean_number(n: str | None):
-        if not n:
-            return None
-        n = n.strip()
-        if '@' in n:
-            n = n.split('@', 1)[0]
-        return n
-
-    def text_from_message(msg: dict):
-        # Conversas/Texto estendido
-        if 'conversation' in msg:
-            return msg.get('conversation')
-        etm = msg.get('extendedTextMessage') or {}
-        if isinstance(etm, dict) and etm.get('text'):
-            return etm.get('text')
-        # Botões/Listas
-        brm = msg.get('buttonsResponseMessage') or {}
-        if isinstance(brm, dict):
-            return brm.get('selectedDisplayText') or brm.get('selectedButtonId')
-        lrm = msg.get('listResponseMessage') or {}
-        if isinstance(lrm, dict):
-            single = lrm.get('singleSelectReply') or {}
-            return single.get('selectedRowId') or single.get('title')
-        # Imagem/Vídeo com legenda
-        im = msg.get('imageMessage') or {}
-        if isinstance(im, dict) and im.get('caption'):
-            return im.get('caption')
-        vm = msg.get('videoMessage') or {}
-        if isinstance(vm, dict) and vm.get('caption'):
-            return vm.get('caption')
-        # Documento
-        dm = msg.get('documentMessage') or {}
-        if isinstance(dm, dict):
-            return dm.get('caption') or '[DOCUMENT_MESSAGE]'
-        # Áudio/ptt
-        if msg.get('audioMessage') or msg.get('ptt') or msg.get('voiceMessage'):
-            return '[AUDIO_MESSAGE]'
-        return None
-
-    # Evento simples: message (Evolution)
-    if event_type == 'message' or item.get('type') == 'message':
-        text = item.get('body') or item.get('text') or None
-        # Capturar legendas em mídia
-        if not text:
-            if (item.get('type') in ['image', 'video', 'document']) and isinstance(item.get('media'), dict):
-                text = item.get('media', {}).get('caption')
-            if item.get('type') == 'audio':
-                text = '[AUDIO_MESSAGE]'
-        number = clean_number(item.get('from') or item.get('jid') or item.get('chatId'))
-        return (text or None), (number or None)
-
-    # Evento Baileys: messages.upsert (Evolution v3/v4)
-    if event_type == 'messages.upsert':
-        key = item.get('key') or {}
-        message = item.get('message') or {}
-        from_me = bool(key.get('fromMe', False))
-        if from_me:
-            return None, None
-        number = clean_number(key.get('remoteJid') or item.get('from') or item.get('jid') or item.get('chatId'))
-        text = text_from_message(message)
-        return (text or None), (number or None)
-
-    # Fallback: tentar campos genéricos
-    text = item.get('body') or item.get('text')
-    number = clean_number(item.get('from') or item.get('jid') or item.get('chatId'))
-    return (text or None), (number or None)
-
-def _iter_event_items(event_type: str | None, data: dict | list):
-    """Normaliza os itens do evento em uma lista processável."""
-    if event_type == 'messages.upsert':
-        # Formatos possíveis: data é um dict com 'messages' (lista) ou um item único
-        if isinstance(data, dict) and isinstance(data.get('messages'), list):
-            return data.get('messages')
-        if isinstance(data, list):
-            return data
-        return [data]
-    # Demais eventos: aceitar lista ou item único
-    if isinstance(data, list):
-        return data
-    return [data]
-
-def _safe_dump(obj: dict, maxlen: int = 600):
-    try:
-        import json
-        s = json.dumps(obj or {}, ensure_ascii=False)
-        return s if len(s) <= maxlen else (s[:maxlen] + '…')
-    except Exception:
-        return str(obj)[:maxlen]
-
-# Função de geração via agente IA removida
-
-def send_text_web(number: str, text: str):
-    """Wrapper para enviar texto, detectando usuários web."""
-    # Para usuários web, apenas logar e retornar (não enviar para WhatsApp)
-    if number.startswith('web-'):
-        print(f"🌐 Usuário web detectado: {number} - mensagem: {text[:50]}...")
-        return
-    # Para números normais, usar função original
-    return send_text_original(number, text)
-
-def send_media_web(number: str, media_type: str, file_name: str, caption: str, media: str):
-    """Wrapper para enviar mídia, detectando usuários web."""
-    # Para usuários web, apenas logar e retornar (não enviar para WhatsApp)
-    if number.startswith('web-'):
-        print(f"🌐 Usuário web detectado: {number} - envio de mídia ignorado")
-        return True  # Retornar sucesso para não quebrar o fluxo
-    # Para números normais, usar função original
-    return send_media_original(number, media_type, file_name, caption, media)
-
-def send_media_original(number: str, media_type: str, file_name: str, caption: str, media: str):
-    """Envia mídia via Evolution API."""
-    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
-        print("❌ Configuração ausente: verifique EVOLUTION_API_URL, EVOLUTION_INSTANCE_NAME, API_KEY_EVOLUTION no .env")
-        return
-    number_norm = _normalize_number(number)
-    if not number_norm:
-        print(f"❌ Número inválido para envio de texto: {number}")
-        return
-    if number_norm in EVOLUTION_INVALID_NUMBERS:
-        print(f"⛔ Ignorando envio: número não está no WhatsApp (cache) -> {number_norm}")
-        return
-
-    # Usar apenas um endpoint canônico e um formato de payload estável
-    endpoints = [
-        f"{EVOLUTION_API}/message/sendText/{INSTANCE_NAME}",
-    ]
-    # Payload compatível com versões atuais da Evolution API
-    def build_payloads(url: str):
-        return [{"number": number_norm, "textMessage": {"text": text}}]
-    headers = {"Content-Type": "application/json", "apikey": API_KEY}
-    # Alguns servidores usam Authorization Bearer
-    headers["Authorization"] = f"Bearer {API_KEY}"
-
-    last_error = None
-    for url in endpoints:
-        if url in EVOLUTION_DISABLED_ENDPOINTS:
-            print(f"⛔ Ignorando endpoint desativado (404 prévio): {url}")
-            continue
+def _processar_remetente(number: str, mensagens: list[tuple[int, str, Prazo]]) -> Future:
+    """Agenda, em ordem, as mensagens de um mesmo remetente. Retorna Future da lista de resultados."""
+    return _fila_por_numero.submeter(number, lambda: _encadear_mensagens(number, mensagens))
+
+
+def _encadear_mensagens(number: str, mensagens: list[tuple[int, str, Prazo]]) -> Future:
+    """Roda as mensagens uma após a outra; erro em uma não impede as seguintes.
+    Em estado de texto livre (endereço), as mensagens seguidas que chegaram dentro da
+    janela de coalescência (ver fim_da_rajada) viram um único passo.
+    """
+    saida: Future = Future()
+    resultados: list[dict] = []
+
+    def proxima(i: int):
+        if i == len(mensagens):
+            saida.set_result(resultados)
+            return
+        idx, text, prazo = mensagens[i]
+        fim = i + 1
+        if _coalescedor.ativo and fim < len(mensagens) and bot_simples.aceita_texto_livre(number):
+            fim = fim_da_rajada(mensagens, i, _coalescedor.janela, _coalescedor.espera_max)
+        if fim > i + 1:
+            # Prazo da primeira mensagem (o mais apertado); a resposta vai no índice da última
+            text = juntar_texto_livre([m[1] for m in mensagens[i:fim]])
+            for idx_juntado, _, _ in mensagens[i:fim - 1]:
+                resultados.append({"index": idx_juntado, "number": number, "status": "coalesced"})
+            idx = mensagens[fim - 1][0]
+            print(f"🧩 {fim - i} mensagens de {number} juntadas: {text}")
         try:
-            payload = build_payloads(url)[0]
-            print(f"➡️ Enviando texto via {url} para {number_norm}")
-            resp = requests.post(url, json=payload, headers=headers, timeout=12)
-            if resp.status_code < 300:
-                print(f"✅ Texto enviado para {number_norm}: {resp.status_code} via {url}")
-                return
+            futuro = _responder_mensagem(number, text, prazo)
+        except Exception as e:  # ex.: PoolSaturado na primeira etapa
+            futuro = Future()
+            futuro.set_exception(e)
+
+        def pronto(f: Future):
+            erro = f.exception()
+            if erro is None:
+                resultados.append({"index": idx, "number": number, "status": "processed", "reply": f.result()})
             else:
-                # Log compacto para reduzir ruído em 400
-                snippet = resp.text[:200]
-                print(f"⚠️ Falha ({resp.status_code}) em {url}: {snippet}")
-                if resp.status_code == 404:
-                    EVOLUTION_DISABLED_ENDPOINTS.add(url)
-                # Se o servidor indicar que o número/jid não existe, cachear para evitar novas tentativas
-                if resp.status_code == 400:
-                    try:
-                        data = resp.json()
-                        msg_list = ((data or {}).get('response') or {}).get('message') or []
-                        for item in msg_list:
-                            if isinstance(item, dict) and item.get('exists') is False:
-                                bad_num = item.get('number') or number_norm
-                                EVOLUTION_INVALID_NUMBERS.add(str(bad_num))
-                                print(f"🚫 Número inválido detectado pelo Evolution (exists=false): {bad_num}")
-                                break
-                    except Exception:
-                        pass
-        except Exception as e:
-            last_error = e
-            print(f"⚠️ Erro ao enviar texto via {url}: {e}")
-
-    if last_error:
-        print(f"❌ Falha ao enviar resposta após tentativas: {last_error}")
-
-def send_media(number: str, media_type: str, file_name: str, caption: str, media: str):
-    """Envia mídia via Evolution API."""
-    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
-        print("❌ Configuração ausente")
-        return False
-
-    number_norm = _normalize_number(number)
-    if not number_norm:
-        print(f"❌ Número inválido: {number}")
-        return False
-
-    if number_norm in EVOLUTION_INVALID_NUMBERS:
-        print(f"⛔ Número não está no WhatsApp: {number_norm}")
-        return False
-
-    # Se for data URI, extrair apenas o base64
-    media_clean = media
-    if isinstance(media, str) and media.startswith("data:"):
-        try:
-            # data:image/png;base64,iVBORw0KG... -> iVBORw0KG...
-            _, base64_data = media.split(",", 1)
-            media_clean = base64_data
-            print(f"📸 Data URI detectado, extraindo base64 puro")
-        except Exception:
-            pass
-
-    # Endpoint principal
-    url = f"{EVOLUTION_API}/message/sendMedia/{INSTANCE_NAME}"
-
-    # Payload
-    payload = {
-        "number": number_norm,
-        "mediaMessage": {
-            "mediatype": media_type,
-            "caption": caption,
-            "fileName": file_name,
-            "media": media_clean
-        }
-    }
+                print(f"❌ Erro ao gerar/enviar resposta: {erro}")
+                resultados.append({"index": idx, "number": number, "status": "error", "error": str(erro)})
+            proxima(fim)
 
-    headers = {
-        "Content-Type": "application/json",
-        "apikey": API_KEY,
-        "Authorization": f"Bearer {API_KEY}"
-    }
+        futuro.add_done_callback(pronto)
+
+    proxima(0)
+    return saida
+
+
+def _responder_mensagem(number: str, text: str, prazo: Prazo | None = None) -> Future:
+    """Passo do bot_simples (pool de respostas) -> PIX, se pedido (pool de pagamentos)
+    -> envio da resposta (pool de envios). Retorna Future com o texto respondido.
+    """
+    print(f"💬 Texto: {text}")
+    print(f"👤 Número: {number}")
+    # Rastro da mensagem desde a chegada (Prazo.inicio); os pools levam o contexto adiante
+    raiz = rastreador.iniciar_rastro("mensagem", prazo.inicio if prazo else None, numero=number)
+    if raiz is not None:
+        raiz.filho_concluido("espera_fila", raiz.inicio_ns)
+        print(f"🧵 Rastro {raiz.rastro.trace_id}")
+    with ativar(raiz):
+        etapa = pool_respostas.submeter(bot_simples.processar_mensagem, number, text)
+        etapa = encadear(etapa, lambda resposta: _gerar_pix_isolado(number, prazo) if resposta.startswith("GERAR_PIX:") else resposta)
+        saida = encadear(etapa, lambda reply: _agendar_envio(number, reply, prazo))
+    finalizar_com_futuro(raiz, saida)
+    return saida
+
+
+def _agendar_envio(number: str, reply: str, prazo: Prazo | None = None) -> Future | str:
+    """Põe a resposta na fila de envios, exceto se for repetida para o mesmo número (ver supressao.py).
+    A resposta entra no outbox antes de sair, para ser reenviada se o processo cair.
+    """
+    conv = bot_simples.conversas.get(number) or {}
+    if (
+        not str(number).startswith('web-')
+        and not conv.get("enviar_pix")
+        and supressor_respostas.deve_suprimir(_normalize_number(number) or number, reply)
+    ):
+        print(f"🔇 Resposta repetida para {number} suprimida: {reply[:40]!r}")
+        return reply
+    entrada = outbox.registrar(number, _partes_da_resposta(number, reply))
+    # Instância fora do ar: guardada para a reconexão, onde o prazo da mensagem já não vale (TTL da fila)
+    if saida_pausavel.tentar_guardar(_enviar_resposta, number, reply, None, entrada):
+        print(f"⏸️ Instância {estado_instancia.estado}: resposta para {number} guardada")
+        return reply
+    return pool_envios.submeter(_enviar_resposta, number, reply, prazo, entrada)
+
+
+def _gerar_pix_isolado(number: str, prazo: Prazo | None = None) -> Future | str:
+    """Gera o PIX no pool de pagamentos; com o pool cheio, devolve o cliente ao passo do CPF."""
+    try:
+        return pool_pagamentos.submeter(bot_simples.gerar_pix_ou_adiar, number, prazo)
+    except PoolSaturado as e:
+        print(f"⚠️ {e}")
+        return bot_simples.adiar_pix(number)
+
+
+@app.route('/dependencias', methods=['GET'])
+def dependencias_status():
+    """Saúde das dependências pelo monitor (cache, sem chamada externa).
+    ?atualizar=1 (admin: X-Admin-Token) antecipa a próxima rodada de sondas.
+    """
+    if request.args.get('atualizar'):
+        if not _admin_autorizado():
+            return jsonify({"error": "não autorizado"}), 403
+        monitor_saude.sondar_agora()
+    return jsonify(monitor_saude.status()), 200
+
+
+@app.route('/cobrancas-pendentes', methods=['GET'])
+def cobrancas_pendentes():
+    """Resumo das cobranças PIX acompanhadas (pendentes, pagas, expiradas)."""
+    return jsonify(registro_cobrancas.status()), 200
+
+
+@app.route('/envios-suprimidos', methods=['GET'])
+def envios_suprimidos():
+    """Respostas repetidas descartadas antes do envio (por prévia do texto)."""
+    return jsonify(supressor_respostas.status()), 200
+
+
+@app.route('/outbox', methods=['GET'])
+def outbox_status():
+    """Diário de saída: respostas pendentes de confirmação e custo do fsync em grupo."""
+    return jsonify(outbox.status()), 200
+
+
+@app.route('/prazos', methods=['GET'])
+def prazos_status():
+    """Estouros do prazo por mensagem, por etapa (pix, envio_texto, envio_midia)."""
+    return jsonify({
+        "prazo_segundos": PRAZO_MENSAGEM_SEGUNDOS,
+        "reserva_resposta": RESERVA_RESPOSTA,
+        "estouros": contador_estouros.snapshot(),
+    }), 200
 
-    print(f"➡️ Enviando mídia para {number_norm}")
-    print(f"📦 Media length: {len(media_clean) if media_clean else 0}")
 
+@app.route('/debug/traces', methods=['GET'])
+def debug_traces():
+    """Rastros recentes por mensagem (ver rastreamento.py).
+    ?numero=<número> &min_ms=<duração mínima> &limite=<n> (padrão 50);
+    ?trace_id=<id> traz todos os spans; com &formato=otlp, em OTLP/JSON.
+    Os rastros trazem números de clientes: só com X-Admin-Token.
+    """
+    if not _admin_autorizado():
+        return jsonify({"error": "não autorizado"}), 403
+    trace_id = request.args.get('trace_id')
+    if trace_id:
+        rastro = rastreador.obter(trace_id)
+        if rastro is None:
+            return jsonify({"error": "rastro não encontrado (pode ter saído do buffer)"}), 404
+        return jsonify(rastro.otlp() if request.args.get('formato') == 'otlp' else rastro.detalhes()), 200
     try:
-        resp = requests.post(url, json=payload, headers=headers, timeout=20)
-        if resp.status_code < 300:
-            print(f"✅ Mídia enviada: {resp.status_code}")
-            return True
+        min_ms = float(request.args.get('min_ms') or 0)
+        limite = int(request.args.get('limite') or 50)
+    except ValueError:
+        return jsonify({"error": "min_ms e limite devem ser números"}), 400
+    return jsonify({
+        "status": rastreador.status(),
+        "rastros": rastreador.listar(request.args.get('numero'), min_ms, limite),
+    }), 200
+
+
+@app.route('/debug/perfil', methods=['GET', 'POST'])
+def debug_perfil():
+    """Perfis de CPU das requisições (admin: X-Admin-Token).
+    GET: junta os perfis recentes num collapsed stack (flamegraph.pl / speedscope).
+         ?ultimos=<n> &desde=<segundos> &rota=webhook|bot-simples &espera=1
+    GET ?status=1: configuração e arquivos. POST {"amostragem": 0.05}: muda a taxa em execução.
+    """
+    if not _admin_autorizado():
+        return jsonify({"error": "não autorizado"}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            amostragem = float(data.get('amostragem'))
+        except (TypeError, ValueError):
+            return jsonify({"error": "amostragem deve ser um número entre 0 e 1"}), 400
+        perfilador.amostragem = min(max(amostragem, 0.0), 1.0)
+        print(f"🔬 Amostragem do perfilador: {perfilador.amostragem:.2%}")
+        return jsonify(perfilador.status()), 200
+    if request.args.get('status'):
+        return jsonify(perfilador.status()), 200
+    try:
+        ultimos = int(request.args['ultimos']) if request.args.get('ultimos') else None
+        desde = float(request.args['desde']) if request.args.get('desde') else None
+    except ValueError:
+        return jsonify({"error": "ultimos e desde devem ser números"}), 400
+    texto = perfilador.agregar(ultimos, desde, request.args.get('rota'), request.args.get('espera') == '1')
+    return Response(texto, content_type='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': 'attachment; filename="perfil-agregado.collapsed"'})
+
+
+@app.route('/pools', methods=['GET'])
+def pools_status():
+    """Ocupação, filas e rejeições dos pools de execução (respostas, envios, pagamentos)."""
+    return jsonify({
+        "pools": status_pools(),
+        "numeros_em_andamento": _fila_por_numero.tamanho(),
+        "coalescencia": _coalescedor.status(),
+    }), 200
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Métricas no formato de texto do Prometheus (ver metricas.py)."""
+    return Response(registro_metricas.exportar(), mimetype=None, content_type=TIPO_CONTEUDO)
+
+
+@app.route('/debug/gravacao', methods=['GET', 'POST'])
+def debug_gravacao():
+    """Gravação do tráfego de entrada para replay (admin: X-Admin-Token; ver gravador.py).
+    GET: estado. POST {"ativo": true|false}: liga ou desliga sem reiniciar.
+    """
+    if not _admin_autorizado():
+        return jsonify({"error": "não autorizado"}), 403
+    if request.method == 'POST':
+        ativo = (request.get_json(silent=True) or {}).get('ativo')
+        if not isinstance(ativo, bool):
+            return jsonify({"error": "ativo deve ser true ou false"}), 400
+        if ativo:
+            gravador.ligar()
         else:
-            print(f"⚠️ Falha ({resp.status_code}): {resp.text[:500]}")
-            return False
-    except Exception as e:
-        print(f"❌ Erro: {e}")
-        return False
+            gravador.desligar()
+    return jsonify(gravador.status()), 200
+
+
+@app.route('/debug/memoria', methods=['GET', 'POST', 'DELETE'])
+def debug_memoria():
+    """Memória das estruturas residentes (admin: X-Admin-Token).
+    GET: RSS do processo, entradas e bytes estimados por estrutura e as maiores
+         conversas (?top=<n>); com ?diferenca=1, a diferença entre os dois
+         últimos instantâneos do tracemalloc (&agrupar=lineno|filename|traceback).
+    POST: tira um instantâneo (liga o tracemalloc no primeiro) e já devolve a
+          diferença para o anterior. DELETE: desliga o tracemalloc.
+    """
+    if not _admin_autorizado():
+        return jsonify({"error": "não autorizado"}), 403
+    if request.method == 'DELETE':
+        instantaneos.desligar()
+        return jsonify(instantaneos.status()), 200
+    try:
+        top = int(request.args.get('top') or MEMORIA_TOP)
+    except ValueError:
+        return jsonify({"error": "top deve ser um número"}), 400
+    agrupar = request.args.get('agrupar') or 'lineno'
+    if agrupar not in AGRUPAMENTOS:
+        return jsonify({"error": f"agrupar deve ser um de {', '.join(AGRUPAMENTOS)}"}), 400
+    if request.method == 'POST':
+        instantaneo = instantaneos.tirar()
+        return jsonify({"instantaneo": instantaneo, "diferenca": instantaneos.diferenca(agrupar, top)}), 200
+    if request.args.get('diferenca'):
+        return jsonify({"diferenca": instantaneos.diferenca(agrupar, top), "tracemalloc": instantaneos.status()}), 200
+    return jsonify({
+        "processo": memoria_processo(),
+        **contabilidade.medir(),
+        "maiores_conversas": contabilidade.maiores(bot_simples.conversas, top, _descrever_conversa),
+        "tracemalloc": instantaneos.status(),
+    }), 200
 
 
 @app.route('/enviar-pix-whatsapp', methods=['POST'])
@@ -740,8 +763,28 @@ def enviar_pix_whatsapp():
         return jsonify({"error": str(e)}), 500
 
 
+def _executar_checkout_node(comando: list, timeout: float):
+    """Roda o checkout_cli.js medindo como dependência externa (código de saída != 0 é erro)."""
+    import subprocess
+
+    with ChamadaExterna("checkout_node") as chamada:
+        result = subprocess.run(comando, capture_output=True, text=True, timeout=timeout)
+        chamada.ok = result.returncode == 0
+    return result
+
+
 @app.route('/gerar-pix', methods=['POST'])
 def gerar_pix():
+    """Rota /gerar-pix com rastro próprio (checkout Node + envios; ver _gerar_pix)."""
+    numero = (request.get_json(silent=True) or {}).get('numero_whatsapp')
+    with novo_rastro("gerar_pix_http", numero=numero) as raiz:
+        resposta, status = _gerar_pix()
+        if raiz is not None:
+            raiz.definir(status=status)
+        return resposta, status
+
+
+def _gerar_pix():
     """
     Endpoint para gerar PIX e enviar QR Code
     Body: {
@@ -752,6 +795,7 @@ def gerar_pix():
         "numero_whatsapp": "5511999999999"
     }
     """
+    prazo = Prazo()
     try:
         data = request.get_json()
         produto = data.get('produto', 'Produto')
@@ -764,73 +808,90 @@ def gerar_pix():
 
         if not numero_whatsapp or not valor_centavos:
             return jsonify({"error": "numero_whatsapp e valor_centavos são obrigatórios"}), 400
+        if not monitor_saude.disponivel("checkout_node"):
+            return jsonify({"error": "Checkout Node indisponível no momento", "saude": monitor_saude.status("checkout_node")}), 503
 
         # Chamar checkout.js via subprocess
         import subprocess
-        import json as json_lib
 
         script_path = os.path.join(os.path.dirname(__file__), 'checkout_cli.js')
         # Sempre (re)criar o script CLI para garantir versão atualizada
         criar_checkout_cli()
 
-        # Executar Node.js
-        result = subprocess.run(
-            ['node', script_path, produto, str(valor_centavos), cliente_nome, cliente_telefone, str(validade_segundos), cliente_cpf],
-            capture_output=True,
-            text=True,
-            timeout=15
-        )
+        # Executar Node.js (no pool de pagamentos, para não competir com as respostas)
+        try:
+            result = pool_pagamentos.executar(
+                _executar_checkout_node,
+                ['node', script_path, produto, str(valor_centavos), cliente_nome, cliente_telefone, str(validade_segundos), cliente_cpf],
+                prazo.timeout(15, "pix", RESERVA_RESPOSTA),
+            )
+        except PoolSaturado as e:
+            return jsonify({"error": "Muitos PIX sendo gerados agora, tente novamente em instantes", "details": str(e)}), 503
+        except subprocess.TimeoutExpired as e:
+            estourou(prazo, "pix", RESERVA_RESPOSTA)
+            return jsonify({"error": "checkout.js não respondeu a tempo", "details": str(e)}), 504
 
         if result.returncode == 0:
             # Parse do resultado
-            pix_data = json_lib.loads(result.stdout)
+            pix_data = json_codec.loads(result.stdout)
 
             if pix_data.get('success'):
                 qr_code_url = pix_data['qr_code_url']
                 pix_code = pix_data['pix_copia_cola']
+                registro_cobrancas.registrar(pix_data.get('id'), numero_whatsapp, validade_segundos)
+
+                # Mensagens 1-3 dentro do prazo; o que não couber fica de fora (PIX já foi criado)
+                ok_media = False
+                etapa_estourada = None
+                try:
+                    # Mensagem 1: PIX copia e cola
+                    msg_copia_cola = (
+                        f"💰 *PIX Gerado!*\n\n"
+                        f"📦 Produto: {produto}\n"
+                        f"💵 Valor: R$ {valor_centavos/100:.2f}\n\n"
+                        f"*PIX Copia e Cola:*\n`{pix_code}`"
+                    )
+                    send_text(numero_whatsapp, msg_copia_cola, prazo)
 
-                # Mensagem 1: PIX copia e cola
-                msg_copia_cola = (
-                    f"💰 *PIX Gerado!*\n\n"
-                    f"📦 Produto: {produto}\n"
-                    f"💵 Valor: R$ {valor_centavos/100:.2f}\n\n"
-                    f"*PIX Copia e Cola:*\n`{pix_code}`"
-                )
-                send_text(numero_whatsapp, msg_copia_cola)
-
-                # Mensagem 2: QR Code como mídia
-                ok_media = send_media(
-                    number=numero_whatsapp,
-                    media_type="image",
-                    file_name="qrcode_pix.png",
-                    caption=f"🔳 Escaneie para pagar R$ {valor_centavos/100:.2f}",
-                    media=qr_code_url
-                )
-                if not ok_media:
-                    print("🔁 Tentando enviar o QR como documento...")
-                    ok_media_doc = send_media(
+                    # Mensagem 2: QR Code como mídia
+                    ok_media = send_media(
                         number=numero_whatsapp,
-                        media_type="document",
+                        media_type="image",
                         file_name="qrcode_pix.png",
                         caption=f"🔳 Escaneie para pagar R$ {valor_centavos/100:.2f}",
-                        media=qr_code_url
+                        media=qr_code_url,
+                        prazo=prazo
                     )
-                    ok_media = ok_media or ok_media_doc
-
-                # Mensagem 3: validade
-                expiracao_info = pix_data.get('expires_at') or ''
-                msg_validade = (
-                    f"⏳ Validade: 5 minutos ({validade_segundos} segundos)."
-                    + (f"\nAté: {expiracao_info}" if expiracao_info else "")
-                )
-                send_text(numero_whatsapp, msg_validade)
+                    if not ok_media:
+                        print("🔁 Tentando enviar o QR como documento...")
+                        ok_media_doc = send_media(
+                            number=numero_whatsapp,
+                            media_type="document",
+                            file_name="qrcode_pix.png",
+                            caption=f"🔳 Escaneie para pagar R$ {valor_centavos/100:.2f}",
+                            media=qr_code_url,
+                            prazo=prazo
+                        )
+                        ok_media = ok_media or ok_media_doc
+
+                    # Mensagem 3: validade
+                    expiracao_info = pix_data.get('expires_at') or ''
+                    msg_validade = (
+                        f"⏳ Validade: 5 minutos ({validade_segundos} segundos)."
+                        + (f"\nAté: {expiracao_info}" if expiracao_info else "")
+                    )
+                    send_text(numero_whatsapp, msg_validade, prazo)
+                except PrazoEsgotado as e:
+                    print(f"⏱️ {e}: envios restantes do /gerar-pix abandonados")
+                    etapa_estourada = e.etapa
 
                 return jsonify({
                     "success": True,
                     "message": "PIX gerado e enviado com sucesso",
                     "pix_data": pix_data,
                     "validade_segundos": validade_segundos,
-                    "ok_media": ok_media
+                    "ok_media": ok_media,
+                    "prazo_esgotado": etapa_estourada
                 }), 200
             else:
                 return jsonify({"error": "Falha ao gerar PIX", "details": pix_data}), 500
@@ -869,32 +930,6 @@ def obter_dados_pix(numero):
         }), 500
 
 
-def criar_checkout_cli():
-    """Cria/Recria script CLI para chamar checkout.js com validade em segundos"""
-    cli_content = """#!/usr/bin/env node
-import { criarPixCheckout } from './checkout.js';
-
-const [,, produtoNome, valorCentavos, clienteNome, clienteTelefone, expiresSeconds, clienteCpf] = process.argv;
-
-criarPixCheckout(
-    produtoNome,
-    parseInt(valorCentavos),
-    clienteNome,
-    clienteTelefone,
-    'cliente@email.com',
-    clienteCpf || '',
-    parseInt(expiresSeconds || '3600')
-).then(result => {
-    console.log(JSON.stringify(result));
-    process.exit(0);
-}).catch(error => {
-    console.error(JSON.stringify({ success: false, error: error.message }));
-    process.exit(1);
-});
-"""
-    with open('checkout_cli.js', 'w') as f:
-        f.write(cli_content)
-
 # Rotas de teste de envio (diagnóstico)
 @app.route('/test-send', methods=['POST'])
 def test_send():
@@ -991,20 +1026,11 @@ def disparar_pix_get():
         return jsonify({"ok": False, "error": str(e)}), 500
 
 if __name__ == '__main__':
-    print("=== App.py pronto em http://localhost:8001 ===")
-    app.run(host='0.0.0.0', port=8001, debug=True)
-def _normalize_number(number: str | None) -> str | None:
-    """Normaliza número para formato E.164 sem sufixos de JID.
-    - Remove qualquer sufixo após '@' (ex.: '@s.whatsapp.net', '@c.us', outros).
-    - Remove espaços e caracteres não numéricos.
-    - Mantém apenas dígitos (sem '+').
-    """
-    if not number:
-        return None
-    s = str(number).strip()
-    if '@' in s:
-        s = s.split('@', 1)[0]
-    # Remover tudo que não seja dígito
-    import re
-    s = ''.join(re.findall(r'\d+', s))
-    return s or None
\ No newline at end of file
+    # PORT/APP_DEBUG permitem subir vários workers (ver dispatcher.py)
+    port = int(os.getenv("PORT", "8001"))
+    debug = os.getenv("APP_DEBUG", "1").strip().lower() not in ("0", "false", "nao", "não", "off")
+    # Com debug, o reloader do Flask roda este bloco também no processo que só vigia os arquivos
+    if not debug or os.environ.get("WERKZEUG_RUN_MAIN") == "true":
+        iniciar_servicos()
+    print(f"=== App.py pronto em http://localhost:{port} ===")
+    app.run(host='0.0.0.0', port=port, debug=debug, threaded=True)
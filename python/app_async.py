@@ -0,0 +1,807 @@
+"""
+Modo ASGI (assíncrono) do bot
+
+Mesmas rotas principais do App.py servidas em um event loop, com I/O de saída
+não bloqueante (httpx.AsyncClient) para Evolution e AbacatePay:
+  /webhook, /process-event, /bot-simples, /gerar-pix,
+  /health, /evolution-health, /notion-health, /metrics, /debug/traces, /debug/perfil
+
+A conversa continua no BotSimples (mesma instância global, mesma lógica).
+O passo da máquina de estados roda no pool de respostas (pools.py) porque as
+consultas ao Notion usam o SDK síncrono; os envios e a criação do PIX são async.
+
+Executar (1 worker por processo: o estado das conversas fica em memória):
+    uvicorn app_async:app --host 0.0.0.0 --port 8001
+
+Dependências: starlette, uvicorn, httpx (ver requirements.txt)
+"""
+import asyncio
+import contextlib
+import hmac
+import os
+import time
+
+import httpx
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+import json_codec
+from nucleo import (
+    ADMIN_TOKEN,
+    API_KEY,
+    EVOLUTION_API,
+    EVOLUTION_DISABLED_ENDPOINTS,
+    EVOLUTION_INVALID_NUMBERS,
+    INSTANCE_NAME,
+    ROTAS_PERFILAVEIS,
+    _coletar_itens,
+    _descrever_conversa,
+    _enviar_resposta as _enviar_resposta_sync,
+    _normalize_number,
+    _partes_da_resposta,
+    _safe_dump,
+    _saude_evolution,
+    _saude_notion,
+    criar_checkout_cli,
+    criar_cobranca_pix_async,
+    extract_text_and_number,
+    iniciar_servicos,
+)
+from bot_simples import PIX_ESPECULATIVO, bot_simples, cpf_valido, gerar_cpf_valido, opcoes_notion
+from cobrancas_pendentes import registro_cobrancas
+from coalescencia import COALESCENCIA_MS, fim_da_rajada, juntar_texto_livre
+from conexao import estado_do_evento, estado_instancia, saida_pausavel
+from extracao_streaming import LIMITE_CORPO, CorpoGrandeDemais, PodadorJSON, verificar_tamanho_declarado
+from filtro_eventos import (
+    EVENTOS_IGNORA,
+    TAMANHO_PREFIXO,
+    contador_descartes,
+    deve_ignorar,
+    evento_da_rota,
+    farejar_evento,
+    normalizar_evento,
+)
+from gravador import gravador
+from memoria import AGRUPAMENTOS, MEMORIA_TOP, contabilidade, instantaneos, memoria_processo
+from metricas import TIPO_CONTEUDO, ChamadaExterna, latencia_http, registrar_cache, registro_metricas, requisicoes_http
+from notion_sync import notion_instalado
+from outbox import OUTBOX_ESPERA_MAX, EntradaOutbox, outbox
+from perfilador import perfilador
+from pools import pool_respostas
+from prazo import RESERVA_RESPOSTA, Prazo, PrazoEsgotado, estourou, timeout_de
+from rastreamento import novo_rastro, rastreado, rastreador
+from saude import monitor_saude
+from supressao import supressor_respostas
+
+_cliente: httpx.AsyncClient | None = None
+# notion_client.AsyncClient do /notion-health?query (o SDK troca base_url/headers do httpx que recebe,
+# por isso não reaproveita o _cliente da Evolution); None sem NOTION_API_KEY ou sem o notion-client
+_cliente_notion = None
+# Uma mensagem por vez por remetente: [lock, quantos usam]; sai do mapa quando ninguém usa
+_locks_numeros: dict[str, list] = {}
+
+
+class JSONCodecResponse(JSONResponse):
+    """JSONResponse usando o codec do projeto (orjson quando instalado)."""
+
+    def render(self, content) -> bytes:
+        return json_codec.dumps_bytes(content)
+
+
+def _json(conteudo, status: int = 200) -> Response:
+    return JSONCodecResponse(conteudo, status_code=status)
+
+
+def _evolution_headers() -> dict:
+    return {"Content-Type": "application/json", "apikey": API_KEY, "Authorization": f"Bearer {API_KEY}"}
+
+
+# ----------------------------------------------------------------------------
+# Leitura do corpo (filtro rápido + poda em streaming, versão async)
+# ----------------------------------------------------------------------------
+
+async def _ler_payload(request: Request, endpoint: str | None = None):
+    """Retorna (payload, None) ou (None, evento_descartado). Lança CorpoGrandeDemais."""
+    verificar_tamanho_declarado(int(request.headers.get("content-length") or 0) or None)
+
+    evento = evento_da_rota(endpoint)
+    if evento in EVENTOS_IGNORA:
+        contador_descartes.registrar(evento)
+        return None, evento
+
+    podador = PodadorJSON()
+    prefixo = b""
+    farejado = False
+    total = 0
+    async for bloco in request.stream():
+        total += len(bloco)
+        if LIMITE_CORPO and total > LIMITE_CORPO:
+            raise CorpoGrandeDemais(f"corpo acima de {LIMITE_CORPO} bytes")
+        if farejado:
+            podador.alimentar(bloco)
+            continue
+        prefixo += bloco
+        if len(prefixo) < TAMANHO_PREFIXO:
+            continue
+        farejado = True
+        evento = normalizar_evento(farejar_evento(prefixo[:TAMANHO_PREFIXO]))
+        if evento in EVENTOS_IGNORA:
+            contador_descartes.registrar(evento)
+            return None, evento
+        podador.alimentar(prefixo)
+
+    if not farejado:
+        evento = normalizar_evento(farejar_evento(prefixo))
+        if evento in EVENTOS_IGNORA:
+            contador_descartes.registrar(evento)
+            return None, evento
+        podador.alimentar(prefixo)
+
+    corpo = podador.resultado()
+    gravador.registrar(request.url.path, corpo)
+    try:
+        return (json_codec.loads(corpo) if corpo.strip() else {}), None
+    except ValueError:
+        return {}, None
+
+
+# ----------------------------------------------------------------------------
+# Saída (Evolution / AbacatePay / checkout Node)
+# ----------------------------------------------------------------------------
+
+async def send_text(number: str, text: str, prazo: Prazo | None = None) -> bool:
+    """Versão async de nucleo.send_text (mesmos caches de número/endpoint e o mesmo prazo)."""
+    if number.startswith('web-'):
+        print(f"🌐 Usuário web detectado: {number} - mensagem: {text[:50]}...")
+        return True
+    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
+        print("❌ Configuração ausente: verifique EVOLUTION_API_URL, EVOLUTION_INSTANCE_NAME, API_KEY_EVOLUTION no .env")
+        return False
+    number_norm = _normalize_number(number)
+    if not number_norm:
+        print(f"❌ Número inválido para envio de texto: {number}")
+        return False
+    invalido = number_norm in EVOLUTION_INVALID_NUMBERS
+    registrar_cache("numeros_invalidos", invalido)
+    if invalido:
+        print(f"⛔ Ignorando envio: número não está no WhatsApp (cache) -> {number_norm}")
+        return False
+    if not estado_instancia.conectado():
+        print(f"⏸️ Instância {estado_instancia.estado}: envio de texto para {number_norm} não realizado")
+        return False
+
+    url = f"{EVOLUTION_API}/message/sendText/{INSTANCE_NAME}"
+    if url in EVOLUTION_DISABLED_ENDPOINTS:
+        print(f"⛔ Ignorando endpoint desativado (404 prévio): {url}")
+        return False
+    payload = {"number": number_norm, "textMessage": {"text": text}}
+    timeout = timeout_de(prazo, 12, "envio_texto")
+    try:
+        with ChamadaExterna("evolution_send_text") as chamada:
+            resp = await _cliente.post(url, content=json_codec.dumps_bytes(payload), headers=_evolution_headers(), timeout=timeout)
+            chamada.ok = resp.status_code < 300
+    except Exception as e:
+        print(f"⚠️ Erro ao enviar texto via {url}: {e}")
+        if isinstance(e, httpx.TimeoutException) and estourou(prazo, "envio_texto"):
+            raise PrazoEsgotado("envio_texto") from e
+        return False
+    if resp.status_code < 300:
+        print(f"✅ Texto enviado para {number_norm}: {resp.status_code} via {url}")
+        estado_instancia.alcancada("envio")
+        return True
+    print(f"⚠️ Falha ({resp.status_code}) em {url}: {resp.text[:200]}")
+    if resp.status_code == 404:
+        EVOLUTION_DISABLED_ENDPOINTS.add(url)
+    if resp.status_code == 400:
+        try:
+            data = json_codec.loads(resp.content)
+            msg_list = ((data or {}).get('response') or {}).get('message') or []
+            for item in msg_list:
+                if isinstance(item, dict) and item.get('exists') is False:
+                    EVOLUTION_INVALID_NUMBERS.add(str(item.get('number') or number_norm))
+                    break
+        except Exception:
+            pass
+    return False
+
+
+async def send_media(number: str, media_type: str, file_name: str, caption: str, media: str,
+                     prazo: Prazo | None = None) -> bool:
+    """Versão async de nucleo.send_media."""
+    if number.startswith('web-'):
+        print(f"🌐 Usuário web detectado: {number} - envio de mídia ignorado")
+        return True
+    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
+        print("❌ Configuração ausente")
+        return False
+    number_norm = _normalize_number(number)
+    if not number_norm:
+        print(f"❌ Número inválido: {number}")
+        return False
+    invalido = number_norm in EVOLUTION_INVALID_NUMBERS
+    registrar_cache("numeros_invalidos", invalido)
+    if invalido:
+        print(f"⛔ Número não está no WhatsApp: {number_norm}")
+        return False
+    if not estado_instancia.conectado():
+        print(f"⏸️ Instância {estado_instancia.estado}: envio de mídia para {number_norm} não realizado")
+        return False
+
+    # Se for data URI, extrair apenas o base64
+    media_clean = media
+    if isinstance(media, str) and media.startswith("data:") and "," in media:
+        media_clean = media.split(",", 1)[1]
+
+    payload = {
+        "number": number_norm,
+        "mediaMessage": {"mediatype": media_type, "caption": caption, "fileName": file_name, "media": media_clean},
+    }
+    url = f"{EVOLUTION_API}/message/sendMedia/{INSTANCE_NAME}"
+    timeout = timeout_de(prazo, 20, "envio_midia")
+    try:
+        with ChamadaExterna("evolution_send_media") as chamada:
+            resp = await _cliente.post(url, content=json_codec.dumps_bytes(payload), headers=_evolution_headers(), timeout=timeout)
+            chamada.ok = resp.status_code < 300
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        if isinstance(e, httpx.TimeoutException) and estourou(prazo, "envio_midia"):
+            raise PrazoEsgotado("envio_midia") from e
+        return False
+    if resp.status_code < 300:
+        print(f"✅ Mídia enviada: {resp.status_code}")
+        estado_instancia.alcancada("envio")
+        return True
+    print(f"⚠️ Falha ({resp.status_code}): {resp.text[:500]}")
+    return False
+
+
+@rastreado("gerar_pix")
+async def gerar_pix(numero: str, prazo: Prazo | None = None) -> str:
+    """Mesmo fluxo de BotSimples.gerar_pix, com a chamada à AbacatePay via httpx."""
+    dados, erro = bot_simples._preparar_pix(numero)
+    if erro:
+        return erro
+    if not monitor_saude.disponivel("abacatepay"):
+        print(f"🩺 AbacatePay fora do ar: PIX de {numero} adiado")
+        return bot_simples.adiar_pix(numero, motivo="indisponivel")
+    cliente_cpf = dados["cliente_cpf"]
+    cobranca = None
+    if numero in bot_simples.pix_especulativo:
+        cobranca = await asyncio.to_thread(bot_simples._usar_pix_especulativo, numero, dados, cliente_cpf, prazo)
+    if PIX_ESPECULATIVO:
+        registrar_cache("pix_especulativo", cobranca is not None)
+    if cobranca is None:
+        cpf_para_envio = cliente_cpf if cpf_valido(cliente_cpf) else gerar_cpf_valido()
+        cobranca = await criar_cobranca_pix_async(_cliente, dados, cpf_para_envio, prazo)
+    return bot_simples._concluir_pix(numero, dados, cobranca)
+
+
+# ----------------------------------------------------------------------------
+# Processamento de mensagens
+# ----------------------------------------------------------------------------
+
+async def _responder_mensagem(number: str, text: str, prazo: Prazo | None = None) -> str:
+    """Mensagem dentro do seu rastro (mesma estrutura do App._responder_mensagem)."""
+    with novo_rastro("mensagem", prazo.inicio if prazo else None, numero=number) as raiz:
+        if raiz is not None:
+            raiz.filho_concluido("espera_fila", raiz.inicio_ns)
+            print(f"🧵 Rastro {raiz.rastro.trace_id}")
+        return await _passos_da_mensagem(number, text, prazo)
+
+
+async def _passos_da_mensagem(number: str, text: str, prazo: Prazo | None = None) -> str:
+    print(f"💬 Texto: {text} | 👤 Número: {number}")
+    reply = await asyncio.wrap_future(pool_respostas.submeter(bot_simples.processar_mensagem, number, text))
+    if reply.startswith("GERAR_PIX:"):
+        try:
+            reply = await gerar_pix(number, prazo)
+        except PrazoEsgotado as e:
+            print(f"⏱️ {e} para {number}")
+            reply = bot_simples.adiar_pix(number, motivo="prazo")
+        except Exception as e:
+            reply = f"❌ Falha ao gerar PIX: {e}"
+    print(f"🤖 Resposta (bot_simples): {reply}")
+    conv = bot_simples.conversas.get(number) or {}
+    if (
+        not number.startswith('web-')
+        and not conv.get("enviar_pix")
+        and supressor_respostas.deve_suprimir(_normalize_number(number) or number, reply)
+    ):
+        print(f"🔇 Resposta repetida para {number} suprimida: {reply[:40]!r}")
+        return reply
+    entrada = outbox.registrar(number, _partes_da_resposta(number, reply))
+    # Instância fora do ar: guarda para a reconexão (drenada pelo pool de envios, com nucleo._enviar_resposta)
+    if saida_pausavel.tentar_guardar(_enviar_resposta_sync, number, reply, None, entrada):
+        print(f"⏸️ Instância {estado_instancia.estado}: resposta para {number} guardada")
+        return reply
+    try:
+        await _enviar_resposta(number, reply, prazo, entrada)
+    except PrazoEsgotado as e:
+        print(f"⏱️ {e}: envios restantes para {number} abandonados")
+        outbox.abandonar(entrada, "prazo")
+    return reply
+
+
+@rastreado("enviar_resposta")
+async def _enviar_resposta(number: str, reply: str, prazo: Prazo | None = None,
+                           entrada: EntradaOutbox | None = None) -> None:
+    """Resposta, copia e cola e QR Code (partes de nucleo._partes_da_resposta).
+    Com entrada do outbox, espera a gravação em disco e confirma cada parte aceita.
+    """
+    partes = entrada.partes if entrada is not None else _partes_da_resposta(number, reply)
+    if entrada is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(entrada.gravada)), OUTBOX_ESPERA_MAX)
+        except asyncio.TimeoutError:
+            print(f"⚠️ Outbox: gravação de {entrada.id} passou de {OUTBOX_ESPERA_MAX}s, enviando mesmo assim")
+    for i, parte in enumerate(partes):
+        if entrada is not None and i in entrada.confirmadas:
+            continue
+        if parte.get("tipo") == "midia":
+            ok = await send_media(
+                number=number,
+                media_type=parte["media_type"],
+                file_name=parte["file_name"],
+                caption=parte["caption"],
+                media=parte["media"],
+                prazo=prazo,
+            )
+            conv = bot_simples.conversas.get(number)
+            if ok and conv and conv.get("qr_base64") == parte["media"] and not str(number).startswith('web-'):
+                conv.pop("qr_base64", None)
+                conv.pop("pix_code", None)
+                conv.pop("enviar_pix", None)
+        else:
+            ok = await send_text(number, parte["texto"], prazo)
+        if ok:
+            outbox.confirmar(entrada, i)
+            if i == 0:
+                supressor_respostas.confirmar(_normalize_number(number) or number, parte["texto"])
+        elif entrada is not None and _normalize_number(number) in EVOLUTION_INVALID_NUMBERS:
+            outbox.abandonar(entrada, "numero_invalido")
+            return
+
+
+@contextlib.asynccontextmanager
+async def _vez_do_numero(number: str):
+    """Serializa o remetente (mesma ordem do App.py) sem guardar um lock por número para sempre.
+    Tudo roda no mesmo loop: entre o get e o incremento não há await.
+    """
+    trava = _locks_numeros.get(number)
+    if trava is None:
+        trava = _locks_numeros[number] = [asyncio.Lock(), 0]
+    trava[1] += 1
+    try:
+        async with trava[0]:
+            yield
+    finally:
+        trava[1] -= 1
+        if trava[1] == 0:
+            del _locks_numeros[number]
+
+
+async def _processar_remetente(number: str, mensagens: list[tuple[int, str, Prazo]]) -> list[dict]:
+    resultados = []
+    async with _vez_do_numero(number):
+        i = 0
+        while i < len(mensagens):
+            idx, text, prazo = mensagens[i]
+            fim = i + 1
+            # Mesma fusão de App._encadear_mensagens (só dentro do lote; sem janela de espera)
+            if COALESCENCIA_MS > 0 and fim < len(mensagens) and bot_simples.aceita_texto_livre(number):
+                fim = fim_da_rajada(mensagens, i)
+            if fim > i + 1:
+                text = juntar_texto_livre([m[1] for m in mensagens[i:fim]])
+                for idx_juntado, _, _ in mensagens[i:fim - 1]:
+                    resultados.append({"index": idx_juntado, "number": number, "status": "coalesced"})
+                idx = mensagens[fim - 1][0]
+            try:
+                reply = await _responder_mensagem(number, text, prazo)
+                resultados.append({"index": idx, "number": number, "status": "processed", "reply": reply})
+            except Exception as e:
+                print(f"❌ Erro ao gerar/enviar resposta: {e}")
+                resultados.append({"index": idx, "number": number, "status": "error", "error": str(e)})
+            i = fim
+    return resultados
+
+
+async def _processar_lote(payload: dict | list) -> dict:
+    """Mesmo contrato de App._processar_lote: grupos por remetente em paralelo, ordem por remetente."""
+    itens = _coletar_itens(payload)
+    status_itens: list[dict | None] = [None] * len(itens)
+    grupos: dict[str, list[tuple[int, str, Prazo]]] = {}
+    for idx, (event_type, entry) in enumerate(itens):
+        if deve_ignorar(event_type):
+            status_itens[idx] = {"index": idx, "status": "ignored", "event": event_type}
+            continue
+        text, number = extract_text_and_number(event_type, entry)
+        if text and number:
+            grupos.setdefault(number, []).append((idx, text, Prazo()))
+        else:
+            status_itens[idx] = {"index": idx, "status": "skipped"}
+            print(f"ℹ️ Item sem texto/número para resposta. 📦 Dump: {_safe_dump(entry)}")
+
+    resultados = await asyncio.gather(*(_processar_remetente(n, m) for n, m in grupos.items()))
+    for resultado_grupo in resultados:
+        for item in resultado_grupo:
+            status_itens[item["index"]] = item
+
+    last_reply = last_number = None
+    for item in status_itens:
+        if item and item["status"] == "processed":
+            last_reply, last_number = item["reply"], item["number"]
+    return {"processed": last_number is not None, "reply": last_reply, "number": last_number, "items": status_itens}
+
+
+# ----------------------------------------------------------------------------
+# Rotas
+# ----------------------------------------------------------------------------
+
+async def webhook(request: Request):
+    """Eventos Evolution (diretos ou encaminhados pelo webhook.py)."""
+    try:
+        payload, descartado = await _ler_payload(request, request.path_params.get("endpoint"))
+        if descartado:
+            return _json({"status": "ignored", "event": descartado})
+        if isinstance(payload, dict) and deve_ignorar(payload.get('event')):
+            contador_descartes.registrar(payload.get('event'))
+            return _json({"status": "ignored", "event": payload.get('event')})
+        evento = payload.get('event') if isinstance(payload, dict) else None
+        if normalizar_evento(evento) == 'connection.update' or (
+            not evento and evento_da_rota(request.path_params.get("endpoint")) == 'connection.update'
+        ):
+            estado = estado_do_evento(payload)
+            mudou = estado_instancia.atualizar(estado)
+            return _json({"status": "success", "event": "connection.update", "state": estado, "changed": mudou})
+        return _json({"status": "success", **(await _processar_lote(payload))})
+    except CorpoGrandeDemais as e:
+        return _json({"status": "error", "message": str(e)}, 413)
+    except Exception as e:
+        print(f"❌ Erro no /webhook (async): {e}")
+        return _json({"status": "error", "message": str(e)})
+
+
+async def bot_simples_route(request: Request):
+    try:
+        corpo = await request.body()
+        payload = json_codec.loads(corpo or b"{}")
+        gravador.registrar(request.url.path, corpo)
+    except Exception as e:
+        return _json({"status": "error", "message": str(e)})
+    resultado = await _processar_lote(payload)
+    extra = {}
+    conv = bot_simples.conversas.get(resultado["number"] or "")
+    if conv and conv.get("enviar_pix"):
+        extra["pix_data"] = {
+            "pix_copia_cola": conv.get("pix_code"),
+            "qr_code_url": conv.get("qr_base64"),
+            "produto": conv.get("prato", {}).get("nome"),
+            "valor": (conv.get("prato", {}).get("preco") or 0) / 100.0,
+        }
+    return _json({"status": "success", **resultado, **extra})
+
+
+async def gerar_pix_route(request: Request):
+    """Mesmo contrato do /gerar-pix do App.py (checkout.js via Node, sem bloquear o loop)."""
+    prazo = Prazo()
+    try:
+        data = json_codec.loads(await request.body() or b"{}")
+        produto = data.get('produto', 'Produto')
+        valor_centavos = data.get('valor_centavos', 0)
+        numero_whatsapp = data.get('numero_whatsapp')
+        validade_segundos = int(data.get('validade_segundos') or 300)
+        if not numero_whatsapp or not valor_centavos:
+            return _json({"error": "numero_whatsapp e valor_centavos são obrigatórios"}, 400)
+        if not monitor_saude.disponivel("checkout_node"):
+            return _json({"error": "Checkout Node indisponível no momento", "saude": monitor_saude.status("checkout_node")}, 503)
+
+        criar_checkout_cli()
+        script_path = os.path.join(os.path.dirname(__file__), 'checkout_cli.js')
+        proc = await asyncio.create_subprocess_exec(
+            'node', script_path, produto, str(valor_centavos), data.get('cliente_nome', 'Cliente'),
+            data.get('cliente_telefone', ''), str(validade_segundos), data.get('cliente_cpf', ''),
+            stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE,
+        )
+        try:
+            stdout, stderr = await asyncio.wait_for(proc.communicate(), timeout=prazo.timeout(15, "pix", RESERVA_RESPOSTA))
+        except asyncio.TimeoutError:
+            proc.kill()
+            estourou(prazo, "pix", RESERVA_RESPOSTA)
+            return _json({"error": "checkout.js não respondeu a tempo"}, 504)
+        if proc.returncode != 0:
+            return _json({"error": "Erro ao executar checkout.js", "stderr": stderr.decode(errors="replace")}, 500)
+
+        pix_data = json_codec.loads(stdout)
+        if not pix_data.get('success'):
+            return _json({"error": "Falha ao gerar PIX", "details": pix_data}, 500)
+
+        registro_cobrancas.registrar(pix_data.get('id'), numero_whatsapp, validade_segundos)
+
+        valor = valor_centavos / 100
+        caption = f"🔳 Escaneie para pagar R$ {valor:.2f}"
+        ok_media = False
+        etapa_estourada = None
+        try:
+            await send_text(numero_whatsapp, (
+                f"💰 *PIX Gerado!*\n\n"
+                f"📦 Produto: {produto}\n"
+                f"💵 Valor: R$ {valor:.2f}\n\n"
+                f"*PIX Copia e Cola:*\n`{pix_data['pix_copia_cola']}`"
+            ), prazo)
+            ok_media = await send_media(numero_whatsapp, "image", "qrcode_pix.png", caption, pix_data['qr_code_url'], prazo)
+            if not ok_media:
+                ok_media = await send_media(numero_whatsapp, "document", "qrcode_pix.png", caption, pix_data['qr_code_url'], prazo)
+            expiracao_info = pix_data.get('expires_at') or ''
+            await send_text(numero_whatsapp, (
+                f"⏳ Validade: 5 minutos ({validade_segundos} segundos)."
+                + (f"\nAté: {expiracao_info}" if expiracao_info else "")
+            ), prazo)
+        except PrazoEsgotado as e:
+            print(f"⏱️ {e}: envios restantes do /gerar-pix abandonados")
+            etapa_estourada = e.etapa
+        return _json({
+            "success": True,
+            "message": "PIX gerado e enviado com sucesso",
+            "pix_data": pix_data,
+            "validade_segundos": validade_segundos,
+            "ok_media": ok_media,
+            "prazo_esgotado": etapa_estourada,
+        })
+    except Exception as e:
+        return _json({"error": str(e)}, 500)
+
+
+async def health(request: Request):
+    return _json({"status": "running", "mode": "asgi"})
+
+
+async def evolution_health(request: Request):
+    """Mesmo contrato do /evolution-health do App.py (cache do monitor de saúde)."""
+    corpo, status = _saude_evolution()
+    return _json(corpo, status)
+
+
+async def notion_health(request: Request):
+    """Sem ?query, o último resultado do monitor; com ?query, busca no Notion agora."""
+    if not request.query_params.get('query'):
+        corpo, status = _saude_notion()
+        return _json(corpo, status)
+    if _cliente_notion is None:
+        if not (os.getenv("NOTION_API_KEY") or os.getenv("Notion_API_Key")):
+            return _json({"ok": False, "error": "Missing NOTION_API_KEY"}, 500)
+        return _json({"ok": False, "mode": "search", "error": "notion-client não instalado"})
+    try:
+        resp = await _cliente_notion.search(query=(request.query_params.get('query') or '').strip())
+        results = resp.get('results', []) or []
+        return _json({"ok": True, "mode": "search", "count": len(results)})
+    except Exception as e:
+        return _json({"ok": False, "mode": "search", "error": str(e)})
+
+
+async def metrics(request: Request):
+    """Mesmo registro do App.py (metricas.py), incluindo as métricas coletadas em nucleo.py."""
+    return Response(registro_metricas.exportar(), headers={"Content-Type": TIPO_CONTEUDO})
+
+
+async def debug_traces(request: Request):
+    """Mesmos filtros (e a mesma exigência de X-Admin-Token) do /debug/traces do App.py."""
+    if not _admin_autorizado(request):
+        return _json({"error": "não autorizado"}, 403)
+    args = request.query_params
+    trace_id = args.get('trace_id')
+    if trace_id:
+        rastro = rastreador.obter(trace_id)
+        if rastro is None:
+            return _json({"error": "rastro não encontrado (pode ter saído do buffer)"}, 404)
+        return _json(rastro.otlp() if args.get('formato') == 'otlp' else rastro.detalhes())
+    try:
+        min_ms = float(args.get('min_ms') or 0)
+        limite = int(args.get('limite') or 50)
+    except ValueError:
+        return _json({"error": "min_ms e limite devem ser números"}, 400)
+    return _json({"status": rastreador.status(), "rastros": rastreador.listar(args.get('numero'), min_ms, limite)})
+
+
+async def dependencias_status(request: Request):
+    """Mesmo contrato do /dependencias do App.py."""
+    if request.query_params.get('atualizar'):
+        if not _admin_autorizado(request):
+            return _json({"error": "não autorizado"}, 403)
+        monitor_saude.sondar_agora()
+    return _json(monitor_saude.status())
+
+
+def _admin_autorizado(request: Request) -> bool:
+    """Mesma regra do App._admin_autorizado (X-Admin-Token == ADMIN_TOKEN)."""
+    token = request.headers.get('x-admin-token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token.encode('utf-8'), ADMIN_TOKEN.encode('utf-8'))
+
+
+async def debug_perfil(request: Request):
+    """Mesmo contrato do /debug/perfil do App.py."""
+    if not _admin_autorizado(request):
+        return _json({"error": "não autorizado"}, 403)
+    if request.method == 'POST':
+        try:
+            data = json_codec.loads(await request.body() or b"{}") or {}
+            amostragem = float(data.get('amostragem'))
+        except (TypeError, ValueError, AttributeError):
+            return _json({"error": "amostragem deve ser um número entre 0 e 1"}, 400)
+        perfilador.amostragem = min(max(amostragem, 0.0), 1.0)
+        return _json(perfilador.status())
+    args = request.query_params
+    if args.get('status'):
+        return _json(perfilador.status())
+    try:
+        ultimos = int(args['ultimos']) if args.get('ultimos') else None
+        desde = float(args['desde']) if args.get('desde') else None
+    except ValueError:
+        return _json({"error": "ultimos e desde devem ser números"}, 400)
+    texto = await asyncio.to_thread(perfilador.agregar, ultimos, desde, args.get('rota'), args.get('espera') == '1')
+    return Response(texto, media_type='text/plain; charset=utf-8',
+                    headers={'Content-Disposition': 'attachment; filename="perfil-agregado.collapsed"'})
+
+
+async def debug_gravacao(request: Request):
+    """Mesmo contrato do /debug/gravacao do App.py."""
+    if not _admin_autorizado(request):
+        return _json({"error": "não autorizado"}, 403)
+    if request.method == 'POST':
+        try:
+            ativo = (json_codec.loads(await request.body() or b"{}") or {}).get('ativo')
+        except (ValueError, AttributeError):
+            ativo = None
+        if not isinstance(ativo, bool):
+            return _json({"error": "ativo deve ser true ou false"}, 400)
+        if ativo:
+            gravador.ligar()
+        else:
+            gravador.desligar()
+    return _json(gravador.status())
+
+
+def _relatorio_memoria(top: int) -> dict:
+    return {
+        "processo": memoria_processo(),
+        **contabilidade.medir(),
+        "maiores_conversas": contabilidade.maiores(bot_simples.conversas, top, _descrever_conversa),
+        "tracemalloc": instantaneos.status(),
+    }
+
+
+async def debug_memoria(request: Request):
+    """Mesmo contrato do /debug/memoria do App.py (as estruturas são registradas em nucleo.py).
+    A varredura roda numa thread para não parar o loop.
+    """
+    if not _admin_autorizado(request):
+        return _json({"error": "não autorizado"}, 403)
+    if request.method == 'DELETE':
+        instantaneos.desligar()
+        return _json(instantaneos.status())
+    args = request.query_params
+    try:
+        top = int(args.get('top') or MEMORIA_TOP)
+    except ValueError:
+        return _json({"error": "top deve ser um número"}, 400)
+    agrupar = args.get('agrupar') or 'lineno'
+    if agrupar not in AGRUPAMENTOS:
+        return _json({"error": f"agrupar deve ser um de {', '.join(AGRUPAMENTOS)}"}, 400)
+    if request.method == 'POST':
+        instantaneo = await asyncio.to_thread(instantaneos.tirar)
+        diferenca = await asyncio.to_thread(instantaneos.diferenca, agrupar, top)
+        return _json({"instantaneo": instantaneo, "diferenca": diferenca})
+    if args.get('diferenca'):
+        diferenca = await asyncio.to_thread(instantaneos.diferenca, agrupar, top)
+        return _json({"diferenca": diferenca, "tracemalloc": instantaneos.status()})
+    return _json(await asyncio.to_thread(_relatorio_memoria, top))
+
+
+class PerfilarRotas:
+    """Middleware ASGI: envolve /webhook e /bot-simples no perfilador (ver perfilador.py)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["path"] not in ROTAS_PERFILAVEIS:
+            await self.app(scope, receive, send)
+            return
+        cabecalhos = dict(scope.get("headers") or [])
+        pedido_admin = cabecalhos.get(b"x-perfil") == b"1" and bool(ADMIN_TOKEN) and hmac.compare_digest(
+            cabecalhos.get(b"x-admin-token", b""), ADMIN_TOKEN.encode("utf-8"))
+        if not perfilador.deve_perfilar(pedido_admin):
+            await self.app(scope, receive, send)
+            return
+        sessao = perfilador.iniciar(scope["path"])
+        status = "erro"
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            await asyncio.to_thread(perfilador.finalizar, sessao, status)
+
+
+class MedirRotas:
+    """Middleware ASGI: latência e status por rota (padrão da rota, como no after_request do App.py)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        inicio = time.perf_counter()
+        status = 500
+
+        async def enviar(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, enviar)
+        finally:
+            # O roteador preenche o scope: "route" (Starlette >= 0.33) ou só "endpoint"
+            rota = getattr(scope.get("route"), "path", None)
+            if rota is None:
+                endpoint = scope.get("endpoint")
+                rota = getattr(endpoint, "__name__", None) or "<sem rota>"
+            latencia_http.observar(time.perf_counter() - inicio, rota, scope["method"])
+            requisicoes_http.inc(rota, scope["method"], status)
+
+
+@contextlib.asynccontextmanager
+async def lifespan(app):
+    global _cliente, _cliente_notion
+    _cliente = httpx.AsyncClient(limits=httpx.Limits(max_connections=200, max_keepalive_connections=50))
+    api_key = os.getenv("NOTION_API_KEY") or os.getenv("Notion_API_Key")
+    if api_key and notion_instalado():
+        from notion_client import AsyncClient
+        _cliente_notion = AsyncClient(**opcoes_notion(api_key))
+    iniciar_servicos()
+    print("=== app_async.py (ASGI) pronto ===")
+    try:
+        yield
+    finally:
+        await _cliente.aclose()
+        if _cliente_notion is not None:
+            await _cliente_notion.aclose()
+            _cliente_notion = None
+
+
+app = Starlette(
+    routes=[
+        Route('/health', health, methods=['GET']),
+        Route('/evolution-health', evolution_health, methods=['GET']),
+        Route('/notion-health', notion_health, methods=['GET']),
+        Route('/dependencias', dependencias_status, methods=['GET']),
+        Route('/webhook', webhook, methods=['POST']),
+        Route('/process-event', webhook, methods=['POST']),
+        Route('/bot-simples', bot_simples_route, methods=['POST']),
+        Route('/gerar-pix', gerar_pix_route, methods=['POST']),
+        Route('/webhook/{endpoint:path}', webhook, methods=['POST']),
+        Route('/metrics', metrics, methods=['GET']),
+        Route('/debug/traces', debug_traces, methods=['GET']),
+        Route('/debug/perfil', debug_perfil, methods=['GET', 'POST']),
+        Route('/debug/memoria', debug_memoria, methods=['GET', 'POST', 'DELETE']),
+        Route('/debug/gravacao', debug_gravacao, methods=['GET', 'POST']),
+    ],
+    middleware=[Middleware(MedirRotas), Middleware(PerfilarRotas)],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=int(os.getenv("PORT", "8001")))
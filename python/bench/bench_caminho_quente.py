@@ -0,0 +1,212 @@
+"""
+Microbenchmarks do caminho quente de cada mensagem, com gate de regressão.
+
+Casos (CPU puro, sem rede):
+- extrair[<payload>]   _coletar_itens -> _iter_event_items -> extract_text_and_number
+                       -> _normalize_number, para cada evento em bench/payloads
+- normalize_number     JIDs variados (@s.whatsapp.net, @lid, formatação manual)
+- pedido_dinheiro      processar_mensagem num pedido completo pago em dinheiro
+- pedido_pix           processar_mensagem até o GERAR_PIX (o PIX em si é rede)
+- mostrar_cardapio
+- cpf_valido           CPFs válidos, inválidos e formatados
+
+Para cada caso mede operações/s (melhor de 3) e o pico de memória alocada por
+operação (tracemalloc). --salvar grava a linha de base; --comparar falha
+(código de saída 1) quando um caso perde mais que --tolerancia-ops de vazão ou
+aloca mais que --tolerancia-memoria acima da base (casos mais lentos são medidos
+de novo --confirmacoes vezes antes de acusar). A base de vazão depende da
+máquina: gere e compare no mesmo ambiente.
+
+Uso:
+    python bench/bench_caminho_quente.py --salvar      # na base (ex.: main)
+    python bench/bench_caminho_quente.py --comparar    # na mudança
+"""
+import argparse
+import glob
+import json
+import os
+import platform
+import statistics
+import sys
+import timeit
+import tracemalloc
+
+PASTA_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(PASTA_BENCH))
+
+# Sem diário de saída nem chamadas externas durante a medição
+os.environ["OUTBOX_ARQUIVO"] = ""
+
+from nucleo import _coletar_itens, _normalize_number, extract_text_and_number  # noqa: E402
+from bot_simples import BotSimples, cpf_valido  # noqa: E402
+
+PASTA_PAYLOADS = os.path.join(PASTA_BENCH, "payloads")
+BASE_PADRAO = os.path.join(PASTA_BENCH, "baseline_caminho_quente.json")
+# Diferenças de memória abaixo disso são ruído (alinhamento, caches internos)
+FOLGA_MEMORIA_BYTES = 256
+
+JIDS = [
+    "5511987654321@s.whatsapp.net",
+    "5521912345678@c.us",
+    "123456789012345@lid",
+    "+55 (11) 98765-4321",
+    "5511987654321",
+    "5511987654321:12@s.whatsapp.net",
+    "status@broadcast",
+    "",
+]
+CPFS = ["52998224725", "529.982.247-25", "11111111111", "12345678900", "123", "não"]
+PEDIDO_DINHEIRO = ["menu", "3", "2", "Rua das Flores 123, Centro", "2", "2"]
+PEDIDO_PIX = ["menu", "1", "4", "Avenida Paulista 1000, Bela Vista", "1", "não"]
+
+
+def _extrair(payload):
+    for event_type, item in _coletar_itens(payload):
+        _, number = extract_text_and_number(event_type, item)
+        _normalize_number(number)
+
+
+def _bot_offline() -> BotSimples:
+    bot = BotSimples()
+    bot._buscar_notion_texto = lambda query: None  # o cardápio do Notion é rede, fora do escopo
+    return bot
+
+
+def _casos(pasta: str) -> dict:
+    casos = {}
+    for caminho in sorted(glob.glob(os.path.join(pasta, "*.json"))):
+        with open(caminho, "rb") as f:
+            payload = json.loads(f.read())
+        if not isinstance(payload, (dict, list)) or (isinstance(payload, dict) and "event" not in payload):
+            continue
+        nome = os.path.splitext(os.path.basename(caminho))[0]
+        casos[f"extrair[{nome}]"] = (lambda p=payload: _extrair(p))
+
+    casos["normalize_number"] = lambda: [_normalize_number(j) for j in JIDS]
+
+    bot = _bot_offline()
+
+    def _pedido(mensagens, numero):
+        for mensagem in mensagens:
+            bot.processar_mensagem(numero, mensagem)
+
+    casos["pedido_dinheiro"] = lambda: _pedido(PEDIDO_DINHEIRO, "5511900000001")
+    casos["pedido_pix"] = lambda: _pedido(PEDIDO_PIX, "5511900000002")
+    casos["mostrar_cardapio"] = bot._mostrar_cardapio
+    casos["cpf_valido"] = lambda: [cpf_valido(c) for c in CPFS]
+    return casos
+
+
+def _ops_por_segundo(fn, alvo_s: float) -> float:
+    # Calibra o número de repetições para rodar ~alvo_s segundos
+    n, tempo = timeit.Timer(fn).autorange()
+    total = max(n, int(n * alvo_s / max(tempo, 1e-9)))
+    melhor = min(timeit.repeat(fn, number=total, repeat=3))
+    return total / melhor
+
+
+def _pico_por_operacao(fn, repeticoes: int = 7) -> int:
+    """Mediana do pico de memória alocada (bytes) durante uma operação."""
+    fn()  # aquece caches (regex, atributos)
+    picos = []
+    tracemalloc.start()
+    try:
+        for _ in range(repeticoes):
+            tracemalloc.reset_peak()
+            antes = tracemalloc.get_traced_memory()[0]
+            fn()
+            picos.append(tracemalloc.get_traced_memory()[1] - antes)
+    finally:
+        tracemalloc.stop()
+    return int(statistics.median(picos))
+
+
+def medir(casos: dict, alvo_s: float) -> dict:
+    resultados = {}
+    for nome, fn in casos.items():
+        resultados[nome] = {"ops": round(_ops_por_segundo(fn, alvo_s), 1), "pico_bytes": _pico_por_operacao(fn)}
+    return resultados
+
+
+def confirmar_lentos(casos: dict, base: dict, atual: dict, tol_ops: float, alvo_s: float, tentativas: int) -> None:
+    """Mede de novo os casos que parecem mais lentos e fica com a melhor vazão
+    (uma medição isolada sofre com outros processos na máquina)."""
+    for nome, medida in atual.items():
+        anterior = base.get(nome)
+        for _ in range(tentativas):
+            if not anterior or medida["ops"] >= anterior["ops"] * (1 - tol_ops):
+                break
+            medida["ops"] = max(medida["ops"], round(_ops_por_segundo(casos[nome], alvo_s), 1))
+
+
+def comparar(base: dict, atual: dict, tol_ops: float, tol_mem: float) -> list:
+    """Imprime a comparação e retorna os casos que regrediram."""
+    regressoes = []
+    print(f"{'caso':<36} {'op/s base':>12} {'op/s atual':>12} {'Δ':>7} {'bytes base':>11} {'bytes atual':>11}")
+    for nome, medida in atual.items():
+        anterior = base.get(nome)
+        if not anterior:
+            print(f"{nome:<36} {'-':>12} {medida['ops']:>12,.0f} {'novo':>7} {'-':>11} {medida['pico_bytes']:>11}")
+            continue
+        delta = medida["ops"] / anterior["ops"] - 1
+        lento = delta < -tol_ops
+        limite_mem = max(anterior["pico_bytes"] * (1 + tol_mem), anterior["pico_bytes"] + FOLGA_MEMORIA_BYTES)
+        pesado = medida["pico_bytes"] > limite_mem
+        marca = " ❌" if lento or pesado else ""
+        print(
+            f"{nome:<36} {anterior['ops']:>12,.0f} {medida['ops']:>12,.0f} {delta:>+7.0%}"
+            f" {anterior['pico_bytes']:>11} {medida['pico_bytes']:>11}{marca}"
+        )
+        if lento:
+            regressoes.append(f"{nome}: vazão {delta:+.0%} (tolerância -{tol_ops:.0%})")
+        if pesado:
+            regressoes.append(f"{nome}: pico {anterior['pico_bytes']} -> {medida['pico_bytes']} bytes")
+    return regressoes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=PASTA_PAYLOADS, help="pasta com eventos .json")
+    parser.add_argument("--tempo", type=float, default=0.3, help="segundos por medição")
+    parser.add_argument("--base", default=BASE_PADRAO, help="arquivo da linha de base")
+    parser.add_argument("--salvar", action="store_true", help="grava as medições como linha de base")
+    parser.add_argument("--comparar", action="store_true", help="compara com a linha de base e falha se regredir")
+    parser.add_argument("--tolerancia-ops", type=float, default=0.15, help="perda de vazão aceita (fração)")
+    parser.add_argument("--tolerancia-memoria", type=float, default=0.10, help="aumento de pico aceito (fração)")
+    parser.add_argument("--confirmacoes", type=int, default=2, help="novas medições antes de acusar lentidão")
+    parser.add_argument("--filtro", default="", help="só casos cujo nome contém o texto")
+    args = parser.parse_args()
+
+    casos = {nome: fn for nome, fn in _casos(args.dir).items() if args.filtro in nome}
+    atual = medir(casos, args.tempo)
+
+    if args.comparar:
+        if not os.path.exists(args.base):
+            print(f"Sem linha de base em {args.base}: rode antes com --salvar")
+            sys.exit(2)
+        with open(args.base, "r", encoding="utf-8") as f:
+            base = json.load(f)
+        if base.get("python") != platform.python_version():
+            print(f"⚠️ Base gerada com Python {base.get('python')}, medindo com {platform.python_version()}")
+        confirmar_lentos(casos, base.get("casos", {}), atual, args.tolerancia_ops, args.tempo, args.confirmacoes)
+        regressoes = comparar(base.get("casos", {}), atual, args.tolerancia_ops, args.tolerancia_memoria)
+        if regressoes:
+            print("\nRegressões:")
+            for r in regressoes:
+                print(f"  - {r}")
+            sys.exit(1)
+        print("\nSem regressões.")
+    else:
+        print(f"{'caso':<36} {'op/s':>12} {'pico bytes/op':>14}")
+        for nome, medida in atual.items():
+            print(f"{nome:<36} {medida['ops']:>12,.0f} {medida['pico_bytes']:>14}")
+
+    if args.salvar:
+        with open(args.base, "w", encoding="utf-8") as f:
+            json.dump({"python": platform.python_version(), "maquina": platform.machine(), "casos": atual},
+                      f, indent=2, ensure_ascii=False)
+        print(f"\nLinha de base salva em {args.base}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark de memória das conversas residentes: dict por número x Conversa (__slots__).
+
+Monta N conversas (padrão 100 mil) espalhadas pelas etapas do fluxo, incluindo
+uma fração com PIX gerado e ainda não enviado, nos dois formatos:
+- dict: o formato antigo ({"estado": "pedindo_cpf", "prato": ..., "qr_base64": ...})
+- slots: conversa.Conversa com código de estado e DadosPix fora da linha
+
+Os textos do cliente (endereço, CPF, copia e cola, QR Code) são os mesmos objetos
+nos dois formatos e ficam fora da medição: o que se compara é o custo do registro.
+
+Uso:
+    python bench/bench_conversas.py
+    python bench/bench_conversas.py --n 200000 --fracao-pix 0.2
+"""
+import argparse
+import gc
+import os
+import random
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bot_simples import CARDAPIO  # noqa: E402
+from conversa import (  # noqa: E402
+    ESCOLHENDO_PRATO,
+    FINALIZADO,
+    MENU_PRINCIPAL,
+    NOMES_ESTADOS,
+    PEDINDO_CPF,
+    PEDINDO_ENDERECO,
+    PEDINDO_PAGAMENTO,
+    Conversa,
+    DadosPix,
+)
+
+# (estado, chegou no endereço, chegou no pagamento, fração)
+ETAPAS = (
+    (MENU_PRINCIPAL, False, False, 0.30),
+    (ESCOLHENDO_PRATO, False, False, 0.20),
+    (PEDINDO_ENDERECO, False, False, 0.15),
+    (PEDINDO_PAGAMENTO, True, False, 0.10),
+    (PEDINDO_CPF, True, True, 0.15),
+    (FINALIZADO, True, True, 0.10),
+)
+
+
+def _clientes(n: int, fracao_pix: float, semente: int) -> list:
+    """Dados de cada cliente (criados antes da medição e compartilhados pelos dois formatos)."""
+    aleatorio = random.Random(semente)
+    pesos = [etapa[3] for etapa in ETAPAS]
+    pratos = list(CARDAPIO.values())
+    qr = "iVBORw0KGgo" + "A" * 6000  # QR Code em base64 (~6 KB)
+    clientes = []
+    for i in range(n):
+        estado, com_endereco, com_pagamento, _ = aleatorio.choices(ETAPAS, pesos)[0]
+        prato = aleatorio.choice(pratos) if estado != MENU_PRINCIPAL and estado != ESCOLHENDO_PRATO else None
+        pix = None
+        if estado == FINALIZADO and aleatorio.random() < fracao_pix / ETAPAS[-1][3]:
+            pix = (f"pix_{i:08d}", f"00020101021226850014br.gov.bcb.pix{i:012d}" + "5204000053039865802BR", qr)
+        clientes.append((
+            estado,
+            prato,
+            f"Rua {i % 997}, {i % 1200}, Bairro {i % 83}" if com_endereco else None,
+            "pix" if com_pagamento else None,
+            f"{i:011d}" if com_pagamento and i % 3 == 0 else None,
+            pix,
+        ))
+    return clientes
+
+
+def _como_dict(cliente) -> dict:
+    estado, prato, endereco, pagamento, cpf, pix = cliente
+    conv = {
+        "estado": NOMES_ESTADOS[estado],
+        "prato": prato,
+        "endereco": endereco,
+        "pagamento": pagamento,
+        "cpf": cpf,
+    }
+    if pix:
+        conv["qr_base64"] = pix[2]
+        conv["pix_code"] = pix[1]
+        conv["enviar_pix"] = True
+        conv["pix_id"] = pix[0]
+    return conv
+
+
+def _como_conversa(cliente) -> Conversa:
+    estado, prato, endereco, pagamento, cpf, pix = cliente
+    conv = Conversa(estado)
+    conv.prato = prato
+    conv.endereco = endereco
+    conv.pagamento = pagamento
+    conv.cpf = cpf
+    if pix:
+        conv.pix = DadosPix(pix[0], pix[1], pix[2], enviar_pix=True)
+    return conv
+
+
+def _medir(construir, clientes) -> tuple:
+    """Bytes alocados pelos registros (tracemalloc), sem contar os textos do cliente."""
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    registros = [construir(c) for c in clientes]
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    # A lista que segura os registros não faz parte do custo por conversa
+    total = depois - antes - sys.getsizeof(registros)
+    return total, registros
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--n", type=int, default=100_000, help="conversas residentes")
+    parser.add_argument("--fracao-pix", type=float, default=0.05, help="fração com PIX gerado ainda não enviado")
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+
+    clientes = _clientes(args.n, args.fracao_pix, args.semente)
+    com_pix = sum(1 for c in clientes if c[5])
+    print(f"{args.n:,} conversas ({com_pix:,} com PIX pendente)")
+
+    print(f"{'formato':<10} {'total MB':>10} {'bytes/conversa':>16}")
+    resultados = {}
+    for nome, construir in (("dict", _como_dict), ("slots", _como_conversa)):
+        total, registros = _medir(construir, clientes)
+        resultados[nome] = total
+        print(f"{nome:<10} {total / 1e6:>10.2f} {total / args.n:>16.1f}")
+        del registros
+    print(f"redução: {1 - resultados['slots'] / resultados['dict']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
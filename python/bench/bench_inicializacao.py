@@ -0,0 +1,159 @@
+"""
+Tempo de partida a frio do App.py, com e sem a cópia local do Notion
+
+Casos (mediana de --repeticoes processos novos, mocks de bench/servidores_mock.py):
+- importacao         `import App` num processo novo, sem threads de fundo; lista
+                     quais SDKs pesados (requests, notion_client, httpx) foram
+                     importados junto (devem ficar para o primeiro uso)
+- ate_health         do Popen até o primeiro GET /health 200
+- primeiro_cardapio  "oi" + "1" (cardápio com o texto do Notion) logo depois do
+                     /health: tempo da resposta do "1" e chamadas ao Notion até ela,
+                     sem cópia (arquivo apagado antes) e com cópia (a da execução
+                     anterior, ver NOTION_SNAPSHOT_ARQUIVO em notion_sync.py)
+
+Com a cópia, a primeira resposta não espera o Notion (--notion-latencia-ms por
+chamada no mock); sem ela, espera o search e a leitura dos blocos.
+
+Uso:
+    python bench/bench_inicializacao.py
+    python bench/bench_inicializacao.py --repeticoes 10 --notion-latencia-ms 400
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import requests
+
+PASTA_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PASTA_BENCH)
+import servidores_mock  # noqa: E402
+
+PASTA_APP = os.path.dirname(PASTA_BENCH)
+SDKS = ("requests", "notion_client", "httpx")
+
+_SCRIPT_IMPORTACAO = f"""
+import sys, time
+inicio = time.perf_counter()
+import App
+duracao = time.perf_counter() - inicio
+print(duracao, ",".join(m for m in {SDKS!r} if m in sys.modules))
+"""
+
+
+def _ambiente(porta: int, porta_mocks: int, copia: str) -> Dict[str, str]:
+    ambiente = dict(os.environ)
+    ambiente.update(servidores_mock.variaveis_ambiente(porta_mocks))
+    ambiente.update({
+        "PORT": str(porta),
+        "APP_DEBUG": "0",
+        "OUTBOX_ARQUIVO": "",
+        "GRAVACAO": "0",
+        "NOTION_SNAPSHOT_ARQUIVO": copia,
+        "PYTHONUNBUFFERED": "1",
+    })
+    return ambiente
+
+
+def medir_importacao(ambiente: Dict[str, str]) -> tuple:
+    ambiente = dict(ambiente, SAUDE_MONITOR="0", NOTION_SYNC="0")
+    saida = subprocess.run([sys.executable, "-c", _SCRIPT_IMPORTACAO], cwd=PASTA_APP, env=ambiente,
+                           capture_output=True, text=True, check=True).stdout.strip().splitlines()[-1]
+    duracao, _, sdks = saida.partition(" ")
+    return float(duracao), sdks
+
+
+def _mensagem(alvo: str, texto: str) -> str:
+    evento = {"event": "messages.upsert", "data": {
+        "key": {"remoteJid": "5511900000001@s.whatsapp.net", "fromMe": False},
+        "message": {"conversation": texto},
+    }}
+    return requests.post(f"{alvo}/bot-simples", json=evento, timeout=60).json().get("reply") or ""
+
+
+def medir_partida(ambiente: Dict[str, str], porta: int, notion: "servidores_mock.ServicoMock", log: str) -> Dict:
+    alvo = f"http://127.0.0.1:{porta}"
+    with open(log, "ab") as saida:
+        inicio = time.perf_counter()
+        processo = subprocess.Popen([sys.executable, "App.py"], cwd=PASTA_APP, env=ambiente,
+                                    stdout=saida, stderr=subprocess.STDOUT)
+    try:
+        limite = time.monotonic() + 30
+        while True:
+            try:
+                if requests.get(f"{alvo}/health", timeout=1).status_code == 200:
+                    break
+            except requests.RequestException:
+                pass
+            if processo.poll() is not None or time.monotonic() > limite:
+                raise SystemExit(f"App.py não subiu na porta {porta} (ver {log})")
+            time.sleep(0.005)
+        ate_health = time.perf_counter() - inicio
+        chamadas_antes = sum(notion.contagem.values())
+        _mensagem(alvo, "oi")
+        t = time.perf_counter()
+        resposta = _mensagem(alvo, "1")
+        return {
+            "ate_health": ate_health,
+            "primeiro_cardapio": time.perf_counter() - t,
+            "chamadas_notion": sum(notion.contagem.values()) - chamadas_antes,
+            "com_notion": "(Notion)" in resposta,
+        }
+    finally:
+        processo.terminate()
+        try:
+            processo.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            processo.kill()
+
+
+def _ms(valores: List[float]) -> str:
+    return f"{statistics.median(valores) * 1000:8.1f} ms (mín {min(valores) * 1000:.1f}, máx {max(valores) * 1000:.1f})"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeticoes", type=int, default=5)
+    parser.add_argument("--porta-app", type=int, default=18103)
+    parser.add_argument("--log-app", default=os.path.join(tempfile.gettempdir(), "bench-inicializacao-app.log"))
+    servidores_mock.adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    c = servidores_mock.comportamentos(args)
+    servicos = servidores_mock.iniciar_todos(args.porta_base, c["evolution"], c["pix"], c["notion"])
+    copia = os.path.join(tempfile.gettempdir(), f"bench-notion-snapshot-{args.porta_app}.json")
+    ambiente = _ambiente(args.porta_app, args.porta_base, copia)
+    try:
+        importacoes, sdks = [], ""
+        for _ in range(args.repeticoes):
+            duracao, sdks = medir_importacao(ambiente)
+            importacoes.append(duracao)
+        print(f"importacao         {_ms(importacoes)}   SDKs importados no boot: {sdks or 'nenhum'}")
+
+        for caso in ("sem_copia", "com_copia"):
+            medidas = []
+            for _ in range(args.repeticoes):
+                if caso == "sem_copia" and os.path.exists(copia):
+                    os.remove(copia)
+                medidas.append(medir_partida(ambiente, args.porta_app, servicos["notion"], args.log_app))
+                if caso == "sem_copia" and not os.path.exists(copia):
+                    raise SystemExit(f"A cópia do Notion não foi salva em {copia} (ver {args.log_app})")
+            chamadas = statistics.median(m["chamadas_notion"] for m in medidas)
+            notion = sum(m["com_notion"] for m in medidas)
+            print(f"\n[{caso}]")
+            print(f"ate_health         {_ms([m['ate_health'] for m in medidas])}")
+            print(f"primeiro_cardapio  {_ms([m['primeiro_cardapio'] for m in medidas])}"
+                  f"   chamadas ao Notion: {chamadas:g}, com texto do Notion: {notion}/{len(medidas)}")
+    finally:
+        for servico in servicos.values():
+            servico.parar()
+        if os.path.exists(copia):
+            os.remove(copia)
+
+
+if __name__ == "__main__":
+    main()
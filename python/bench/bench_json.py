@@ -0,0 +1,79 @@
+"""
+Benchmark do json_codec (o codec que o App usa) em payloads capturados da Evolution.
+
+Mede json_codec.loads e json_codec.dumps_bytes nos dois backends: o módulo é
+carregado duas vezes, uma com JSON_BACKEND=stdlib e outra com o padrão (orjson
+quando instalado, ver requirements.txt).
+
+Uso:
+    python bench/bench_json.py                  # payloads capturados em bench/payloads
+    python bench/bench_json.py --dir gravacoes/ # outros payloads (.json)
+"""
+import argparse
+import glob
+import importlib.util
+import os
+import timeit
+
+PASTA_BENCH = os.path.dirname(os.path.abspath(__file__))
+PASTA_PADRAO = os.path.join(PASTA_BENCH, "payloads")
+ARQUIVO_CODEC = os.path.join(os.path.dirname(PASTA_BENCH), "json_codec.py")
+
+
+def _carregar_codec(backend: str):
+    """Instância própria do json_codec com JSON_BACKEND=backend ("" = padrão)."""
+    anterior = os.environ.get("JSON_BACKEND")
+    os.environ["JSON_BACKEND"] = backend
+    try:
+        spec = importlib.util.spec_from_file_location(f"json_codec_{backend or 'padrao'}", ARQUIVO_CODEC)
+        codec = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(codec)
+        return codec
+    finally:
+        if anterior is None:
+            os.environ.pop("JSON_BACKEND", None)
+        else:
+            os.environ["JSON_BACKEND"] = anterior
+
+
+def _ops_por_segundo(fn, arg, alvo_s: float) -> float:
+    # Calibra o número de repetições para rodar ~alvo_s segundos
+    n, tempo = timeit.Timer(lambda: fn(arg)).autorange()
+    total = max(n, int(n * alvo_s / max(tempo, 1e-9)))
+    melhor = min(timeit.repeat(lambda: fn(arg), number=total, repeat=3))
+    return total / melhor
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=PASTA_PADRAO, help="pasta com payloads .json")
+    parser.add_argument("--tempo", type=float, default=0.3, help="segundos por medição")
+    args = parser.parse_args()
+
+    arquivos = sorted(glob.glob(os.path.join(args.dir, "*.json")))
+    if not arquivos:
+        print(f"Nenhum payload .json em {args.dir}")
+        return
+    stdlib = _carregar_codec("stdlib")
+    padrao = _carregar_codec("")
+    if padrao.BACKEND == "stdlib":
+        print("⚠️ orjson não instalado: medindo apenas a stdlib (pip install -r requirements.txt)")
+        padrao = None
+
+    print(f"{'payload':<28} {'bytes':>8} {'op':<6} {'stdlib op/s':>12} {'orjson op/s':>12} {'ganho':>7}")
+    for caminho in arquivos:
+        with open(caminho, "rb") as f:
+            bruto = f.read()
+        obj = stdlib.loads(bruto)
+        nome = os.path.splitext(os.path.basename(caminho))[0]
+        for op, fn, arg in (("loads", "loads", bruto), ("dumps", "dumps_bytes", obj)):
+            std = _ops_por_segundo(getattr(stdlib, fn), arg, args.tempo)
+            if padrao:
+                orj = _ops_por_segundo(getattr(padrao, fn), arg, args.tempo)
+                print(f"{nome:<28} {len(bruto):>8} {op:<6} {std:>12,.0f} {orj:>12,.0f} {orj / std:>6.1f}x")
+            else:
+                print(f"{nome:<28} {len(bruto):>8} {op:<6} {std:>12,.0f} {'-':>12} {'-':>7}")
+
+
+if __name__ == "__main__":
+    main()
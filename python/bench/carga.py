@@ -0,0 +1,219 @@
+"""
+Gerador de carga: conversas sintéticas completas contra o App.py
+
+Cada cliente virtual percorre um pedido inteiro (saudação, cardápio, prato,
+endereço, pagamento PIX ou dinheiro, CPF/troco) com eventos messages.upsert,
+esperando a resposta de cada mensagem antes de mandar a próxima. Os clientes são
+distribuídos entre as rotas pedidas (/webhook e/ou /bot-simples).
+
+Relatório por rota: requisições, erros, vazão e latência p50/p95/p99/máx;
+a mensagem do CPF (que gera o PIX) aparece também em separado.
+
+Uso:
+    # App e mocks já rodando (ver bench/servidores_mock.py)
+    python bench/carga.py --alvo http://127.0.0.1:8001 --clientes 200 --concorrencia 20
+
+    # Sobe os mocks e o App.py apontado para eles, roda e derruba tudo
+    python bench/carga.py --subir --clientes 500 --concorrencia 50 --evolution-erro 0.01
+"""
+import argparse
+import os
+import queue
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import servidores_mock  # noqa: E402
+
+PASTA_APP = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+ROTAS = ("webhook", "bot-simples")
+
+
+def _evento(numero: str, texto: str, i: int) -> dict:
+    return {
+        "event": "messages.upsert",
+        "instance": "bench",
+        "data": {
+            "key": {"remoteJid": f"{numero}@s.whatsapp.net", "fromMe": False, "id": f"BENCH{numero}{i:03d}"},
+            "pushName": "Cliente Bench",
+            "message": {"conversation": texto},
+            "messageType": "conversation",
+            "messageTimestamp": int(time.time()),
+        },
+    }
+
+
+def _roteiro(aleatorio: random.Random, fracao_pix: float) -> List[Tuple[str, str]]:
+    """Mensagens de um pedido completo, com um rótulo para o relatório."""
+    pix = aleatorio.random() < fracao_pix
+    passos = [
+        ("oi", "texto"),
+        (aleatorio.choice(["1", "3"]), "texto"),  # "1" consulta o cardápio no Notion
+        (str(aleatorio.randint(1, 4)), "texto"),
+        (f"Rua {aleatorio.randint(1, 999)}, número {aleatorio.randint(1, 2000)}, bairro Centro", "texto"),
+    ]
+    if pix:
+        passos += [("1", "texto"), (aleatorio.choice(["não", "52998224725"]), "pix")]
+    else:
+        passos += [("2", "texto"), ("2", "texto")]
+    return passos
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, int(round(p / 100.0 * (len(ordenados) - 1))))]
+
+
+class Resultados:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias: Dict[str, List[float]] = {}
+        self.erros: Dict[str, int] = {}
+
+    def registrar(self, chave: str, segundos: float, ok: bool) -> None:
+        with self._lock:
+            self.latencias.setdefault(chave, []).append(segundos)
+            if not ok:
+                self.erros[chave] = self.erros.get(chave, 0) + 1
+
+    def imprimir(self, duracao: float) -> None:
+        print(f"\n{'rota':<22} {'req':>7} {'erros':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'máx ms':>8}")
+        for chave in sorted(self.latencias):
+            valores = self.latencias[chave]
+            print(
+                f"{chave:<22} {len(valores):>7} {self.erros.get(chave, 0):>6} {len(valores) / duracao:>8.1f}"
+                f" {_percentil(valores, 50) * 1000:>8.1f} {_percentil(valores, 95) * 1000:>8.1f}"
+                f" {_percentil(valores, 99) * 1000:>8.1f} {max(valores) * 1000:>8.1f}"
+            )
+
+
+def _cliente_virtual(sessao: requests.Session, alvo: str, rota: str, numero: str,
+                     roteiro: List[Tuple[str, str]], resultados: Resultados, timeout: float) -> None:
+    for i, (texto, rotulo) in enumerate(roteiro):
+        inicio = time.perf_counter()
+        ok = False
+        try:
+            resp = sessao.post(f"{alvo}/{rota}", json=_evento(numero, texto, i), timeout=timeout)
+            ok = resp.status_code == 200 and (resp.json() or {}).get("status") != "error"
+        except Exception:
+            pass
+        duracao = time.perf_counter() - inicio
+        resultados.registrar(f"/{rota}", duracao, ok)
+        if rotulo != "texto":
+            resultados.registrar(f"/{rota} ({rotulo})", duracao, ok)
+
+
+def executar(alvo: str, clientes: int, concorrencia: int, rotas: List[str], fracao_pix: float,
+             semente: int, timeout: float) -> Tuple[Resultados, float]:
+    aleatorio = random.Random(semente)
+    fila: "queue.Queue" = queue.Queue()
+    prefixo = aleatorio.randint(10, 99)
+    for i in range(clientes):
+        fila.put((rotas[i % len(rotas)], f"55{prefixo}9{i:08d}", _roteiro(aleatorio, fracao_pix)))
+    resultados = Resultados()
+
+    def trabalhador():
+        sessao = requests.Session()
+        while True:
+            try:
+                rota, numero, roteiro = fila.get_nowait()
+            except queue.Empty:
+                return
+            _cliente_virtual(sessao, alvo, rota, numero, roteiro, resultados, timeout)
+
+    inicio = time.perf_counter()
+    threads = [threading.Thread(target=trabalhador, daemon=True) for _ in range(concorrencia)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return resultados, time.perf_counter() - inicio
+
+
+def _subir_app(porta: int, porta_mocks: int, log: str, extra: Optional[Dict[str, str]] = None) -> subprocess.Popen:
+    ambiente = dict(os.environ)
+    ambiente.update(servidores_mock.variaveis_ambiente(porta_mocks))
+    ambiente.update({
+        "PORT": str(porta),
+        "APP_DEBUG": "0",
+        "OUTBOX_ARQUIVO": os.path.join(tempfile.gettempdir(), f"bench-outbox-{porta}.jsonl"),
+        "PYTHONUNBUFFERED": "1",
+    })
+    ambiente.update(extra or {})
+    saida = open(log, "ab")
+    processo = subprocess.Popen([sys.executable, "App.py"], cwd=PASTA_APP, env=ambiente, stdout=saida, stderr=subprocess.STDOUT)
+    limite = time.monotonic() + 30
+    while time.monotonic() < limite:
+        try:
+            if requests.get(f"http://127.0.0.1:{porta}/health", timeout=1).status_code == 200:
+                return processo
+        except requests.RequestException:
+            pass
+        if processo.poll() is not None:
+            break
+        time.sleep(0.2)
+    processo.kill()
+    raise SystemExit(f"App.py não subiu na porta {porta} (ver {log})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--alvo", default="http://127.0.0.1:8001")
+    parser.add_argument("--clientes", type=int, default=200, help="pedidos completos")
+    parser.add_argument("--concorrencia", type=int, default=20, help="clientes simultâneos")
+    parser.add_argument("--rotas", default="webhook,bot-simples", help=f"separadas por vírgula ({', '.join(ROTAS)})")
+    parser.add_argument("--fracao-pix", type=float, default=0.6, help="fração dos pedidos pagos com PIX")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--semente", type=int, default=7)
+    parser.add_argument("--subir", action="store_true", help="sobe os mocks e o App.py (porta --porta-app)")
+    parser.add_argument("--porta-app", type=int, default=18101)
+    parser.add_argument("--log-app", default=os.path.join(tempfile.gettempdir(), "bench-app.log"))
+    servidores_mock.adicionar_argumentos(parser)
+    args = parser.parse_args()
+
+    rotas = [r.strip().strip("/") for r in args.rotas.split(",") if r.strip()]
+    desconhecidas = [r for r in rotas if r not in ROTAS]
+    if desconhecidas:
+        parser.error(f"rotas desconhecidas: {desconhecidas}")
+
+    processo = None
+    servicos = {}
+    alvo = args.alvo.rstrip("/")
+    if args.subir:
+        c = servidores_mock.comportamentos(args)
+        servicos = servidores_mock.iniciar_todos(args.porta_base, c["evolution"], c["pix"], c["notion"])
+        processo = _subir_app(args.porta_app, args.porta_base, args.log_app)
+        alvo = f"http://127.0.0.1:{args.porta_app}"
+        print(f"App.py em {alvo} (log: {args.log_app})")
+
+    try:
+        print(f"{args.clientes} pedidos, {args.concorrencia} simultâneos, rotas {rotas}, PIX {args.fracao_pix:.0%}")
+        resultados, duracao = executar(alvo, args.clientes, args.concorrencia, rotas,
+                                       args.fracao_pix, args.semente, args.timeout)
+        total = sum(len(v) for k, v in resultados.latencias.items() if "(" not in k)
+        print(f"{total} requisições em {duracao:.1f}s ({total / duracao:.1f} req/s)")
+        resultados.imprimir(duracao)
+        for nome, servico in servicos.items():
+            print(f"mock {nome}: {servico.contagem}")
+    finally:
+        if processo is not None:
+            processo.terminate()
+            try:
+                processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+        for servico in servicos.values():
+            servico.parar()
+
+
+if __name__ == "__main__":
+    main()
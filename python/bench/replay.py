@@ -0,0 +1,233 @@
+"""
+Replay de uma gravação de tráfego (gravador.py) contra um App local
+
+Reinjeta os eventos gravados, na mesma rota em que chegaram, com:
+- o ritmo original (--velocidade 1, padrão),
+- N vezes mais rápido (--velocidade 10), ou
+- o mais rápido possível (--maximo), limitado por --concorrencia.
+
+Eventos do mesmo número vão sempre para o mesmo trabalhador, em ordem: a
+conversa de cada cliente é reproduzida como foi, mesmo com concorrência. As
+respostas do bot (campo "items" das rotas) são guardadas por número; com
+--saida elas vão para um JSON e --comparar mostra as diferenças contra uma
+execução anterior (código de saída 1 se houver). IDs e códigos PIX, que mudam a
+cada execução, são mascarados antes da comparação.
+
+O App guarda o estado das conversas: para comparar execuções, use --subir (mocks
+e App novos a cada replay) ou reinicie o App entre elas.
+
+Uso:
+    python bench/replay.py gravacoes-8001/ --subir --velocidade 5 --saida base.json
+    python bench/replay.py gravacoes-8001/ --subir --maximo --comparar base.json
+"""
+import argparse
+import difflib
+import json
+import os
+import queue
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+PASTA_BENCH = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, PASTA_BENCH)
+sys.path.insert(0, os.path.dirname(PASTA_BENCH))
+import servidores_mock  # noqa: E402
+from carga import Resultados, _percentil, _subir_app  # noqa: E402
+from gravador import ler_gravacao  # noqa: E402
+
+_NUMERO_JID = re.compile(r'(\d{10,15})(?::\d+)?@')
+_NUMERO_CAMPO = re.compile(r'"(?:number|sender)"\s*:\s*"\+?(\d{10,15})"')
+# Muda a cada execução: copia e cola (000201...), ids da AbacatePay e hashes/ids longos
+_VOLATEIS = re.compile(r"000201\S+|pix_char_\w+|\b[0-9a-fA-F]{16,}\b")
+
+
+def _chave(evento: dict) -> str:
+    """Número do remetente (primeiro JID do payload): define o trabalhador do evento."""
+    texto = json.dumps(evento["payload"], ensure_ascii=False)
+    achado = _NUMERO_JID.search(texto) or _NUMERO_CAMPO.search(texto)
+    return achado.group(1) if achado else ""
+
+
+def carregar(caminhos: List[str], limite: Optional[int] = None) -> List[dict]:
+    eventos = sorted(ler_gravacao(caminhos), key=lambda e: e.get("t", 0.0))
+    return eventos[:limite] if limite else eventos
+
+
+class Respostas:
+    """Respostas do bot por número, na ordem em que os eventos foram enviados."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.por_numero: Dict[str, List[str]] = {}
+
+    def registrar(self, chave: str, corpo: Optional[dict], status: int) -> None:
+        if status != 200 or not isinstance(corpo, dict):
+            respostas = [(chave, f"<http {status}>")]
+        elif corpo.get("status") == "ignored":
+            return
+        else:
+            respostas = []
+            for item in corpo.get("items") or []:
+                if not item:
+                    continue
+                if item.get("status") == "processed":
+                    respostas.append((item.get("number") or chave, item.get("reply") or ""))
+                elif item.get("status") in ("coalesced", "error"):
+                    respostas.append((item.get("number") or chave, f"<{item['status']}>"))
+        with self._lock:
+            for numero, texto in respostas:
+                self.por_numero.setdefault(numero, []).append(texto)
+
+
+def executar(alvo: str, eventos: List[dict], velocidade: float, maximo: bool, concorrencia: int,
+             timeout: float) -> Tuple[Resultados, Respostas, List[float], float]:
+    """Envia os eventos; retorna latências, respostas, atrasos em relação ao ritmo pedido e a duração."""
+    filas = [queue.Queue() for _ in range(max(1, concorrencia))]
+    resultados = Resultados()
+    respostas = Respostas()
+    atrasos: List[float] = []
+
+    def trabalhador(fila: "queue.Queue"):
+        sessao = requests.Session()
+        while True:
+            item = fila.get()
+            if item is None:
+                return
+            agendado, chave, evento = item
+            inicio = time.perf_counter()
+            atrasos.append(inicio - agendado)
+            rota = "/" + evento.get("rota", "webhook")
+            corpo, status = None, 0
+            try:
+                resp = sessao.post(alvo + rota, json=evento["payload"], timeout=timeout)
+                status = resp.status_code
+                corpo = resp.json()
+            except Exception:
+                pass
+            resultados.registrar(rota, time.perf_counter() - inicio, status == 200)
+            respostas.registrar(chave, corpo, status)
+
+    threads = [threading.Thread(target=trabalhador, args=(f,), daemon=True) for f in filas]
+    for t in threads:
+        t.start()
+    inicio = time.perf_counter()
+    t0 = eventos[0].get("t", 0.0) if eventos else 0.0
+    for evento in eventos:
+        agendado = inicio if maximo else inicio + (evento.get("t", t0) - t0) / velocidade
+        espera = agendado - time.perf_counter()
+        if espera > 0:
+            time.sleep(espera)
+        chave = _chave(evento)
+        filas[zlib.crc32(chave.encode()) % len(filas)].put((agendado, chave, evento))
+    for fila in filas:
+        fila.put(None)
+    for t in threads:
+        t.join()
+    return resultados, respostas, atrasos, time.perf_counter() - inicio
+
+
+def _normalizar(texto: str) -> str:
+    return _VOLATEIS.sub("<var>", texto)
+
+
+def comparar(anterior: Dict[str, List[str]], atual: Dict[str, List[str]], max_diferencas: int) -> int:
+    """Imprime as conversas que mudaram; retorna quantas."""
+    diferentes = 0
+    for numero in sorted(set(anterior) | set(atual)):
+        antes = [_normalizar(r) for r in anterior.get(numero, [])]
+        depois = [_normalizar(r) for r in atual.get(numero, [])]
+        if antes == depois:
+            continue
+        diferentes += 1
+        if diferentes <= max_diferencas:
+            print(f"\n--- {numero}")
+            for linha in difflib.unified_diff(antes, depois, "anterior", "atual", lineterm="", n=1):
+                print(linha.replace("\n", "\\n"))
+    if diferentes > max_diferencas:
+        print(f"\n... e mais {diferentes - max_diferencas} conversas diferentes")
+    return diferentes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("gravacoes", nargs="+", help="arquivos .jsonl.gz ou pastas do gravador")
+    parser.add_argument("--alvo", default="http://127.0.0.1:8001")
+    parser.add_argument("--velocidade", type=float, default=1.0, help="1 = ritmo original, 10 = 10x mais rápido")
+    parser.add_argument("--maximo", action="store_true", help="sem esperas: vazão máxima")
+    parser.add_argument("--concorrencia", type=int, default=20, help="trabalhadores (números em paralelo)")
+    parser.add_argument("--limite", type=int, default=0, help="só os primeiros N eventos")
+    parser.add_argument("--timeout", type=float, default=60.0)
+    parser.add_argument("--saida", help="grava as respostas do bot (JSON)")
+    parser.add_argument("--comparar", help="respostas de uma execução anterior (--saida)")
+    parser.add_argument("--max-diferencas", type=int, default=20, help="conversas diferentes mostradas")
+    parser.add_argument("--subir", action="store_true", help="sobe os mocks e o App.py (porta --porta-app)")
+    parser.add_argument("--porta-app", type=int, default=18102)
+    parser.add_argument("--log-app", default=os.path.join(tempfile.gettempdir(), "replay-app.log"))
+    servidores_mock.adicionar_argumentos(parser)
+    args = parser.parse_args()
+    if args.velocidade <= 0:
+        parser.error("--velocidade deve ser maior que zero")
+
+    eventos = carregar(args.gravacoes, args.limite or None)
+    if not eventos:
+        raise SystemExit("Nenhum evento nas gravações informadas")
+    janela = eventos[-1].get("t", 0.0) - eventos[0].get("t", 0.0)
+    modo = "máximo" if args.maximo else f"{args.velocidade:g}x"
+    print(f"{len(eventos)} eventos gravados em {janela:.1f}s, replay {modo}, {args.concorrencia} trabalhadores")
+
+    processo = None
+    servicos = {}
+    alvo = args.alvo.rstrip("/")
+    if args.subir:
+        c = servidores_mock.comportamentos(args)
+        servicos = servidores_mock.iniciar_todos(args.porta_base, c["evolution"], c["pix"], c["notion"])
+        # O App do replay não grava de novo o que está reproduzindo
+        processo = _subir_app(args.porta_app, args.porta_base, args.log_app, {"GRAVACAO": "0"})
+        alvo = f"http://127.0.0.1:{args.porta_app}"
+        print(f"App.py em {alvo} (log: {args.log_app})")
+
+    try:
+        resultados, respostas, atrasos, duracao = executar(
+            alvo, eventos, args.velocidade, args.maximo, args.concorrencia, args.timeout)
+    finally:
+        if processo is not None:
+            processo.terminate()
+            try:
+                processo.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                processo.kill()
+        for servico in servicos.values():
+            servico.parar()
+
+    print(f"{len(eventos)} eventos em {duracao:.1f}s ({len(eventos) / duracao:.1f} ev/s)")
+    if not args.maximo:
+        print(f"Atraso em relação ao ritmo pedido: p50 {_percentil(atrasos, 50) * 1000:.1f} ms,"
+              f" p95 {_percentil(atrasos, 95) * 1000:.1f} ms, máx {max(atrasos) * 1000:.1f} ms")
+    resultados.imprimir(duracao)
+
+    if args.saida:
+        with open(args.saida, "w", encoding="utf-8") as f:
+            json.dump({"gravacoes": args.gravacoes, "eventos": len(eventos), "modo": modo,
+                       "respostas": respostas.por_numero}, f, indent=1, ensure_ascii=False)
+        print(f"\nRespostas de {len(respostas.por_numero)} números salvas em {args.saida}")
+
+    if args.comparar:
+        with open(args.comparar, "r", encoding="utf-8") as f:
+            anterior = json.load(f).get("respostas", {})
+        diferentes = comparar(anterior, respostas.por_numero, args.max_diferencas)
+        if diferentes:
+            print(f"\n{diferentes} conversas com respostas diferentes")
+            sys.exit(1)
+        print(f"\nRespostas iguais às de {args.comparar} ({len(anterior)} números)")
+
+
+if __name__ == "__main__":
+    main()
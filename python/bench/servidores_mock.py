@@ -0,0 +1,294 @@
+"""
+Servidores locais que imitam Evolution API, AbacatePay e Notion (para teste de carga)
+
+Cada serviço sobe numa porta própria, com latência (média + variação) e injeção
+de erro (fração das requisições respondida com HTTP 500) configuráveis:
+
+    Evolution  (porta base)      POST /message/sendText/{instância}
+                                 POST /message/sendMedia/{instância}
+                                 GET  /instance/connectionState/{instância}, /health
+    AbacatePay (porta base + 1)  POST /v1/pixQrCode/create, GET /v1/pixQrCode/check
+    Notion     (porta base + 2)  POST /v1/search, GET /v1/pages/{id},
+                                 GET /v1/blocks/{id}/children (duas páginas, com filhos)
+
+Para apontar o App.py para eles:
+    EVOLUTION_API_URL=http://127.0.0.1:18080
+    ABACATEPAY_API_URL=http://127.0.0.1:18081/v1
+    NOTION_BASE_URL=http://127.0.0.1:18082
+
+Uso:
+    python bench/servidores_mock.py
+    python bench/servidores_mock.py --evolution-latencia-ms 80 --evolution-erro 0.02 --pix-latencia-ms 600
+"""
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlparse
+
+# QR Code "de mentira" com o tamanho de um real (~6 KB em base64)
+QR_BASE64 = "data:image/png;base64," + "iVBORw0KGgo" + "A" * 6000
+
+
+class Comportamento:
+    """Latência e erro injetados num serviço (alteráveis com o servidor rodando)."""
+
+    def __init__(self, latencia_ms: float = 0.0, variacao_ms: float = 0.0, taxa_erro: float = 0.0):
+        self.latencia_ms = latencia_ms
+        self.variacao_ms = variacao_ms
+        self.taxa_erro = taxa_erro
+
+    def esperar(self) -> None:
+        atraso = self.latencia_ms + random.uniform(-self.variacao_ms, self.variacao_ms)
+        if atraso > 0:
+            time.sleep(atraso / 1000.0)
+
+    def falhar(self) -> bool:
+        return self.taxa_erro > 0 and random.random() < self.taxa_erro
+
+
+class ServicoMock:
+    """Um serviço HTTP: rotas (método, prefixo) -> função(caminho, corpo) -> (status, json)."""
+
+    def __init__(self, nome: str, comportamento: Comportamento):
+        self.nome = nome
+        self.comportamento = comportamento
+        self.rotas: List[Tuple[str, str, Callable[[str, dict], Tuple[int, dict]]]] = []
+        self._lock = threading.Lock()
+        self.contagem: Dict[str, int] = {}
+        self.servidor: Optional[ThreadingHTTPServer] = None
+
+    def rota(self, metodo: str, prefixo: str):
+        def registrar(fn):
+            self.rotas.append((metodo, prefixo, fn))
+            return fn
+        return registrar
+
+    def _contar(self, chave: str) -> None:
+        with self._lock:
+            self.contagem[chave] = self.contagem.get(chave, 0) + 1
+
+    def _handler(self):
+        servico = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # keep-alive
+
+            def log_message(self, *args):
+                pass
+
+            def _responder(self, status: int, corpo: dict) -> None:
+                dados = json.dumps(corpo).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(dados)))
+                self.end_headers()
+                self.wfile.write(dados)
+
+            def _tratar(self, metodo: str) -> None:
+                tamanho = int(self.headers.get("Content-Length") or 0)
+                bruto = self.rfile.read(tamanho) if tamanho else b""
+                url = urlparse(self.path)
+                caminho = url.path
+                try:
+                    # GET: a query string (ex.: start_cursor) chega no lugar do corpo
+                    corpo = json.loads(bruto) if bruto else dict(parse_qsl(url.query))
+                except ValueError:
+                    corpo = {}
+                for metodo_rota, prefixo, fn in servico.rotas:
+                    if metodo_rota == metodo and caminho.startswith(prefixo):
+                        servico.comportamento.esperar()
+                        if servico.comportamento.falhar():
+                            servico._contar("erro_injetado")
+                            self._responder(500, {"error": "erro injetado pelo mock"})
+                            return
+                        servico._contar(prefixo)
+                        status, resposta = fn(caminho, corpo)
+                        self._responder(status, resposta)
+                        return
+                servico._contar("404")
+                self._responder(404, {"error": f"rota não simulada: {metodo} {caminho}"})
+
+            def do_GET(self):
+                self._tratar("GET")
+
+            def do_POST(self):
+                self._tratar("POST")
+
+        return Handler
+
+    def iniciar(self, porta: int, host: str = "127.0.0.1") -> "ServicoMock":
+        self.servidor = ThreadingHTTPServer((host, porta), self._handler())
+        self.servidor.daemon_threads = True
+        threading.Thread(target=self.servidor.serve_forever, name=f"mock-{self.nome}", daemon=True).start()
+        return self
+
+    def parar(self) -> None:
+        if self.servidor:
+            self.servidor.shutdown()
+            self.servidor.server_close()
+
+
+def criar_evolution(comportamento: Comportamento) -> ServicoMock:
+    servico = ServicoMock("evolution", comportamento)
+
+    @servico.rota("POST", "/message/sendText/")
+    def send_text(caminho, corpo):
+        return 201, {"key": {"id": uuid.uuid4().hex[:20].upper(), "remoteJid": f"{corpo.get('number')}@s.whatsapp.net"},
+                     "status": "PENDING"}
+
+    @servico.rota("POST", "/message/sendMedia/")
+    def send_media(caminho, corpo):
+        return 201, {"key": {"id": uuid.uuid4().hex[:20].upper()}, "status": "PENDING"}
+
+    @servico.rota("GET", "/instance/connectionState/")
+    def estado(caminho, corpo):
+        return 200, {"instance": {"instanceName": caminho.rsplit("/", 1)[-1], "state": "open"}}
+
+    @servico.rota("GET", "/")
+    def saude(caminho, corpo):
+        return 200, {"status": 200, "message": "mock evolution"}
+
+    return servico
+
+
+def criar_abacatepay(comportamento: Comportamento) -> ServicoMock:
+    servico = ServicoMock("abacatepay", comportamento)
+
+    @servico.rota("POST", "/v1/pixQrCode/create")
+    def criar(caminho, corpo):
+        pix_id = f"pix_char_{uuid.uuid4().hex[:16]}"
+        valor = int(corpo.get("amount") or 0)
+        return 200, {"data": {
+            "id": pix_id,
+            "amount": valor,
+            "status": "PENDING",
+            "brCode": f"00020101021226850014br.gov.bcb.pix2563{pix_id}5204000053039865406{valor / 100:.2f}5802BR",
+            "brCodeBase64": QR_BASE64,
+        }, "error": None}
+
+    @servico.rota("GET", "/v1/pixQrCode/check")
+    def checar(caminho, corpo):
+        return 200, {"data": {"status": "PENDING"}, "error": None}
+
+    return servico
+
+
+def criar_notion(comportamento: Comportamento) -> ServicoMock:
+    servico = ServicoMock("notion", comportamento)
+    # last_edited_time de todas as páginas: trocar com o mock rodando simula uma edição
+    servico.ultima_edicao = "2026-01-01T00:00:00.000Z"
+
+    def _texto(conteudo: str) -> dict:
+        return {"rich_text": [{"type": "text", "plain_text": conteudo, "text": {"content": conteudo}}]}
+
+    def _bloco(ident: str, tipo: str, conteudo: str, filhos: bool = False) -> dict:
+        return {"object": "block", "id": ident, "type": tipo, "has_children": filhos, tipo: _texto(conteudo)}
+
+    def _lista(resultados: list, proximo: Optional[str] = None) -> dict:
+        return {"object": "list", "has_more": proximo is not None, "next_cursor": proximo, "results": resultados}
+
+    @servico.rota("POST", "/v1/search")
+    def buscar(caminho, corpo):
+        consulta = (corpo.get("query") or "pagina").strip() or "pagina"
+        return 200, _lista([{
+            "object": "page",
+            "id": f"pg-{abs(hash(consulta)) % 10**8:08d}",
+            "last_edited_time": servico.ultima_edicao,
+            "properties": {"title": {"title": [{"plain_text": consulta}]}},
+        }])
+
+    @servico.rota("GET", "/v1/pages/")
+    def pagina(caminho, corpo):
+        return 200, {"object": "page", "id": caminho.rstrip("/").split("/")[-1],
+                     "last_edited_time": servico.ultima_edicao}
+
+    @servico.rota("GET", "/v1/blocks/")
+    def blocos(caminho, corpo):
+        bloco_id = caminho.split("/")[3]
+        if bloco_id == "b4":
+            return 200, _lista([
+                _bloco("b4a", "bulleted_list_item", "Camarão"),
+                _bloco("b4b", "bulleted_list_item", "Frango"),
+            ])
+        if corpo.get("start_cursor") == "pagina-2":
+            return 200, _lista([
+                _bloco("b4", "toggle", "Adicionais (R$ 8,00)", filhos=True),
+                _bloco("b5", "paragraph", "Entrega grátis acima de R$ 60"),
+            ])
+        return 200, _lista([
+            _bloco("b1", "heading_2", "Destaques da semana"),
+            _bloco("b2", "paragraph", "Moqueca de camarão com arroz e pirão - R$ 39,90"),
+            _bloco("b3", "paragraph", "Feijoada completa aos sábados - R$ 42,00"),
+        ], proximo="pagina-2")
+
+    return servico
+
+
+def iniciar_todos(porta_base: int = 18080, evolution: Optional[Comportamento] = None,
+                  pix: Optional[Comportamento] = None, notion: Optional[Comportamento] = None) -> Dict[str, ServicoMock]:
+    """Sobe os três serviços em porta_base, +1 e +2."""
+    return {
+        "evolution": criar_evolution(evolution or Comportamento()).iniciar(porta_base),
+        "abacatepay": criar_abacatepay(pix or Comportamento()).iniciar(porta_base + 1),
+        "notion": criar_notion(notion or Comportamento()).iniciar(porta_base + 2),
+    }
+
+
+def variaveis_ambiente(porta_base: int = 18080) -> Dict[str, str]:
+    """Ambiente para o App.py falar com os mocks."""
+    return {
+        "EVOLUTION_API_URL": f"http://127.0.0.1:{porta_base}",
+        "EVOLUTION_INSTANCE_NAME": "bench",
+        "API_KEY_EVOLUTION": "bench",
+        "ABACATEPAY_API_URL": f"http://127.0.0.1:{porta_base + 1}/v1",
+        "ABACATEPAY_API_KEY": "bench",
+        "NOTION_BASE_URL": f"http://127.0.0.1:{porta_base + 2}",
+        "NOTION_API_KEY": "bench",
+    }
+
+
+def adicionar_argumentos(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument("--porta-base", type=int, default=18080)
+    for servico, latencia in (("evolution", 30.0), ("pix", 300.0), ("notion", 120.0)):
+        parser.add_argument(f"--{servico}-latencia-ms", type=float, default=latencia)
+        parser.add_argument(f"--{servico}-variacao-ms", type=float, default=latencia / 3)
+        parser.add_argument(f"--{servico}-erro", type=float, default=0.0, help="fração respondida com HTTP 500")
+
+
+def comportamentos(args) -> Dict[str, Comportamento]:
+    return {
+        servico: Comportamento(
+            getattr(args, f"{servico}_latencia_ms"),
+            getattr(args, f"{servico}_variacao_ms"),
+            getattr(args, f"{servico}_erro"),
+        )
+        for servico in ("evolution", "pix", "notion")
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    adicionar_argumentos(parser)
+    args = parser.parse_args()
+    c = comportamentos(args)
+    servicos = iniciar_todos(args.porta_base, c["evolution"], c["pix"], c["notion"])
+    for nome, valor in variaveis_ambiente(args.porta_base).items():
+        print(f"{nome}={valor}")
+    print("Mocks no ar (Ctrl+C para parar)")
+    try:
+        while True:
+            time.sleep(5)
+    except KeyboardInterrupt:
+        pass
+    for nome, servico in servicos.items():
+        print(f"{nome}: {servico.contagem}")
+        servico.parar()
+
+
+if __name__ == "__main__":
+    main()
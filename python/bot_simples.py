@@ -9,13 +9,34 @@ Complementos:
 import re
 import os
 import random
-from typing import Dict, Optional
-import requests
+import time
+from typing import Dict, Optional, Tuple
 from dotenv import load_dotenv
-try:
-    from notion_client import Client
-except Exception:
-    Client = None
+import json_codec
+from cobrancas_pendentes import registro_cobrancas
+from conversa import (
+    CONFIRMANDO_PEDIDO,
+    ESCOLHENDO_PRATO,
+    FINALIZADO,
+    INICIO,
+    MENU_PRINCIPAL,
+    PEDINDO_CPF,
+    PEDINDO_ENDERECO,
+    PEDINDO_PAGAMENTO,
+    TROCO,
+    Conversa,
+    DadosPix,
+)
+from metricas import ChamadaExterna, registrar_cache
+from notion_sync import notion_instalado, novo_cliente_notion, sincronizador_notion
+from pools import PoolSaturado, pool_especulativo
+from prazo import RESERVA_RESPOSTA, Prazo, PrazoEsgotado, estourou, timeout_de
+from rastreamento import rastreado
+from saude import SAUDE_TIMEOUT_SEGUNDOS, monitor_saude
+
+# requests e notion_client são importados no primeiro uso (requests_http e
+# notion_sync.novo_cliente_notion): juntos passam de 150 ms e não são
+# necessários para o processo subir
 
 load_dotenv()
 NOTION_API_KEY = (
@@ -23,6 +44,101 @@ NOTION_API_KEY = (
     or os.getenv("Notion_API_Key")
     or os.getenv("notion_api_key")
 )
+# Raiz da API do Notion (ex.: servidor local do bench/servidores_mock.py)
+NOTION_BASE_URL = os.getenv("NOTION_BASE_URL", "").rstrip("/")
+
+
+_requests = None
+
+
+def requests_http():
+    """Módulo requests, importado na primeira chamada e guardado: um `import` dentro
+    de cada envio/sonda passaria pelo lock de importação a cada chamada.
+    """
+    global _requests
+    if _requests is None:
+        import requests
+        _requests = requests
+    return _requests
+
+
+def opcoes_notion(api_key: Optional[str]) -> Dict:
+    """Argumentos do notion_client.Client / AsyncClient (auth e, se definido, NOTION_BASE_URL)."""
+    opcoes = {"auth": api_key}
+    if NOTION_BASE_URL:
+        opcoes["base_url"] = NOTION_BASE_URL
+    return opcoes
+
+
+sincronizador_notion.configurar(NOTION_API_KEY, opcoes_notion(NOTION_API_KEY))
+
+# PIX especulativo: cria a cobrança em segundo plano assim que o cliente escolhe PIX,
+# enquanto ele ainda está respondendo a pergunta do CPF.
+PIX_ESPECULATIVO = os.getenv("PIX_ESPECULATIVO", "0").strip().lower() in ("1", "true", "sim", "on")
+
+ABACATEPAY_API_URL = os.getenv("ABACATEPAY_API_URL", "https://api.abacatepay.com/v1").rstrip("/")
+PIX_EXPIRACAO_SEGUNDOS = 3600  # 1 hora
+# A AbacatePay só é usada aqui via create/check (sem cancelamento): a cobrança
+# especulativa nasce curta para que, se for descartada (CPF real informado, pedido
+# mudou, conversa abandonada), vença sozinha logo em vez de ficar pagável por 1 hora.
+PIX_ESPECULATIVO_EXPIRACAO_SEGUNDOS = int(os.getenv("PIX_ESPECULATIVO_EXPIRACAO_SEGUNDOS", "900"))
+
+_NAO_DIGITOS = re.compile(r"[^0-9]")
+_NUMERO_PRATO = re.compile(r"[1-4]")
+
+
+def _abacatepay_api_key() -> Optional[str]:
+    return os.getenv("AbacatePay_API_Key") or os.getenv("ABACATEPAY_API_KEY")
+
+
+def consultar_status_pix(pix_id: str) -> Optional[str]:
+    """Consulta o status de uma cobrança na AbacatePay ("PENDING", "PAID", "EXPIRED"...)."""
+    api_key = _abacatepay_api_key()
+    if not api_key or not pix_id:
+        return None
+    with ChamadaExterna("abacatepay_status") as chamada:
+        resp = requests_http().get(
+            f"{ABACATEPAY_API_URL}/pixQrCode/check",
+            params={"id": pix_id},
+            headers={"Authorization": f"Bearer {api_key}"},
+            timeout=8,
+        )
+        chamada.ok = resp.status_code == 200
+    if resp.status_code != 200:
+        print(f"⚠️ Status PIX {pix_id}: HTTP {resp.status_code}")
+        return None
+    data = (json_codec.loads(resp.content) or {}).get("data") or {}
+    return (data.get("status") or "").upper() or None
+
+
+_cliente_sonda_notion = None
+
+
+def sondar_notion() -> Optional[Tuple[bool, Dict]]:
+    """Sonda do monitor de saúde (saude.py): uma busca de 1 resultado. None = não configurado."""
+    global _cliente_sonda_notion
+    if not NOTION_API_KEY or not notion_instalado():
+        return None
+    if _cliente_sonda_notion is None:
+        _cliente_sonda_notion = novo_cliente_notion(opcoes_notion(NOTION_API_KEY), SAUDE_TIMEOUT_SEGUNDOS)
+    resp = _cliente_sonda_notion.search(query="", page_size=1)
+    return True, {"resultados": len(resp.get("results", []) or [])}
+
+
+def sondar_abacatepay() -> Optional[Tuple[bool, Dict]]:
+    """Sonda do monitor de saúde: consulta uma cobrança inexistente. 404/400 provam que a API
+    responde e aceita a chave; 401/403 (chave recusada) e 5xx contam como falha.
+    """
+    api_key = _abacatepay_api_key()
+    if not api_key:
+        return None
+    resp = requests_http().get(
+        f"{ABACATEPAY_API_URL}/pixQrCode/check",
+        params={"id": "pix_char_sonda_saude"},
+        headers={"Authorization": f"Bearer {api_key}"},
+        timeout=SAUDE_TIMEOUT_SEGUNDOS,
+    )
+    return resp.status_code < 500 and resp.status_code not in (401, 403), {"code": resp.status_code}
 
 # CARDÁPIO FIXO
 CARDAPIO = {
@@ -32,23 +148,15 @@ CARDAPIO = {
     "4": {"nome": "Virado à Paulista", "preco": 3090},
 }
 
-# Estados da conversa
-ESTADOS = {
-    "INICIO": "inicio",
-    "MENU_PRINCIPAL": "menu_principal",
-    "ESCOLHENDO_PRATO": "escolhendo_prato",
-    "CONFIRMANDO_PEDIDO": "confirmando_pedido",
-    "PEDINDO_ENDERECO": "pedindo_endereco",
-    "PEDINDO_PAGAMENTO": "pedindo_pagamento",
-    "PEDINDO_CPF": "pedindo_cpf",
-    "TROCO": "troco",
-    "FINALIZADO": "finalizado",
-}
+# Estados em que o cliente digita texto livre (várias mensagens seguidas podem ser juntadas)
+ESTADOS_TEXTO_LIVRE = frozenset({PEDINDO_ENDERECO})
 
 class BotSimples:
     def __init__(self):
-        self.conversas = {}  # {numero: {estado, prato_escolhido, endereco, etc}}
+        self.conversas: Dict[str, Conversa] = {}  # {numero: Conversa (ver conversa.py)}
+        self.pix_especulativo = {}  # {numero: ((produto, valor_centavos), Future, criado_em)}
 
+    @rastreado("processar_mensagem")
     def processar_mensagem(self, numero: str, mensagem: str) -> str:
         """Processa mensagem do cliente e retorna resposta"""
         mensagem = mensagem.strip().lower()
@@ -60,85 +168,105 @@ class BotSimples:
         # Comando menu - voltar ao início de qualquer estado
         if mensagem in ["menu", "voltar", "inicio", "início"]:
             # Resetar conversa para o estado inicial
-            self.conversas[numero] = {
-                "estado": ESTADOS["INICIO"],
-                "prato": None,
-                "endereco": None,
-                "pagamento": None,
-                "cpf": None,
-            }
+            self._descartar_pix_especulativo(numero, "menu")
+            conv = self.conversas.get(numero)
+            if conv is None:
+                self.conversas[numero] = Conversa()
+            else:
+                conv.reiniciar(INICIO)
             return self._saudacao(numero)
 
         # Inicializar conversa se não existir
-        if numero not in self.conversas:
-            self.conversas[numero] = {
-                "estado": ESTADOS["INICIO"],
-                "prato": None,
-                "endereco": None,
-                "pagamento": None,
-                "cpf": None,
-            }
+        conv = self.conversas.get(numero)
+        if conv is None:
+            conv = self.conversas[numero] = Conversa()
 
-        estado_atual = self.conversas[numero]["estado"]
+        estado_atual = conv.estado
 
         # MÁQUINA DE ESTADOS
-        if estado_atual == ESTADOS["INICIO"]:
+        if estado_atual == INICIO:
             if mensagem:
-                self.conversas[numero]["estado"] = ESTADOS["MENU_PRINCIPAL"]
+                conv.estado = MENU_PRINCIPAL
                 return self._menu_principal(numero, mensagem)
             return self._saudacao(numero)
 
-        elif estado_atual == ESTADOS["MENU_PRINCIPAL"]:
+        elif estado_atual == MENU_PRINCIPAL:
             return self._menu_principal(numero, mensagem)
 
-        elif estado_atual == ESTADOS["ESCOLHENDO_PRATO"]:
+        elif estado_atual == ESCOLHENDO_PRATO:
             return self._escolher_prato(numero, mensagem)
 
-        elif estado_atual == ESTADOS["CONFIRMANDO_PEDIDO"]:
+        elif estado_atual == CONFIRMANDO_PEDIDO:
             return self._confirmar_pedido(numero, mensagem)
 
-        elif estado_atual == ESTADOS["PEDINDO_ENDERECO"]:
+        elif estado_atual == PEDINDO_ENDERECO:
             return self._pedir_endereco(numero, mensagem)
 
-        elif estado_atual == ESTADOS["PEDINDO_PAGAMENTO"]:
+        elif estado_atual == PEDINDO_PAGAMENTO:
             return self._pedir_pagamento(numero, mensagem)
 
-        elif estado_atual == ESTADOS["PEDINDO_CPF"]:
+        elif estado_atual == PEDINDO_CPF:
             return self._pedir_cpf(numero, mensagem)
 
-        elif estado_atual == ESTADOS["TROCO"]:
+        elif estado_atual == TROCO:
             return self._troco(numero, mensagem)
 
-        elif estado_atual == ESTADOS["FINALIZADO"]:
-            self.conversas[numero] = {
-                "estado": ESTADOS["MENU_PRINCIPAL"],
-                "prato": None,
-                "endereco": None,
-                "pagamento": None,
-                "cpf": None,
-            }
+        elif estado_atual == FINALIZADO:
+            conv.reiniciar(MENU_PRINCIPAL)
             return self._menu_principal(numero, mensagem)
 
         else:
             print(f"DEBUG: Estado inválido: {estado_atual}")
             return "Desculpe, algo deu errado. Digite 'menu' para recomeçar."
 
-    def processar_mensagem_com_pix(self, numero: str, mensagem: str) -> str:
+    def processar_mensagem_com_pix(self, numero: str, mensagem: str, prazo: Optional[Prazo] = None) -> str:
         """Processa mensagem e, quando o fluxo solicitar, gera o PIX automaticamente.
         - Se o retorno for 'GERAR_PIX:<numero>', chama gerar_pix e retorna a mensagem de pagamento.
         - Caso contrário, retorna a resposta normal do fluxo.
+        - Com prazo, o PIX usa só o tempo que resta; se estourar, devolve o cliente ao passo do CPF.
         """
         resposta = self.processar_mensagem(numero, mensagem)
         if resposta.startswith("GERAR_PIX:"):
-            try:
-                return self.gerar_pix(numero)
-            except Exception as e:
-                return f"❌ Falha ao gerar PIX: {e}"
+            return self.gerar_pix_ou_adiar(numero, prazo)
         return resposta
 
+    def gerar_pix_ou_adiar(self, numero: str, prazo: Optional[Prazo] = None) -> str:
+        """gerar_pix com as respostas de contingência (prazo esgotado ou falha)."""
+        try:
+            return self.gerar_pix(numero, prazo)
+        except PrazoEsgotado as e:
+            print(f"⏱️ {e} para {numero}")
+            return self.adiar_pix(numero, motivo="prazo")
+        except Exception as e:
+            return f"❌ Falha ao gerar PIX: {e}"
+
+    def aceita_texto_livre(self, numero: str) -> bool:
+        """True quando a próxima mensagem do número é texto livre (ex.: endereço)."""
+        conv = self.conversas.get(numero)
+        return conv is not None and conv.estado in ESTADOS_TEXTO_LIVRE
+
+    def adiar_pix(self, numero: str, motivo: str = "ocupado") -> str:
+        """PIX não saiu agora (pool cheio ou prazo esgotado): volta ao passo do CPF para o cliente tentar de novo."""
+        if numero in self.conversas:
+            self.conversas[numero].estado = PEDINDO_CPF
+        if motivo == "prazo":
+            return (
+                "⏳ O PIX está demorando mais que o normal.\n"
+                "Envie o CPF (ou 'não') de novo para tentar gerar outra vez."
+            )
+        if motivo == "indisponivel":
+            return (
+                "⚠️ O sistema de pagamento PIX está fora do ar no momento.\n"
+                "Envie o CPF (ou 'não') de novo em alguns minutos para gerar o seu."
+            )
+        return (
+            "⏳ Estamos gerando muitos PIX neste momento.\n"
+            "Envie o CPF (ou 'não') de novo em alguns instantes para gerar o seu."
+        )
+
     def _saudacao(self, numero: str) -> str:
         """Estado inicial"""
-        self.conversas[numero]["estado"] = ESTADOS["MENU_PRINCIPAL"]
+        self.conversas[numero].estado = MENU_PRINCIPAL
         return (
             "👋 E aí, amigo! Sou a Julia do Coco Bambu!\n"
 
@@ -153,36 +281,33 @@ class BotSimples:
         """Menu principal - Lógica corrigida conforme especificações"""
         if mensagem in ["1", "cardapio", "cardápio", "ver cardapio"]:
             # Opção 1: Mostra apenas o cardápio e vai para estado de escolha
-            self.conversas[numero]["estado"] = ESTADOS["ESCOLHENDO_PRATO"]
+            self.conversas[numero].estado = ESCOLHENDO_PRATO
             # Tentar buscar cardápio no Notion e complementar
-            notion_text = self._buscar_notion_texto("cardapio") or self._buscar_notion_texto("cardápio")
+            notion_text = self._buscar_notion_texto("cardapio")
             if notion_text:
                 return "🍽️ Cardápio (Notion):\n\n" + notion_text[:800] + "\n\n" + self._mostrar_cardapio()
             return self._mostrar_cardapio()
 
         elif mensagem in ["2", "promocoes", "promoções"]:
             # Opção 2: Mostra promoções depois mostra cardápio
-            notion_text = self._buscar_notion_texto("promoções") or self._buscar_notion_texto("promocoes")
+            notion_text = self._buscar_notion_texto("promocoes")
             if notion_text:
                 promo_msg = "📢 Promoções (Notion):\n\n" + notion_text[:800] + "\n\n"
             else:
                 promo_msg = "📢 Promoções da semana:\n- Compre 5, leve 6!\n\n"
             
             # Mostra promoções e depois vai para cardápio
-            self.conversas[numero]["estado"] = ESTADOS["ESCOLHENDO_PRATO"]
+            self.conversas[numero].estado = ESCOLHENDO_PRATO
             return promo_msg + self._mostrar_cardapio()
 
         elif mensagem in ["3", "ja sei", "já sei"]:
             # Opção 3: Pula direto para escolha de prato (mostra cardápio com preços)
-            self.conversas[numero]["estado"] = ESTADOS["ESCOLHENDO_PRATO"]
+            self.conversas[numero].estado = ESCOLHENDO_PRATO
             return "Ótimo! Aqui está nosso cardápio:\n\n" + self._mostrar_cardapio()
 
         elif mensagem in ["4", "informacoes", "informações", "info"]:
             # Opção 4: Mostra informações com opção de ver cardápio
-            notion_text = (
-                self._buscar_notion_texto("informações")
-                or self._buscar_notion_texto("informacoes")
-            )
+            notion_text = self._buscar_notion_texto("informacoes")
             if notion_text:
                 info_msg = "📍 Informações (Notion):\n\n" + notion_text[:800] + "\n\n"
             else:
@@ -193,7 +318,7 @@ class BotSimples:
                     "- Funcionamento: 11h-15h / 18h-22h\n\n"
                 )
             # Após mostrar informações, continua no menu principal e oferece opções
-            self.conversas[numero]["estado"] = ESTADOS["MENU_PRINCIPAL"]
+            self.conversas[numero].estado = MENU_PRINCIPAL
             return info_msg + "Quer ver o cardápio? Digite 1 para ver o cardápio.\nOu 2 para Promoções."
 
         else:
@@ -217,7 +342,7 @@ class BotSimples:
     def _escolher_prato(self, numero: str, mensagem: str) -> str:
         """Cliente escolhe prato - Vai direto para pedir endereço"""
         # Extrair número do prato (1-4)
-        match = re.search(r'[1-4]', mensagem)
+        match = _NUMERO_PRATO.search(mensagem)
         if not match:
             return "Escolha um número de 1 a 4:\n\n" + self._mostrar_cardapio()
 
@@ -227,10 +352,10 @@ class BotSimples:
             return "Número inválido! Escolha de 1 a 4:\n\n" + self._mostrar_cardapio()
 
         # Salvar escolha
-        self.conversas[numero]["prato"] = CARDAPIO[num_prato]
+        self.conversas[numero].prato = CARDAPIO[num_prato]
         
         # Vai direto para pedir endereço (sem confirmação)
-        self.conversas[numero]["estado"] = ESTADOS["PEDINDO_ENDERECO"]
+        self.conversas[numero].estado = PEDINDO_ENDERECO
 
         prato = CARDAPIO[num_prato]
         preco = prato["preco"] / 100
@@ -244,7 +369,7 @@ class BotSimples:
     def _confirmar_pedido(self, numero: str, mensagem: str) -> str:
         """Confirmação do pedido"""
         if mensagem in ["1", "sim", "s", "confirmo", "ok"]:
-            self.conversas[numero]["estado"] = ESTADOS["PEDINDO_ENDERECO"]
+            self.conversas[numero].estado = PEDINDO_ENDERECO
             return (
                 "Perfeito! ✅\n\n"
                 "Qual o endereço de entrega?\n"
@@ -252,8 +377,8 @@ class BotSimples:
             )
 
         elif mensagem in ["2", "nao", "não", "n", "cancelar"]:
-            self.conversas[numero]["estado"] = ESTADOS["ESCOLHENDO_PRATO"]
-            self.conversas[numero]["prato"] = None
+            self.conversas[numero].estado = ESCOLHENDO_PRATO
+            self.conversas[numero].prato = None
             return "Sem problemas! Vamos escolher outro:\n\n" + self._mostrar_cardapio()
 
         else:
@@ -268,8 +393,8 @@ class BotSimples:
         if len(mensagem) < 10:
             return "Por favor, me passe o endereço completo (rua, número, bairro)"
 
-        self.conversas[numero]["endereco"] = mensagem
-        self.conversas[numero]["estado"] = ESTADOS["PEDINDO_PAGAMENTO"]
+        self.conversas[numero].endereco = mensagem
+        self.conversas[numero].estado = PEDINDO_PAGAMENTO
 
         return (
             "Endereço anotado! 📍\n\n"
@@ -281,8 +406,9 @@ class BotSimples:
     def _pedir_pagamento(self, numero: str, mensagem: str) -> str:
         """Forma de pagamento"""
         if mensagem in ["1", "pix"]:
-            self.conversas[numero]["pagamento"] = "pix"
-            self.conversas[numero]["estado"] = ESTADOS["PEDINDO_CPF"]
+            self.conversas[numero].pagamento = "pix"
+            self.conversas[numero].estado = PEDINDO_CPF
+            self._iniciar_pix_especulativo(numero)
             return (
                 "Ótimo! Vou gerar o PIX pra você. 💰\n\n"
                 "Quer CPF na nota?\n"
@@ -290,8 +416,8 @@ class BotSimples:
             )
 
         elif mensagem in ["2", "dinheiro"]:
-            self.conversas[numero]["pagamento"] = "dinheiro"
-            self.conversas[numero]["estado"] = ESTADOS["TROCO"]
+            self.conversas[numero].pagamento = "dinheiro"
+            self.conversas[numero].estado = TROCO
             return (
                 "Beleza! Pagamento em dinheiro. 💵\n\n"
                 "Precisa de troco?\n"
@@ -309,17 +435,17 @@ class BotSimples:
     def _pedir_cpf(self, numero: str, mensagem: str) -> str:
         """Pede CPF (opcional)"""
         # Extrair CPF se fornecido
-        cpf = re.sub(r'[^0-9]', '', mensagem)
+        cpf = _NAO_DIGITOS.sub("", mensagem)
 
         if mensagem in ["nao", "não", "n", "sem cpf", "nenhum"]:
             cpf = ""
         elif cpf and len(cpf) == 11 and cpf_valido(cpf):
-            self.conversas[numero]["cpf"] = cpf
+            self.conversas[numero].cpf = cpf
         else:
             cpf = ""
 
         # Gerar PIX aqui
-        self.conversas[numero]["estado"] = ESTADOS["FINALIZADO"]
+        self.conversas[numero].estado = FINALIZADO
 
         # Sinalizar que precisa gerar PIX
         return f"GERAR_PIX:{numero}"
@@ -332,20 +458,20 @@ class BotSimples:
                 "_(Digite o valor)_"
             )
         elif mensagem in ["2", "nao", "não", "n"]:
-            self.conversas[numero]["estado"] = ESTADOS["FINALIZADO"]
+            self.conversas[numero].estado = FINALIZADO
             return self._finalizar_dinheiro(numero)
 
         # Se é um valor
         if any(c.isdigit() for c in mensagem):
-            self.conversas[numero]["troco"] = mensagem
-            self.conversas[numero]["estado"] = ESTADOS["FINALIZADO"]
+            self.conversas[numero].troco = mensagem
+            self.conversas[numero].estado = FINALIZADO
             return self._finalizar_dinheiro(numero)
 
         return "Digite [1] para sim ou [2] para não"
 
     def _finalizar_dinheiro(self, numero: str) -> str:
         """Finaliza pedido em dinheiro"""
-        prato = self.conversas[numero]["prato"]
+        prato = self.conversas[numero].prato
         return (
             "✅ *Pedido confirmado!*\n\n"
             f"📦 {prato['nome']}\n"
@@ -361,93 +487,128 @@ class BotSimples:
             return None
 
         conv = self.conversas[numero]
-        if not conv.get("prato"):
+        if not conv.prato:
             return None
 
         return {
-            "produto": conv["prato"]["nome"],
-            "valor_centavos": conv["prato"]["preco"],
+            "produto": conv.prato["nome"],
+            "valor_centavos": conv.prato["preco"],
             "cliente_nome": "Cliente",  # Pode extrair do WhatsApp
             "cliente_telefone": numero,
-            "cliente_cpf": conv.get("cpf", ""),
+            "cliente_cpf": conv.cpf,
         }
 
     def resetar_conversa(self, numero: str):
         """Reseta conversa do cliente"""
         if numero in self.conversas:
             del self.conversas[numero]
+        self._descartar_pix_especulativo(numero, "conversa resetada")
 
-    def _buscar_notion_texto(self, query: str) -> Optional[str]:
-        """Busca uma página no Notion e retorna texto concatenado dos blocos.
-        Requer NOTION_API_KEY e pacote notion-client instalados.
+    def _buscar_notion_texto(self, topico: str) -> Optional[str]:
+        """Texto da página do Notion do tópico ("cardapio", "promocoes", "informacoes"),
+        da cópia local mantida por notion_sync.py. Requer NOTION_API_KEY e notion-client.
         """
-        if not Client or not NOTION_API_KEY:
-            return None
-        try:
-            client = Client(auth=NOTION_API_KEY)
-            resp = client.search(query=query, filter={"property": "object", "value": "page"})
-            results = resp.get("results", [])
-            if not results:
-                return None
-            page_id = results[0].get("id")
-            blocks = client.blocks.children.list(block_id=page_id)
-            lines = []
-            for block in blocks.get("results", []):
-                btype = block.get("type")
-                content = block.get(btype, {})
-                rich = content.get("rich_text") or content.get("rich_text", [])
-                if btype.startswith("heading_"):
-                    text = "".join([t.get("plain_text", "") for t in content.get("rich_text", [])])
-                    if text.strip():
-                        lines.append(f"**{text.strip()}**")
-                elif btype == "paragraph":
-                    text = "".join([t.get("plain_text", "") for t in rich])
-                    if text.strip():
-                        lines.append(text.strip())
-            texto = "\n".join(lines).strip()
-            return texto or None
-        except Exception:
-            return None
+        return sincronizador_notion.texto(topico)
 
-    def gerar_pix(self, numero: str) -> str:
-        """Gera PIX via AbacatePay e retorna mensagem amigável com o código.
-        - Usa a variável de ambiente 'AbacatePay_API_Key' (ou 'ABACATEPAY_API_KEY').
-        - Inclui CPF (taxId) apenas se for válido para evitar erro 'Invalid taxId'.
+    def _iniciar_pix_especulativo(self, numero: str) -> None:
+        """Dispara em segundo plano a criação da cobrança assim que o PIX é escolhido.
+        O valor já é conhecido nesse ponto; o taxId usa um CPF gerado (o mesmo que
+        gerar_pix usaria sem CPF válido). Se o cliente informar um CPF válido, a
+        cobrança é recriada com o taxId real em gerar_pix.
         """
-        print(f"🔧 gerar_pix() chamado para número: {numero}")
-
+        if not PIX_ESPECULATIVO or not _abacatepay_api_key() or not monitor_saude.disponivel("abacatepay"):
+            return
+        self._limpar_pix_especulativo_vencido()
+        self._descartar_pix_especulativo(numero, "novo PIX especulativo")
         dados = self.obter_dados_pix(numero)
         if not dados:
-            print(f"❌ Dados do pedido não encontrados para {numero}")
-            return "❌ Não encontrei dados do pedido para gerar PIX. Volte ao menu e escolha um prato."
-
-        print(f"✅ Dados do pedido obtidos: {dados}")
-
-        api_key = (
-            os.getenv("AbacatePay_API_Key")
-            or os.getenv("ABACATEPAY_API_KEY")
-        )
-        if not api_key:
-            print("❌ API Key não encontrada")
-            return "❌ AbacatePay_API_Key não configurada no .env. Configure e tente novamente."
-
-        print(f"✅ API Key encontrada: {api_key[:10]}...")
+            return
+        chave = (dados["produto"], int(dados["valor_centavos"]))
+        try:
+            # Pool próprio: quem espera por esta cobrança (gerar_pix) já ocupa um worker de pagamentos
+            futuro = pool_especulativo.submeter(self._criar_cobranca_pix, dados, gerar_cpf_valido(), None,
+                                                PIX_ESPECULATIVO_EXPIRACAO_SEGUNDOS)
+        except PoolSaturado:
+            # Especulação é opcional: com o pool cheio, o PIX sai normalmente em gerar_pix
+            return
+        self.pix_especulativo[numero] = (chave, futuro, time.monotonic())
+        print(f"⚡ PIX especulativo iniciado para {numero}: {chave[0]} ({chave[1]} centavos)")
+
+    def _descartar_pix_especulativo(self, numero: str, motivo: str) -> None:
+        """Tira a cobrança especulativa do número (se houver). Ela não é oferecida a
+        ninguém e vence sozinha em PIX_ESPECULATIVO_EXPIRACAO_SEGUNDOS."""
+        especulativa = self.pix_especulativo.pop(numero, None)
+        if especulativa is None:
+            return
+        futuro = especulativa[1]
+
+        def _registrar(f):
+            cobranca = f.result() if not f.cancelled() and f.exception() is None else None
+            if cobranca and cobranca.get("ok"):
+                print(f"🗑️ PIX especulativo {cobranca.get('id')} de {numero} descartado ({motivo}): "
+                      f"vence sozinho em {PIX_ESPECULATIVO_EXPIRACAO_SEGUNDOS // 60} min")
+
+        futuro.add_done_callback(_registrar)
+
+    def _limpar_pix_especulativo_vencido(self) -> None:
+        """Conversas abandonadas depois de escolher PIX: descarta as entradas já vencidas."""
+        limite = time.monotonic() - PIX_ESPECULATIVO_EXPIRACAO_SEGUNDOS
+        for numero in [n for n, e in list(self.pix_especulativo.items()) if e[2] < limite]:
+            self._descartar_pix_especulativo(numero, "conversa abandonada")
+
+    def _usar_pix_especulativo(self, numero: str, dados: Dict, cliente_cpf: str, prazo: Optional[Prazo] = None) -> Optional[Dict]:
+        """Retorna a cobrança especulativa quando ela ainda serve para o pedido atual.
+        Descarta (retorna None) se o pedido mudou, se a criação falhou ou se o cliente
+        informou um CPF válido (nesse caso a cobrança precisa do taxId real).
+        """
+        especulativa = self.pix_especulativo.get(numero)
+        if not especulativa:
+            return None
+        chave, futuro, criado_em = especulativa
+        if cpf_valido(cliente_cpf):
+            print("🔁 CPF válido informado: recriando cobrança com o taxId real")
+            self._descartar_pix_especulativo(numero, "CPF real informado")
+            return None
+        if chave != (dados["produto"], int(dados["valor_centavos"])):
+            print("🔁 Pedido mudou desde o PIX especulativo: criando nova cobrança")
+            self._descartar_pix_especulativo(numero, "pedido mudou")
+            return None
+        if time.monotonic() - criado_em > PIX_ESPECULATIVO_EXPIRACAO_SEGUNDOS / 2:
+            # Metade do prazo já passou: o cliente receberia um PIX quase vencido
+            self._descartar_pix_especulativo(numero, "perto de vencer")
+            return None
+        self.pix_especulativo.pop(numero, None)
+        try:
+            cobranca = futuro.result(timeout=timeout_de(prazo, 15, "pix", RESERVA_RESPOSTA))
+        except PrazoEsgotado:
+            raise
+        except Exception as e:
+            if estourou(prazo, "pix", RESERVA_RESPOSTA):
+                raise PrazoEsgotado("pix") from e
+            print(f"⚠️ PIX especulativo falhou: {e}")
+            return None
+        if not cobranca.get("ok"):
+            print(f"⚠️ PIX especulativo retornou erro: {cobranca.get('erro')}")
+            return None
+        print(f"⚡ Usando PIX especulativo para {numero} (pronto: {futuro.done()})")
+        return cobranca
 
-        descricao = f"Marmiratria - {dados['produto']}"
+    def _requisicao_cobranca_pix(self, dados: Dict, cpf_para_envio: str,
+                                 expiracao: int = PIX_EXPIRACAO_SEGUNDOS) -> Tuple[str, bytes, Dict]:
+        """Monta (url, corpo, headers) da criação da cobrança na AbacatePay."""
         valor_centavos = int(dados["valor_centavos"])
-        cliente_nome = dados["cliente_nome"]
-        cliente_telefone = dados["cliente_telefone"]
-        cliente_cpf = re.sub(r"[^0-9]", "", dados.get("cliente_cpf", "") or "")
 
         # Monta payload básico
         payload = {
             "amount": valor_centavos,
-            "expiresIn": 3600,  # 1 hora
-            "description": descricao,
+            "expiresIn": expiracao,
+            "description": f"Marmiratria - {dados['produto']}",
             "customer": {
-                "name": cliente_nome,
-                "cellphone": cliente_telefone,
+                "name": dados["cliente_nome"],
+                "cellphone": dados["cliente_telefone"],
                 "email": "cliente@email.com",
+                # Sempre incluir taxId
+                "taxId": cpf_para_envio,
             },
             "metadata": {
                 "produto": dados["produto"],
@@ -455,79 +616,152 @@ class BotSimples:
             },
         }
 
-        # Sempre incluir taxId
-        cpf_para_envio = cliente_cpf if cpf_valido(cliente_cpf) else gerar_cpf_valido()
-        payload["customer"]["taxId"] = cpf_para_envio
-
         headers = {
-            "Authorization": f"Bearer {api_key}",
+            "Authorization": f"Bearer {_abacatepay_api_key()}",
             "Content-Type": "application/json",
         }
 
         print(f"📤 Enviando requisição para AbacatePay...")
         print(f"📦 Payload: {payload}")
+        return f"{ABACATEPAY_API_URL}/pixQrCode/create", json_codec.dumps_bytes(payload), headers
 
+    def _resultado_cobranca_pix(self, status_code: int, content: bytes, expira_em: float) -> Dict:
+        """Interpreta a resposta da AbacatePay (criação síncrona e nucleo.criar_cobranca_pix_async).
+        Retorna {"ok": True, "pix_code", "qr_base64", "id", "expira_em"} ou {"ok": False, "erro": mensagem};
+        expira_em (epoch) é o que o registro de cobranças usa como vencimento.
+        """
+        print(f"📥 Resposta recebida: Status {status_code}")
+
+        if status_code in (200, 201):
+            response_data = json_codec.loads(content)
+            print(f"📊 Resposta JSON completa: {response_data}")
+
+            # A resposta pode vir diretamente ou dentro de 'data'
+            data = response_data.get("data", response_data)
+
+            # Extrair campos da resposta da AbacatePay
+            # brCode = PIX copia e cola (texto)
+            # brCodeBase64 = QR Code em base64 (data URI)
+            return {
+                "ok": True,
+                "id": data.get("id"),
+                "pix_code": data.get("brCode") or data.get("qrCode") or data.get("pix_code"),
+                "qr_base64": data.get("brCodeBase64") or data.get("qrCodeUrl") or data.get("qr_code_url"),
+                "expira_em": expira_em,
+            }
+        # Tentar mostrar erro amigável
         try:
-            resp = requests.post(
-                "https://api.abacatepay.com/v1/pixQrCode/create",
-                json=payload,
-                headers=headers,
-                timeout=15,
-            )
-            print(f"📥 Resposta recebida: Status {resp.status_code}")
+            err = json_codec.loads(content)
+            msg = err.get("error") or err.get("message") or str(err)
+        except Exception:
+            msg = content.decode("utf-8", errors="replace")
+        return {"ok": False, "erro": f"❌ Erro ao criar PIX ({status_code}): {msg}"}
 
-            if resp.status_code in (200, 201):
-                response_data = resp.json()
-                print(f"📊 Resposta JSON completa: {response_data}")
+    def _criar_cobranca_pix(self, dados: Dict, cpf_para_envio: str, prazo: Optional[Prazo] = None,
+                            expiracao: int = PIX_EXPIRACAO_SEGUNDOS) -> Dict:
+        """Cria a cobrança PIX na AbacatePay (ver _resultado_cobranca_pix para o retorno).
+        Lança PrazoEsgotado quando quem interrompeu a chamada foi o prazo da mensagem.
+        """
+        requests = requests_http()
+        url, corpo, headers = self._requisicao_cobranca_pix(dados, cpf_para_envio, expiracao)
+        timeout = timeout_de(prazo, 15, "pix", RESERVA_RESPOSTA)
+        inicio = time.time()
+        try:
+            with ChamadaExterna("abacatepay_criar_pix") as chamada:
+                resp = requests.post(url, data=corpo, headers=headers, timeout=timeout)
+                chamada.ok = resp.status_code < 300
+            return self._resultado_cobranca_pix(resp.status_code, resp.content, inicio + expiracao)
+        except Exception as e:
+            if isinstance(e, requests.Timeout) and estourou(prazo, "pix", RESERVA_RESPOSTA):
+                raise PrazoEsgotado("pix") from e
+            return {"ok": False, "erro": f"❌ Erro de comunicação com AbacatePay: {e}"}
 
-                # A resposta pode vir diretamente ou dentro de 'data'
-                data = response_data.get("data", response_data)
+    def _preparar_pix(self, numero: str) -> Tuple[Optional[Dict], Optional[str]]:
+        """Confere pedido e API key. Retorna (dados, None) ou (None, mensagem de erro).
+        Em dados, 'cliente_cpf' vem só com dígitos.
+        """
+        dados = self.obter_dados_pix(numero)
+        if not dados:
+            print(f"❌ Dados do pedido não encontrados para {numero}")
+            return None, "❌ Não encontrei dados do pedido para gerar PIX. Volte ao menu e escolha um prato."
 
-                # Extrair campos da resposta da AbacatePay
-                # brCode = PIX copia e cola (texto)
-                # brCodeBase64 = QR Code em base64 (data URI)
-                pix_code = data.get("brCode") or data.get("qrCode") or data.get("pix_code")
-                qr_base64 = data.get("brCodeBase64") or data.get("qrCodeUrl") or data.get("qr_code_url")
+        print(f"✅ Dados do pedido obtidos: {dados}")
 
-                valor_reais = float(valor_centavos) / 100.0
+        api_key = _abacatepay_api_key()
+        if not api_key:
+            print("❌ API Key não encontrada")
+            return None, "❌ AbacatePay_API_Key não configurada no .env. Configure e tente novamente."
 
-                # Debug: verificar dados recebidos
-                print(f"🔍 Debug PIX - QR Base64: {qr_base64[:80] if qr_base64 else 'None'}...")
-                print(f"🔍 Debug PIX - Code: {pix_code[:50] if pix_code else 'None'}...")
+        print(f"✅ API Key encontrada: {api_key[:10]}...")
+        dados["cliente_cpf"] = _NAO_DIGITOS.sub("", dados.get("cliente_cpf", "") or "")
+        return dados, None
+
+    def _concluir_pix(self, numero: str, dados: Dict, cobranca: Dict) -> str:
+        """Guarda a cobrança criada na conversa e devolve a mensagem 1 (informações do PIX)."""
+        if not cobranca.get("ok"):
+            return cobranca["erro"]
+
+        pix_code = cobranca.get("pix_code")
+        qr_base64 = cobranca.get("qr_base64")
+        valor_reais = float(int(dados["valor_centavos"])) / 100.0
+
+        # Debug: verificar dados recebidos
+        print(f"🔍 Debug PIX - QR Base64: {qr_base64[:80] if qr_base64 else 'None'}...")
+        print(f"🔍 Debug PIX - Code: {pix_code[:50] if pix_code else 'None'}...")
+
+        # Mensagem 1: Informações do PIX
+        texto_info = (
+            "✅ *PIX gerado com sucesso!*\n\n"
+            f"📦 {dados['produto']}\n"
+            f"💰 Valor: R$ {valor_reais:.2f}\n\n"
+            "🔢 *Copia e Cola e QR Code:*"
+        )
 
-                # Mensagem 1: Informações do PIX
-                texto_info = (
-                    "✅ *PIX gerado com sucesso!*\n\n"
-                    f"📦 {dados['produto']}\n"
-                    f"💰 Valor: R$ {valor_reais:.2f}\n\n"
-                    "🔢 *Copia e Cola e QR Code:*"
-                )
+        # Salvar dados para enviar mensagens 2 e 3 separadamente
+        self.conversas[numero].pix = DadosPix(cobranca.get("id"), pix_code, qr_base64, enviar_pix=True)
 
-                # Salvar dados para enviar mensagens 2 e 3 separadamente
-                self.conversas[numero]["qr_base64"] = qr_base64
-                self.conversas[numero]["pix_code"] = pix_code
-                self.conversas[numero]["enviar_pix"] = True
+        # Acompanhar pagamento/expiração da cobrança
+        expira_em = cobranca.get("expira_em")
+        registro_cobrancas.registrar(cobranca.get("id"), numero,
+                                     expira_em - time.time() if expira_em else PIX_EXPIRACAO_SEGUNDOS)
 
-                print(f"✅ Dados salvos na conversa. enviar_pix={self.conversas[numero].get('enviar_pix')}")
-                print(f"✅ PIX Code length: {len(pix_code) if pix_code else 0}")
-                print(f"✅ QR Base64 length: {len(qr_base64) if qr_base64 else 0}")
+        print(f"✅ Dados salvos na conversa. enviar_pix={self.conversas[numero].pix.enviar_pix}")
+        print(f"✅ PIX Code length: {len(pix_code) if pix_code else 0}")
+        print(f"✅ QR Base64 length: {len(qr_base64) if qr_base64 else 0}")
 
-                return texto_info
-            else:
-                # Tentar mostrar erro amigável
-                try:
-                    err = resp.json()
-                    msg = err.get("error") or err.get("message") or str(err)
-                except Exception:
-                    msg = resp.text
-                return f"❌ Erro ao criar PIX ({resp.status_code}): {msg}"
-        except Exception as e:
-            return f"❌ Erro de comunicação com AbacatePay: {e}"
+        return texto_info
+
+    @rastreado("gerar_pix")
+    def gerar_pix(self, numero: str, prazo: Optional[Prazo] = None) -> str:
+        """Gera PIX via AbacatePay e retorna mensagem amigável com o código.
+        - Usa a variável de ambiente 'AbacatePay_API_Key' (ou 'ABACATEPAY_API_KEY').
+        - Inclui CPF (taxId) apenas se for válido para evitar erro 'Invalid taxId'.
+        - Com PIX_ESPECULATIVO ativo, reaproveita a cobrança criada em segundo plano.
+        - Com prazo, lança PrazoEsgotado se não der tempo (ver gerar_pix_ou_adiar).
+        - Com a AbacatePay fora do ar (saude.py), adia sem tentar.
+        """
+        print(f"🔧 gerar_pix() chamado para número: {numero}")
+
+        dados, erro = self._preparar_pix(numero)
+        if erro:
+            return erro
+        if not monitor_saude.disponivel("abacatepay"):
+            print(f"🩺 AbacatePay fora do ar: PIX de {numero} adiado")
+            return self.adiar_pix(numero, motivo="indisponivel")
+
+        cliente_cpf = dados["cliente_cpf"]
+        cobranca = self._usar_pix_especulativo(numero, dados, cliente_cpf, prazo)
+        if PIX_ESPECULATIVO:
+            registrar_cache("pix_especulativo", cobranca is not None)
+        if cobranca is None:
+            cpf_para_envio = cliente_cpf if cpf_valido(cliente_cpf) else gerar_cpf_valido()
+            cobranca = self._criar_cobranca_pix(dados, cpf_para_envio, prazo)
+        return self._concluir_pix(numero, dados, cobranca)
 
 
 def cpf_valido(cpf: str) -> bool:
     """Valida CPF (11 dígitos) com cálculo dos dígitos verificadores."""
-    cpf = re.sub(r"[^0-9]", "", cpf or "")
+    cpf = _NAO_DIGITOS.sub("", cpf or "")
     if len(cpf) != 11:
         return False
     if cpf == cpf[0] * 11:
@@ -0,0 +1,168 @@
+"""
+Janela de coalescência para mensagens em rajada do mesmo número
+
+Clientes quebram uma ideia em várias mensagens ("rua x", "número 12", "bairro y").
+Com COALESCENCIA_MS > 0, as mensagens de um número que chegam dentro da janela
+são juntadas num único lote antes de entrar na fila do número; o lote é então
+processado com juntar_texto_livre (ver App._encadear_mensagens), que funde as
+mensagens seguidas num único passo da máquina de estados quando o estado atual
+aceita texto livre (endereço). Menus continuam passo a passo.
+
+A janela é deslizante (debounce) e limitada por COALESCENCIA_MAX_MS desde a
+primeira mensagem. Na fusão vale a mesma regra pelo instante de chegada de cada
+mensagem (Prazo.inicio), ver fim_da_rajada: mensagens que só se acumularam na fila
+do número (chegaram espaçadas enquanto a anterior era processada) seguem separadas. Só atrasa números em estado de texto livre ou que já têm
+mensagens esperando, para não pôr latência nas respostas de menu.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+
+COALESCENCIA_MS = int(os.getenv("COALESCENCIA_MS", "0"))  # 0 = desligado
+COALESCENCIA_MAX_MS = int(os.getenv("COALESCENCIA_MAX_MS", str(max(COALESCENCIA_MS * 4, 1000))))
+
+
+def juntar_texto_livre(textos: List[str]) -> str:
+    """'rua x', 'número 12', 'bairro y' -> 'rua x, número 12, bairro y'."""
+    return ", ".join(t.strip() for t in textos if t and t.strip())
+
+
+def fim_da_rajada(mensagens: list, inicio: int, janela_s: float = COALESCENCIA_MS / 1000.0,
+                  espera_max_s: float = max(COALESCENCIA_MAX_MS, COALESCENCIA_MS) / 1000.0) -> int:
+    """Fim (exclusivo) da rajada que começa em mensagens[inicio]; itens (idx, texto, prazo).
+    Cada mensagem seguinte entra se chegou até janela_s depois da anterior e até
+    espera_max_s depois da primeira. Sem prazo (sem instante de chegada), não junta.
+    """
+    primeira = mensagens[inicio][2]
+    if janela_s <= 0 or primeira is None:
+        return inicio + 1
+    anterior = primeira.inicio
+    fim = inicio + 1
+    while fim < len(mensagens):
+        prazo = mensagens[fim][2]
+        if prazo is None or prazo.inicio - anterior > janela_s or prazo.inicio - primeira.inicio > espera_max_s:
+            break
+        anterior = prazo.inicio
+        fim += 1
+    return fim
+
+
+class _Pendente:
+    __slots__ = ("inicio", "disparo", "entradas")
+
+    def __init__(self, agora: float):
+        self.inicio = agora
+        self.disparo = agora
+        self.entradas: List[Tuple[list, Future]] = []
+
+
+class CoalescedorMensagens:
+    """Debounce por número. `processar(numero, mensagens)` recebe a lista juntada
+    (itens (idx, texto, prazo)) e retorna Future de uma lista de resultados com "index".
+    Cada chamador recebe de volta só os resultados dos seus itens, com o idx original.
+    """
+
+    def __init__(self, processar: Callable[[str, list], Future],
+                 janela_ms: int = COALESCENCIA_MS, espera_max_ms: int = COALESCENCIA_MAX_MS,
+                 deve_esperar: Callable[[str], bool] | None = None):
+        self.processar = processar
+        self.janela = janela_ms / 1000.0
+        self.espera_max = max(espera_max_ms, janela_ms) / 1000.0
+        self.deve_esperar = deve_esperar
+        self._cond = threading.Condition()
+        self._pendentes: Dict[str, _Pendente] = {}
+        self._agenda: list = []  # heap (instante, seq, numero)
+        self._seq = itertools.count()
+        self._thread = None
+        self.lotes = 0
+        self.mensagens_juntadas = 0
+
+    @property
+    def ativo(self) -> bool:
+        return self.janela > 0
+
+    def submeter(self, numero: str, mensagens: list) -> Future:
+        if not self.ativo:
+            return self.processar(numero, mensagens)
+        saida: Future = Future()
+        with self._cond:
+            pendente = self._pendentes.get(numero)
+            if pendente is None and (self.deve_esperar is None or self.deve_esperar(numero)):
+                pendente = self._pendentes[numero] = _Pendente(time.monotonic())
+            if pendente is not None:
+                agora = time.monotonic()
+                pendente.entradas.append((mensagens, saida))
+                pendente.disparo = min(agora + self.janela, pendente.inicio + self.espera_max)
+                heapq.heappush(self._agenda, (pendente.disparo, next(self._seq), numero))
+                self._garantir_thread()
+                self._cond.notify()
+                return saida
+        # Estado não aceita texto livre e nada esperando: segue direto
+        return self.processar(numero, mensagens)
+
+    def _garantir_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="coalescencia", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while True:
+                    agora = time.monotonic()
+                    if self._agenda and self._agenda[0][0] <= agora:
+                        _, _, numero = heapq.heappop(self._agenda)
+                        pendente = self._pendentes.get(numero)
+                        # Entradas antigas da agenda (janela foi estendida) são ignoradas
+                        if pendente is not None and pendente.disparo <= agora:
+                            del self._pendentes[numero]
+                            break
+                        continue
+                    self._cond.wait(self._agenda[0][0] - agora if self._agenda else None)
+            self._disparar(numero, pendente.entradas)
+
+    def _disparar(self, numero: str, entradas: List[Tuple[list, Future]]) -> None:
+        juntas = []
+        origem = []  # posição no lote juntado -> (futuro do chamador, idx original)
+        for mensagens, saida in entradas:
+            for idx, *resto in mensagens:
+                origem.append((saida, idx))
+                juntas.append((len(juntas), *resto))
+        self.lotes += 1
+        self.mensagens_juntadas += len(juntas)
+
+        def _repartir(f: Future):
+            erro = f.exception()
+            if erro is not None:
+                for _, saida in entradas:
+                    saida.set_exception(erro)
+                return
+            por_chamador: Dict[int, list] = {id(s): [] for _, s in entradas}
+            for item in f.result():
+                saida, idx = origem[item["index"]]
+                por_chamador[id(saida)].append({**item, "index": idx})
+            for _, saida in entradas:
+                saida.set_result(por_chamador[id(saida)])
+
+        try:
+            futuro = self.processar(numero, juntas)
+        except BaseException as e:
+            for _, saida in entradas:
+                saida.set_exception(e)
+            return
+        futuro.add_done_callback(_repartir)
+
+    def status(self) -> Dict[str, float]:
+        with self._cond:
+            esperando = len(self._pendentes)
+        return {
+            "janela_ms": round(self.janela * 1000),
+            "espera_max_ms": round(self.espera_max * 1000),
+            "numeros_esperando": esperando,
+            "lotes": self.lotes,
+            "mensagens": self.mensagens_juntadas,
+        }
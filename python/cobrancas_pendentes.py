@@ -0,0 +1,296 @@
+"""
+Registro de cobranças PIX pendentes
+
+- Roda de temporização hierárquica (4 níveis x 64 posições, tick de 1 s):
+  inserir, cancelar e expirar em O(1), mesmo com dezenas de milhares de cobranças.
+- Consulta de status em lotes na AbacatePay (rodízio, concorrência limitada), fora
+  da thread da roda: uma rodada lenta não atrasa as expirações. O tamanho da
+  rodada acompanha o número de pendentes, para cada cobrança ser consultada ao
+  menos uma vez em COBRANCAS_TTL_REFERENCIA (até COBRANCAS_LOTE_MAX por rodada;
+  acima disso, aviso no log e "polling_atrasado" no status).
+- Callbacks de pagamento/expiração para avisar o cliente e limpar a conversa.
+"""
+import math
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+BITS_POR_NIVEL = 6
+POSICOES = 1 << BITS_POR_NIVEL  # 64
+MASCARA = POSICOES - 1
+NIVEIS = 4  # 64^4 ticks (~194 dias com tick de 1 s)
+
+
+class CobrancaPendente:
+    """Entrada mínima da roda (sem __dict__)."""
+    __slots__ = ("id", "numero", "tick", "nivel", "posicao")
+
+    def __init__(self, id: str, numero: str, tick: int):
+        self.id = id
+        self.numero = numero
+        self.tick = tick
+        self.nivel = -1
+        self.posicao = -1
+
+
+class RodaTemporizacao:
+    """Roda de temporização hierárquica. Não é thread-safe (o registro trava por fora)."""
+
+    def __init__(self, tick_atual: int):
+        self.atual = tick_atual
+        # Cada posição é um dict {id: CobrancaPendente} para cancelamento O(1)
+        self.niveis: List[List[Dict[str, CobrancaPendente]]] = [
+            [{} for _ in range(POSICOES)] for _ in range(NIVEIS)
+        ]
+        self.excedente: Dict[str, CobrancaPendente] = {}
+
+    def _colocar(self, item: CobrancaPendente) -> None:
+        tick = max(item.tick, self.atual)
+        for nivel in range(NIVEIS):
+            deslocamento = BITS_POR_NIVEL * (nivel + 1)
+            # Menor nível em que o tick e o "agora" compartilham os bits superiores
+            if (tick >> deslocamento) == (self.atual >> deslocamento):
+                posicao = (tick >> (BITS_POR_NIVEL * nivel)) & MASCARA
+                self.niveis[nivel][posicao][item.id] = item
+                item.nivel, item.posicao = nivel, posicao
+                return
+        self.excedente[item.id] = item
+        item.nivel, item.posicao = NIVEIS, -1
+
+    def inserir(self, item: CobrancaPendente) -> None:
+        # Vencimentos no passado expiram no próximo tick
+        if item.tick <= self.atual:
+            item.tick = self.atual + 1
+        self._colocar(item)
+
+    def remover(self, item: CobrancaPendente) -> None:
+        if item.nivel == NIVEIS:
+            self.excedente.pop(item.id, None)
+        elif item.nivel >= 0:
+            self.niveis[item.nivel][item.posicao].pop(item.id, None)
+        item.nivel = item.posicao = -1
+
+    def avancar_ate(self, tick_alvo: int) -> List[CobrancaPendente]:
+        """Avança tick a tick até tick_alvo e retorna as entradas vencidas."""
+        vencidas: List[CobrancaPendente] = []
+        while self.atual < tick_alvo:
+            self.atual += 1
+            if self.atual & ((1 << (BITS_POR_NIVEL * NIVEIS)) - 1) == 0 and self.excedente:
+                pendentes, self.excedente = self.excedente, {}
+                for item in pendentes.values():
+                    self._colocar(item)
+            # Cascata: do nível mais alto para o mais baixo, nas fronteiras do tick atual
+            for nivel in range(NIVEIS - 1, 0, -1):
+                if self.atual & ((1 << (BITS_POR_NIVEL * nivel)) - 1) == 0:
+                    posicao = (self.atual >> (BITS_POR_NIVEL * nivel)) & MASCARA
+                    balde = self.niveis[nivel][posicao]
+                    if balde:
+                        self.niveis[nivel][posicao] = {}
+                        for item in balde.values():
+                            self._colocar(item)
+            posicao = self.atual & MASCARA
+            balde = self.niveis[0][posicao]
+            if balde:
+                self.niveis[0][posicao] = {}
+                for item in balde.values():
+                    item.nivel = item.posicao = -1
+                vencidas.extend(balde.values())
+        return vencidas
+
+
+class RegistroCobrancas:
+    """Acompanha cobranças PIX abertas até o pagamento ou a expiração.
+
+    - verificar_status(id) -> "PAID" | "EXPIRED" | "PENDING" | None (erro)
+    - ao_pagar(numero, id) / ao_expirar(numero, id): chamados uma única vez por cobrança
+    """
+
+    def __init__(self, tick_s: float = 1.0, intervalo_polling: float = 20.0, lote: int = 50,
+                 lote_max: int = 200, ttl_referencia: float = 900.0, concorrencia: int = 4):
+        self.tick_s = tick_s
+        self.intervalo_polling = intervalo_polling
+        self.lote = lote  # mínimo por rodada
+        self.lote_max = max(lote, lote_max)
+        self.ttl_referencia = ttl_referencia
+        self.ultimo_lote = 0
+        self.polling_atrasado = False
+        self.verificar_status: Optional[Callable[[str], Optional[str]]] = None
+        self.ao_pagar: Optional[Callable[[str, str], None]] = None
+        self.ao_expirar: Optional[Callable[[str, str], None]] = None
+        self._lock = threading.Lock()
+        self._roda = RodaTemporizacao(self._tick_agora())
+        self._pendentes: Dict[str, CobrancaPendente] = {}
+        self._rodizio: deque = deque()  # ids para consulta em lote (remoção preguiçosa)
+        self._no_rodizio: set = set()  # ids presentes em _rodizio (sem duplicatas)
+        self._executor = ThreadPoolExecutor(max_workers=concorrencia, thread_name_prefix="cobrancas")
+        # Rodada de consulta em lote: uma por vez, fora da thread da roda e do _executor
+        # (a rodada espera as consultas que ela mesma põe no _executor)
+        self._executor_lote = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cobrancas-lote")
+        self._rodada: Optional[Future] = None
+        self._thread: Optional[threading.Thread] = None
+        self.pagas = 0
+        self.expiradas = 0
+
+    def _tick_agora(self) -> int:
+        return int(time.monotonic() / self.tick_s)
+
+    def configurar(self, verificar_status=None, ao_pagar=None, ao_expirar=None) -> None:
+        self.verificar_status = verificar_status or self.verificar_status
+        self.ao_pagar = ao_pagar or self.ao_pagar
+        self.ao_expirar = ao_expirar or self.ao_expirar
+
+    def registrar(self, id: str, numero: str, expira_em_s: float) -> None:
+        """Registra uma cobrança aberta que vence em expira_em_s segundos."""
+        if not id:
+            return
+        item = CobrancaPendente(id, numero, self._tick_agora() + int(expira_em_s / self.tick_s) + 1)
+        with self._lock:
+            antigo = self._pendentes.pop(id, None)
+            if antigo:
+                self._roda.remover(antigo)
+            self._roda.inserir(item)
+            self._pendentes[id] = item
+            self._entrar_no_rodizio(id)
+        self.iniciar()
+
+    def _entrar_no_rodizio(self, id: str) -> None:
+        """Chamado com o lock: um id entra no rodízio uma única vez."""
+        if id not in self._no_rodizio:
+            self._no_rodizio.add(id)
+            self._rodizio.append(id)
+
+    def remover(self, id: str) -> Optional[CobrancaPendente]:
+        with self._lock:
+            item = self._pendentes.pop(id, None)
+            if item:
+                self._roda.remover(item)
+            return item
+
+    def __len__(self) -> int:
+        return len(self._pendentes)
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "pendentes": len(self._pendentes),
+                "pagas": self.pagas,
+                "expiradas": self.expiradas,
+                "ultimo_lote": self.ultimo_lote,
+                "lote_max": self.lote_max,
+                "polling_atrasado": self.polling_atrasado,
+            }
+
+    def iniciar(self) -> None:
+        """Inicia (uma vez) a thread que avança a roda e consulta os status."""
+        if self._thread and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._loop, name="registro-cobrancas", daemon=True)
+            self._thread.start()
+
+    def _loop(self) -> None:
+        proxima_consulta = time.monotonic() + self.intervalo_polling
+        while True:
+            time.sleep(self.tick_s)
+            try:
+                with self._lock:
+                    vencidas = self._roda.avancar_ate(self._tick_agora())
+                    for item in vencidas:
+                        self._pendentes.pop(item.id, None)
+                for item in vencidas:
+                    self._executor.submit(self._finalizar_vencida, item)
+                if time.monotonic() >= proxima_consulta:
+                    proxima_consulta = time.monotonic() + self.intervalo_polling
+                    # Rodada anterior ainda em andamento: esta é pulada
+                    if self._rodada is None or self._rodada.done():
+                        self._rodada = self._executor_lote.submit(self.consultar_lote)
+            except Exception as e:
+                print(f"⚠️ Erro no registro de cobranças: {e}")
+
+    def _finalizar_vencida(self, item: CobrancaPendente) -> None:
+        # Última consulta antes de expirar: o pagamento pode ter caído no último segundo
+        status = self._consultar(item.id)
+        if status == "PAID":
+            self._notificar_pagamento(item)
+        else:
+            with self._lock:
+                self.expiradas += 1
+            print(f"⏳ Cobrança {item.id} expirada ({item.numero})")
+            if self.ao_expirar:
+                self.ao_expirar(item.numero, item.id)
+
+    def _notificar_pagamento(self, item: CobrancaPendente) -> None:
+        with self._lock:
+            self.pagas += 1
+        print(f"💸 Cobrança {item.id} paga ({item.numero})")
+        if self.ao_pagar:
+            self.ao_pagar(item.numero, item.id)
+
+    def _consultar(self, id: str) -> Optional[str]:
+        if not self.verificar_status:
+            return None
+        try:
+            return self.verificar_status(id)
+        except Exception as e:
+            print(f"⚠️ Falha ao consultar status da cobrança {id}: {e}")
+            return None
+
+    def _tamanho_rodada(self, pendentes: int) -> int:
+        """Ids por rodada para passar por todas as pendentes dentro de ttl_referencia,
+        entre `lote` e `lote_max`. Chamado com o lock.
+        """
+        necessario = math.ceil(pendentes * self.intervalo_polling / self.ttl_referencia)
+        atrasado = necessario > self.lote_max
+        if atrasado and not self.polling_atrasado:
+            print(f"⚠️ {pendentes} cobranças pendentes pedem {necessario} consultas a cada "
+                  f"{self.intervalo_polling:g}s (máx. {self.lote_max}, COBRANCAS_LOTE_MAX): "
+                  f"parte delas só será vista na expiração")
+        self.polling_atrasado = atrasado
+        return min(max(self.lote, necessario), self.lote_max)
+
+    def consultar_lote(self) -> int:
+        """Consulta uma rodada do rodízio em paralelo (ver _tamanho_rodada). Retorna quantas foram consultadas."""
+        if not self.verificar_status:
+            return 0
+        lote: List[str] = []
+        with self._lock:
+            tamanho = self.ultimo_lote = self._tamanho_rodada(len(self._pendentes))
+            while self._rodizio and len(lote) < tamanho:
+                id = self._rodizio.popleft()
+                self._no_rodizio.discard(id)
+                if id in self._pendentes:
+                    lote.append(id)
+        if not lote:
+            return 0
+        for id, status in zip(lote, self._executor.map(self._consultar, lote)):
+            if status == "PAID":
+                item = self.remover(id)
+                if item:
+                    self._executor.submit(self._notificar_pagamento, item)
+            elif status == "EXPIRED":
+                item = self.remover(id)
+                if item:
+                    with self._lock:
+                        self.expiradas += 1
+                    if self.ao_expirar:
+                        self._executor.submit(self.ao_expirar, item.numero, item.id)
+            else:
+                with self._lock:
+                    if id in self._pendentes:
+                        self._entrar_no_rodizio(id)
+        return len(lote)
+
+
+# Instância global
+registro_cobrancas = RegistroCobrancas(
+    intervalo_polling=float(os.getenv("COBRANCAS_INTERVALO_POLLING", "20")),
+    lote=int(os.getenv("COBRANCAS_LOTE", "50")),
+    lote_max=int(os.getenv("COBRANCAS_LOTE_MAX", "200")),
+    ttl_referencia=float(os.getenv("COBRANCAS_TTL_REFERENCIA", "900")),
+    concorrencia=int(os.getenv("COBRANCAS_CONCORRENCIA", "4")),
+)
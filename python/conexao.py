@@ -0,0 +1,232 @@
+"""
+Estado da conexão da instância na Evolution e pausa dos envios
+
+Os eventos connection.update (state: open / connecting / close) alimentam o
+EstadoInstancia. Enquanto a sessão do WhatsApp não está "open", a
+FilaSaidaPausavel guarda os envios em vez de disparar chamadas que só dariam
+timeout (12-20 s cada): a fila é limitada (CONEXAO_BUFFER_MAX, descarta a mais
+antiga) e cada item expira após CONEXAO_BUFFER_TTL segundos. Na reconexão, a
+fila é drenada em ritmo controlado (CONEXAO_DRENAGEM_POR_SEGUNDO), preservando
+a ordem: enquanto houver itens guardados, os envios novos entram no fim da fila.
+
+Se o "open" não chegar por evento, uma sonda periódica consulta o estado da
+instância enquanto ela estiver fora do ar.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, Optional
+
+CONEXAO_BUFFER_MAX = int(os.getenv("CONEXAO_BUFFER_MAX", "1000"))
+CONEXAO_BUFFER_TTL = float(os.getenv("CONEXAO_BUFFER_TTL", "300"))
+CONEXAO_DRENAGEM_POR_SEGUNDO = float(os.getenv("CONEXAO_DRENAGEM_POR_SEGUNDO", "5"))
+CONEXAO_SONDA_SEGUNDOS = float(os.getenv("CONEXAO_SONDA_SEGUNDOS", "15"))
+
+DESCONHECIDO = "desconhecido"
+ABERTO = "open"
+# API da Evolution sem resposta (conexão recusada/timeout no monitor de saúde, saude.py):
+# envios pausados como numa queda. Qualquer resposta HTTP da API (sonda ou envio) desfaz.
+INACESSIVEL = "inacessivel"
+
+
+def estado_do_evento(payload: Any) -> Optional[str]:
+    """Extrai o estado de um connection.update ({"data": {"state": "open"}} e variações)."""
+    if not isinstance(payload, dict):
+        return None
+    data = payload.get("data")
+    for fonte in (data if isinstance(data, dict) else {}, payload):
+        estado = fonte.get("state") or fonte.get("connection")
+        if isinstance(estado, str) and estado.strip():
+            return estado.strip().lower()
+    return None
+
+
+class EstadoInstancia:
+    """Último estado conhecido da instância. Sem nenhum evento, assume conectada."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.estado = DESCONHECIDO
+        self.desde = time.time()
+        self.transicoes = 0
+        self.eventos = 0
+        self._ouvintes: list[Callable[[str, str], None]] = []
+
+    def conectado(self) -> bool:
+        return self.estado in (ABERTO, DESCONHECIDO)
+
+    def ao_mudar(self, fn: Callable[[str, str], None]) -> None:
+        self._ouvintes.append(fn)
+
+    def atualizar(self, estado: Optional[str], origem: str = "evento") -> bool:
+        """Registra o estado; retorna True se mudou (e avisa os ouvintes)."""
+        if not estado:
+            return False
+        with self._lock:
+            self.eventos += 1
+            anterior = self.estado
+            if estado == anterior:
+                return False
+            self.estado = estado
+            self.desde = time.time()
+            self.transicoes += 1
+        print(f"🔌 Instância: {anterior} -> {estado} ({origem})")
+        for fn in self._ouvintes:
+            try:
+                fn(anterior, estado)
+            except Exception as e:
+                print(f"⚠️ Erro ao notificar mudança de conexão: {e}")
+        return True
+
+    def alcancada(self, origem: str) -> bool:
+        """A API respondeu (qualquer HTTP): sai de INACESSIVEL para DESCONHECIDO (envios liberados)."""
+        if self.estado != INACESSIVEL:
+            return False
+        return self.atualizar(DESCONHECIDO, origem=origem)
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "estado": self.estado,
+            "conectado": self.conectado(),
+            "desde": self.desde,
+            "ha_segundos": round(time.time() - self.desde, 1),
+            "transicoes": self.transicoes,
+            "eventos": self.eventos,
+        }
+
+
+class FilaSaidaPausavel:
+    """Guarda envios enquanto a instância está fora e os drena na reconexão.
+    `submeter(fn, *args)` é quem efetivamente agenda o envio (ex.: pool_envios.submeter).
+    `sondar()` (opcional) retorna o estado atual consultado na Evolution.
+    `descartar(fn, args, motivo)` (opcional) é avisado dos itens que saem sem envio
+    (expirados ou empurrados pela fila cheia).
+    """
+
+    def __init__(self, estado: EstadoInstancia, max_itens: int = CONEXAO_BUFFER_MAX,
+                 ttl: float = CONEXAO_BUFFER_TTL, por_segundo: float = CONEXAO_DRENAGEM_POR_SEGUNDO,
+                 intervalo_sonda: float = CONEXAO_SONDA_SEGUNDOS):
+        self.estado = estado
+        self.max_itens = max_itens
+        self.ttl = ttl
+        self.intervalo = 1.0 / por_segundo if por_segundo > 0 else 0.0
+        self.intervalo_sonda = intervalo_sonda
+        self.submeter: Optional[Callable[..., Any]] = None
+        self.sondar: Optional[Callable[[], Optional[str]]] = None
+        self.descartar: Optional[Callable[[Callable, tuple, str], Any]] = None
+        self._cond = threading.Condition()
+        self._itens: deque = deque()  # (expira, fn, args)
+        self._thread = None
+        self.guardados = 0
+        self.drenados = 0
+        self.expirados = 0
+        self.descartados_cheia = 0
+        estado.ao_mudar(self._ao_mudar)
+
+    def configurar(self, submeter: Callable[..., Any], sondar: Optional[Callable[[], Optional[str]]] = None,
+                   descartar: Optional[Callable[[Callable, tuple, str], Any]] = None) -> None:
+        self.submeter = submeter
+        self.sondar = sondar
+        self.descartar = descartar
+
+    def _avisar_descarte(self, item: tuple, motivo: str) -> None:
+        if self.descartar is None:
+            return
+        try:
+            self.descartar(item[1], item[2], motivo)
+        except Exception as e:
+            print(f"⚠️ Aviso de descarte da fila de saída falhou: {e}")
+
+    def tentar_guardar(self, fn: Callable, *args) -> bool:
+        """True se o envio foi guardado (instância fora ou fila ainda drenando).
+        False quando o chamador deve enviar agora.
+        """
+        with self._cond:
+            if self.estado.conectado() and not self._itens:
+                return False
+            if len(self._itens) >= self.max_itens:
+                self._avisar_descarte(self._itens.popleft(), "fila_cheia")
+                self.descartados_cheia += 1
+            self._itens.append((time.monotonic() + self.ttl, fn, args))
+            self.guardados += 1
+            self._garantir_thread()
+            self._cond.notify()
+            return True
+
+    def _ao_mudar(self, anterior: str, novo: str) -> None:
+        with self._cond:
+            if not self.estado.conectado():
+                # Fora do ar: a thread passa a sondar a instância
+                self._garantir_thread()
+            self._cond.notify()
+
+    def _garantir_thread(self) -> None:
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="saida-pausavel", daemon=True)
+            self._thread.start()
+
+    def _proximo(self):
+        """Próximo item válido para drenar (ou None), descartando os expirados."""
+        agora = time.monotonic()
+        while self._itens:
+            item = self._itens.popleft()
+            if item[0] > agora:
+                return item
+            self.expirados += 1
+            self._avisar_descarte(item, "ttl")
+        return None
+
+    def _loop(self) -> None:
+        ultima_sonda = time.monotonic()
+        while True:
+            with self._cond:
+                while self.estado.conectado() and not self._itens:
+                    self._cond.wait()
+                if not self.estado.conectado():
+                    espera = max(0.0, ultima_sonda + self.intervalo_sonda - time.monotonic())
+                    self._cond.wait(espera if self.sondar else None)
+                    item = None
+                else:
+                    item = self._proximo()
+            if not self.estado.conectado():
+                if self.sondar and time.monotonic() - ultima_sonda >= self.intervalo_sonda:
+                    ultima_sonda = time.monotonic()
+                    try:
+                        self.estado.atualizar(self.sondar(), origem="sonda")
+                    except Exception as e:
+                        print(f"⚠️ Sonda de conexão falhou: {e}")
+                continue
+            if item is None:
+                continue
+            _, fn, args = item
+            try:
+                self.submeter(fn, *args)
+                self.drenados += 1
+            except Exception as e:
+                # Pool de envios cheio: devolve o item para a frente da fila e espera
+                print(f"⚠️ Drenagem adiada: {e}")
+                with self._cond:
+                    self._itens.appendleft(item)
+                time.sleep(max(self.intervalo, 0.5))
+                continue
+            if self.intervalo:
+                time.sleep(self.intervalo)
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            na_fila = len(self._itens)
+        return {
+            "na_fila": na_fila,
+            "max_itens": self.max_itens,
+            "ttl_segundos": self.ttl,
+            "drenagem_por_segundo": round(1.0 / self.intervalo, 2) if self.intervalo else None,
+            "guardados": self.guardados,
+            "drenados": self.drenados,
+            "expirados": self.expirados,
+            "descartados_fila_cheia": self.descartados_cheia,
+        }
+
+
+estado_instancia = EstadoInstancia()
+saida_pausavel = FilaSaidaPausavel(estado_instancia)
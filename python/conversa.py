@@ -0,0 +1,148 @@
+"""
+Registro compacto de conversa do bot_simples
+
+Cada número tinha um dict (estado, prato, endereco, pagamento, cpf, troco, e os
+dados do PIX), recriado a cada "menu"/fim de pedido. Com dezenas de milhares de
+clientes residentes, isso pesa. Aqui:
+
+- Conversa usa __slots__ (sem __dict__) e é reaproveitada no reinício.
+- O estado é um código inteiro pequeno (INICIO, MENU_PRINCIPAL, ...; os ints
+  pequenos são compartilhados pelo interpretador). NOMES_ESTADOS traduz para o
+  nome antigo quando necessário.
+- prato aponta para o item do CARDAPIO (mesmo objeto, sem cópia).
+- Os dados do PIX (copia e cola e QR Code em base64, alguns KB) ficam fora da
+  linha, num DadosPix que só existe depois que um PIX é gerado e é liberado
+  quando o QR Code já foi enviado.
+
+A Conversa mantém a API de dict usada no App.py (conv.get("enviar_pix"),
+conv["prato"], conv.pop("qr_base64"), ...).
+"""
+from typing import Any, Dict, Optional
+
+NOMES_ESTADOS = (
+    "inicio",
+    "menu_principal",
+    "escolhendo_prato",
+    "confirmando_pedido",
+    "pedindo_endereco",
+    "pedindo_pagamento",
+    "pedindo_cpf",
+    "troco",
+    "finalizado",
+)
+(
+    INICIO,
+    MENU_PRINCIPAL,
+    ESCOLHENDO_PRATO,
+    CONFIRMANDO_PEDIDO,
+    PEDINDO_ENDERECO,
+    PEDINDO_PAGAMENTO,
+    PEDINDO_CPF,
+    TROCO,
+    FINALIZADO,
+) = range(len(NOMES_ESTADOS))
+
+# Nome em maiúsculas -> código (ESTADOS["PEDINDO_CPF"] == PEDINDO_CPF)
+ESTADOS: Dict[str, int] = {nome.upper(): codigo for codigo, nome in enumerate(NOMES_ESTADOS)}
+CODIGO_ESTADO: Dict[str, int] = {nome: codigo for codigo, nome in enumerate(NOMES_ESTADOS)}
+
+_CAMPOS = frozenset(("prato", "endereco", "pagamento", "cpf", "troco"))
+_CAMPOS_PIX = frozenset(("pix_id", "pix_code", "qr_base64", "enviar_pix"))
+_SEM_PADRAO = object()
+
+
+class DadosPix:
+    """Cobrança gerada para a conversa (a parte volumosa, fora da Conversa)."""
+
+    __slots__ = ("pix_id", "pix_code", "qr_base64", "enviar_pix")
+
+    def __init__(self, pix_id: Optional[str] = None, pix_code: Optional[str] = None,
+                 qr_base64: Optional[str] = None, enviar_pix: bool = False):
+        self.pix_id = pix_id
+        self.pix_code = pix_code
+        self.qr_base64 = qr_base64
+        self.enviar_pix = enviar_pix
+
+    def vazio(self) -> bool:
+        return not (self.pix_id or self.pix_code or self.qr_base64 or self.enviar_pix)
+
+
+class Conversa:
+    """Estado de um cliente no fluxo de pedido."""
+
+    __slots__ = ("estado", "prato", "endereco", "pagamento", "cpf", "troco", "pix")
+
+    def __init__(self, estado: int = INICIO):
+        self.reiniciar(estado)
+
+    def reiniciar(self, estado: int = INICIO) -> None:
+        """Volta ao começo do fluxo (menu ou pedido finalizado), sem realocar."""
+        self.estado = estado
+        self.prato: Optional[Dict[str, Any]] = None
+        self.endereco: Optional[str] = None
+        self.pagamento: Optional[str] = None
+        self.cpf: Optional[str] = None
+        self.troco: Optional[str] = None
+        self.pix: Optional[DadosPix] = None
+
+    @property
+    def nome_estado(self) -> str:
+        return NOMES_ESTADOS[self.estado]
+
+    # ------------------------------------------------------------------
+    # API de dict (compatibilidade com o formato antigo)
+    # ------------------------------------------------------------------
+
+    def get(self, chave: str, padrao: Any = None) -> Any:
+        if chave == "estado":
+            return NOMES_ESTADOS[self.estado]
+        if chave in _CAMPOS:
+            return getattr(self, chave)
+        if chave in _CAMPOS_PIX and self.pix is not None:
+            valor = getattr(self.pix, chave)
+            return padrao if valor is None else valor
+        return padrao
+
+    def __getitem__(self, chave: str) -> Any:
+        if chave not in _CAMPOS and chave not in _CAMPOS_PIX and chave != "estado":
+            raise KeyError(chave)
+        return self.get(chave)
+
+    def __setitem__(self, chave: str, valor: Any) -> None:
+        if chave == "estado":
+            self.estado = CODIGO_ESTADO[valor] if isinstance(valor, str) else valor
+        elif chave in _CAMPOS:
+            setattr(self, chave, valor)
+        elif chave in _CAMPOS_PIX:
+            if self.pix is None:
+                self.pix = DadosPix()
+            setattr(self.pix, chave, valor)
+        else:
+            raise KeyError(chave)
+
+    def __contains__(self, chave: str) -> bool:
+        return self.get(chave) is not None
+
+    def pop(self, chave: str, padrao: Any = _SEM_PADRAO) -> Any:
+        """Remove um campo, como dict.pop: campo vazio (ou "estado", que não sai)
+        retorna o padrão e, sem padrão, lança KeyError.
+        Sem copia e cola, QR Code nem id, o DadosPix é liberado.
+        """
+        valor = self.get(chave) if chave != "estado" else None
+        if valor is None:
+            if padrao is _SEM_PADRAO:
+                raise KeyError(chave)
+            return padrao
+        if chave in _CAMPOS_PIX:
+            setattr(self.pix, chave, False if chave == "enviar_pix" else None)
+            if self.pix.vazio():
+                self.pix = None
+        else:
+            setattr(self, chave, None)
+        return valor
+
+    def __repr__(self) -> str:
+        return (
+            f"Conversa(estado={self.nome_estado!r}, prato={(self.prato or {}).get('nome')!r}, "
+            f"pagamento={self.pagamento!r}, pix={self.pix is not None})"
+        )
@@ -0,0 +1,275 @@
+"""
+Dispatcher com hash consistente de números para workers do App.py
+
+O estado das conversas (bot_simples) vive em memória em cada processo. Para usar
+todos os núcleos sem um store compartilhado, cada número normalizado é mapeado
+num anel de hash consistente (com nós virtuais) para um único worker, onde a
+conversa fica residente. Adicionar/remover um worker move só ~1/N dos números.
+
+Uso:
+    python dispatcher.py --workers 4                 # sobe 4 App.py (portas 8101..8104)
+    WORKERS_URLS=http://h1:8001,http://h2:8001 python dispatcher.py   # workers externos
+
+Rotas:
+    POST /webhook, /process-event, /<evento>  -> itens agrupados por número e repassados
+                                                (connection.update vai para todos os workers)
+    POST /bot-simples                          -> repassado ao dono do número
+    GET  /anel                                 -> workers e fatia do anel de cada um
+    POST /anel {"adicionar": url} | {"remover": url}
+"""
+import argparse
+import bisect
+import hashlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from flask import Flask, jsonify, request
+
+import json_codec
+from nucleo import _coletar_itens, _normalize_number, extract_text_and_number
+from extracao_streaming import CorpoGrandeDemais, verificar_tamanho_declarado
+from filtro_eventos import contador_descartes, deve_ignorar, ler_corpo_filtrado, normalizar_evento
+
+NOS_VIRTUAIS = int(os.getenv("ANEL_NOS_VIRTUAIS", "160"))
+
+
+def _hash(chave: str) -> int:
+    return int.from_bytes(hashlib.blake2b(chave.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class AnelHash:
+    """Anel de hash consistente com nós virtuais.
+    Pontos e donos ficam numa única tupla trocada de uma vez na reconstrução, então
+    dono()/fatias() leem sem lock um anel sempre coerente.
+    """
+
+    def __init__(self, nos: list[str] | None = None, nos_virtuais: int = NOS_VIRTUAIS):
+        self.nos_virtuais = nos_virtuais
+        self._lock = threading.Lock()
+        self._anel: tuple[tuple[int, ...], tuple[str, ...]] = ((), ())  # (pontos, donos)
+        self.nos: set[str] = set()
+        for no in nos or []:
+            self.adicionar(no)
+
+    def _reconstruir(self) -> None:
+        pares = sorted(
+            (_hash(f"{no}#{i}"), no) for no in self.nos for i in range(self.nos_virtuais)
+        )
+        self._anel = (tuple(p for p, _ in pares), tuple(n for _, n in pares))
+
+    def adicionar(self, no: str) -> None:
+        with self._lock:
+            if no not in self.nos:
+                self.nos.add(no)
+                self._reconstruir()
+
+    def remover(self, no: str) -> None:
+        with self._lock:
+            if no in self.nos:
+                self.nos.discard(no)
+                self._reconstruir()
+
+    def dono(self, chave: str) -> str | None:
+        pontos, donos = self._anel
+        if not pontos:
+            return None
+        i = bisect.bisect(pontos, _hash(chave))
+        return donos[i % len(donos)]
+
+    def fatias(self) -> dict[str, float]:
+        """Fração do espaço de hash atribuída a cada nó."""
+        pontos, donos = self._anel
+        if not pontos:
+            return {}
+        total = 1 << 64
+        fatias = {no: 0 for no in set(donos)}
+        for i, ponto in enumerate(pontos):
+            anterior = pontos[i - 1] if i else pontos[-1] - total
+            fatias[donos[i]] += ponto - anterior
+        return {no: round(v / total, 4) for no, v in fatias.items()}
+
+
+def chave_do_numero(numero: str) -> str:
+    """Chave de roteamento: número normalizado (ou o id bruto, ex.: usuários 'web-')."""
+    return _normalize_number(numero) or str(numero)
+
+
+app = Flask(__name__)
+anel = AnelHash()
+_sessao = requests.Session()
+_executor = ThreadPoolExecutor(max_workers=int(os.getenv("DISPATCHER_THREADS", "32")), thread_name_prefix="repasse")
+_fora_do_anel: set[str] = set()
+
+
+def _repassar(worker: str, caminho: str, payload) -> dict:
+    resp = _sessao.post(
+        f"{worker}{caminho}",
+        data=json_codec.dumps_bytes(payload),
+        headers={"Content-Type": "application/json"},
+        timeout=60,
+    )
+    return json_codec.loads(resp.content) if resp.content else {}
+
+
+def _repassar_com_failover(chave: str, caminho: str, payload) -> dict:
+    """Repassa ao dono; se o worker estiver fora, tira do anel e tenta o próximo dono.
+    Outras falhas (timeout, resposta que não é JSON, ex.: 502 do proxy) viram o erro
+    só deste repasse: o worker pode ter processado, então não há nova tentativa.
+    """
+    for _ in range(max(1, len(anel.nos))):
+        worker = anel.dono(chave)
+        if not worker:
+            break
+        try:
+            return _repassar(worker, caminho, payload)
+        except requests.ConnectionError as e:
+            print(f"⚠️ Worker {worker} indisponível ({e}); removendo do anel")
+            anel.remover(worker)
+            _fora_do_anel.add(worker)
+        except (requests.RequestException, ValueError) as e:
+            print(f"⚠️ Falha no repasse para {worker}{caminho}: {e}")
+            return {"status": "error", "message": f"{worker}: {e}"}
+    return {"status": "error", "message": "nenhum worker disponível"}
+
+
+def _difundir(caminho: str, payload) -> dict:
+    """Repassa a todos os workers (eventos sem número, ex.: connection.update)."""
+    def enviar(worker: str):
+        try:
+            return worker, _repassar(worker, caminho, payload)
+        except (requests.RequestException, ValueError) as e:
+            return worker, {"status": "error", "message": str(e)}
+    return {"status": "success", "workers": dict(_executor.map(enviar, sorted(anel.nos)))}
+
+
+@app.route('/webhook', methods=['POST'])
+@app.route('/process-event', methods=['POST'])
+@app.route('/<path:endpoint>', methods=['POST'])
+def despachar(endpoint: str = "webhook"):
+    try:
+        verificar_tamanho_declarado(request.content_length)
+        descartado, corpo = ler_corpo_filtrado(request.stream, endpoint)
+        if descartado:
+            return jsonify({"status": "ignored", "event": descartado}), 200
+        payload = json_codec.loads(corpo) if corpo and corpo.strip() else {}
+    except CorpoGrandeDemais as e:
+        return jsonify({"status": "error", "message": str(e)}), 413
+    except ValueError:
+        payload = {}
+
+    if isinstance(payload, dict) and 'event' not in payload:
+        payload['event'] = endpoint.strip().lower().replace('-', '.')
+    if isinstance(payload, dict) and deve_ignorar(payload.get('event')):
+        contador_descartes.registrar(payload.get('event'))
+        return jsonify({"status": "ignored", "event": payload.get('event')}), 200
+    if isinstance(payload, dict) and normalizar_evento(payload.get('event')) == 'connection.update':
+        return jsonify(_difundir('/process-event', payload)), 200
+
+    # Agrupar itens por dono, preservando a ordem de chegada
+    itens = _coletar_itens(payload)
+    status_itens: list[dict | None] = [None] * len(itens)
+    grupos: dict[str, list[int]] = {}
+    for idx, (event_type, entry) in enumerate(itens):
+        _, number = extract_text_and_number(event_type, entry)
+        if not number:
+            status_itens[idx] = {"index": idx, "status": "skipped"}
+            continue
+        grupos.setdefault(chave_do_numero(number), []).append(idx)
+
+    def enviar(chave: str, indices: list[int]):
+        sub_lote = [{"event": itens[i][0], "data": itens[i][1]} for i in indices]
+        return indices, _repassar_com_failover(chave, '/process-event', sub_lote)
+
+    for indices, resposta in _executor.map(lambda kv: enviar(*kv), grupos.items()):
+        itens_worker = resposta.get("items") or []
+        erro = {"status": "error", "message": resposta["message"]} if resposta.get("message") else {"status": "error"}
+        for pos, idx in enumerate(indices):
+            item = dict(itens_worker[pos]) if pos < len(itens_worker) and itens_worker[pos] else dict(erro)
+            item["index"] = idx
+            status_itens[idx] = item
+
+    processados = [i for i in status_itens if i and i.get("status") == "processed"]
+    return jsonify({
+        "status": "success",
+        "processed": bool(processados),
+        "reply": processados[-1].get("reply") if processados else None,
+        "number": processados[-1].get("number") if processados else None,
+        "items": status_itens,
+    }), 200
+
+
+@app.route('/bot-simples', methods=['POST'])
+def despachar_bot_simples():
+    payload = request.get_json(force=True, silent=True) or {}
+    numero = None
+    for event_type, entry in _coletar_itens(payload):
+        _, numero = extract_text_and_number(event_type, entry)
+        if numero:
+            break
+    if not numero:
+        return jsonify({"status": "success", "processed": False, "reply": None, "number": None}), 200
+    return jsonify(_repassar_com_failover(chave_do_numero(numero), '/bot-simples', payload)), 200
+
+
+@app.route('/anel', methods=['GET', 'POST'])
+def anel_status():
+    if request.method == 'POST':
+        data = request.get_json(force=True, silent=True) or {}
+        if data.get("adicionar"):
+            anel.adicionar(data["adicionar"].rstrip('/'))
+        if data.get("remover"):
+            anel.remover(data["remover"].rstrip('/'))
+    return jsonify({"workers": sorted(anel.nos), "fora_do_anel": sorted(_fora_do_anel), "fatias": anel.fatias()}), 200
+
+
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "running", "workers": len(anel.nos)}), 200
+
+
+def _vigiar_workers(intervalo: float = 10.0) -> None:
+    """Devolve ao anel os workers que voltaram a responder."""
+    while True:
+        time.sleep(intervalo)
+        for worker in list(_fora_do_anel):
+            try:
+                if _sessao.get(f"{worker}/health", timeout=2).status_code == 200:
+                    _fora_do_anel.discard(worker)
+                    anel.adicionar(worker)
+                    print(f"✅ Worker {worker} de volta ao anel")
+            except requests.RequestException:
+                pass
+
+
+def _subir_workers(quantidade: int, porta_base: int) -> list[str]:
+    urls = []
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'App.py')
+    for i in range(quantidade):
+        porta = porta_base + i
+        env = {**os.environ, "PORT": str(porta), "APP_DEBUG": "0"}
+        subprocess.Popen([sys.executable, script], env=env)
+        urls.append(f"http://127.0.0.1:{porta}")
+    return urls
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Dispatcher com hash consistente para workers do App.py")
+    parser.add_argument("--workers", type=int, default=0, help="quantos App.py subir localmente")
+    parser.add_argument("--porta-base", type=int, default=8101)
+    parser.add_argument("--porta", type=int, default=int(os.getenv("PORT", "8001")))
+    args = parser.parse_args()
+
+    workers = [u.strip().rstrip('/') for u in os.getenv("WORKERS_URLS", "").split(",") if u.strip()]
+    if args.workers:
+        workers += _subir_workers(args.workers, args.porta_base)
+    for w in workers:
+        anel.adicionar(w)
+    threading.Thread(target=_vigiar_workers, daemon=True).start()
+
+    print(f"=== dispatcher.py em http://localhost:{args.porta} -> {len(workers)} workers ===")
+    app.run(host='0.0.0.0', port=args.porta, threaded=True)
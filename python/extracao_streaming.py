@@ -0,0 +1,184 @@
+"""
+Leitura em streaming do corpo do webhook, sem os campos binários pesados
+
+Itens de imageMessage/videoMessage/documentMessage trazem jpegThumbnail, base64
+e afins (centenas de KB em base64). O bot só precisa de key.remoteJid, fromMe,
+id e legenda. O PodadorJSON copia o JSON bloco a bloco e troca por "" os valores
+string das chaves pesadas (ou longos demais); essas strings nunca são montadas
+em memória. O resultado podado é pequeno e vai para o parse normal.
+
+O limite de tamanho por string não vale para as chaves de texto que o bot lê
+(CHAVES_TEXTO: conversation, text, caption...): um endereço ou mensagem longa
+chega inteira, contida só pelo limite do corpo.
+
+Também aplica um limite rígido de tamanho do corpo (WEBHOOK_MAX_BYTES).
+"""
+import os
+import re
+from typing import BinaryIO, Iterable
+
+LIMITE_CORPO = int(os.getenv("WEBHOOK_MAX_BYTES", str(8 * 1024 * 1024)))  # 8 MB
+# Strings maiores que isso são descartadas mesmo fora das chaves conhecidas, exceto
+# as de CHAVES_TEXTO (0 = desliga)
+LIMITE_STRING = int(os.getenv("WEBHOOK_MAX_STRING", str(16 * 1024)))
+TAMANHO_BLOCO = 64 * 1024
+
+CHAVES_PESADAS = frozenset({
+    b"jpegThumbnail",
+    b"thumbnail",
+    b"base64",
+    b"pngThumbnail",
+    b"thumbnailDirectPath",
+    b"streamingSidecar",
+    b"scansSidecar",
+    b"waveform",
+    b"mediaKey",
+    b"fileSha256",
+    b"fileEncSha256",
+    b"midQualityFileSha256",
+})
+
+# Texto do cliente (ver text_from_message no App.py): nunca cortado por LIMITE_STRING
+CHAVES_TEXTO = frozenset({
+    b"conversation",
+    b"text",
+    b"caption",
+    b"body",
+    b"title",
+    b"selectedDisplayText",
+    b"selectedButtonId",
+    b"selectedRowId",
+})
+
+_RE_ASPAS_OU_BARRA = re.compile(rb'["\\]')
+
+
+class CorpoGrandeDemais(Exception):
+    """Corpo da requisição acima de LIMITE_CORPO."""
+
+
+class PodadorJSON:
+    """Copia um JSON recebido em blocos, trocando por "" as strings pesadas.
+    Não valida o JSON; só acompanha strings, escapes e a última chave vista.
+    """
+
+    def __init__(self, limite_string: int = LIMITE_STRING, chaves=CHAVES_PESADAS, chaves_texto=CHAVES_TEXTO):
+        self.limite_string = limite_string
+        self.chaves = chaves
+        self.chaves_texto = chaves_texto
+        self.saida = bytearray()
+        self.dentro_string = False
+        self.escapando = False
+        self.descartando = False
+        self.sem_limite = False  # string atual é valor de uma chave de texto
+        self.buf = bytearray()
+        self.ultima_string = None  # candidata a chave (aguardando ':')
+        self.chave_valor = None  # chave cujo valor vem a seguir
+        self.descartadas = 0
+
+    def _fora_da_string(self, seg: bytes) -> None:
+        self.saida += seg
+        resto = seg.strip()
+        if not resto:
+            return
+        if self.ultima_string is not None:
+            if resto[:1] == b':':
+                self.chave_valor = self.ultima_string
+                resto = resto[1:].strip()
+            self.ultima_string = None
+        if resto:
+            # O valor não é string (objeto, lista, número...): a chave não se aplica
+            self.chave_valor = None
+
+    def _acumular(self, pedaco: bytes) -> None:
+        if self.descartando:
+            return
+        self.buf += pedaco
+        if self.limite_string and not self.sem_limite and len(self.buf) > self.limite_string:
+            self.descartando = True
+            self.buf = bytearray()
+
+    def _fechar_string(self) -> None:
+        self.dentro_string = False
+        if self.descartando:
+            self.saida += b'""'
+            self.descartadas += 1
+            self.ultima_string = None
+        else:
+            self.saida += b'"' + self.buf + b'"'
+            self.ultima_string = bytes(self.buf)
+        self.buf = bytearray()
+        self.descartando = False
+
+    def alimentar(self, bloco: bytes) -> None:
+        i, n = 0, len(bloco)
+        while i < n:
+            if not self.dentro_string:
+                j = bloco.find(b'"', i)
+                if j < 0:
+                    self._fora_da_string(bloco[i:])
+                    return
+                self._fora_da_string(bloco[i:j])
+                self.dentro_string = True
+                self.descartando = self.chave_valor in self.chaves
+                self.sem_limite = self.chave_valor in self.chaves_texto
+                self.chave_valor = None
+                i = j + 1
+                continue
+
+            if self.escapando:
+                self._acumular(bloco[i:i + 1])
+                self.escapando = False
+                i += 1
+                continue
+            m = _RE_ASPAS_OU_BARRA.search(bloco, i)
+            if not m:
+                if not self.descartando:
+                    self._acumular(bloco[i:])
+                return
+            k = m.start()
+            if not self.descartando:
+                self._acumular(bloco[i:k])
+            if bloco[k] == 0x5C:  # '\\'
+                if k + 1 < n:
+                    self._acumular(bloco[k:k + 2])
+                    i = k + 2
+                else:
+                    self._acumular(b'\\')
+                    self.escapando = True
+                    i = n
+            else:
+                self._fechar_string()
+                i = k + 1
+
+    def resultado(self) -> bytes:
+        return bytes(self.saida)
+
+
+def verificar_tamanho_declarado(tamanho: int | None, limite_corpo: int = LIMITE_CORPO) -> None:
+    """Rejeição antecipada pelo Content-Length, antes de ler qualquer byte."""
+    if limite_corpo and tamanho and tamanho > limite_corpo:
+        raise CorpoGrandeDemais(f"Content-Length {tamanho} acima de {limite_corpo} bytes")
+
+
+def ler_podado(blocos: Iterable[bytes], limite_corpo: int = LIMITE_CORPO) -> bytes:
+    """Consome os blocos aplicando o limite de tamanho e a poda. Lança CorpoGrandeDemais."""
+    podador = PodadorJSON()
+    total = 0
+    for bloco in blocos:
+        total += len(bloco)
+        if limite_corpo and total > limite_corpo:
+            raise CorpoGrandeDemais(f"corpo acima de {limite_corpo} bytes")
+        podador.alimentar(bloco)
+    return podador.resultado()
+
+
+def blocos_do_stream(stream: BinaryIO, prefixo: bytes = b'', tamanho: int = TAMANHO_BLOCO):
+    """Gera o prefixo já lido e, depois, o restante do stream em blocos."""
+    if prefixo:
+        yield prefixo
+    while True:
+        bloco = stream.read(tamanho)
+        if not bloco:
+            return
+        yield bloco
@@ -0,0 +1,110 @@
+"""
+Filtro rápido de eventos da Evolution API
+
+A maior parte do volume do webhook são eventos sem mensagens (contacts.update,
+chats.update, qr.updated). connection.update não é descartado: alimenta o estado
+da instância (ver conexao.py). Aqui o tipo do evento é descoberto
+pelo caminho da rota ou por uma leitura limitada do início do corpo, e os eventos
+ignorados são descartados sem fazer o parse do JSON inteiro.
+"""
+import re
+import threading
+from typing import BinaryIO, Dict, Optional, Tuple
+
+from extracao_streaming import blocos_do_stream, ler_podado
+
+# Eventos que não contêm mensagens processáveis
+EVENTOS_IGNORA = frozenset({
+    'contacts.update',
+    'chats.update',
+    'qr.updated',
+    'qrcode.updated',
+})
+
+# Bytes lidos do início do corpo para achar o campo "event"
+TAMANHO_PREFIXO = 1024
+TAMANHO_BLOCO_DESCARTE = 64 * 1024
+
+_RE_EVENTO = re.compile(rb'"event"\s*:\s*"([^"\\]{1,64})"')
+
+
+def normalizar_evento(nome: Optional[str]) -> Optional[str]:
+    """'CONTACTS_UPDATE', 'contacts-update' e 'contacts.update' -> 'contacts.update'."""
+    if not nome:
+        return None
+    return nome.strip().lower().replace('_', '.').replace('-', '.')
+
+
+def evento_da_rota(endpoint: Optional[str]) -> Optional[str]:
+    """Deriva o evento do caminho (webhookByEvents): '/webhook/contacts-update' -> 'contacts.update'."""
+    if not endpoint:
+        return None
+    ultimo = endpoint.strip().strip('/').rsplit('/', 1)[-1]
+    if '-' not in ultimo and '_' not in ultimo and '.' not in ultimo:
+        return None
+    return normalizar_evento(ultimo)
+
+
+def farejar_evento(prefixo: bytes) -> Optional[str]:
+    """Procura o campo "event" no início do corpo. Só vale para objeto único (não listas)."""
+    inicio = prefixo.lstrip()[:1]
+    if inicio != b'{':
+        return None
+    m = _RE_EVENTO.search(prefixo)
+    if not m:
+        return None
+    try:
+        return m.group(1).decode('utf-8')
+    except UnicodeDecodeError:
+        return None
+
+
+class ContadorDescartes:
+    """Contadores de eventos descartados por tipo."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contagens: Dict[str, int] = {}
+
+    def registrar(self, evento: str) -> None:
+        with self._lock:
+            self._contagens[evento] = self._contagens.get(evento, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._contagens)
+
+
+contador_descartes = ContadorDescartes()
+
+
+def deve_ignorar(evento: Optional[str]) -> bool:
+    return normalizar_evento(evento) in EVENTOS_IGNORA
+
+
+def _drenar(stream: BinaryIO) -> None:
+    """Consome o restante do corpo sem guardar (mantém a conexão keep-alive saudável)."""
+    while stream.read(TAMANHO_BLOCO_DESCARTE):
+        pass
+
+
+def ler_corpo_filtrado(stream: BinaryIO, endpoint: Optional[str] = None) -> Tuple[Optional[str], Optional[bytes]]:
+    """Lê o corpo da requisição descartando cedo os eventos ignorados.
+    Retorna (evento_descartado, None) quando o evento deve ser ignorado,
+    ou (None, corpo_podado) caso contrário (sem thumbnails/base64, ver extracao_streaming).
+    Lança CorpoGrandeDemais se o corpo passar de LIMITE_CORPO.
+    """
+    evento = evento_da_rota(endpoint)
+    if evento in EVENTOS_IGNORA:
+        _drenar(stream)
+        contador_descartes.registrar(evento)
+        return evento, None
+
+    prefixo = stream.read(TAMANHO_PREFIXO)
+    evento = normalizar_evento(farejar_evento(prefixo))
+    if evento in EVENTOS_IGNORA:
+        _drenar(stream)
+        contador_descartes.registrar(evento)
+        return evento, None
+
+    return None, ler_podado(blocos_do_stream(stream, prefixo))
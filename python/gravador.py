@@ -0,0 +1,312 @@
+"""
+Gravação do tráfego de entrada (webhooks da Evolution) para replay
+
+Com GRAVACAO=1 (ou POST /debug/gravacao {"ativo": true}), cada corpo aceito em
+/webhook, /process-event, /bot-simples e nas rotas por evento vira uma linha
+de um arquivo JSON lines comprimido com gzip, em GRAVACAO_DIR:
+    {"t": 1760000000.123, "rota": "webhook", "payload": {...}}
+A primeira linha de cada arquivo é um cabeçalho ({"gravacao": 1, ...}).
+
+- A requisição só enfileira os bytes já lidos (e já podados de thumbnails);
+  parse, anonimização e compressão ficam numa thread própria.
+- Números de telefone (JIDs, "number", "sender"...) viram pseudônimos do mesmo
+  tamanho via HMAC-SHA256 com GRAVACAO_CHAVE: o mesmo número vira sempre o mesmo
+  pseudônimo, então as conversas continuam coerentes no replay. Sem chave, uma
+  chave aleatória é sorteada por processo. Nomes (pushName) também são trocados.
+- O texto das mensagens é mantido (o replay depende dele), exceto CPFs e telefones
+  digitados nele: um CPF válido vira outro CPF válido (mesmo formato, pseudônimo
+  HMAC), então o replay segue o mesmo caminho do bot; telefones viram pseudônimos
+  como os dos JIDs.
+- O gzip recebe um flush de sincronização a cada lote: um arquivo cortado (queda
+  do processo) continua legível até o último lote (ver ler_gravacao).
+- Arquivos trocados a cada GRAVACAO_EVENTOS_POR_ARQUIVO eventos; só os
+  GRAVACAO_MAX_ARQUIVOS mais novos ficam.
+
+Reprodução: bench/replay.py.
+"""
+import glob
+import gzip
+import hashlib
+import hmac
+import json
+import os
+import re
+import secrets
+import threading
+import time
+import zlib
+from collections import deque
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+import json_codec
+
+GRAVACAO_ATIVA = os.getenv("GRAVACAO", "0").strip().lower() in ("1", "true", "sim", "on")
+GRAVACAO_DIR = os.getenv("GRAVACAO_DIR", f"gravacoes-{os.getenv('PORT', '8001')}")
+GRAVACAO_CHAVE = os.getenv("GRAVACAO_CHAVE", "")
+GRAVACAO_EVENTOS_POR_ARQUIVO = int(os.getenv("GRAVACAO_EVENTOS_POR_ARQUIVO", "50000"))
+GRAVACAO_MAX_ARQUIVOS = int(os.getenv("GRAVACAO_MAX_ARQUIVOS", "50"))
+EXTENSAO = ".jsonl.gz"
+
+# 10 a 15 dígitos antes do @ de um JID (5511...@s.whatsapp.net, ...:12@s.whatsapp.net, ...@lid)
+_JID = re.compile(r"(?<!\d)(\d{10,15})(?=(?::\d+)?@)")
+_SO_DIGITOS = re.compile(r"\+?\d{10,15}")
+_CAMPOS_NUMERO = frozenset({
+    "number", "numero", "sender", "from", "to", "owner", "participant", "phone", "telefone", "wuid", "remoteJid",
+})
+_CAMPOS_NOME = frozenset({"pushName", "notifyName", "verifiedBizName"})
+# Texto livre digitado pelo cliente (mesmas chaves de extracao_streaming.CHAVES_TEXTO)
+_CAMPOS_TEXTO = frozenset({
+    "conversation", "text", "caption", "body", "title", "selectedDisplayText", "selectedButtonId", "selectedRowId",
+})
+# CPF formatado (529.982.247-25), telefone formatado ((11) 91234-5678, +55 11 91234-5678)
+# ou uma sequência de 10 a 15 dígitos (CPF ou telefone sem formatação)
+_CPF_OU_TELEFONE = re.compile(
+    r"(?<![\d.])\d{3}\.\d{3}\.\d{3}-\d{2}(?![\d])"
+    r"|(?<![\d+])(?:\+?55[\s-]?)?\(?\d{2}\)?[\s-]?9?\d{4}[\s-]\d{4}(?!\d)"
+    r"|(?<![\d+])\+?\d{10,15}(?!\d)"
+)
+
+
+def _verificadores_cpf(base: str) -> str:
+    digitos = [int(c) for c in base]
+    for peso_inicial in (10, 11):
+        soma = sum(d * (peso_inicial - i) for i, d in enumerate(digitos))
+        digitos.append(soma * 10 % 11 % 10)
+    return "".join(str(d) for d in digitos[9:])
+
+
+def _cpf_valido(digitos: str) -> bool:
+    return len(digitos) == 11 and digitos != digitos[0] * 11 and _verificadores_cpf(digitos[:9]) == digitos[9:]
+
+
+def _recolocar_digitos(trecho: str, digitos: str) -> str:
+    """Troca os dígitos de `trecho` pelos de `digitos`, mantendo pontos, traços e espaços."""
+    novos = iter(digitos)
+    return "".join(next(novos) if c.isdigit() else c for c in trecho)
+
+
+class Anonimizador:
+    """Pseudônimos estáveis (HMAC) para números de telefone e nomes."""
+
+    def __init__(self, chave: bytes):
+        self._chave = chave
+        self._cache: Dict[str, str] = {}
+
+    def _hmac(self, valor: str) -> int:
+        return int.from_bytes(hmac.new(self._chave, valor.encode("utf-8"), hashlib.sha256).digest()[:8], "big")
+
+    def numero(self, numero: str) -> str:
+        """Mesmo tamanho e mesmo código de país (55...), demais dígitos trocados."""
+        pseudo = self._cache.get(numero)
+        if pseudo is None:
+            mais = "+" if numero.startswith("+") else ""
+            digitos = numero.lstrip("+")
+            pais = digitos[:2] if digitos.startswith("55") and len(digitos) >= 12 else ""
+            resto = len(digitos) - len(pais)
+            pseudo = f"{mais}{pais}{self._hmac(digitos) % 10 ** resto:0{resto}d}"
+            if len(self._cache) < 100000:
+                self._cache[numero] = pseudo
+        return pseudo
+
+    def nome(self, nome: str) -> str:
+        return f"Cliente {self._hmac('nome:' + nome) % 0x10000:04x}" if nome else nome
+
+    def cpf(self, digitos: str) -> str:
+        """Outro CPF válido, estável para o mesmo CPF de entrada."""
+        base = f"{self._hmac('cpf:' + digitos) % 10 ** 9:09d}"
+        if base == base[0] * 9:
+            base = f"{(int(base[0]) + 1) % 10}{base[1:]}"
+        return base + _verificadores_cpf(base)
+
+    def _texto(self, valor: str) -> str:
+        return _JID.sub(lambda m: self.numero(m.group(1)), valor)
+
+    def _cpf_ou_telefone(self, m: "re.Match") -> str:
+        trecho = m.group(0)
+        digitos = "".join(c for c in trecho if c.isdigit())
+        if _cpf_valido(digitos):
+            return _recolocar_digitos(trecho, self.cpf(digitos))
+        if len(digitos) == 11 and "." in trecho:
+            # Formato de CPF com dígitos verificadores errados: pseudônimo também inválido
+            return _recolocar_digitos(trecho, f"{self._hmac('cpf:' + digitos) % 10 ** 11:011d}")
+        return _recolocar_digitos(trecho, self.numero(digitos))
+
+    def texto_livre(self, valor: str) -> str:
+        """Mensagem do cliente: CPFs e telefones trocados, o resto intacto."""
+        return _CPF_OU_TELEFONE.sub(self._cpf_ou_telefone, self._texto(valor) if "@" in valor else valor)
+
+    def anonimizar(self, valor: Any, campo: str = "") -> Any:
+        """Cópia do payload com números e nomes trocados."""
+        if isinstance(valor, dict):
+            return {k: self.anonimizar(v, k) for k, v in valor.items()}
+        if isinstance(valor, list):
+            return [self.anonimizar(v, campo) for v in valor]
+        if isinstance(valor, str):
+            if campo in _CAMPOS_NOME:
+                return self.nome(valor)
+            if campo in _CAMPOS_NUMERO and _SO_DIGITOS.fullmatch(valor):
+                return self.numero(valor)
+            if campo in _CAMPOS_TEXTO:
+                return self.texto_livre(valor)
+            return self._texto(valor) if "@" in valor else valor
+        if isinstance(valor, int) and not isinstance(valor, bool) and campo in _CAMPOS_NUMERO \
+                and 10 ** 9 <= valor < 10 ** 15:
+            return int(self.numero(str(valor)))
+        return valor
+
+
+class Gravador:
+    def __init__(self, pasta: str = GRAVACAO_DIR, ativo: bool = GRAVACAO_ATIVA, chave: str = GRAVACAO_CHAVE,
+                 origem: Optional[str] = None, eventos_por_arquivo: int = GRAVACAO_EVENTOS_POR_ARQUIVO,
+                 max_arquivos: int = GRAVACAO_MAX_ARQUIVOS, max_fila: int = 10000):
+        self.pasta = pasta
+        self.ativo = False
+        self.origem = origem or f"app{os.getenv('PORT', '8001')}"
+        self.chave_aleatoria = not chave
+        self.anonimizador = Anonimizador(chave.encode("utf-8") if chave else secrets.token_bytes(32))
+        self.eventos_por_arquivo = max(1, eventos_por_arquivo)
+        self.max_arquivos = max(1, max_arquivos)
+        self._fila: deque = deque()
+        self.max_fila = max_fila
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._arquivo = None
+        self._nome_arquivo: Optional[str] = None
+        self._eventos_no_arquivo = 0
+        self.gravados = 0
+        self.perdidos = 0
+        self.falhas = 0
+        if ativo:
+            self.ligar()
+
+    def registrar(self, rota: str, corpo: bytes) -> None:
+        """Enfileira um corpo recebido (chamado no caminho da requisição: só um append)."""
+        if not self.ativo or not corpo:
+            return
+        with self._cond:
+            if len(self._fila) >= self.max_fila:
+                self.perdidos += 1
+                return
+            self._fila.append((time.time(), rota.strip("/") or "webhook", bytes(corpo)))
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="gravador", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def ligar(self) -> None:
+        if not self.ativo:
+            self.ativo = True
+            aviso = " (chave aleatória: pseudônimos mudam a cada reinício)" if self.chave_aleatoria else ""
+            print(f"⏺️ Gravação de tráfego ligada em {os.path.abspath(self.pasta)}{aviso}")
+
+    def desligar(self) -> None:
+        """Para de aceitar eventos; o que já está na fila ainda é gravado e o arquivo é fechado."""
+        if self.ativo:
+            self.ativo = False
+            with self._cond:
+                self._fila.append(None)  # fecha o arquivo depois do que já estava na fila
+                self._cond.notify()
+            print("⏹️ Gravação de tráfego desligada")
+
+    def _abrir_proximo(self) -> None:
+        self._fechar()
+        os.makedirs(self.pasta, exist_ok=True)
+        prefixo = f"gravacao-{self.origem}-"
+        inicio = time.time()
+        nome = f"{prefixo}{time.strftime('%Y%m%d-%H%M%S', time.localtime(inicio))}-{os.getpid()}{EXTENSAO}"
+        self._arquivo = gzip.open(os.path.join(self.pasta, nome), "ab")
+        self._nome_arquivo = nome
+        self._eventos_no_arquivo = 0
+        cabecalho = {"gravacao": 1, "origem": self.origem, "inicio": inicio, "pid": os.getpid()}
+        self._arquivo.write(json_codec.dumps_bytes(cabecalho) + b"\n")
+        antigos = sorted(f for f in os.listdir(self.pasta) if f.startswith(prefixo) and f.endswith(EXTENSAO))
+        for velho in antigos[:-self.max_arquivos]:
+            try:
+                os.remove(os.path.join(self.pasta, velho))
+            except OSError:
+                pass
+
+    def _fechar(self) -> None:
+        if self._arquivo is not None:
+            try:
+                self._arquivo.close()
+            except OSError:
+                pass
+            self._arquivo = None
+
+    def _linha(self, instante: float, rota: str, corpo: bytes) -> bytes:
+        try:
+            payload = json_codec.loads(corpo)
+        except ValueError:
+            payload = {"_corpo_invalido": len(corpo)}
+        evento = {"t": round(instante, 3), "rota": rota, "payload": self.anonimizador.anonimizar(payload)}
+        return json_codec.dumps_bytes(evento) + b"\n"
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._fila:
+                    self._cond.wait()
+                lote = list(self._fila)
+                self._fila.clear()
+            try:
+                for item in lote:
+                    if item is None:
+                        self._fechar()
+                        continue
+                    if self._arquivo is None or self._eventos_no_arquivo >= self.eventos_por_arquivo:
+                        self._abrir_proximo()
+                    self._arquivo.write(self._linha(*item))
+                    self._eventos_no_arquivo += 1
+                    self.gravados += 1
+                if self._arquivo is not None:
+                    self._arquivo.flush()  # Z_SYNC_FLUSH: o lote já fica legível no arquivo
+            except Exception as e:
+                self.falhas += 1
+                self._fechar()
+                print(f"⚠️ Falha ao gravar tráfego: {e}")
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            na_fila = len(self._fila)
+        return {
+            "ativo": self.ativo,
+            "pasta": os.path.abspath(self.pasta),
+            "arquivo_atual": self._nome_arquivo if self._arquivo is not None else None,
+            "chave_aleatoria": self.chave_aleatoria,
+            "gravados": self.gravados,
+            "na_fila": na_fila,
+            "perdidos": self.perdidos,
+            "falhas": self.falhas,
+        }
+
+
+def _arquivos(caminhos: Iterable[str]) -> list:
+    arquivos = []
+    for caminho in caminhos:
+        if os.path.isdir(caminho):
+            arquivos.extend(sorted(glob.glob(os.path.join(caminho, f"*{EXTENSAO}"))))
+        else:
+            arquivos.extend(sorted(glob.glob(caminho)) or [caminho])
+    return arquivos
+
+
+def ler_gravacao(caminhos: Iterable[str]) -> Iterator[Dict[str, Any]]:
+    """Eventos gravados (sem os cabeçalhos), arquivo por arquivo. Pastas viram todos os
+    *.jsonl.gz dentro delas. Um arquivo cortado é lido até a última linha inteira.
+    """
+    for caminho in _arquivos(caminhos):
+        with gzip.open(caminho, "rb") as f:
+            try:
+                for linha in f:
+                    try:
+                        evento = json.loads(linha)
+                    except ValueError:
+                        continue  # última linha de um arquivo cortado
+                    if isinstance(evento, dict) and "payload" in evento:
+                        yield evento
+            except (EOFError, gzip.BadGzipFile, zlib.error):
+                print(f"⚠️ {caminho} termina no meio (gravação interrompida): lido até o último lote")
+
+
+gravador = Gravador()
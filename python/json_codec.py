@@ -0,0 +1,46 @@
+"""
+Codec JSON plugável
+
+Usa orjson quando instalado (bem mais rápido em payloads grandes, como
+thumbnails de mídia e QR Codes em base64) e cai para o json da stdlib caso
+contrário. Forçar a stdlib: JSON_BACKEND=stdlib.
+"""
+import json
+import os
+from typing import Any, Callable, Optional
+
+try:
+    import orjson
+except Exception:
+    orjson = None
+
+if os.getenv("JSON_BACKEND", "").strip().lower() == "stdlib":
+    orjson = None
+
+BACKEND = "orjson" if orjson else "stdlib"
+
+
+def loads(dados: bytes | bytearray | memoryview | str) -> Any:
+    """Decodifica JSON a partir de bytes ou str. Lança ValueError em JSON inválido."""
+    if orjson:
+        return orjson.loads(dados)
+    if isinstance(dados, memoryview):
+        dados = dados.tobytes()
+    return json.loads(dados)
+
+
+def dumps_bytes(obj: Any, indent: bool = False, default: Optional[Callable] = None) -> bytes:
+    """Codifica para JSON em UTF-8 (sem escapar não-ASCII)."""
+    if orjson:
+        opcoes = orjson.OPT_NON_STR_KEYS
+        if indent:
+            opcoes |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=default, option=opcoes)
+    return dumps(obj, indent=indent, default=default).encode("utf-8")
+
+
+def dumps(obj: Any, indent: bool = False, default: Optional[Callable] = None) -> str:
+    """Codifica para JSON como str (sem escapar não-ASCII)."""
+    if orjson:
+        return dumps_bytes(obj, indent=indent, default=default).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, indent=2 if indent else None, default=default)
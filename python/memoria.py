@@ -0,0 +1,280 @@
+"""
+Contabilidade de memória das estruturas residentes (GET /debug/memoria)
+
+- Estruturas registradas (conversas, caches, outbox, rastros...): quantidade de
+  entradas e tamanho profundo estimado (sys.getsizeof de tudo o que é alcançável
+  pelos contêineres, __slots__ e __dict__, contando cada objeto uma vez).
+  Funções, classes, módulos e threads não são seguidos; objetos marcados como
+  compartilhados (ex.: itens do CARDAPIO apontados por Conversa.prato) não entram
+  na conta. É uma estimativa: strings internadas e ints pequenos são do
+  interpretador, mas são contados.
+- maiores(): as N entradas mais pesadas de um dict (ex.: conversas).
+- Instantâneos do tracemalloc: o primeiro liga o rastreamento (só o que for
+  alocado depois aparece), os dois últimos ficam guardados e a diferença entre
+  eles mostra onde a memória cresceu. Com o tracemalloc ligado toda alocação fica
+  mais lenta e cada bloco vivo custa memória: ligue para investigar e desligue
+  depois (DELETE /debug/memoria). MEMORIA_TRACEMALLOC=1 liga já na importação.
+
+Uso:
+    contabilidade.registrar("conversas", lambda: bot_simples.conversas)
+    contabilidade.compartilhar(lambda: CARDAPIO)
+    contabilidade.medir()
+"""
+import gc
+import heapq
+import os
+import sys
+import threading
+import time
+import tracemalloc
+import types
+from collections import deque
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+MEMORIA_TOP = int(os.getenv("MEMORIA_TOP", "10"))
+# Quadros guardados por alocação no tracemalloc (mais quadros = mais memória)
+MEMORIA_QUADROS = int(os.getenv("MEMORIA_QUADROS", "1"))
+MEMORIA_TRACEMALLOC = os.getenv("MEMORIA_TRACEMALLOC", "0").strip().lower() in ("1", "true", "sim", "on")
+AGRUPAMENTOS = ("lineno", "filename", "traceback")
+
+# Não seguidos: código e infraestrutura do interpretador, não dados do bot
+_OPACOS = (
+    type, types.ModuleType, types.FunctionType, types.BuiltinFunctionType, types.MethodType,
+    types.CodeType, types.FrameType, threading.Thread,
+)
+_ATOMICOS = (str, bytes, bytearray, int, float, complex, bool, type(None))
+_SEQUENCIAS = (list, tuple, set, frozenset, deque)
+_slots_por_tipo: Dict[type, tuple] = {}
+
+
+def _slots(tipo: type) -> tuple:
+    nomes = _slots_por_tipo.get(tipo)
+    if nomes is None:
+        vistos = []
+        for classe in tipo.__mro__:
+            slots = classe.__dict__.get("__slots__", ())
+            if isinstance(slots, str):
+                slots = (slots,)
+            vistos.extend(s for s in slots if s not in ("__dict__", "__weakref__") and s not in vistos)
+        nomes = _slots_por_tipo[tipo] = tuple(vistos)
+    return nomes
+
+
+def _filhos(obj: Any) -> Iterable[Any]:
+    if isinstance(obj, dict):
+        # list(): cópia feita sem soltar o GIL, o dict pode mudar em outra thread
+        for chave, valor in list(obj.items()):
+            yield chave
+            yield valor
+        return
+    if isinstance(obj, _SEQUENCIAS):
+        yield from list(obj)
+        return
+    for nome in _slots(type(obj)):
+        valor = getattr(obj, nome, None)
+        if valor is not None:
+            yield valor
+    atributos = getattr(obj, "__dict__", None)
+    if isinstance(atributos, dict):
+        yield atributos
+
+
+def tamanho_profundo(obj: Any, vistos: Optional[set] = None, ignorar: Iterable[int] = ()) -> int:
+    """Bytes estimados de obj e de tudo o que ele alcança (cada objeto uma vez em `vistos`)."""
+    if vistos is None:
+        vistos = set()
+    ignorar = ignorar if isinstance(ignorar, (set, frozenset)) else set(ignorar)
+    total = 0
+    pilha = [obj]
+    while pilha:
+        atual = pilha.pop()
+        ident = id(atual)
+        if ident in vistos or ident in ignorar or isinstance(atual, _OPACOS):
+            continue
+        vistos.add(ident)
+        total += sys.getsizeof(atual, 0)
+        if not isinstance(atual, _ATOMICOS):
+            pilha.extend(_filhos(atual))
+    return total
+
+
+def _ids_alcancaveis(objetos: Iterable[Any]) -> set:
+    vistos: set = set()
+    for obj in objetos:
+        tamanho_profundo(obj, vistos)
+    return vistos
+
+
+def memoria_processo() -> Dict[str, Any]:
+    """RSS atual e pico do processo (Linux: /proc; fora dele, só o pico)."""
+    info: Dict[str, Any] = {"pid": os.getpid(), "gc_contagens": list(gc.get_count())}
+    try:
+        with open("/proc/self/statm", "r") as f:
+            info["rss_bytes"] = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+        pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        info["pico_rss_bytes"] = pico if sys.platform == "darwin" else pico * 1024
+    except Exception:
+        pass
+    return info
+
+
+class Contabilidade:
+    """Estruturas em memória registradas por nome: `coletar()` retorna o contêiner."""
+
+    def __init__(self):
+        self._estruturas: Dict[str, tuple] = {}  # nome -> (coletar, descrição, parte_de)
+        self._compartilhados: List[Callable[[], Any]] = []
+
+    def registrar(self, nome: str, coletar: Callable[[], Any], descricao: str = "",
+                  parte_de: Optional[str] = None) -> None:
+        """parte_de: a estrutura já está dentro de outra (fica fora do bytes_total)."""
+        self._estruturas[nome] = (coletar, descricao, parte_de)
+
+    def estrutura(self, nome: str, descricao: str = "",
+                  parte_de: Optional[str] = None) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+        """Decorador equivalente a registrar(nome, fn, descricao, parte_de)."""
+        def registrar(fn):
+            self.registrar(nome, fn, descricao, parte_de)
+            return fn
+        return registrar
+
+    def compartilhar(self, coletar: Callable[[], Any]) -> None:
+        """Objetos (e o que eles alcançam) fora da conta de qualquer estrutura."""
+        self._compartilhados.append(coletar)
+
+    def _ignorados(self) -> set:
+        return _ids_alcancaveis(coletar() for coletar in self._compartilhados)
+
+    def medir(self) -> Dict[str, Any]:
+        """Entradas e bytes de cada estrutura (cada uma medida isoladamente)."""
+        inicio = time.perf_counter()
+        ignorar = self._ignorados()
+        estruturas = {}
+        total = 0
+        for nome, (coletar, descricao, parte_de) in list(self._estruturas.items()):
+            try:
+                obj = coletar()
+                medida = {"entradas": len(obj) if hasattr(obj, "__len__") else None,
+                          "bytes": tamanho_profundo(obj, ignorar=ignorar)}
+            except Exception as e:
+                medida = {"erro": f"{type(e).__name__}: {e}"}
+            if descricao:
+                medida["descricao"] = descricao
+            if parte_de:
+                medida["parte_de"] = parte_de
+            else:
+                total += medida.get("bytes", 0)
+            estruturas[nome] = medida
+        return {
+            "estruturas": estruturas,
+            "bytes_total": total,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 1),
+        }
+
+    def maiores(self, mapa: dict, n: int = MEMORIA_TOP,
+                descrever: Optional[Callable[[Any, Any], Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
+        """As n entradas de `mapa` com maior tamanho profundo (chave + valor)."""
+        ignorar = self._ignorados()
+
+        def medir(chave, valor) -> int:
+            vistos: set = set()
+            return tamanho_profundo(chave, vistos, ignorar) + tamanho_profundo(valor, vistos, ignorar)
+
+        medidas = ((medir(chave, valor), chave, valor) for chave, valor in list(mapa.items()))
+        resultado = []
+        for tamanho, chave, valor in heapq.nlargest(max(n, 0), medidas, key=lambda m: m[0]):
+            item = {"chave": chave, "bytes": tamanho}
+            if descrever is not None:
+                item.update(descrever(chave, valor))
+            resultado.append(item)
+        return resultado
+
+
+class Instantaneos:
+    """Os dois últimos instantâneos do tracemalloc e a diferença entre eles."""
+
+    def __init__(self, quadros: int = MEMORIA_QUADROS):
+        self.quadros = max(quadros, 1)
+        self._lock = threading.Lock()
+        self._anterior: Optional[tuple] = None  # (instante, snapshot, resumo)
+        self._atual: Optional[tuple] = None
+
+    def ligar(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.quadros)
+            print(f"🧠 tracemalloc ligado ({self.quadros} quadro(s) por alocação)")
+
+    def tirar(self) -> Dict[str, Any]:
+        """Liga o tracemalloc se preciso e guarda um instantâneo (o mais antigo sai)."""
+        self.ligar()
+        snapshot = tracemalloc.take_snapshot().filter_traces((
+            tracemalloc.Filter(False, tracemalloc.__file__),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            tracemalloc.Filter(False, "<frozen importlib._bootstrap_external>"),
+        ))
+        instante = time.time()
+        estatisticas = snapshot.statistics("filename")
+        resumo = {
+            "instante": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(instante)),
+            "bytes": sum(e.size for e in estatisticas),
+            "blocos": sum(e.count for e in estatisticas),
+        }
+        with self._lock:
+            self._anterior, self._atual = self._atual, (instante, snapshot, resumo)
+        return resumo
+
+    def diferenca(self, agrupar: str = "lineno", top: int = 20) -> Optional[Dict[str, Any]]:
+        """Maiores crescimentos do instantâneo anterior para o atual (None sem dois instantâneos)."""
+        if agrupar not in AGRUPAMENTOS:
+            raise ValueError(f"agrupar deve ser um de {', '.join(AGRUPAMENTOS)}")
+        with self._lock:
+            anterior, atual = self._anterior, self._atual
+        if anterior is None or atual is None:
+            return None
+        estatisticas = atual[1].compare_to(anterior[1], agrupar)
+        return {
+            "intervalo_s": round(atual[0] - anterior[0], 1),
+            "bytes_diff_total": sum(e.size_diff for e in estatisticas),
+            "maiores": [{
+                "local": [f"{q.filename}:{q.lineno}" for q in e.traceback],
+                "bytes_diff": e.size_diff,
+                "bytes": e.size,
+                "blocos_diff": e.count_diff,
+                "blocos": e.count,
+            } for e in estatisticas[:max(top, 0)]],
+        }
+
+    def desligar(self) -> None:
+        """Para o tracemalloc e descarta os instantâneos (devolve a memória deles)."""
+        with self._lock:
+            self._anterior = self._atual = None
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+            print("🧠 tracemalloc desligado")
+
+    def status(self) -> Dict[str, Any]:
+        ligado = tracemalloc.is_tracing()
+        with self._lock:
+            anterior, atual = self._anterior, self._atual
+        status: Dict[str, Any] = {
+            "ligado": ligado,
+            "quadros": self.quadros,
+            "anterior": anterior[2] if anterior else None,
+            "atual": atual[2] if atual else None,
+        }
+        if ligado:
+            rastreada, pico = tracemalloc.get_traced_memory()
+            status.update({"rastreada_bytes": rastreada, "pico_bytes": pico,
+                           "custo_tracemalloc_bytes": tracemalloc.get_tracemalloc_memory()})
+        return status
+
+
+contabilidade = Contabilidade()
+instantaneos = Instantaneos()
+
+if MEMORIA_TRACEMALLOC:
+    instantaneos.ligar()
@@ -0,0 +1,264 @@
+"""
+Métricas no formato de exposição de texto do Prometheus (GET /metrics)
+
+- Contador e Histograma: usados no caminho quente (rotas, chamadas externas,
+  caches). Cada thread escreve só no seu próprio dicionário (threading.local),
+  então incrementar não pega lock nem disputa com outras threads; a coleta soma
+  os dicionários de todas as threads. Threads encerradas são incorporadas a um
+  acumulado e esquecidas (o servidor Flask cria uma thread por requisição).
+- MedidorColetado: valores lidos só na hora da coleta (conversas por estado,
+  profundidade das filas, tamanho dos caches), sem custo por mensagem.
+
+Uso nas chamadas externas:
+    with ChamadaExterna("evolution_send_text") as chamada:
+        resp = requests.post(...)
+        chamada.ok = resp.status_code < 300
+"""
+import bisect
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from rastreamento import SPAN_CLIENTE, rastreador
+
+# Limites (segundos) dos baldes de latência: de 5 ms até o timeout do envio de mídia
+BALDES_PADRAO = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 20.0)
+TIPO_CONTEUDO = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _juntar(destino: dict, origem: dict) -> None:
+    for chave, valor in origem.items():
+        if isinstance(valor, list):
+            atual = destino.get(chave)
+            if atual is None:
+                destino[chave] = list(valor)
+            else:
+                for i, v in enumerate(valor):
+                    atual[i] += v
+        else:
+            destino[chave] = destino.get(chave, 0) + valor
+
+
+class _Fragmentos:
+    """Valores por thread: {(métrica, rótulos): número ou lista de baldes}."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._threads: List[Tuple[threading.Thread, dict]] = []
+        self._encerradas: dict = {}
+        self._limite_poda = 64
+
+    def meus(self) -> dict:
+        try:
+            return self._local.dados
+        except AttributeError:
+            return self._registrar()
+
+    def _registrar(self) -> dict:
+        dados = self._local.dados = {}
+        with self._lock:
+            self._threads.append((threading.current_thread(), dados))
+            if len(self._threads) > self._limite_poda:
+                self._podar()
+                self._limite_poda = max(64, 2 * len(self._threads))
+        return dados
+
+    def _podar(self) -> None:
+        """Incorpora as threads encerradas ao acumulado (com o lock)."""
+        vivas = []
+        for thread, dados in self._threads:
+            if thread.is_alive():
+                vivas.append((thread, dados))
+            else:
+                _juntar(self._encerradas, dados)
+        self._threads = vivas
+
+    def somar(self) -> dict:
+        with self._lock:
+            self._podar()
+            total: dict = {}
+            _juntar(total, self._encerradas)
+            for _, dados in self._threads:
+                # dict.copy()/list() não liberam o GIL: cópia consistente sem parar a thread dona
+                _juntar(total, dados.copy())
+        return total
+
+
+def _escapar(valor: Any) -> str:
+    return str(valor).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _rotulos(nomes: Sequence[str], valores: Sequence[Any], extra: str = "") -> str:
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def _numero(valor: float) -> str:
+    if valor == float("inf"):
+        return "+Inf"
+    if isinstance(valor, float) and valor.is_integer() and abs(valor) < 1e15:
+        return str(int(valor))
+    return repr(valor) if isinstance(valor, float) else str(valor)
+
+
+class Registro:
+    """Conjunto de métricas exportadas juntas."""
+
+    def __init__(self):
+        self.metricas: list = []
+        self.fragmentos = _Fragmentos()
+
+    def adicionar(self, metrica):
+        self.metricas.append(metrica)
+        return metrica
+
+    def exportar(self) -> str:
+        valores = self.fragmentos.somar()
+        por_metrica: Dict[Any, list] = {}
+        for (metrica, rotulos), valor in valores.items():
+            por_metrica.setdefault(metrica, []).append((rotulos, valor))
+        linhas: List[str] = []
+        for metrica in self.metricas:
+            linhas.append(f"# HELP {metrica.nome} {metrica.ajuda}")
+            linhas.append(f"# TYPE {metrica.nome} {metrica.tipo}")
+            try:
+                linhas.extend(metrica.amostras(sorted(por_metrica.get(metrica, []), key=lambda a: a[0])))
+            except Exception as e:
+                linhas.append(f"# erro ao coletar {metrica.nome}: {_escapar(e)}")
+        return "\n".join(linhas) + "\n"
+
+
+class Contador:
+    tipo = "counter"
+
+    def __init__(self, registro: Registro, nome: str, ajuda: str, rotulos: Sequence[str] = ()):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._fragmentos = registro.fragmentos
+        registro.adicionar(self)
+
+    def inc(self, *valores_rotulos: Any, valor: float = 1) -> None:
+        dados = self._fragmentos.meus()
+        chave = (self, valores_rotulos)
+        dados[chave] = dados.get(chave, 0) + valor
+
+    def amostras(self, valores: list) -> List[str]:
+        return [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in valores]
+
+
+class Histograma:
+    tipo = "histogram"
+
+    def __init__(self, registro: Registro, nome: str, ajuda: str, rotulos: Sequence[str] = (),
+                 limites: Sequence[float] = BALDES_PADRAO):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.limites = tuple(sorted(limites))
+        self._fragmentos = registro.fragmentos
+        registro.adicionar(self)
+
+    def observar(self, valor: float, *valores_rotulos: Any) -> None:
+        dados = self._fragmentos.meus()
+        chave = (self, valores_rotulos)
+        baldes = dados.get(chave)
+        if baldes is None:
+            # Um balde por limite + o +Inf; a última posição guarda a soma
+            baldes = dados[chave] = [0] * (len(self.limites) + 1) + [0.0]
+        baldes[bisect.bisect_left(self.limites, valor)] += 1
+        baldes[-1] += valor
+
+    def amostras(self, valores: list) -> List[str]:
+        linhas = []
+        for rotulos, baldes in valores:
+            acumulado = 0
+            for limite, quantidade in zip(self.limites + (float("inf"),), baldes):
+                acumulado += quantidade
+                le = 'le="' + _numero(limite) + '"'
+                linhas.append(f"{self.nome}_bucket{_rotulos(self.rotulos, rotulos, le)} {acumulado}")
+            # count = +Inf: sempre consistente com os baldes, mesmo lidos durante uma escrita
+            linhas.append(f"{self.nome}_sum{_rotulos(self.rotulos, rotulos)} {_numero(baldes[-1])}")
+            linhas.append(f"{self.nome}_count{_rotulos(self.rotulos, rotulos)} {acumulado}")
+        return linhas
+
+
+class MedidorColetado:
+    """Valor calculado na coleta: `coletar()` retorna um número ou {tupla de rótulos: valor}.
+    tipo="counter" para contadores que o próprio componente já mantém (ex.: supressao.py).
+    """
+
+    def __init__(self, registro: Registro, nome: str, ajuda: str, rotulos: Sequence[str],
+                 coletar: Callable[[], Any], tipo: str = "gauge"):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self.coletar = coletar
+        self.tipo = tipo
+        registro.adicionar(self)
+
+    def amostras(self, _valores: list) -> List[str]:
+        atual = self.coletar()
+        if not isinstance(atual, dict):
+            return [f"{self.nome} {_numero(atual)}"]
+        return [f"{self.nome}{_rotulos(self.rotulos, r)} {_numero(v)}" for r, v in sorted(atual.items())]
+
+
+registro_metricas = Registro()
+
+requisicoes_http = Contador(
+    registro_metricas, "bot_http_requisicoes_total", "Requisições HTTP atendidas.", ("rota", "metodo", "status"))
+latencia_http = Histograma(
+    registro_metricas, "bot_http_requisicao_segundos", "Latência das rotas HTTP.", ("rota", "metodo"))
+latencia_dependencias = Histograma(
+    registro_metricas, "bot_dependencia_segundos",
+    "Latência das chamadas externas (Evolution, AbacatePay, Notion, checkout Node).", ("dependencia",))
+erros_dependencias = Contador(
+    registro_metricas, "bot_dependencia_erros_total",
+    "Chamadas externas com exceção ou resposta de erro.", ("dependencia",))
+consultas_cache = Contador(
+    registro_metricas, "bot_cache_consultas_total", "Consultas a caches locais.", ("cache", "resultado"))
+
+
+class ChamadaExterna:
+    """Mede uma chamada externa; exceção ou `ok = False` contam como erro.
+    Com um rastro ativo (rastreamento.py), a chamada também vira um span.
+    """
+
+    __slots__ = ("dependencia", "inicio", "ok", "span")
+
+    def __init__(self, dependencia: str):
+        self.dependencia = dependencia
+        self.ok = True
+
+    def __enter__(self) -> "ChamadaExterna":
+        self.span = rastreador.iniciar_span(self.dependencia, SPAN_CLIENTE)
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, tipo, valor, rastro) -> bool:
+        latencia_dependencias.observar(time.perf_counter() - self.inicio, self.dependencia)
+        falhou = tipo is not None or not self.ok
+        if falhou:
+            erros_dependencias.inc(self.dependencia)
+        if self.span is not None:
+            if falhou and valor is None:
+                self.span.erro = "resposta de erro"
+            self.span.finalizar(valor)
+        return False
+
+
+def registrar_cache(cache: str, acerto: bool) -> None:
+    consultas_cache.inc(cache, "acerto" if acerto else "falha")
+
+
+def medidor(nome: str, ajuda: str, rotulos: Sequence[str] = (), tipo: str = "gauge",
+            registro: Optional[Registro] = None) -> Callable[[Callable[[], Any]], Callable[[], Any]]:
+    """Decorador para registrar um MedidorColetado a partir de uma função."""
+    def registrar(fn):
+        MedidorColetado(registro or registro_metricas, nome, ajuda, rotulos, fn, tipo)
+        return fn
+    return registrar
@@ -0,0 +1,385 @@
+"""
+Cópia local das páginas do Notion usadas pelo bot (cardápio, promoções, informações)
+
+As conversas leem só a cópia renderizada (texto pronto); o Notion é consultado
+por uma thread a cada NOTION_SYNC_INTERVALO_SEGUNDOS, então o uso da API não
+cresce com o tráfego do chat. A cada rodada, por página:
+- 1 chamada para saber o last_edited_time (pages.retrieve; search só na
+  primeira vez, para achar a página pelo título, ou se ela sumir);
+- só se o last_edited_time mudou: todos os blocos, seguindo a paginação
+  (has_more/next_cursor) e os filhos (has_children) até NOTION_SYNC_PROFUNDIDADE,
+  e a renderização em texto, uma vez por mudança.
+
+O Notion arredonda o last_edited_time para o minuto: uma edição feita no mesmo
+minuto da última leitura não muda o valor. Por isso a página é relida enquanto a
+edição for mais recente que JANELA_EDICAO_SEGUNDOS em relação à leitura.
+
+Páginas fixas por ID (sem search): NOTION_PAGINA_CARDAPIO, NOTION_PAGINA_PROMOCOES,
+NOTION_PAGINA_INFORMACOES. Com o Notion fora do ar (saude.py), a rodada é pulada
+e a última cópia continua valendo.
+
+Partida a frio: a cópia é salva em NOTION_SNAPSHOT_ARQUIVO (tmp + rename) a cada
+mudança e carregada em iniciar(), em milissegundos, sem tocar no Notion; as
+primeiras respostas já saem com o texto da última execução. A primeira rodada,
+em segundo plano, só confere o last_edited_time de cada página. Cópias mais
+velhas que NOTION_SNAPSHOT_MAX_IDADE_SEGUNDOS são ignoradas. O notion-client só
+é importado no primeiro uso (novo_cliente_notion).
+
+Uso:
+    sincronizador_notion.iniciar()
+    sincronizador_notion.texto("cardapio")   # -> str ou None
+"""
+import importlib.util
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import json_codec
+from metricas import ChamadaExterna, registrar_cache
+from saude import monitor_saude
+
+NOTION_SYNC = os.getenv("NOTION_SYNC", "1").strip().lower() not in ("0", "false", "nao", "não", "off")
+NOTION_SYNC_INTERVALO_SEGUNDOS = float(os.getenv("NOTION_SYNC_INTERVALO_SEGUNDOS", "300"))
+NOTION_SYNC_PROFUNDIDADE = int(os.getenv("NOTION_SYNC_PROFUNDIDADE", "3"))
+NOTION_SYNC_TIMEOUT_SEGUNDOS = float(os.getenv("NOTION_SYNC_TIMEOUT_SEGUNDOS", "10"))
+NOTION_SNAPSHOT_ARQUIVO = os.getenv("NOTION_SNAPSHOT_ARQUIVO", f"notion-snapshot-{os.getenv('PORT', '8001')}.json")  # vazio = desligado
+NOTION_SNAPSHOT_MAX_IDADE_SEGUNDOS = float(os.getenv("NOTION_SNAPSHOT_MAX_IDADE_SEGUNDOS", str(7 * 24 * 3600)))
+JANELA_EDICAO_SEGUNDOS = 90
+# Primeira leitura sob demanda que falhou: não tenta de novo a cada mensagem
+ESPERA_APOS_FALHA_SEGUNDOS = 30
+
+# tópico -> títulos procurados no search, na ordem
+TOPICOS: Dict[str, tuple] = {
+    "cardapio": ("cardapio", "cardápio"),
+    "promocoes": ("promoções", "promocoes"),
+    "informacoes": ("informações", "informacoes"),
+}
+
+# Filhos que são outras páginas/bases: não fazem parte do texto da página
+_SEM_DESCER = frozenset({"child_page", "child_database", "link_to_page", "synced_block"})
+
+
+_instalado: Optional[bool] = None
+
+
+def notion_instalado() -> bool:
+    """notion-client disponível, sem importá-lo (find_spec só procura o pacote)."""
+    global _instalado
+    if _instalado is None:
+        _instalado = importlib.util.find_spec("notion_client") is not None
+    return _instalado
+
+
+def novo_cliente_notion(opcoes: Dict[str, Any], timeout_segundos: float):
+    """notion_client.Client importado só aqui: o SDK (e o httpx) não pesam no boot."""
+    from notion_client import Client
+    return Client(**opcoes, timeout_ms=int(timeout_segundos * 1000))
+
+
+def _texto_rico(conteudo: Dict[str, Any]) -> str:
+    return "".join(t.get("plain_text", "") for t in conteudo.get("rich_text") or []).strip()
+
+
+def renderizar(blocos: List[Dict[str, Any]], nivel: int = 0) -> List[str]:
+    """Linhas de texto dos blocos (com os filhos em "_filhos", recuados)."""
+    linhas: List[str] = []
+    recuo = "  " * nivel
+    numero = 0
+    for bloco in blocos:
+        tipo = bloco.get("type") or ""
+        conteudo = bloco.get(tipo) or {}
+        texto = _texto_rico(conteudo)
+        numero = numero + 1 if tipo == "numbered_list_item" else 0
+        if not texto:
+            linha = None
+        elif tipo.startswith("heading_"):
+            linha = f"**{texto}**"
+        elif tipo == "bulleted_list_item":
+            linha = f"• {texto}"
+        elif tipo == "numbered_list_item":
+            linha = f"{numero}. {texto}"
+        elif tipo == "to_do":
+            linha = f"{'☑' if conteudo.get('checked') else '☐'} {texto}"
+        elif tipo == "quote":
+            linha = f"> {texto}"
+        elif tipo == "callout":
+            emoji = (conteudo.get("icon") or {}).get("emoji")
+            linha = f"{emoji} {texto}" if emoji else texto
+        else:
+            linha = texto
+        if linha:
+            linhas.append(recuo + linha)
+        linhas.extend(renderizar(bloco.get("_filhos") or [], nivel + 1))
+    return linhas
+
+
+def _instante(iso: Optional[str]) -> Optional[float]:
+    if not iso:
+        return None
+    try:
+        return datetime.fromisoformat(iso.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+
+class PaginaNotion:
+    __slots__ = ("topico", "page_id", "editada_em", "texto", "lida_em", "falhou_em", "renderizacoes", "erro")
+
+    def __init__(self, topico: str, page_id: Optional[str] = None):
+        self.topico = topico
+        self.page_id = page_id
+        self.editada_em: Optional[str] = None  # last_edited_time da cópia atual
+        self.texto: Optional[str] = None
+        self.lida_em: Optional[float] = None
+        self.falhou_em: Optional[float] = None
+        self.renderizacoes = 0
+        self.erro: Optional[str] = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "page_id": self.page_id,
+            "last_edited_time": self.editada_em,
+            "caracteres": len(self.texto) if self.texto else 0,
+            "lida_ha_segundos": round(time.time() - self.lida_em, 1) if self.lida_em else None,
+            "renderizacoes": self.renderizacoes,
+            "erro": self.erro,
+        }
+
+
+class SincronizadorNotion:
+    def __init__(self, api_key: Optional[str] = None, opcoes: Optional[Dict[str, Any]] = None,
+                 intervalo: float = NOTION_SYNC_INTERVALO_SEGUNDOS, profundidade: int = NOTION_SYNC_PROFUNDIDADE,
+                 arquivo: str = NOTION_SNAPSHOT_ARQUIVO):
+        self.api_key = api_key
+        self.arquivo = arquivo
+        self.instantaneo: Dict[str, Any] = {}
+        self.opcoes = opcoes or {}
+        self.intervalo = intervalo
+        self.profundidade = max(0, profundidade)
+        self._paginas: Dict[str, PaginaNotion] = {
+            topico: PaginaNotion(topico, os.getenv(f"NOTION_PAGINA_{topico.upper()}") or None) for topico in TOPICOS
+        }
+        # uma sincronização por página de cada vez (thread ou primeira leitura): a primeira
+        # leitura do cardápio não espera a rodada terminar as outras páginas
+        self._locks = {topico: threading.Lock() for topico in TOPICOS}
+        self._lock_arquivo = threading.Lock()
+        self._cliente = None
+        self._thread: Optional[threading.Thread] = None
+        self._acordar = threading.Event()
+        self.rodadas = 0
+        self.chamadas_api = 0
+
+    def configurar(self, api_key: Optional[str], opcoes: Optional[Dict[str, Any]] = None) -> None:
+        self.api_key = api_key
+        self.opcoes = opcoes or {}
+        self._cliente = None
+
+    @property
+    def configurado(self) -> bool:
+        return bool(self.api_key and notion_instalado())
+
+    def _client(self):
+        if self._cliente is None:
+            self._cliente = novo_cliente_notion(self.opcoes, NOTION_SYNC_TIMEOUT_SEGUNDOS)
+        return self._cliente
+
+    def _chamar(self, fn, **kwargs) -> Dict[str, Any]:
+        self.chamadas_api += 1
+        with ChamadaExterna("notion"):
+            return fn(**kwargs)
+
+    def texto(self, topico: str) -> Optional[str]:
+        """Texto renderizado da página. Só a primeira leitura de um tópico (sem cópia
+        ainda) vai ao Notion; as seguintes nunca esperam por ele.
+        """
+        pagina = self._paginas.get(topico)
+        if pagina is None or not self.configurado:
+            return None
+        if pagina.lida_em is not None:
+            registrar_cache("notion", True)
+            return pagina.texto
+        registrar_cache("notion", False)
+        if not monitor_saude.disponivel("notion"):
+            return None  # fora do ar: vai direto para o cardápio fixo, sem esperar timeout
+        if pagina.falhou_em and time.time() - pagina.falhou_em < ESPERA_APOS_FALHA_SEGUNDOS:
+            return None
+        with self._locks[topico]:
+            # outra thread pode ter lido enquanto esperávamos
+            if pagina.lida_em is None and self._sincronizar_pagina(pagina):
+                self._salvar_instantaneo()
+        return pagina.texto
+
+    def sincronizar(self) -> Dict[str, bool]:
+        """Uma rodada em todas as páginas; retorna quais foram relidas."""
+        if not self.configurado:
+            return {}
+        self.rodadas += 1
+        relidas = {}
+        for topico, pagina in self._paginas.items():
+            with self._locks[topico]:
+                relidas[topico] = self._sincronizar_pagina(pagina)
+            if relidas[topico]:
+                self._salvar_instantaneo()  # já na primeira página: o processo pode cair no meio da rodada
+        return relidas
+
+    def carregar_instantaneo(self) -> int:
+        """Restaura a cópia salva (sem chamar o Notion). Retorna quantas páginas vieram."""
+        if not self.arquivo or not os.path.exists(self.arquivo):
+            return 0
+        inicio = time.perf_counter()
+        try:
+            with open(self.arquivo, "rb") as f:
+                dados = json_codec.loads(f.read()) or {}
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Cópia do Notion ilegível ({self.arquivo}): {e}")
+            return 0
+        salvo_em = float(dados.get("salvo_em") or 0)
+        if time.time() - salvo_em > NOTION_SNAPSHOT_MAX_IDADE_SEGUNDOS:
+            print(f"⚠️ Cópia do Notion em {self.arquivo} velha demais: ignorada")
+            return 0
+        carregadas = 0
+        for topico, salva in (dados.get("paginas") or {}).items():
+            pagina = self._paginas.get(topico)
+            if pagina is None or not salva.get("lida_em"):
+                continue
+            with self._locks[topico]:
+                if pagina.lida_em is not None:
+                    continue
+                if pagina.page_id and salva.get("page_id") != pagina.page_id:
+                    continue  # NOTION_PAGINA_<TOPICO> mudou desde que a cópia foi salva
+                pagina.page_id = salva.get("page_id")
+                pagina.editada_em = salva.get("last_edited_time")
+                pagina.texto = salva.get("texto")
+                pagina.lida_em = float(salva["lida_em"])
+                carregadas += 1
+        self.instantaneo = {
+            "salvo_em": salvo_em,
+            "paginas": carregadas,
+            "duracao_ms": round((time.perf_counter() - inicio) * 1000, 2),
+        }
+        print(f"📦 Cópia do Notion carregada: {carregadas} página(s) em {self.instantaneo['duracao_ms']} ms")
+        return carregadas
+
+    def _salvar_instantaneo(self) -> None:
+        if not self.arquivo:
+            return
+        paginas = {
+            p.topico: {"page_id": p.page_id, "last_edited_time": p.editada_em, "texto": p.texto, "lida_em": p.lida_em}
+            for p in self._paginas.values() if p.lida_em is not None
+        }
+        temporario = self.arquivo + ".tmp"
+        try:
+            with self._lock_arquivo:
+                with open(temporario, "wb") as f:
+                    f.write(json_codec.dumps_bytes({"versao": 1, "salvo_em": time.time(), "paginas": paginas}))
+                    f.flush()
+                    os.fsync(f.fileno())
+                os.replace(temporario, self.arquivo)
+        except OSError as e:
+            print(f"⚠️ Falha ao salvar a cópia do Notion em {self.arquivo}: {e}")
+
+    def _sincronizar_pagina(self, pagina: PaginaNotion) -> bool:
+        try:
+            editada_em = self._ultima_edicao(pagina)
+            if editada_em is None:
+                pagina.erro, pagina.falhou_em = "página não encontrada", time.time()
+                return False
+            pagina.falhou_em = None
+            if editada_em == pagina.editada_em and not self._edicao_recente(pagina):
+                pagina.erro = None
+                return False
+            lida_em = time.time()
+            blocos = self._blocos(pagina.page_id, self.profundidade)
+            pagina.texto = "\n".join(renderizar(blocos)).strip() or None
+            pagina.editada_em = editada_em
+            pagina.lida_em = lida_em
+            pagina.renderizacoes += 1
+            pagina.erro = None
+            print(f"📝 Notion: {pagina.topico} atualizado ({len(pagina.texto or '')} caracteres, editado {editada_em})")
+            return True
+        except Exception as e:
+            pagina.erro, pagina.falhou_em = f"{type(e).__name__}: {e}", time.time()
+            print(f"⚠️ Falha ao sincronizar {pagina.topico} do Notion: {e}")
+            return False
+
+    def _ultima_edicao(self, pagina: PaginaNotion) -> Optional[str]:
+        """last_edited_time atual da página (acha a página pelo título se preciso)."""
+        client = self._client()
+        if pagina.page_id:
+            try:
+                return self._chamar(client.pages.retrieve, page_id=pagina.page_id).get("last_edited_time")
+            except Exception as e:
+                if getattr(e, "code", None) != "object_not_found":
+                    raise
+                print(f"⚠️ Página {pagina.page_id} ({pagina.topico}) sumiu do Notion: procurando de novo")
+                pagina.page_id = None
+        for consulta in TOPICOS[pagina.topico]:
+            resp = self._chamar(client.search, query=consulta, filter={"property": "object", "value": "page"})
+            resultados = resp.get("results") or []
+            if resultados:
+                pagina.page_id = resultados[0].get("id")
+                return resultados[0].get("last_edited_time")
+        return None
+
+    @staticmethod
+    def _edicao_recente(pagina: PaginaNotion) -> bool:
+        editada = _instante(pagina.editada_em)
+        return editada is not None and pagina.lida_em is not None \
+            and pagina.lida_em - editada < JANELA_EDICAO_SEGUNDOS
+
+    def _blocos(self, bloco_id: str, profundidade: int) -> List[Dict[str, Any]]:
+        """Todos os filhos de um bloco (todas as páginas da listagem), com os netos em "_filhos"."""
+        client = self._client()
+        blocos: List[Dict[str, Any]] = []
+        cursor = None
+        while True:
+            kwargs = {"block_id": bloco_id, "page_size": 100}
+            if cursor:
+                kwargs["start_cursor"] = cursor
+            resp = self._chamar(client.blocks.children.list, **kwargs)
+            blocos.extend(resp.get("results") or [])
+            cursor = resp.get("next_cursor")
+            if not resp.get("has_more") or not cursor:
+                break
+        if profundidade > 0:
+            for bloco in blocos:
+                if bloco.get("has_children") and bloco.get("type") not in _SEM_DESCER:
+                    bloco["_filhos"] = self._blocos(bloco["id"], profundidade - 1)
+        return blocos
+
+    def iniciar(self) -> None:
+        """Carrega a cópia salva e começa a sincronizar em segundo plano."""
+        if not self.configurado or self._thread is not None:
+            return
+        self.carregar_instantaneo()
+        if not NOTION_SYNC:
+            return
+        self._thread = threading.Thread(target=self._loop, name="notion-sync", daemon=True)
+        self._thread.start()
+
+    def sincronizar_agora(self) -> None:
+        """Antecipa a próxima rodada (não espera o resultado)."""
+        self._acordar.set()
+
+    def _loop(self) -> None:
+        while True:
+            if monitor_saude.disponivel("notion"):
+                self.sincronizar()
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ativo": self._thread is not None,
+            "intervalo_segundos": self.intervalo,
+            "rodadas": self.rodadas,
+            "chamadas_api": self.chamadas_api,
+            "arquivo": os.path.abspath(self.arquivo) if self.arquivo else None,
+            "instantaneo_carregado": self.instantaneo or None,
+            "paginas": {topico: pagina.status() for topico, pagina in self._paginas.items()},
+        }
+
+
+sincronizador_notion = SincronizadorNotion()
@@ -0,0 +1,757 @@
+"""
+Núcleo do bot compartilhado pelos dois servidores
+
+App.py (Flask) e app_async.py (ASGI) servem as mesmas conversas com a mesma
+configuração: extração do texto/número dos eventos da Evolution, envio pela
+Evolution com o outbox, sondas do monitor de saúde, ganchos das cobranças e
+a subida das peças de fundo (iniciar_servicos). O dispatcher.py e os
+benchmarks também usam as funções de extração.
+
+Importar este módulo não sobe thread nem abre conexão (nem importa o Flask):
+quem serve as rotas chama iniciar_servicos() uma vez na subida.
+"""
+import os
+import re
+import time
+from concurrent.futures import Future
+from typing import Callable
+
+from dotenv import load_dotenv
+
+import json_codec
+from bot_simples import CARDAPIO, PIX_EXPIRACAO_SEGUNDOS, bot_simples, consultar_status_pix, requests_http, sondar_abacatepay, sondar_notion
+from cobrancas_pendentes import registro_cobrancas
+from conexao import DESCONHECIDO, INACESSIVEL, estado_do_evento, estado_instancia, saida_pausavel
+from conversa import NOMES_ESTADOS
+from memoria import contabilidade
+from metricas import ChamadaExterna, medidor, registrar_cache
+from notion_sync import sincronizador_notion
+from outbox import EntradaOutbox, outbox
+from pools import pool_envios, status_pools
+from prazo import RESERVA_RESPOSTA, Prazo, PrazoEsgotado, estourou, timeout_de
+from rastreamento import rastreador, span
+from saude import DEGRADADA, FORA, OK, SAUDE_TIMEOUT_SEGUNDOS, monitor_saude
+from supressao import supressor_respostas
+
+load_dotenv()
+
+# Token das rotas de diagnóstico (/debug/perfil, /debug/memoria, /debug/gravacao); vazio = rotas de admin fechadas
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Rotas que o perfilador pode envolver (ver perfilador.py)
+ROTAS_PERFILAVEIS = frozenset({'/webhook', '/bot-simples'})
+
+# Configurações
+EVOLUTION_API = os.getenv("EVOLUTION_API_URL")
+INSTANCE_NAME = os.getenv("EVOLUTION_INSTANCE_NAME")
+API_KEY = os.getenv("API_KEY_EVOLUTION")
+
+# Cache simples de endpoints que retornaram 404 previamente
+EVOLUTION_DISABLED_ENDPOINTS: set[str] = set()
+# Cache de números inválidos (não estão no WhatsApp ou bloqueados pelo servidor)
+EVOLUTION_INVALID_NUMBERS: set[str] = set()
+
+_NAO_DIGITOS = re.compile(r'\D+')
+
+def _normalize_number(number: str | None) -> str | None:
+    """Normaliza número para formato E.164 sem sufixos de JID.
+    - Remove qualquer sufixo após '@' (incluindo @lid, @s.whatsapp.net, @c.us)
+    - Remove espaços e caracteres não numéricos
+    - Mantém apenas dígitos (sem '+')
+    - Para @lid: extrai apenas os dígitos antes do @
+    """
+    if not number:
+        return None
+    s = str(number).strip()
+
+    # Remover QUALQUER sufixo JID (incluindo @lid)
+    if '@' in s:
+        s = s.split('@', 1)[0]
+
+    s = _NAO_DIGITOS.sub('', s)
+
+    # Validar se é um número de telefone válido (pelo menos 10 dígitos)
+    if len(s) < 10:
+        return None
+
+    return s or None
+
+
+def _saude_evolution() -> tuple[dict, int]:
+    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
+        return {
+            "ok": False,
+            "error": "EVOLUTION_API_URL/INSTANCE_NAME/API_KEY_EVOLUTION ausentes",
+            "env": {
+                "EVOLUTION_API_URL": bool(EVOLUTION_API),
+                "EVOLUTION_INSTANCE_NAME": bool(INSTANCE_NAME),
+                "API_KEY_EVOLUTION": bool(API_KEY)
+            }
+        }, 500
+    saude = monitor_saude.status("evolution")
+    return {
+        "ok": saude["estado"] == OK,
+        **saude,
+        "checks": [saude["detalhes"]] if saude.get("detalhes") else [],
+        "instancia": estado_instancia.status(),
+    }, 200
+
+
+def _saude_notion() -> tuple[dict, int]:
+    if not (os.getenv("NOTION_API_KEY") or os.getenv("Notion_API_Key")):
+        return {"ok": False, "error": "Missing NOTION_API_KEY"}, 500
+    saude = monitor_saude.status("notion")
+    return {"ok": saude["estado"] == OK, "mode": "search", **saude, "sincronizacao": sincronizador_notion.status()}, 200
+
+
+def _sondar_conexao() -> str | None:
+    """Consulta o estado da instância na Evolution (usada enquanto ela está fora do ar)."""
+    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
+        return None
+    with ChamadaExterna("evolution_connection_state") as chamada:
+        resp = requests_http().get(
+            f"{EVOLUTION_API}/instance/connectionState/{INSTANCE_NAME}",
+            headers={"apikey": API_KEY, "Authorization": f"Bearer {API_KEY}"},
+            timeout=5,
+        )
+        chamada.ok = resp.status_code == 200
+    if resp.status_code != 200:
+        # A API respondeu (ex.: 404 numa versão sem o endpoint): não está inacessível
+        return DESCONHECIDO if estado_instancia.estado == INACESSIVEL else None
+    data = json_codec.loads(resp.content) or {}
+    return estado_do_evento(data.get("instance") or data)
+
+
+def _sondar_evolution() -> tuple[bool | str, dict] | None:
+    """Sonda do monitor de saúde: connectionState da instância. O estado lido também
+    atualiza o EstadoInstancia (pausa/retomada dos envios, ver conexao.py).
+    Só conexão recusada/timeout é falha (exceção -> "fora", pausa os envios). Um erro
+    HTTP (404 de uma versão sem o endpoint, 401, 5xx) prova que a API responde:
+    "degradada", sem pausar nada.
+    """
+    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
+        return None
+    url = f"{EVOLUTION_API}/instance/connectionState/{INSTANCE_NAME}"
+    resp = requests_http().get(url, headers={"apikey": API_KEY, "Authorization": f"Bearer {API_KEY}"},
+                        timeout=SAUDE_TIMEOUT_SEGUNDOS)
+    estado_instancia.alcancada("monitor")
+    detalhes = {"url": url, "code": resp.status_code, "body": (resp.text or "")[:400]}
+    if resp.status_code != 200:
+        return DEGRADADA, detalhes
+    try:
+        data = json_codec.loads(resp.content) or {}
+    except ValueError:
+        return DEGRADADA, detalhes
+    estado = estado_do_evento(data.get("instance") or data) if isinstance(data, dict) else None
+    detalhes["estado"] = estado
+    if estado and estado != estado_instancia.estado:
+        estado_instancia.atualizar(estado, origem="monitor")
+    return True, detalhes
+
+
+def _sondar_checkout_node() -> tuple[bool, dict]:
+    """Sonda do monitor de saúde: o /gerar-pix precisa do node e do checkout.js."""
+    import subprocess
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'checkout.js')
+    if not os.path.exists(script):
+        return False, {"erro": "checkout.js não encontrado"}
+    result = subprocess.run(['node', '--version'], capture_output=True, text=True, timeout=SAUDE_TIMEOUT_SEGUNDOS)
+    return result.returncode == 0, {"node": result.stdout.strip() or result.stderr.strip()[:200]}
+
+
+def _ao_mudar_saude(nome: str, anterior: str, novo: str) -> None:
+    # API da Evolution sem resposta (conexão/timeout): os envios ficam guardados
+    # (conexao.py) em vez de esperar timeout. Qualquer resposta HTTP (sonda, fila
+    # pausada ou envio bem-sucedido) libera de novo, ver EstadoInstancia.alcancada
+    if nome == "evolution" and novo == FORA:
+        estado_instancia.atualizar(INACESSIVEL, origem="monitor")
+
+
+def _coletar_itens(payload: dict | list) -> list[tuple[str | None, dict]]:
+    """Achata o payload (evento único, lista de eventos, data.messages) em (evento, item)."""
+    itens = []
+    eventos = payload if isinstance(payload, list) else [payload]
+    for evento in eventos:
+        if not isinstance(evento, dict):
+            continue
+        event_type = evento.get('event')
+        data = evento.get('data', evento)
+        for entry in _iter_event_items(event_type, data):
+            itens.append((event_type, entry))
+    return itens
+
+
+def _enviar_ou_guardar(fn, *args) -> Future | None:
+    """Envia pelo pool de envios ou, com a instância fora do ar, guarda para a reconexão."""
+    if saida_pausavel.tentar_guardar(fn, *args):
+        return None
+    return pool_envios.submeter(fn, *args)
+
+
+def _descartar_envio_guardado(fn, args: tuple, motivo: str) -> None:
+    """Envio guardado que expirou (ou foi empurrado) na fila de saída: não volta no reenvio do outbox."""
+    for arg in args:
+        if isinstance(arg, EntradaOutbox):
+            outbox.abandonar(arg, f"fila_saida_{motivo}")
+
+
+def _notificar(numero: str, texto: str) -> None:
+    """Aviso fora do fluxo de mensagens (pagamento, expiração), também journalado no outbox."""
+    entrada = outbox.registrar(numero, [{"tipo": "texto", "texto": texto}])
+    _enviar_ou_guardar(_enviar_resposta, numero, texto, None, entrada)
+
+
+def _enviar_resposta(number: str, reply: str, prazo: Prazo | None = None, entrada: EntradaOutbox | None = None) -> str:
+    """Envia a resposta e, quando gerado, o PIX (copia e cola + QR Code).
+    Com entrada do outbox, só envia depois de ela estar em disco e confirma cada parte aceita.
+    Se o prazo da mensagem acabar, os envios restantes são abandonados.
+    """
+    print(f"🤖 Resposta (bot_simples): {reply}")
+    partes = entrada.partes if entrada is not None else _partes_da_resposta(number, reply)
+    with span("enviar_resposta", partes=len(partes)) as etapa:
+        outbox.aguardar(entrada)
+        try:
+            _enviar_partes(number, partes, prazo, entrada)
+        except PrazoEsgotado as e:
+            print(f"⏱️ {e}: envios restantes para {number} abandonados ({prazo.decorrido():.1f}s)")
+            outbox.abandonar(entrada, "prazo")
+            if etapa is not None:
+                etapa.erro = str(e)
+    return reply
+
+
+def _partes_da_resposta(number: str, reply: str) -> list[dict]:
+    """Mensagens da resposta: o texto e, se o PIX foi gerado, o copia e cola e a imagem do QR Code."""
+    partes = [{"tipo": "texto", "texto": reply}]
+    conv = bot_simples.conversas.get(number)
+    if not conv or not conv.get("enviar_pix"):
+        return partes
+    pix_code = conv.get("pix_code")
+    qr_base64 = conv.get("qr_base64")
+    print(f"🔍 Debug - pix_code existe: {bool(pix_code)}")
+    print(f"🔍 Debug - qr_base64 existe: {bool(qr_base64)}")
+
+    # Mensagem 2: Código PIX copia e cola (sem formatação)
+    if pix_code:
+        partes.append({"tipo": "texto", "texto": pix_code})
+    else:
+        print("⚠️ pix_code está vazio ou None")
+
+    # Mensagem 3: Imagem do QR Code (base64)
+    if qr_base64:
+        valor = conv.get("prato", {}).get("preco", 0) / 100
+        partes.append({
+            "tipo": "midia",
+            "media_type": "image",
+            "file_name": "qrcode_pix.png",
+            "caption": f"Escaneie o QR Code para pagar R$ {valor:.2f}",
+            "media": qr_base64,
+        })
+    else:
+        print("⚠️ qr_base64 está vazio ou None")
+    return partes
+
+
+def _enviar_partes(number: str, partes: list[dict], prazo: Prazo | None = None, entrada: EntradaOutbox | None = None) -> None:
+    """Envia as partes em ordem, pulando as já confirmadas no outbox (reenvio)."""
+    for i, parte in enumerate(partes):
+        if entrada is not None and i in entrada.confirmadas:
+            continue
+        if parte.get("tipo") == "midia":
+            print(f"📸 Enviando QR Code como imagem (base64): {parte['media'][:80]}...")
+            ok = send_media_web(
+                number=number,
+                media_type=parte["media_type"],
+                file_name=parte["file_name"],
+                caption=parte["caption"],
+                media=parte["media"],
+                prazo=prazo
+            )
+            print(f"📸 Resultado envio mídia: {ok}")
+            # Usuários web recebem o PIX no retorno HTTP; os demais já receberam no WhatsApp
+            conv = bot_simples.conversas.get(number)
+            if ok and conv and conv.get("qr_base64") == parte["media"] and not str(number).startswith('web-'):
+                # Limpar dados do QR após envio bem-sucedido
+                conv.pop("qr_base64", None)
+                conv.pop("pix_code", None)
+                conv.pop("enviar_pix", None)
+        else:
+            if i > 0:
+                print(f"📋 Enviando código PIX copia e cola ({len(parte['texto'])} chars)")
+            ok = send_text_web(number, parte["texto"], prazo)
+        if ok:
+            outbox.confirmar(entrada, i)
+            if i == 0:
+                supressor_respostas.confirmar(_normalize_number(number) or number, parte["texto"])
+        elif entrada is not None and _normalize_number(number) in EVOLUTION_INVALID_NUMBERS:
+            # Número fora do WhatsApp: as demais partes (e o reenvio na subida) falhariam igual
+            outbox.abandonar(entrada, "numero_invalido")
+            return
+
+
+def _reenviar_do_outbox(entrada: EntradaOutbox) -> None:
+    """Reenvio na subida: só as partes que não chegaram a ser confirmadas."""
+    print(f"📒 Reenviando resposta pendente do outbox para {entrada.numero} ({entrada.id})")
+    _enviar_partes(entrada.numero, entrada.partes, None, entrada)
+
+
+def extract_text_and_number(event_type: str | None, item: dict):
+    """Extrai texto e número do payload conforme o tipo de evento, cobrindo variações comuns da Evolution/Baileys."""
+    if not item:
+        return None, None
+
+    # Helpers de leitura
+    def clean_number(n: str | None):
+        if not n:
+            return None
+        n = n.strip()
+        if '@' in n:
+            n = n.split('@', 1)[0]
+        return n
+
+    def text_from_message(msg: dict):
+        # Conversas/Texto estendido
+        if 'conversation' in msg:
+            return msg.get('conversation')
+        etm = msg.get('extendedTextMessage') or {}
+        if isinstance(etm, dict) and etm.get('text'):
+            return etm.get('text')
+        # Botões/Listas
+        brm = msg.get('buttonsResponseMessage') or {}
+        if isinstance(brm, dict) and brm:
+            return brm.get('selectedDisplayText') or brm.get('selectedButtonId')
+        lrm = msg.get('listResponseMessage') or {}
+        if isinstance(lrm, dict) and lrm:
+            single = lrm.get('singleSelectReply') or {}
+            return single.get('selectedRowId') or single.get('title')
+        # Imagem/Vídeo com legenda
+        im = msg.get('imageMessage') or {}
+        if isinstance(im, dict) and im.get('caption'):
+            return im.get('caption')
+        vm = msg.get('videoMessage') or {}
+        if isinstance(vm, dict) and vm.get('caption'):
+            return vm.get('caption')
+        # Documento
+        dm = msg.get('documentMessage') or {}
+        if isinstance(dm, dict) and dm:
+            return dm.get('caption') or '[DOCUMENT_MESSAGE]'
+        # Áudio/ptt
+        if msg.get('audioMessage') or msg.get('ptt') or msg.get('voiceMessage'):
+            return '[AUDIO_MESSAGE]'
+        return None
+
+    # Evento simples: message (Evolution)
+    if event_type == 'message' or item.get('type') == 'message':
+        text = item.get('body') or item.get('text') or None
+        # Capturar legendas em mídia
+        if not text:
+            if (item.get('type') in ['image', 'video', 'document']) and isinstance(item.get('media'), dict):
+                text = item.get('media', {}).get('caption')
+            if item.get('type') == 'audio':
+                text = '[AUDIO_MESSAGE]'
+        number = clean_number(item.get('from') or item.get('jid') or item.get('chatId'))
+        return (text or None), (number or None)
+
+    # Evento Baileys: messages.upsert (Evolution v3/v4)
+    if event_type == 'messages.upsert':
+        key = item.get('key') or {}
+        message = item.get('message') or {}
+        from_me = bool(key.get('fromMe', False))
+        if from_me:
+            return None, None
+        number = clean_number(key.get('remoteJid') or item.get('from') or item.get('jid') or item.get('chatId'))
+        text = text_from_message(message)
+        return (text or None), (number or None)
+
+    # Fallback: tentar campos genéricos
+    text = item.get('body') or item.get('text')
+    number = clean_number(item.get('from') or item.get('jid') or item.get('chatId'))
+    return (text or None), (number or None)
+
+def _iter_event_items(event_type: str | None, data: dict | list):
+    """Normaliza os itens do evento em uma lista processável."""
+    if event_type == 'messages.upsert':
+        # Formatos possíveis: data é um dict com 'messages' (lista) ou um item único
+        if isinstance(data, dict) and isinstance(data.get('messages'), list):
+            return data.get('messages')
+        if isinstance(data, list):
+            return data
+        return [data]
+    # Demais eventos: aceitar lista ou item único
+    if isinstance(data, list):
+        return data
+    return [data]
+
+def _safe_dump(obj: dict, maxlen: int = 600):
+    try:
+        s = json_codec.dumps(obj or {})
+        return s if len(s) <= maxlen else (s[:maxlen] + '…')
+    except Exception:
+        return str(obj)[:maxlen]
+
+
+def send_text_web(number: str, text: str, prazo: Prazo | None = None):
+    """Wrapper para enviar texto, detectando usuários web."""
+    # Para usuários web, apenas logar e retornar (não enviar para WhatsApp)
+    if number.startswith('web-'):
+        print(f"🌐 Usuário web detectado: {number} - mensagem: {text[:50]}...")
+        return
+    # Para números normais, usar função original
+    return send_text(number, text, prazo)
+
+def send_media_web(number: str, media_type: str, file_name: str, caption: str, media: str, prazo: Prazo | None = None):
+    """Wrapper para enviar mídia, detectando usuários web."""
+    # Para usuários web, apenas logar e retornar (não enviar para WhatsApp)
+    if number.startswith('web-'):
+        print(f"🌐 Usuário web detectado: {number} - envio de mídia ignorado")
+        return True  # Retornar sucesso para não quebrar o fluxo
+    # Para números normais, usar função original
+    return send_media(number, media_type, file_name, caption, media, prazo)
+
+def send_text(number: str, text: str, prazo: Prazo | None = None) -> bool:
+    """Envia texto via Evolution API. Retorna True quando o servidor aceita (2xx).
+    Com prazo, o timeout é o que resta dele (PrazoEsgotado se já acabou).
+    """
+    requests = requests_http()
+    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
+        print("❌ Configuração ausente: verifique EVOLUTION_API_URL, EVOLUTION_INSTANCE_NAME, API_KEY_EVOLUTION no .env")
+        return False
+    number_norm = _normalize_number(number)
+    if not number_norm:
+        print(f"❌ Número inválido para envio de texto: {number}")
+        return False
+    invalido = number_norm in EVOLUTION_INVALID_NUMBERS
+    registrar_cache("numeros_invalidos", invalido)
+    if invalido:
+        print(f"⛔ Ignorando envio: número não está no WhatsApp (cache) -> {number_norm}")
+        return False
+    if not estado_instancia.conectado():
+        print(f"⏸️ Instância {estado_instancia.estado}: envio de texto para {number_norm} não realizado")
+        return False
+
+    # Usar apenas um endpoint canônico e um formato de payload estável
+    endpoints = [
+        f"{EVOLUTION_API}/message/sendText/{INSTANCE_NAME}",
+    ]
+    # Payload compatível com versões atuais da Evolution API
+    def build_payloads(url: str):
+        return [{"number": number_norm, "textMessage": {"text": text}}]
+    headers = {"Content-Type": "application/json", "apikey": API_KEY}
+    # Alguns servidores usam Authorization Bearer
+    headers["Authorization"] = f"Bearer {API_KEY}"
+
+    last_error = None
+    for url in endpoints:
+        if url in EVOLUTION_DISABLED_ENDPOINTS:
+            print(f"⛔ Ignorando endpoint desativado (404 prévio): {url}")
+            continue
+        try:
+            payload = build_payloads(url)[0]
+            timeout = timeout_de(prazo, 12, "envio_texto")
+            print(f"➡️ Enviando texto via {url} para {number_norm}")
+            with ChamadaExterna("evolution_send_text") as chamada:
+                resp = requests.post(url, data=json_codec.dumps_bytes(payload), headers=headers, timeout=timeout)
+                chamada.ok = resp.status_code < 300
+            if resp.status_code < 300:
+                print(f"✅ Texto enviado para {number_norm}: {resp.status_code} via {url}")
+                estado_instancia.alcancada("envio")
+                return True
+            else:
+                # Log compacto para reduzir ruído em 400
+                snippet = resp.text[:200]
+                print(f"⚠️ Falha ({resp.status_code}) em {url}: {snippet}")
+                if resp.status_code == 404:
+                    EVOLUTION_DISABLED_ENDPOINTS.add(url)
+                # Se o servidor indicar que o número/jid não existe, cachear para evitar novas tentativas
+                if resp.status_code == 400:
+                    try:
+                        data = json_codec.loads(resp.content)
+                        msg_list = ((data or {}).get('response') or {}).get('message') or []
+                        for item in msg_list:
+                            if isinstance(item, dict) and item.get('exists') is False:
+                                bad_num = item.get('number') or number_norm
+                                EVOLUTION_INVALID_NUMBERS.add(str(bad_num))
+                                print(f"🚫 Número inválido detectado pelo Evolution (exists=false): {bad_num}")
+                                break
+                    except Exception:
+                        pass
+        except PrazoEsgotado:
+            raise
+        except Exception as e:
+            last_error = e
+            print(f"⚠️ Erro ao enviar texto via {url}: {e}")
+            if isinstance(e, requests.Timeout) and estourou(prazo, "envio_texto"):
+                raise PrazoEsgotado("envio_texto") from e
+
+    if last_error:
+        print(f"❌ Falha ao enviar resposta após tentativas: {last_error}")
+    return False
+
+def send_media(number: str, media_type: str, file_name: str, caption: str, media: str, prazo: Prazo | None = None):
+    """Envia mídia via Evolution API. Com prazo, o timeout é o que resta dele."""
+    requests = requests_http()
+    if not (EVOLUTION_API and INSTANCE_NAME and API_KEY):
+        print("❌ Configuração ausente")
+        return False
+
+    number_norm = _normalize_number(number)
+    if not number_norm:
+        print(f"❌ Número inválido: {number}")
+        return False
+
+    invalido = number_norm in EVOLUTION_INVALID_NUMBERS
+    registrar_cache("numeros_invalidos", invalido)
+    if invalido:
+        print(f"⛔ Número não está no WhatsApp: {number_norm}")
+        return False
+    if not estado_instancia.conectado():
+        print(f"⏸️ Instância {estado_instancia.estado}: envio de mídia para {number_norm} não realizado")
+        return False
+
+    # Se for data URI, extrair apenas o base64
+    media_clean = media
+    if isinstance(media, str) and media.startswith("data:"):
+        try:
+            # data:image/png;base64,iVBORw0KG... -> iVBORw0KG...
+            _, base64_data = media.split(",", 1)
+            media_clean = base64_data
+            print(f"📸 Data URI detectado, extraindo base64 puro")
+        except Exception:
+            pass
+
+    # Endpoint principal
+    url = f"{EVOLUTION_API}/message/sendMedia/{INSTANCE_NAME}"
+
+    # Payload
+    payload = {
+        "number": number_norm,
+        "mediaMessage": {
+            "mediatype": media_type,
+            "caption": caption,
+            "fileName": file_name,
+            "media": media_clean
+        }
+    }
+
+    headers = {
+        "Content-Type": "application/json",
+        "apikey": API_KEY,
+        "Authorization": f"Bearer {API_KEY}"
+    }
+
+    print(f"➡️ Enviando mídia para {number_norm}")
+    print(f"📦 Media length: {len(media_clean) if media_clean else 0}")
+
+    timeout = timeout_de(prazo, 20, "envio_midia")
+    try:
+        with ChamadaExterna("evolution_send_media") as chamada:
+            resp = requests.post(url, data=json_codec.dumps_bytes(payload), headers=headers, timeout=timeout)
+            chamada.ok = resp.status_code < 300
+        if resp.status_code < 300:
+            print(f"✅ Mídia enviada: {resp.status_code}")
+            estado_instancia.alcancada("envio")
+            return True
+        else:
+            print(f"⚠️ Falha ({resp.status_code}): {resp.text[:500]}")
+            return False
+    except Exception as e:
+        print(f"❌ Erro: {e}")
+        if isinstance(e, requests.Timeout) and estourou(prazo, "envio_midia"):
+            raise PrazoEsgotado("envio_midia") from e
+        return False
+
+
+async def criar_cobranca_pix_async(cliente, dados: dict, cpf_para_envio: str, prazo: Prazo | None = None,
+                                   expiracao: int = PIX_EXPIRACAO_SEGUNDOS) -> dict:
+    """BotSimples._criar_cobranca_pix pelo httpx.AsyncClient do app_async.py: mesma requisição
+    e mesmo retorno (com "expira_em", ver BotSimples._resultado_cobranca_pix).
+    Lança PrazoEsgotado quando a chamada falhou com o prazo da mensagem já esgotado.
+    """
+    url, corpo, headers = bot_simples._requisicao_cobranca_pix(dados, cpf_para_envio, expiracao)
+    timeout = timeout_de(prazo, 15, "pix", RESERVA_RESPOSTA)
+    inicio = time.time()
+    try:
+        with ChamadaExterna("abacatepay_criar_pix") as chamada:
+            resp = await cliente.post(url, content=corpo, headers=headers, timeout=timeout)
+            chamada.ok = resp.status_code < 300
+    except Exception as e:
+        if estourou(prazo, "pix", RESERVA_RESPOSTA):
+            raise PrazoEsgotado("pix") from e
+        return {"ok": False, "erro": f"❌ Erro de comunicação com AbacatePay: {e}"}
+    return bot_simples._resultado_cobranca_pix(resp.status_code, resp.content, inicio + expiracao)
+
+
+def _ao_pagar_cobranca(numero: str, pix_id: str):
+    """Pagamento confirmado: avisa o cliente sempre, mesmo que ele já tenha mandado outra
+    mensagem ("paguei" reinicia a conversa e limpa o pix_id) ou começado outro pedido.
+    A conversa só é encerrada se ainda estiver neste PIX.
+    """
+    conv = bot_simples.conversas.get(numero)
+    if conv is not None and conv.get("pix_id") == pix_id:
+        bot_simples.resetar_conversa(numero)
+    _notificar(numero, "✅ Pagamento confirmado! Seu pedido já está sendo preparado. 🛵")
+
+
+def _ao_expirar_cobranca(numero: str, pix_id: str):
+    """PIX expirado: avisa o cliente, a menos que a conversa já esteja num PIX mais novo.
+    Uma conversa reiniciada depois do PIX (pix_id vazio) ainda recebe o aviso; só a que
+    continua neste PIX é liberada, para não apagar um pedido novo em andamento.
+    """
+    conv = bot_simples.conversas.get(numero)
+    atual = conv.get("pix_id") if conv is not None else None
+    if atual not in (None, pix_id):
+        return
+    if atual == pix_id:
+        bot_simples.resetar_conversa(numero)
+    _notificar(numero, "⏳ Seu PIX expirou sem pagamento. Digite *menu* para fazer um novo pedido.")
+
+
+_servicos_iniciados = False
+
+
+def iniciar_servicos() -> None:
+    """Liga as peças de fundo do bot: ganchos das cobranças e da fila de saída,
+    reenvio do outbox, monitor de dependências e sincronização do Notion.
+    Fica fora da importação porque dispatcher.py e os benchmarks importam este
+    módulo só pelas funções; App.py e app_async.py chamam uma vez na subida.
+    """
+    global _servicos_iniciados
+    if _servicos_iniciados:
+        return
+    _servicos_iniciados = True
+    registro_cobrancas.configurar(
+        verificar_status=consultar_status_pix,
+        ao_pagar=_ao_pagar_cobranca,
+        ao_expirar=_ao_expirar_cobranca,
+    )
+    saida_pausavel.configurar(submeter=pool_envios.submeter, sondar=_sondar_conexao, descartar=_descartar_envio_guardado)
+    outbox.iniciar(reenviar=lambda entrada: _enviar_ou_guardar(_reenviar_do_outbox, entrada))
+    monitor_saude.registrar("evolution", _sondar_evolution)
+    monitor_saude.registrar("notion", sondar_notion)
+    monitor_saude.registrar("abacatepay", sondar_abacatepay)
+    monitor_saude.registrar("checkout_node", _sondar_checkout_node)
+    monitor_saude.ao_mudar(_ao_mudar_saude)
+    monitor_saude.iniciar()
+    sincronizador_notion.iniciar()
+
+
+# Filas próprias de cada servidor (ex.: coalescência do App.py) no bot_fila_profundidade
+_filas_do_servidor: dict[str, Callable[[], int]] = {}
+
+
+def registrar_fila(nome: str, tamanho: Callable[[], int]) -> None:
+    """Soma uma fila do servidor às filas comuns (pools, fila de saída, outbox) no /metrics."""
+    _filas_do_servidor[nome] = tamanho
+
+
+# Métricas lidas só na coleta do /metrics (sem custo por mensagem)
+@medidor("bot_conversas_ativas", "Conversas em memória por estado do fluxo.", ("estado",))
+def _conversas_por_estado():
+    contagem = dict.fromkeys(NOMES_ESTADOS, 0)
+    for conv in list(bot_simples.conversas.values()):
+        contagem[conv.nome_estado] += 1
+    return {(estado,): total for estado, total in contagem.items()}
+
+
+@medidor("bot_fila_profundidade", "Itens esperando em cada fila interna.", ("fila",))
+def _profundidade_filas():
+    filas = {(f"pool_{nome}",): st["na_fila"] for nome, st in status_pools().items()}
+    filas[("saida_pausada",)] = saida_pausavel.status()["na_fila"]
+    filas[("outbox_gravacao",)] = outbox.status()["na_fila_gravacao"]
+    for nome, tamanho in list(_filas_do_servidor.items()):
+        filas[(nome,)] = tamanho()
+    return filas
+
+
+@medidor("bot_pool_em_execucao", "Tarefas rodando em cada pool.", ("pool",))
+def _pools_em_execucao():
+    return {(nome,): st["em_execucao"] for nome, st in status_pools().items()}
+
+
+@medidor("bot_outbox_pendentes", "Respostas no outbox ainda sem confirmação da Evolution.")
+def _outbox_pendentes():
+    return outbox.status()["pendentes"]
+
+
+@medidor("bot_cobrancas_pendentes", "Cobranças PIX acompanhadas aguardando pagamento.")
+def _cobrancas_pendentes():
+    return registro_cobrancas.status()["pendentes"]
+
+
+@medidor("bot_cache_entradas", "Entradas em cada cache local.", ("cache",))
+def _tamanho_caches():
+    return {
+        ("supressao",): supressor_respostas.status()["entradas"],
+        ("numeros_invalidos",): len(EVOLUTION_INVALID_NUMBERS),
+        ("pix_especulativo",): len(bot_simples.pix_especulativo),
+    }
+
+
+@medidor("bot_supressao_verificacoes_total", "Respostas checadas no supressor (suprimida = acerto no cache).",
+         ("resultado",), tipo="counter")
+def _verificacoes_supressao():
+    st = supressor_respostas.status()
+    return {("suprimida",): st["suprimidas"], ("enviada",): st["verificadas"] - st["suprimidas"]}
+
+
+@medidor("bot_dependencia_disponivel", "1 quando o monitor de saúde considera a dependência disponível.",
+         ("dependencia",))
+def _dependencias_disponiveis():
+    return {(nome,): 1 if st["disponivel"] else 0 for nome, st in monitor_saude.status()["dependencias"].items()}
+
+
+@medidor("bot_evolution_conectada", "1 quando a instância da Evolution está conectada.")
+def _evolution_conectada():
+    return 1 if estado_instancia.conectado() else 0
+
+
+# Estruturas residentes contadas no /debug/memoria (ver memoria.py)
+contabilidade.compartilhar(lambda: CARDAPIO)  # Conversa.prato aponta para os itens, sem cópia
+contabilidade.registrar("conversas", lambda: bot_simples.conversas, "bot_simples.conversas")
+contabilidade.registrar("qr_codes", lambda: [
+    conv.pix.qr_base64 for conv in list(bot_simples.conversas.values()) if conv.pix is not None and conv.pix.qr_base64
+], "QR Codes em base64 guardados nas conversas", parte_de="conversas")
+contabilidade.registrar("numeros_invalidos", lambda: EVOLUTION_INVALID_NUMBERS)
+contabilidade.registrar("endpoints_desativados", lambda: EVOLUTION_DISABLED_ENDPOINTS)
+contabilidade.registrar("pix_especulativo", lambda: bot_simples.pix_especulativo)
+contabilidade.registrar("supressao", lambda: supressor_respostas._vistos)
+contabilidade.registrar("outbox_pendentes", lambda: outbox._pendentes)
+contabilidade.registrar("cobrancas_pendentes", lambda: registro_cobrancas._pendentes)
+contabilidade.registrar("rastros", lambda: rastreador._rastros)
+contabilidade.registrar("notion_sync", lambda: sincronizador_notion._paginas)
+
+
+def _descrever_conversa(numero: str, conv) -> dict:
+    pix = conv.pix
+    return {
+        "estado": conv.nome_estado,
+        "com_pix": pix is not None,
+        "qr_bytes": len(pix.qr_base64) if pix is not None and pix.qr_base64 else 0,
+    }
+
+
+def criar_checkout_cli():
+    """Cria/Recria script CLI para chamar checkout.js com validade em segundos"""
+    cli_content = """#!/usr/bin/env node
+import { criarPixCheckout } from './checkout.js';
+
+const [,, produtoNome, valorCentavos, clienteNome, clienteTelefone, expiresSeconds, clienteCpf] = process.argv;
+
+criarPixCheckout(
+    produtoNome,
+    parseInt(valorCentavos),
+    clienteNome,
+    clienteTelefone,
+    'cliente@email.com',
+    clienteCpf || '',
+    parseInt(expiresSeconds || '3600')
+).then(result => {
+    console.log(JSON.stringify(result));
+    process.exit(0);
+}).catch(error => {
+    console.error(JSON.stringify({ success: false, error: error.message }));
+    process.exit(1);
+});
+"""
+    with open('checkout_cli.js', 'w') as f:
+        f.write(cli_content)
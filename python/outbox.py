@@ -0,0 +1,386 @@
+"""
+Outbox durável das respostas (diário local, só de acréscimo)
+
+Se o processo morria entre o processar_mensagem avançar o estado e o send_text
+terminar, o cliente ficava sem o código PIX e não sobrava registro disso.
+Agora cada resposta vira uma entrada no diário (OUTBOX_ARQUIVO, uma linha JSON
+por registro) antes de ser despachada:
+
+- {"op": "env", "id", "ts", "numero", "partes": [...]}  -> mensagens a enviar
+- {"op": "ack", "id", "parte": i}                       -> parte i aceita (2xx)
+- {"op": "abd", "id", "motivo"}                         -> abandonada de vez (não reenviar)
+
+Gravação em grupo: registrar() só enfileira a linha; uma thread escritora junta
+tudo o que chegou enquanto o fsync anterior rodava e faz um único write + fsync
+para o lote. O envio espera a gravação (entrada.gravada) antes do primeiro POST,
+então o custo no caminho da resposta é o de um fsync compartilhado. As
+confirmações não esperam fsync: perder uma só causa um reenvio (pelo menos uma vez).
+
+Na subida, o diário é lido, as entradas sem confirmação de todas as partes são
+reenviadas (só as partes que faltam) e o arquivo é compactado. Entradas mais
+velhas que OUTBOX_IDADE_MAX_REPLAY são descartadas, assim como as abandonadas
+(falhas que um reenvio não resolve: número fora do WhatsApp, prazo da mensagem
+esgotado, item expirado na fila de saída pausada).
+
+Com o processo no ar, a thread escritora abandona a cada OUTBOX_LIMPEZA_SEGUNDOS
+as pendentes mais velhas que OUTBOX_IDADE_MAX_REPLAY (5xx, timeout, Evolution
+sem configuração: nada mais as tiraria da memória). A compactação roda quando
+o diário passa do dobro do que a última compactação escreveu (e de
+OUTBOX_COMPACTAR_BYTES): com muitas pendentes vivas ela não vira uma reescrita
+a cada lote.
+
+O diário guarda o copia e cola e o QR Code do PIX enquanto a resposta não é
+entregue, então o arquivo (e o temporário da compactação) é criado só com
+permissão do dono (0600).
+"""
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import Future, InvalidStateError
+from concurrent.futures import TimeoutError as FuturoTimeout
+from typing import Any, Callable, Dict, List, Optional
+
+import json_codec
+
+OUTBOX_ARQUIVO = os.getenv("OUTBOX_ARQUIVO", f"outbox-{os.getenv('PORT', '8001')}.jsonl")  # vazio = desligado
+OUTBOX_GRUPO_MS = float(os.getenv("OUTBOX_GRUPO_MS", "0"))  # espera extra para engordar o lote
+OUTBOX_ESPERA_MAX = float(os.getenv("OUTBOX_ESPERA_MAX", "1"))
+OUTBOX_COMPACTAR_BYTES = int(os.getenv("OUTBOX_COMPACTAR_BYTES", str(8 * 1024 * 1024)))
+OUTBOX_IDADE_MAX_REPLAY = float(os.getenv("OUTBOX_IDADE_MAX_REPLAY", "3600"))
+OUTBOX_LIMPEZA_SEGUNDOS = float(os.getenv("OUTBOX_LIMPEZA_SEGUNDOS", "60"))
+
+
+class EntradaOutbox:
+    """Resposta journalada: as partes (texto / mídia) e quais já foram aceitas."""
+
+    __slots__ = ("id", "numero", "partes", "criada", "confirmadas", "gravada", "abandonada")
+
+    def __init__(self, id: str, numero: str, partes: List[dict], criada: float):
+        self.id = id
+        self.numero = numero
+        self.partes = partes
+        self.criada = criada
+        self.confirmadas: set = set()
+        self.gravada: Future = Future()
+        self.abandonada = False
+
+    def completa(self) -> bool:
+        return self.abandonada or len(self.confirmadas) >= len(self.partes)
+
+    def registro(self) -> dict:
+        reg = {"op": "env", "id": self.id, "ts": self.criada, "numero": self.numero, "partes": self.partes}
+        if self.confirmadas:
+            reg["confirmadas"] = sorted(self.confirmadas)
+        return reg
+
+
+def _linha(registro: dict) -> bytes:
+    return json_codec.dumps_bytes(registro) + b"\n"
+
+
+def _abrir_privado(caminho: str, truncar: bool = False):
+    """Abre para acréscimo (ou recria) com permissão 0600, inclusive se o arquivo já existia."""
+    flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | (os.O_TRUNC if truncar else 0)
+    fd = os.open(caminho, flags, 0o600)
+    try:
+        os.chmod(caminho, 0o600)
+    except OSError:
+        pass
+    return os.fdopen(fd, "ab")
+
+
+def _resolver(futuro: Optional[Future], valor: bool) -> None:
+    if futuro is None:
+        return
+    try:
+        futuro.set_result(valor)
+    except InvalidStateError:
+        pass  # quem esperava desistiu (cancelado)
+
+
+class Outbox:
+    """Diário de saída com gravação em grupo (uma thread escritora, um fsync por lote)."""
+
+    def __init__(self, caminho: str = OUTBOX_ARQUIVO, grupo_ms: float = OUTBOX_GRUPO_MS,
+                 compactar_bytes: int = OUTBOX_COMPACTAR_BYTES, idade_max_replay: float = OUTBOX_IDADE_MAX_REPLAY,
+                 intervalo_limpeza: float = OUTBOX_LIMPEZA_SEGUNDOS):
+        self.caminho = caminho
+        self.grupo = grupo_ms / 1000.0
+        self.compactar_bytes = compactar_bytes
+        self.idade_max_replay = idade_max_replay
+        self.intervalo_limpeza = intervalo_limpeza
+        self._bytes_compactados = 0  # tamanho escrito pela última compactação
+        self._cond = threading.Condition()
+        self._fila: List[tuple] = []  # (linha, futuro ou None)
+        self._pendentes: Dict[str, EntradaOutbox] = {}
+        self._arquivo = None
+        self._thread = None
+        self.registradas = 0
+        self.confirmadas = 0
+        self.reenviadas = 0
+        self.descartadas_antigas = 0
+        self.abandonadas = 0
+        self.fsyncs = 0
+        self.maior_lote = 0
+        self.compactacoes = 0
+        self.falhas_gravacao = 0
+        self._fsync_total = 0.0
+        self._fsync_max = 0.0
+
+    @property
+    def ativo(self) -> bool:
+        return self._arquivo is not None
+
+    # ------------------------------------------------------------------
+    # Subida: leitura, compactação e reenvio
+    # ------------------------------------------------------------------
+
+    def _ler_diario(self) -> Dict[str, EntradaOutbox]:
+        entradas: Dict[str, EntradaOutbox] = {}
+        with open(self.caminho, "rb") as f:
+            for linha in f:
+                try:
+                    reg = json_codec.loads(linha)
+                except Exception:
+                    continue  # linha cortada por queda no meio do write
+                if not isinstance(reg, dict):
+                    continue
+                op, id_ = reg.get("op"), reg.get("id")
+                if op == "env" and id_ not in entradas:
+                    entrada = EntradaOutbox(id_, reg.get("numero") or "", reg.get("partes") or [], reg.get("ts") or 0.0)
+                    entrada.confirmadas.update(reg.get("confirmadas") or ())
+                    entradas[id_] = entrada
+                elif op == "ack" and id_ in entradas:
+                    entradas[id_].confirmadas.add(reg.get("parte"))
+                elif op == "abd" and id_ in entradas:
+                    entradas[id_].abandonada = True
+        return entradas
+
+    def _reescrever(self, linhas: List[bytes]):
+        """Troca o diário por um só com as entradas pendentes (tmp + fsync + rename).
+        Retorna o arquivo novo já aberto para acréscimo (o próprio temporário, que
+        passa a ser o diário no rename): não há reabertura que possa falhar depois.
+        """
+        temporario = self.caminho + ".tmp"
+        conteudo = b"".join(linhas)
+        f = _abrir_privado(temporario, truncar=True)
+        try:
+            f.write(conteudo)
+            f.flush()
+            os.fsync(f.fileno())
+            os.replace(temporario, self.caminho)
+        except OSError:
+            f.close()
+            raise
+        self.compactacoes += 1
+        self._bytes_compactados = len(conteudo)
+        return f
+
+    def abrir(self) -> List[EntradaOutbox]:
+        """Lê o diário, compacta e abre para acréscimo. Retorna as entradas a reenviar."""
+        if not self.caminho or self._arquivo is not None:
+            return []
+        pendentes: List[EntradaOutbox] = []
+        try:
+            if os.path.exists(self.caminho):
+                limite = time.time() - self.idade_max_replay
+                for entrada in self._ler_diario().values():
+                    if entrada.abandonada:
+                        self.abandonadas += 1
+                        continue
+                    if entrada.completa():
+                        continue
+                    if entrada.criada < limite:
+                        self.descartadas_antigas += 1
+                        continue
+                    _resolver(entrada.gravada, True)
+                    pendentes.append(entrada)
+                self._arquivo = self._reescrever([_linha(e.registro()) for e in pendentes])
+            else:
+                self._arquivo = _abrir_privado(self.caminho)
+        except OSError as e:
+            print(f"⚠️ Outbox desligado: não foi possível abrir {self.caminho}: {e}")
+            return []
+        with self._cond:
+            for entrada in pendentes:
+                self._pendentes[entrada.id] = entrada
+        self._thread = threading.Thread(target=self._loop, name="outbox", daemon=True)
+        self._thread.start()
+        print(f"📒 Outbox {self.caminho}: {len(pendentes)} resposta(s) pendente(s) para reenviar")
+        return pendentes
+
+    def iniciar(self, reenviar: Callable[[EntradaOutbox], Any]) -> None:
+        """Abre o diário e reenvia as pendentes em segundo plano.
+        `reenviar(entrada)` agenda o envio; se falhar (pool cheio), tenta de novo.
+        """
+        pendentes = self.abrir()
+        if not pendentes:
+            return
+
+        def _reenviar_todas():
+            for entrada in pendentes:
+                while True:
+                    try:
+                        reenviar(entrada)
+                        self.reenviadas += 1
+                        break
+                    except Exception as e:
+                        print(f"⚠️ Reenvio do outbox adiado: {e}")
+                        time.sleep(0.5)
+
+        threading.Thread(target=_reenviar_todas, name="outbox-reenvio", daemon=True).start()
+
+    # ------------------------------------------------------------------
+    # Caminho da resposta
+    # ------------------------------------------------------------------
+
+    def registrar(self, numero: str, partes: List[dict]) -> Optional[EntradaOutbox]:
+        """Enfileira a entrada no diário e retorna na hora; entrada.gravada conclui após o fsync.
+        Usuários web (resposta no retorno HTTP) e outbox desligado retornam None.
+        """
+        if self._arquivo is None or not partes or str(numero).startswith("web-"):
+            return None
+        entrada = EntradaOutbox(uuid.uuid4().hex, numero, partes, time.time())
+        linha = _linha(entrada.registro())
+        with self._cond:
+            self._pendentes[entrada.id] = entrada
+            self._fila.append((linha, entrada.gravada))
+            self.registradas += 1
+            self._cond.notify()
+        return entrada
+
+    def aguardar(self, entrada: Optional[EntradaOutbox], timeout: float = OUTBOX_ESPERA_MAX) -> None:
+        """Espera a entrada chegar ao disco antes do envio (sem travar o envio se o disco falhar)."""
+        if entrada is None:
+            return
+        try:
+            entrada.gravada.result(timeout=timeout)
+        except FuturoTimeout:
+            print(f"⚠️ Outbox: gravação de {entrada.id} passou de {timeout}s, enviando mesmo assim")
+
+    def confirmar(self, entrada: Optional[EntradaOutbox], parte: int) -> None:
+        """Parte aceita pela Evolution (2xx). Com todas as partes, a entrada sai das pendentes."""
+        if entrada is None or self._arquivo is None or parte in entrada.confirmadas:
+            return
+        linha = _linha({"op": "ack", "id": entrada.id, "parte": parte})
+        with self._cond:
+            entrada.confirmadas.add(parte)
+            if entrada.completa():
+                self._pendentes.pop(entrada.id, None)
+            self._fila.append((linha, None))
+            self.confirmadas += 1
+            self._cond.notify()
+
+    def abandonar(self, entrada: Optional[EntradaOutbox], motivo: str) -> None:
+        """Falha que um reenvio não resolve: a entrada sai das pendentes e não volta na subida."""
+        if entrada is None or self._arquivo is None or entrada.abandonada or entrada.completa():
+            return
+        linha = _linha({"op": "abd", "id": entrada.id, "motivo": motivo})
+        with self._cond:
+            entrada.abandonada = True
+            self._pendentes.pop(entrada.id, None)
+            self._fila.append((linha, None))
+            self.abandonadas += 1
+            self._cond.notify()
+        print(f"📒 Outbox: resposta {entrada.id} para {entrada.numero} abandonada ({motivo})")
+
+    # ------------------------------------------------------------------
+    # Thread escritora
+    # ------------------------------------------------------------------
+
+    def _loop(self) -> None:
+        proxima_limpeza = time.monotonic() + self.intervalo_limpeza
+        while True:
+            with self._cond:
+                while not self._fila:
+                    espera = proxima_limpeza - time.monotonic()
+                    if espera <= 0:
+                        break
+                    self._cond.wait(espera)
+                if time.monotonic() >= proxima_limpeza:
+                    proxima_limpeza = time.monotonic() + self.intervalo_limpeza
+                    self._abandonar_antigas()
+                if not self._fila:
+                    continue
+                if self.grupo:
+                    self._cond.wait(self.grupo)
+                lote, self._fila = self._fila, []
+            ok = True
+            inicio = time.perf_counter()
+            try:
+                self._arquivo.write(b"".join(linha for linha, _ in lote))
+                self._arquivo.flush()
+                os.fsync(self._arquivo.fileno())
+            except OSError as e:
+                ok = False
+                self.falhas_gravacao += 1
+                print(f"⚠️ Outbox: falha ao gravar {len(lote)} registro(s): {e}")
+            duracao = time.perf_counter() - inicio
+            self.fsyncs += 1
+            self._fsync_total += duracao
+            self._fsync_max = max(self._fsync_max, duracao)
+            self.maior_lote = max(self.maior_lote, len(lote))
+            for _, futuro in lote:
+                _resolver(futuro, ok)
+            if ok and self._arquivo.tell() > max(self.compactar_bytes, 2 * self._bytes_compactados):
+                self._compactar()
+
+    def _abandonar_antigas(self) -> None:
+        """Chamado com o lock: pendentes mais velhas que idade_max_replay (falhas que não
+        confirmaram nem abandonaram a entrada) saem da memória e do próximo replay.
+        """
+        limite = time.time() - self.idade_max_replay
+        antigas = [e for e in self._pendentes.values() if e.criada < limite]
+        for entrada in antigas:
+            entrada.abandonada = True
+            del self._pendentes[entrada.id]
+            self._fila.append((_linha({"op": "abd", "id": entrada.id, "motivo": "idade"}), None))
+        if antigas:
+            self.descartadas_antigas += len(antigas)
+            print(f"📒 Outbox: {len(antigas)} resposta(s) sem confirmação há mais de "
+                  f"{self.idade_max_replay:.0f}s abandonada(s)")
+
+    def _compactar(self) -> None:
+        """Diário com o dobro do que a última compactação deixou: reescreve só as pendentes.
+        Roda na thread escritora. Se a reescrita falhar, segue no diário atual (o arquivo
+        antigo continua aberto).
+        """
+        with self._cond:
+            linhas = [_linha(e.registro()) for e in self._pendentes.values()]
+        try:
+            novo = self._reescrever(linhas)
+        except OSError as e:
+            print(f"⚠️ Outbox: falha ao compactar, mantendo o diário atual: {e}")
+            return
+        # Registros de entradas já incluídas podem chegar de novo: a leitura ignora "env" repetido
+        antigo, self._arquivo = self._arquivo, novo
+        try:
+            antigo.close()
+        except OSError:
+            pass
+
+    def status(self) -> Dict[str, Any]:
+        with self._cond:
+            pendentes = len(self._pendentes)
+            na_fila = len(self._fila)
+        return {
+            "arquivo": self.caminho if self.ativo else None,
+            "pendentes": pendentes,
+            "na_fila_gravacao": na_fila,
+            "registradas": self.registradas,
+            "confirmadas": self.confirmadas,
+            "reenviadas_na_subida": self.reenviadas,
+            "descartadas_antigas": self.descartadas_antigas,
+            "abandonadas": self.abandonadas,
+            "fsyncs": self.fsyncs,
+            "maior_lote": self.maior_lote,
+            "fsync_medio_ms": round(self._fsync_total / self.fsyncs * 1000, 3) if self.fsyncs else 0.0,
+            "fsync_max_ms": round(self._fsync_max * 1000, 3),
+            "compactacoes": self.compactacoes,
+            "bytes_ultima_compactacao": self._bytes_compactados,
+            "falhas_gravacao": self.falhas_gravacao,
+        }
+
+
+outbox = Outbox()
@@ -0,0 +1,240 @@
+"""
+Perfilador por amostragem para requisições em produção (sem reiniciar)
+
+Uma requisição a /webhook ou /bot-simples é perfilada quando:
+- traz o cabeçalho X-Perfil: 1 junto com um X-Admin-Token válido, ou
+- PERFIL_SEMPRE=1, ou
+- sorteada pela taxa PERFIL_AMOSTRAGEM (0.01 = 1%; alterável em execução pelo
+  POST /debug/perfil).
+
+Enquanto houver requisição perfilada, uma thread tira a pilha de todas as
+threads a cada PERFIL_INTERVALO_MS (sys._current_frames). O trabalho de uma
+mensagem passa por vários pools (pools.py), então a thread da requisição sozinha
+mostraria só a espera pelos Futures; as pilhas levam o nome da thread (pool) como
+primeiro quadro. Com requisições perfiladas ao mesmo tempo, cada uma recebe todas
+as amostras da sua janela.
+
+Cada requisição vira um arquivo no formato "collapsed stack" (uma pilha por
+linha, quadros separados por ";" e a contagem no fim), pronto para flamegraph.pl,
+speedscope ou inferno, em PERFIL_DIR; só os PERFIL_MAX_ARQUIVOS mais novos ficam.
+Amostras paradas em espera (locks, filas, sockets, subprocess) terminam com o
+quadro "[espera]" e ficam fora da agregação, a não ser que pedidas (espera=1).
+"""
+import itertools
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+PERFIL_DIR = os.getenv("PERFIL_DIR", f"perfis-{os.getenv('PORT', '8001')}")
+PERFIL_SEMPRE = os.getenv("PERFIL_SEMPRE", "0").strip().lower() in ("1", "true", "sim", "on")
+PERFIL_AMOSTRAGEM = float(os.getenv("PERFIL_AMOSTRAGEM", "0"))
+PERFIL_INTERVALO_MS = float(os.getenv("PERFIL_INTERVALO_MS", "5"))
+PERFIL_MAX_ARQUIVOS = int(os.getenv("PERFIL_MAX_ARQUIVOS", "200"))
+# Uma requisição presa não mantém o amostrador ligado para sempre
+PERFIL_MAX_SEGUNDOS = float(os.getenv("PERFIL_MAX_SEGUNDOS", "60"))
+MARCA_ESPERA = "[espera]"
+EXTENSAO = ".collapsed"
+
+# Último quadro nesses módulos = thread bloqueada (não é CPU do bot)
+_ARQUIVOS_ESPERA = frozenset({
+    "threading.py", "queue.py", "selectors.py", "socket.py", "ssl.py",
+    "socketserver.py", "subprocess.py", "thread.py",
+})
+# Leituras de socket do httpx (notion-client) ficam direto no backend do httpcore
+_CAMINHOS_ESPERA = (os.path.join("httpcore", "_backends"),)
+
+
+class SessaoPerfil:
+    __slots__ = ("rota", "inicio", "contagens", "amostras", "arquivo")
+
+    def __init__(self, rota: str):
+        self.rota = rota
+        self.inicio = time.time()
+        self.contagens: Counter = Counter()
+        self.amostras = 0
+        self.arquivo: Optional[str] = None
+
+
+def _nome_thread(nome: str) -> str:
+    """'pool-respostas_3' -> 'pool-respostas', 'Thread-12 (process_request_thread)' -> 'Thread'."""
+    nome = nome.split(" (", 1)[0]
+    return nome.rstrip("0123456789").rstrip("_-") or nome
+
+
+class Perfilador:
+    def __init__(self, pasta: str = PERFIL_DIR, intervalo_ms: float = PERFIL_INTERVALO_MS,
+                 amostragem: float = PERFIL_AMOSTRAGEM, sempre: bool = PERFIL_SEMPRE,
+                 max_arquivos: int = PERFIL_MAX_ARQUIVOS):
+        self.pasta = pasta
+        self.intervalo = max(intervalo_ms, 1.0) / 1000.0
+        self.amostragem = amostragem
+        self.sempre = sempre
+        self.max_arquivos = max_arquivos
+        self._cond = threading.Condition()
+        self._sessoes: List[SessaoPerfil] = []
+        self._thread: Optional[threading.Thread] = None
+        self._quadros: Dict[Any, str] = {}  # code object -> "funcao (arquivo.py:linha)"
+        self._espera: Dict[Any, bool] = {}  # code object -> é quadro de espera
+        self._seq = itertools.count(1)
+        self.perfiladas = 0
+        self.amostras = 0
+        self.custo_amostragem = 0.0
+
+    def deve_perfilar(self, pedido_admin: bool = False) -> bool:
+        if pedido_admin or self.sempre:
+            return True
+        return self.amostragem > 0 and random.random() < self.amostragem
+
+    def iniciar(self, rota: str) -> SessaoPerfil:
+        sessao = SessaoPerfil(rota)
+        with self._cond:
+            self._sessoes.append(sessao)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._loop, name="perfilador", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+        return sessao
+
+    def finalizar(self, sessao: Optional[SessaoPerfil], status: Any = "") -> Optional[str]:
+        """Encerra a sessão e grava o arquivo; retorna o nome dele."""
+        if sessao is None:
+            return None
+        with self._cond:
+            if sessao in self._sessoes:
+                self._sessoes.remove(sessao)
+        self.perfiladas += 1
+        duracao_ms = int((time.time() - sessao.inicio) * 1000)
+        rota = sessao.rota.strip("/").replace("/", "_") or "raiz"
+        # Começa pelo instante (com ms) e pela sequência: a ordem alfabética é a cronológica
+        instante = time.strftime('%Y%m%d-%H%M%S', time.localtime(sessao.inicio)) + f".{int(sessao.inicio * 1000) % 1000:03d}"
+        nome = f"{instante}-{os.getpid()}-{next(self._seq):06d}-{rota}-{status}-{duracao_ms}ms{EXTENSAO}"
+        try:
+            os.makedirs(self.pasta, exist_ok=True)
+            with open(os.path.join(self.pasta, nome), "w", encoding="utf-8") as f:
+                for pilha, n in sessao.contagens.most_common():
+                    f.write(f"{pilha} {n}\n")
+            self._rotacionar()
+        except OSError as e:
+            print(f"⚠️ Falha ao gravar perfil {nome}: {e}")
+            return None
+        sessao.arquivo = nome
+        return nome
+
+    def _rotacionar(self) -> None:
+        arquivos = self._arquivos()
+        for velho in arquivos[:-self.max_arquivos]:
+            try:
+                os.remove(os.path.join(self.pasta, velho))
+            except OSError:
+                pass
+
+    def _arquivos(self) -> List[str]:
+        try:
+            return sorted(f for f in os.listdir(self.pasta) if f.endswith(EXTENSAO))
+        except FileNotFoundError:
+            return []
+
+    def _quadro(self, code) -> str:
+        nome = self._quadros.get(code)
+        if nome is None:
+            nome = f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+            self._quadros[code] = nome
+        return nome
+
+    def _em_espera(self, code) -> bool:
+        espera = self._espera.get(code)
+        if espera is None:
+            arquivo = code.co_filename
+            espera = os.path.basename(arquivo) in _ARQUIVOS_ESPERA or any(c in arquivo for c in _CAMINHOS_ESPERA)
+            self._espera[code] = espera
+        return espera
+
+    def _amostrar(self) -> Counter:
+        proprio = threading.get_ident()
+        nomes = {t.ident: _nome_thread(t.name) for t in threading.enumerate()}
+        amostra: Counter = Counter()
+        for ident, frame in sys._current_frames().items():
+            if ident == proprio:
+                continue
+            folha = frame
+            quadros = []
+            while frame is not None:
+                quadros.append(self._quadro(frame.f_code))
+                frame = frame.f_back
+            quadros.append(nomes.get(ident, "thread"))
+            quadros.reverse()
+            if self._em_espera(folha.f_code):
+                quadros.append(MARCA_ESPERA)
+            amostra[";".join(quadros)] += 1
+        return amostra
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._sessoes:
+                    self._cond.wait()
+                limite = time.time() - PERFIL_MAX_SEGUNDOS
+                for velha in [s for s in self._sessoes if s.inicio < limite]:
+                    self._sessoes.remove(velha)
+                    print(f"⚠️ Perfil de {velha.rota} passou de {PERFIL_MAX_SEGUNDOS:.0f}s: amostragem encerrada")
+                sessoes = list(self._sessoes)
+            inicio = time.perf_counter()
+            amostra = self._amostrar()
+            for sessao in sessoes:
+                sessao.contagens.update(amostra)
+                sessao.amostras += 1
+            self.amostras += 1
+            self.custo_amostragem += time.perf_counter() - inicio
+            time.sleep(self.intervalo)
+
+    def agregar(self, ultimos: Optional[int] = None, desde_segundos: Optional[float] = None,
+                rota: Optional[str] = None, incluir_espera: bool = False) -> str:
+        """Junta os arquivos recentes num único collapsed stack (soma das contagens)."""
+        arquivos = self._arquivos()
+        if desde_segundos is not None:
+            corte = time.time() - desde_segundos
+            arquivos = [a for a in arquivos if os.path.getmtime(os.path.join(self.pasta, a)) >= corte]
+        if rota:
+            trecho = f"-{rota.strip('/').replace('/', '_')}-"
+            arquivos = [a for a in arquivos if trecho in a]
+        if ultimos is not None:
+            arquivos = arquivos[-ultimos:] if ultimos > 0 else []
+        total: Counter = Counter()
+        for nome in arquivos:
+            try:
+                with open(os.path.join(self.pasta, nome), "r", encoding="utf-8") as f:
+                    for linha in f:
+                        pilha, _, n = linha.rstrip("\n").rpartition(" ")
+                        if not pilha or not n.isdigit():
+                            continue
+                        if not incluir_espera and pilha.endswith(MARCA_ESPERA):
+                            continue
+                        total[pilha] += int(n)
+            except OSError:
+                continue
+        return "".join(f"{pilha} {n}\n" for pilha, n in total.most_common())
+
+    def status(self) -> Dict[str, Any]:
+        arquivos = self._arquivos()
+        with self._cond:
+            ativas = len(self._sessoes)
+        return {
+            "pasta": os.path.abspath(self.pasta),
+            "sempre": self.sempre,
+            "amostragem": self.amostragem,
+            "intervalo_ms": round(self.intervalo * 1000, 2),
+            "sessoes_ativas": ativas,
+            "perfiladas": self.perfiladas,
+            "amostras": self.amostras,
+            "custo_medio_amostra_ms": round(self.custo_amostragem / self.amostras * 1000, 3) if self.amostras else 0.0,
+            "arquivos": len(arquivos),
+            "max_arquivos": self.max_arquivos,
+            "recentes": arquivos[-10:],
+        }
+
+
+perfilador = Perfilador()
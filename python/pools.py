@@ -0,0 +1,223 @@
+"""
+Pools de execução isolados (bulkheads)
+
+Cada dependência lenta tem seu próprio pool com fila limitada:
+- respostas:   passo da máquina de estados do bot_simples (rápido, CPU)
+- envios:      chamadas à Evolution API (sendText/sendMedia)
+- pagamentos:  AbacatePay / checkout Node (até ~15 s)
+- especulativo: cobranças PIX especulativas. Separado de pagamentos porque o
+                gerar_pix, que roda num worker de pagamentos, espera por elas:
+                no mesmo pool, 4 checkouts simultâneos ocupariam os 4 workers
+                esperando tarefas que nenhum worker livre poderia rodar
+
+Uma rajada de PIX enche só o pool de pagamentos; o "1 -> cardápio" de outros
+clientes continua saindo pelo pool de respostas. Quando a fila de um pool
+enche, a submissão falha na hora com PoolSaturado em vez de esperar.
+
+As etapas de uma mensagem são encadeadas por Futures (encadear), então nenhuma
+thread fica parada esperando outro pool. FilaPorChave garante a ordem das
+mensagens de um mesmo número sem prender thread entre uma e outra.
+
+Tarefas e continuações rodam numa cópia do contextvars de quem as agendou, para
+o rastro da mensagem (rastreamento.py) seguir de um pool para o outro.
+"""
+import contextvars
+import os
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable
+
+
+class PoolSaturado(Exception):
+    """Fila do pool cheia: a tarefa foi recusada."""
+
+
+class PoolIsolado:
+    """ThreadPoolExecutor com fila limitada e métricas de saturação."""
+
+    def __init__(self, nome: str, max_workers: int, max_fila: int):
+        self.nome = nome
+        self.max_workers = max_workers
+        self.max_fila = max_fila
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"pool-{nome}")
+        self._lock = threading.Lock()
+        self.pendentes = 0  # na fila + em execução
+        self.em_execucao = 0
+        self.submetidas = 0
+        self.concluidas = 0
+        self.falhas = 0
+        self.rejeitadas = 0
+        self.pico_pendentes = 0
+        self._espera_total = 0.0
+        self.espera_max = 0.0
+
+    def submeter(self, fn: Callable, *args, **kwargs) -> Future:
+        with self._lock:
+            if self.pendentes >= self.max_workers + self.max_fila:
+                self.rejeitadas += 1
+                raise PoolSaturado(f"pool '{self.nome}' saturado ({self.pendentes} pendentes)")
+            self.pendentes += 1
+            self.submetidas += 1
+            self.pico_pendentes = max(self.pico_pendentes, self.pendentes)
+        enfileirada = time.monotonic()
+
+        def _rodar():
+            espera = time.monotonic() - enfileirada
+            with self._lock:
+                self.em_execucao += 1
+                self._espera_total += espera
+                self.espera_max = max(self.espera_max, espera)
+            ok = False
+            try:
+                resultado = fn(*args, **kwargs)
+                ok = True
+                return resultado
+            finally:
+                with self._lock:
+                    self.em_execucao -= 1
+                    self.pendentes -= 1
+                    self.concluidas += 1
+                    if not ok:
+                        self.falhas += 1
+
+        try:
+            return self._executor.submit(contextvars.copy_context().run, _rodar)
+        except RuntimeError:
+            with self._lock:
+                self.pendentes -= 1
+            raise
+
+    def executar(self, fn: Callable, *args, timeout: float | None = None, **kwargs) -> Any:
+        """Submete e espera o resultado (para chamadores que já estão fora dos pools)."""
+        return self.submeter(fn, *args, **kwargs).result(timeout=timeout)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            iniciadas = self.concluidas + self.em_execucao
+            return {
+                "workers": self.max_workers,
+                "max_fila": self.max_fila,
+                "em_execucao": self.em_execucao,
+                "na_fila": self.pendentes - self.em_execucao,
+                "pico_pendentes": self.pico_pendentes,
+                "submetidas": self.submetidas,
+                "concluidas": self.concluidas,
+                "falhas": self.falhas,
+                "rejeitadas": self.rejeitadas,
+                "espera_media_ms": round(1000 * self._espera_total / iniciadas, 2) if iniciadas else 0.0,
+                "espera_max_ms": round(1000 * self.espera_max, 2),
+            }
+
+
+def _copiar_resultado(origem: Future, destino: Future) -> None:
+    excecao = origem.exception()
+    if excecao is not None:
+        destino.set_exception(excecao)
+    else:
+        destino.set_result(origem.result())
+
+
+def encadear(futuro: Future, continuacao: Callable[[Any], Any]) -> Future:
+    """Quando `futuro` terminar, chama continuacao(resultado).
+    A continuação roda na thread que concluiu o futuro e deve ser curta: em geral só
+    submete a próxima etapa em outro pool. Pode retornar um valor ou outro Future.
+    """
+    saida: Future = Future()
+    contexto = contextvars.copy_context()
+
+    def _pronto(f: Future):
+        try:
+            r = contexto.run(continuacao, f.result())
+        except BaseException as e:
+            saida.set_exception(e)
+            return
+        if isinstance(r, Future):
+            r.add_done_callback(lambda g: _copiar_resultado(g, saida))
+        else:
+            saida.set_result(r)
+
+    futuro.add_done_callback(_pronto)
+    return saida
+
+
+class FilaPorChave:
+    """Executa em série as tarefas de uma mesma chave (ex.: número do cliente).
+    Cada tarefa é uma função que retorna um Future; a próxima tarefa da chave só
+    começa quando esse Future termina. Chaves distintas andam em paralelo.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._filas: Dict[Hashable, deque] = {}
+
+    def submeter(self, chave: Hashable, tarefa: Callable[[], Future]) -> Future:
+        saida: Future = Future()
+        contexto = contextvars.copy_context()
+        with self._lock:
+            fila = self._filas.get(chave)
+            if fila is not None:
+                fila.append((tarefa, saida, contexto))
+                return saida
+            self._filas[chave] = deque()
+        self._iniciar(chave, tarefa, saida, contexto)
+        return saida
+
+    def _iniciar(self, chave: Hashable, tarefa: Callable[[], Future], saida: Future,
+                 contexto: contextvars.Context) -> None:
+        try:
+            futuro = contexto.run(tarefa)
+        except BaseException as e:
+            saida.set_exception(e)
+            self._proxima(chave)
+            return
+
+        def _pronto(f: Future):
+            _copiar_resultado(f, saida)
+            self._proxima(chave)
+
+        futuro.add_done_callback(_pronto)
+
+    def _proxima(self, chave: Hashable) -> None:
+        with self._lock:
+            fila = self._filas[chave]
+            if not fila:
+                del self._filas[chave]
+                return
+            tarefa, saida, contexto = fila.popleft()
+        self._iniciar(chave, tarefa, saida, contexto)
+
+    def tamanho(self) -> int:
+        """Quantidade de chaves com tarefa em andamento."""
+        with self._lock:
+            return len(self._filas)
+
+
+pool_respostas = PoolIsolado(
+    "respostas",
+    max_workers=int(os.getenv("POOL_RESPOSTAS_WORKERS", "8")),
+    max_fila=int(os.getenv("POOL_RESPOSTAS_FILA", "500")),
+)
+pool_envios = PoolIsolado(
+    "envios",
+    max_workers=int(os.getenv("POOL_ENVIOS_WORKERS", "16")),
+    max_fila=int(os.getenv("POOL_ENVIOS_FILA", "500")),
+)
+pool_pagamentos = PoolIsolado(
+    "pagamentos",
+    max_workers=int(os.getenv("POOL_PAGAMENTOS_WORKERS", "4")),
+    max_fila=int(os.getenv("POOL_PAGAMENTOS_FILA", "20")),
+)
+
+pool_especulativo = PoolIsolado(
+    "especulativo",
+    max_workers=int(os.getenv("POOL_ESPECULATIVO_WORKERS", "4")),
+    max_fila=int(os.getenv("POOL_ESPECULATIVO_FILA", "20")),
+)
+
+POOLS = {p.nome: p for p in (pool_respostas, pool_envios, pool_pagamentos, pool_especulativo)}
+
+
+def status_pools() -> Dict[str, Dict[str, Any]]:
+    return {nome: pool.status() for nome, pool in POOLS.items()}
@@ -0,0 +1,89 @@
+"""
+Prazo (deadline) de ponta a ponta por mensagem recebida
+
+Uma mensagem pode encadear gerar_pix (15 s) e três envios (12 + 12 + 20 s).
+O Prazo é criado na entrada e repassado para o PIX e os envios; cada chamada
+usa como timeout o menor entre o seu limite próprio e o tempo que resta.
+
+A etapa do PIX guarda uma reserva (RESERVA_RESPOSTA) para ainda dar tempo de
+enviar a resposta de contingência quando o PIX estoura o prazo.
+Estouros são contados por etapa (contador_estouros).
+"""
+import os
+import threading
+import time
+from typing import Dict, Optional
+
+PRAZO_MENSAGEM_SEGUNDOS = float(os.getenv("PRAZO_MENSAGEM_SEGUNDOS", "30"))
+RESERVA_RESPOSTA = float(os.getenv("PRAZO_RESERVA_RESPOSTA", "4"))
+# Abaixo disso não vale a pena nem abrir a conexão
+TIMEOUT_MINIMO = 0.05
+
+
+class PrazoEsgotado(Exception):
+    """Não sobrou tempo no prazo da mensagem para a etapa."""
+
+    def __init__(self, etapa: str):
+        super().__init__(f"prazo esgotado na etapa '{etapa}'")
+        self.etapa = etapa
+
+
+class ContadorEstouros:
+    """Contadores de estouro de prazo por etapa."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._contagens: Dict[str, int] = {}
+
+    def registrar(self, etapa: str) -> None:
+        with self._lock:
+            self._contagens[etapa] = self._contagens.get(etapa, 0) + 1
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._contagens)
+
+
+contador_estouros = ContadorEstouros()
+
+
+class Prazo:
+    """Instante limite para concluir o processamento de uma mensagem."""
+
+    __slots__ = ("inicio", "limite")
+
+    def __init__(self, segundos: float = PRAZO_MENSAGEM_SEGUNDOS):
+        self.inicio = time.monotonic()
+        self.limite = self.inicio + segundos
+
+    def restante(self) -> float:
+        return self.limite - time.monotonic()
+
+    def decorrido(self) -> float:
+        return time.monotonic() - self.inicio
+
+    def esgotado(self, reserva: float = 0.0) -> bool:
+        return self.restante() - reserva < TIMEOUT_MINIMO
+
+    def timeout(self, maximo: float, etapa: str, reserva: float = 0.0) -> float:
+        """min(maximo, restante - reserva). Conta o estouro e lança PrazoEsgotado se não sobrar tempo."""
+        disponivel = self.restante() - reserva
+        if disponivel < TIMEOUT_MINIMO:
+            contador_estouros.registrar(etapa)
+            raise PrazoEsgotado(etapa)
+        return min(maximo, disponivel)
+
+
+def timeout_de(prazo: Optional[Prazo], maximo: float, etapa: str, reserva: float = 0.0) -> float:
+    """Timeout da chamada: o limite próprio sem prazo, ou o que resta dele."""
+    if prazo is None:
+        return maximo
+    return prazo.timeout(maximo, etapa, reserva)
+
+
+def estourou(prazo: Optional[Prazo], etapa: str, reserva: float = 0.0) -> bool:
+    """Após um timeout: diz (e conta) se quem limitou a chamada foi o prazo da mensagem."""
+    if prazo is None or not prazo.esgotado(reserva):
+        return False
+    contador_estouros.registrar(etapa)
+    return True
@@ -0,0 +1,438 @@
+"""
+Rastreamento por mensagem (spans) com tempo por etapa
+
+Cada mensagem recebida ganha um rastro (trace id) com um span raiz "mensagem",
+que começa quando a mensagem é extraída do webhook (o mesmo instante do Prazo)
+e termina depois do último envio. Dentro dele:
+    espera_fila          da chegada até o início do processamento (coalescência
+                         + fila do número)
+    processar_mensagem   passo da máquina de estados (inclui o Notion do cardápio)
+    gerar_pix            AbacatePay ou PIX especulativo
+    enviar_resposta      texto, copia e cola e QR Code
+e, em qualquer nível, um span por chamada externa (metricas.ChamadaExterna):
+evolution_send_text, evolution_send_media, abacatepay_criar_pix, notion,
+checkout_node...
+
+O span atual fica num contextvars.ContextVar; pools.py copia o contexto ao
+submeter tarefas, então o rastro acompanha a mensagem entre os pools (e entre
+tasks no app_async). Sem rastro ativo, abrir um span custa só a leitura do
+ContextVar.
+
+Os últimos RASTROS_MAX rastros ficam em memória (GET /debug/traces). Com
+RASTROS_OTLP_DIR, os rastros concluídos também são gravados em arquivos JSON
+lines no formato OTLP/JSON (um ExportTraceServiceRequest por linha), que o
+receiver otlpjsonfile do OpenTelemetry Collector consegue ler.
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+RASTREAMENTO_ATIVO = os.getenv("RASTREAMENTO", "1").strip().lower() not in ("0", "false", "nao", "não", "off")
+RASTROS_MAX = int(os.getenv("RASTROS_MAX", "500"))
+# Limite de spans por rastro (um reenvio em laço não deve crescer sem fim)
+SPANS_MAX_POR_RASTRO = int(os.getenv("RASTROS_SPANS_MAX", "200"))
+RASTROS_OTLP_DIR = os.getenv("RASTROS_OTLP_DIR", "")  # vazio = sem exportação
+RASTROS_OTLP_LINHAS_POR_ARQUIVO = int(os.getenv("RASTROS_OTLP_LINHAS_POR_ARQUIVO", "1000"))
+RASTROS_OTLP_MAX_ARQUIVOS = int(os.getenv("RASTROS_OTLP_MAX_ARQUIVOS", "20"))
+NOME_SERVICO = os.getenv("OTEL_SERVICE_NAME", "bot-restaurante")
+
+# Tipos de span do OTLP
+SPAN_INTERNO = 1
+SPAN_SERVIDOR = 2
+SPAN_CLIENTE = 3
+
+_span_atual: contextvars.ContextVar = contextvars.ContextVar("span_atual", default=None)
+
+
+def _novo_id(bits: int) -> str:
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def _agora_ns() -> int:
+    return time.time_ns()
+
+
+def _monotonic_para_ns(instante: float) -> int:
+    """Converte um time.monotonic() passado (ex.: Prazo.inicio) para epoch em ns."""
+    return time.time_ns() - int((time.monotonic() - instante) * 1e9)
+
+
+class Span:
+    __slots__ = ("rastro", "span_id", "pai_id", "nome", "tipo", "inicio_ns", "fim_ns", "atributos", "erro")
+
+    def __init__(self, rastro: "Rastro", nome: str, pai_id: Optional[str], tipo: int = SPAN_INTERNO,
+                 inicio_ns: Optional[int] = None, atributos: Optional[Dict[str, Any]] = None):
+        self.rastro = rastro
+        self.span_id = _novo_id(64)
+        self.pai_id = pai_id
+        self.nome = nome
+        self.tipo = tipo
+        self.inicio_ns = inicio_ns or _agora_ns()
+        self.fim_ns: Optional[int] = None
+        self.atributos = atributos or {}
+        self.erro: Optional[str] = None
+
+    def definir(self, **atributos: Any) -> None:
+        self.atributos.update(atributos)
+
+    def filho_concluido(self, nome: str, inicio_ns: int, fim_ns: Optional[int] = None, **atributos: Any) -> None:
+        """Registra uma etapa já terminada (ex.: espera na fila, medida de fora)."""
+        filho = self.rastro.novo_span(nome, self.span_id, inicio_ns=inicio_ns, atributos=atributos)
+        if filho is not None:
+            filho.finalizar(fim_ns=fim_ns)
+
+    def finalizar(self, erro: Optional[BaseException] = None, fim_ns: Optional[int] = None) -> None:
+        if self.fim_ns is not None:
+            return
+        if erro is not None:
+            self.erro = f"{type(erro).__name__}: {erro}"
+        self.fim_ns = fim_ns or _agora_ns()
+        self.rastro.span_finalizado()
+
+    @property
+    def duracao_ms(self) -> float:
+        fim = self.fim_ns or _agora_ns()
+        return (fim - self.inicio_ns) / 1e6
+
+    def resumo(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "pai_id": self.pai_id,
+            "nome": self.nome,
+            "inicio_ms": round((self.inicio_ns - self.rastro.raiz.inicio_ns) / 1e6, 3),
+            "duracao_ms": round(self.duracao_ms, 3),
+            "em_andamento": self.fim_ns is None,
+            "erro": self.erro,
+            "atributos": self.atributos,
+        }
+
+    def otlp(self) -> Dict[str, Any]:
+        return {
+            "traceId": self.rastro.trace_id,
+            "spanId": self.span_id,
+            "parentSpanId": self.pai_id or "",
+            "name": self.nome,
+            "kind": self.tipo,
+            "startTimeUnixNano": str(self.inicio_ns),
+            "endTimeUnixNano": str(self.fim_ns or _agora_ns()),
+            "attributes": [_atributo_otlp(k, v) for k, v in self.atributos.items()],
+            "status": {"code": 2, "message": self.erro} if self.erro else {"code": 1},
+        }
+
+
+def _atributo_otlp(chave: str, valor: Any) -> Dict[str, Any]:
+    if isinstance(valor, bool):
+        return {"key": chave, "value": {"boolValue": valor}}
+    if isinstance(valor, int):
+        return {"key": chave, "value": {"intValue": str(valor)}}
+    if isinstance(valor, float):
+        return {"key": chave, "value": {"doubleValue": valor}}
+    return {"key": chave, "value": {"stringValue": str(valor)}}
+
+
+class Rastro:
+    """Spans de uma mensagem. Concluído quando todos os spans abertos terminam."""
+
+    __slots__ = ("trace_id", "spans", "raiz", "abertos", "descartados", "_lock", "_ao_concluir", "_avisado")
+
+    def __init__(self, ao_concluir):
+        self.trace_id = _novo_id(128)
+        self.spans: List[Span] = []
+        self.raiz: Optional[Span] = None
+        self.abertos = 0
+        self.descartados = 0
+        self._lock = threading.Lock()
+        self._ao_concluir = ao_concluir
+        self._avisado = False
+
+    def novo_span(self, nome: str, pai_id: Optional[str], tipo: int = SPAN_INTERNO,
+                  inicio_ns: Optional[int] = None, atributos: Optional[Dict[str, Any]] = None) -> Optional[Span]:
+        span = Span(self, nome, pai_id, tipo, inicio_ns, atributos)
+        with self._lock:
+            if len(self.spans) >= SPANS_MAX_POR_RASTRO:
+                self.descartados += 1
+                return None
+            self.spans.append(span)
+            self.abertos += 1
+        return span
+
+    def span_finalizado(self) -> None:
+        with self._lock:
+            self.abertos -= 1
+            # Avisa uma vez só (um span tardio não exporta o rastro de novo)
+            concluido = self.abertos == 0 and not self._avisado
+            if concluido:
+                self._avisado = True
+        if concluido:
+            self._ao_concluir(self)
+
+    @property
+    def concluido(self) -> bool:
+        return self.abertos == 0
+
+    def resumo(self) -> Dict[str, Any]:
+        """Visão curta: duração total e soma do tempo por etapa (filhos diretos da raiz)."""
+        raiz = self.raiz
+        etapas: Dict[str, float] = {}
+        dependencias: Dict[str, float] = {}
+        erros = []
+        for span in list(self.spans):
+            if span is raiz:
+                continue
+            if span.tipo == SPAN_CLIENTE:
+                dependencias[span.nome] = round(dependencias.get(span.nome, 0.0) + span.duracao_ms, 3)
+            elif span.pai_id == raiz.span_id:
+                etapas[span.nome] = round(etapas.get(span.nome, 0.0) + span.duracao_ms, 3)
+            if span.erro:
+                erros.append(f"{span.nome}: {span.erro}")
+        if raiz.erro:
+            erros.append(f"{raiz.nome}: {raiz.erro}")
+        return {
+            "trace_id": self.trace_id,
+            "nome": raiz.nome,
+            "inicio": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(raiz.inicio_ns / 1e9)),
+            "duracao_ms": round(raiz.duracao_ms, 3),
+            "em_andamento": not self.concluido,
+            "atributos": raiz.atributos,
+            "etapas_ms": etapas,
+            "dependencias_ms": dependencias,
+            "erros": erros,
+            "spans": len(self.spans),
+        }
+
+    def detalhes(self) -> Dict[str, Any]:
+        dados = self.resumo()
+        dados["spans"] = [s.resumo() for s in sorted(list(self.spans), key=lambda s: s.inicio_ns)]
+        dados["spans_descartados"] = self.descartados
+        return dados
+
+    def otlp(self) -> Dict[str, Any]:
+        """ExportTraceServiceRequest (OTLP/JSON) com os spans deste rastro."""
+        return {"resourceSpans": [{
+            "resource": {"attributes": [_atributo_otlp("service.name", NOME_SERVICO)]},
+            "scopeSpans": [{
+                "scope": {"name": "rastreamento"},
+                "spans": [s.otlp() for s in list(self.spans)],
+            }],
+        }]}
+
+
+class ExportadorOTLP:
+    """Grava rastros concluídos em JSON lines (OTLP/JSON) numa thread própria.
+    Arquivos rastros-{PORT}-{n}.jsonl, trocados a cada RASTROS_OTLP_LINHAS_POR_ARQUIVO
+    linhas; só os RASTROS_OTLP_MAX_ARQUIVOS mais novos são mantidos.
+    """
+
+    def __init__(self, pasta: str, linhas_por_arquivo: int = RASTROS_OTLP_LINHAS_POR_ARQUIVO,
+                 max_arquivos: int = RASTROS_OTLP_MAX_ARQUIVOS, max_fila: int = 10000):
+        self.pasta = pasta
+        self.linhas_por_arquivo = max(1, linhas_por_arquivo)
+        self.max_arquivos = max(1, max_arquivos)
+        self._fila: deque = deque(maxlen=max_fila)
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._arquivo = None
+        self._linhas_no_arquivo = 0
+        self.exportados = 0
+        self.falhas = 0
+
+    def enfileirar(self, rastro: Rastro) -> None:
+        with self._cond:
+            self._fila.append(rastro)
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="rastros-otlp", daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _abrir_proximo(self) -> None:
+        if self._arquivo:
+            self._arquivo.close()
+        os.makedirs(self.pasta, exist_ok=True)
+        prefixo = f"rastros-{os.getenv('PORT', '8001')}-"
+        nome = f"{prefixo}{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.jsonl"
+        self._arquivo = open(os.path.join(self.pasta, nome), "a", encoding="utf-8")
+        self._linhas_no_arquivo = 0
+        antigos = sorted(f for f in os.listdir(self.pasta) if f.startswith(prefixo) and f.endswith(".jsonl"))
+        for velho in antigos[:-self.max_arquivos]:
+            try:
+                os.remove(os.path.join(self.pasta, velho))
+            except OSError:
+                pass
+
+    def _loop(self) -> None:
+        while True:
+            with self._cond:
+                while not self._fila:
+                    self._cond.wait()
+                lote = list(self._fila)
+                self._fila.clear()
+            try:
+                for rastro in lote:
+                    if self._arquivo is None or self._linhas_no_arquivo >= self.linhas_por_arquivo:
+                        self._abrir_proximo()
+                    self._arquivo.write(json.dumps(rastro.otlp(), ensure_ascii=False, default=str) + "\n")
+                    self._linhas_no_arquivo += 1
+                self._arquivo.flush()
+                self.exportados += len(lote)
+            except Exception as e:
+                self.falhas += 1
+                print(f"⚠️ Falha ao exportar rastros OTLP: {e}")
+
+
+class Rastreador:
+    def __init__(self, ativo: bool = RASTREAMENTO_ATIVO, max_rastros: int = RASTROS_MAX,
+                 pasta_otlp: str = RASTROS_OTLP_DIR):
+        self.ativo = ativo
+        self._rastros: deque = deque(maxlen=max_rastros)
+        self.exportador = ExportadorOTLP(pasta_otlp) if pasta_otlp else None
+        self.iniciados = 0
+        self.concluidos = 0
+
+    def iniciar_rastro(self, nome: str, inicio_monotonic: Optional[float] = None, **atributos: Any) -> Optional[Span]:
+        """Novo rastro; retorna o span raiz (ainda não ativo: ver ativar())."""
+        if not self.ativo:
+            return None
+        rastro = Rastro(self._concluir)
+        inicio_ns = _monotonic_para_ns(inicio_monotonic) if inicio_monotonic is not None else None
+        rastro.raiz = rastro.novo_span(nome, None, SPAN_SERVIDOR, inicio_ns, atributos)
+        self._rastros.append(rastro)  # deque com maxlen: o mais antigo sai sozinho
+        self.iniciados += 1
+        return rastro.raiz
+
+    def iniciar_span(self, nome: str, tipo: int = SPAN_INTERNO, **atributos: Any) -> Optional[Span]:
+        """Filho do span atual, ou None quando não há rastro ativo."""
+        pai = _span_atual.get()
+        if pai is None:
+            return None
+        return pai.rastro.novo_span(nome, pai.span_id, tipo, atributos=atributos)
+
+    def _concluir(self, rastro: Rastro) -> None:
+        self.concluidos += 1
+        if self.exportador is not None:
+            self.exportador.enfileirar(rastro)
+
+    def listar(self, numero: Optional[str] = None, min_ms: float = 0.0, limite: int = 50) -> List[Dict[str, Any]]:
+        """Rastros mais recentes primeiro, filtrados por número e duração mínima."""
+        saida = []
+        for rastro in reversed(list(self._rastros)):
+            raiz = rastro.raiz
+            if numero and str(raiz.atributos.get("numero", "")) != numero:
+                continue
+            if raiz.duracao_ms < min_ms:
+                continue
+            saida.append(rastro.resumo())
+            if len(saida) >= limite:
+                break
+        return saida
+
+    def obter(self, trace_id: str) -> Optional[Rastro]:
+        for rastro in list(self._rastros):
+            if rastro.trace_id == trace_id:
+                return rastro
+        return None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "ativo": self.ativo,
+            "em_memoria": len(self._rastros),
+            "max_em_memoria": self._rastros.maxlen,
+            "iniciados": self.iniciados,
+            "concluidos": self.concluidos,
+            "otlp_dir": self.exportador.pasta if self.exportador else None,
+            "otlp_exportados": self.exportador.exportados if self.exportador else 0,
+            "otlp_falhas": self.exportador.falhas if self.exportador else 0,
+        }
+
+
+rastreador = Rastreador()
+
+
+def span_atual() -> Optional[Span]:
+    return _span_atual.get()
+
+
+@contextmanager
+def ativar(span: Optional[Span]) -> Iterator[Optional[Span]]:
+    """Torna `span` o span atual dentro do bloco (sem finalizá-lo)."""
+    if span is None:
+        yield None
+        return
+    token = _span_atual.set(span)
+    try:
+        yield span
+    finally:
+        _span_atual.reset(token)
+
+
+@contextmanager
+def span(nome: str, tipo: int = SPAN_INTERNO, **atributos: Any) -> Iterator[Optional[Span]]:
+    """Span filho do atual durante o bloco; exceções ficam registradas no span."""
+    s = rastreador.iniciar_span(nome, tipo, **atributos)
+    if s is None:
+        yield None
+        return
+    token = _span_atual.set(s)
+    erro = None
+    try:
+        yield s
+    except BaseException as e:
+        erro = e
+        raise
+    finally:
+        _span_atual.reset(token)
+        s.finalizar(erro)
+
+
+@contextmanager
+def novo_rastro(nome: str, inicio_monotonic: Optional[float] = None, **atributos: Any) -> Iterator[Optional[Span]]:
+    """Rastro que começa e termina com o bloco (rota HTTP, mensagem no app_async)."""
+    raiz = rastreador.iniciar_rastro(nome, inicio_monotonic, **atributos)
+    if raiz is None:
+        yield None
+        return
+    erro = None
+    try:
+        with ativar(raiz):
+            yield raiz
+    except BaseException as e:
+        erro = e
+        raise
+    finally:
+        raiz.finalizar(erro)
+
+
+def rastreado(nome: str):
+    """Decorador: a função (ou corrotina) roda dentro de span(nome)."""
+    def decorar(fn):
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def envolvida_async(*args, **kwargs):
+                if _span_atual.get() is None:
+                    return await fn(*args, **kwargs)
+                with span(nome):
+                    return await fn(*args, **kwargs)
+            return envolvida_async
+
+        @functools.wraps(fn)
+        def envolvida(*args, **kwargs):
+            if _span_atual.get() is None:  # sem rastro: chamada direta
+                return fn(*args, **kwargs)
+            with span(nome):
+                return fn(*args, **kwargs)
+        return envolvida
+    return decorar
+
+
+def finalizar_com_futuro(raiz: Optional[Span], futuro) -> None:
+    """Finaliza o span raiz quando o Future da mensagem terminar (com o erro, se houver)."""
+    if raiz is None:
+        return
+    futuro.add_done_callback(lambda f: raiz.finalizar(f.exception()))
@@ -0,0 +1,176 @@
+"""
+Monitor de saúde das dependências (Evolution, Notion, AbacatePay, checkout Node)
+
+Uma thread sonda todas as dependências em paralelo a cada SAUDE_INTERVALO_SEGUNDOS
+(cada sonda com timeout próprio, SAUDE_TIMEOUT_SEGUNDOS). As rotas de saúde
+respondem com o último resultado, sem chamada externa no caminho da requisição,
+e o mesmo estado decide o roteamento: disponivel("notion") False pula a busca no
+Notion, por exemplo.
+
+Estados: "desconhecido" (antes da primeira sonda), "ok", "fora" (depois de
+SAUDE_FALHAS_PARA_FORA falhas seguidas: uma falha isolada não derruba nada),
+"degradada" (a dependência responde, mas com erro: a sonda retornou
+(DEGRADADA, detalhes)) e "nao_configurada" (sonda retornou None: falta
+chave/URL). Só "fora" conta como indisponível. Uma sonda que ainda não terminou
+não é disparada de novo.
+
+Uso:
+    monitor_saude.registrar("notion", sondar_notion)   # -> (ok, detalhes) ou None
+    monitor_saude.iniciar()
+    if monitor_saude.disponivel("notion"): ...
+"""
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+SAUDE_MONITOR = os.getenv("SAUDE_MONITOR", "1").strip().lower() not in ("0", "false", "nao", "não", "off")
+SAUDE_INTERVALO_SEGUNDOS = float(os.getenv("SAUDE_INTERVALO_SEGUNDOS", "30"))
+SAUDE_TIMEOUT_SEGUNDOS = float(os.getenv("SAUDE_TIMEOUT_SEGUNDOS", "5"))
+SAUDE_FALHAS_PARA_FORA = int(os.getenv("SAUDE_FALHAS_PARA_FORA", "2"))
+
+DESCONHECIDO = "desconhecido"
+OK = "ok"
+FORA = "fora"
+DEGRADADA = "degradada"
+NAO_CONFIGURADA = "nao_configurada"
+
+# (True | False | DEGRADADA, detalhes) ou None
+Sonda = Callable[[], Optional[Tuple[Any, Dict[str, Any]]]]
+
+
+class Dependencia:
+    __slots__ = ("nome", "sondar", "estado", "desde", "falhas_seguidas", "detalhes", "latencia_ms",
+                 "verificado_em", "sondas", "falhas", "em_andamento")
+
+    def __init__(self, nome: str, sondar: Sonda):
+        self.nome = nome
+        self.sondar = sondar
+        self.estado = DESCONHECIDO
+        self.desde = time.time()
+        self.falhas_seguidas = 0
+        self.detalhes: Dict[str, Any] = {}
+        self.latencia_ms: Optional[float] = None
+        self.verificado_em: Optional[float] = None
+        self.sondas = 0
+        self.falhas = 0
+        self.em_andamento: Optional[Future] = None
+
+    def status(self) -> Dict[str, Any]:
+        agora = time.time()
+        return {
+            "estado": self.estado,
+            "disponivel": self.estado != FORA,
+            "desde": self.desde,
+            "ha_segundos": round(agora - self.desde, 1),
+            "verificado_ha_segundos": round(agora - self.verificado_em, 1) if self.verificado_em else None,
+            "latencia_ms": self.latencia_ms,
+            "falhas_seguidas": self.falhas_seguidas,
+            "sondas": self.sondas,
+            "falhas": self.falhas,
+            "detalhes": self.detalhes,
+        }
+
+
+class MonitorSaude:
+    def __init__(self, intervalo: float = SAUDE_INTERVALO_SEGUNDOS, falhas_para_fora: int = SAUDE_FALHAS_PARA_FORA):
+        self.intervalo = intervalo
+        self.falhas_para_fora = max(1, falhas_para_fora)
+        self._lock = threading.Lock()
+        self._dependencias: Dict[str, Dependencia] = {}
+        self._ouvintes: List[Callable[[str, str, str], None]] = []
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._thread: Optional[threading.Thread] = None
+        self._acordar = threading.Event()
+        self.rodadas = 0
+
+    def registrar(self, nome: str, sondar: Sonda) -> None:
+        with self._lock:
+            self._dependencias[nome] = Dependencia(nome, sondar)
+
+    def ao_mudar(self, fn: Callable[[str, str, str], None]) -> None:
+        """fn(nome, anterior, novo) a cada troca de estado de uma dependência."""
+        self._ouvintes.append(fn)
+
+    def disponivel(self, nome: str) -> bool:
+        dependencia = self._dependencias.get(nome)
+        return dependencia is None or dependencia.estado != FORA
+
+    def iniciar(self) -> None:
+        if not SAUDE_MONITOR or self._thread is not None:
+            return
+        self._executor = ThreadPoolExecutor(max_workers=max(1, len(self._dependencias)), thread_name_prefix="saude")
+        self._thread = threading.Thread(target=self._loop, name="monitor-saude", daemon=True)
+        self._thread.start()
+
+    def sondar_agora(self) -> None:
+        """Antecipa a próxima rodada (não espera o resultado)."""
+        self._acordar.set()
+
+    def _loop(self) -> None:
+        while True:
+            self._rodada()
+            self._acordar.wait(self.intervalo)
+            self._acordar.clear()
+
+    def _rodada(self) -> None:
+        self.rodadas += 1
+        for dependencia in list(self._dependencias.values()):
+            if dependencia.em_andamento is not None and not dependencia.em_andamento.done():
+                continue  # a sonda anterior ainda está presa no timeout
+            dependencia.em_andamento = self._executor.submit(self._sondar, dependencia)
+
+    def _sondar(self, dependencia: Dependencia) -> None:
+        inicio = time.perf_counter()
+        try:
+            resultado = dependencia.sondar()
+        except Exception as e:
+            resultado = (False, {"erro": f"{type(e).__name__}: {e}"})
+        latencia = round((time.perf_counter() - inicio) * 1000, 1)
+        with self._lock:
+            dependencia.sondas += 1
+            dependencia.verificado_em = time.time()
+            if resultado is None:
+                novo, dependencia.detalhes, dependencia.latencia_ms = NAO_CONFIGURADA, {}, None
+                dependencia.falhas_seguidas = 0
+            else:
+                ok, dependencia.detalhes = resultado
+                dependencia.latencia_ms = latencia
+                if ok == DEGRADADA:
+                    dependencia.falhas += 1
+                    dependencia.falhas_seguidas = 0
+                    novo = DEGRADADA
+                elif ok:
+                    dependencia.falhas_seguidas = 0
+                    novo = OK
+                else:
+                    dependencia.falhas += 1
+                    dependencia.falhas_seguidas += 1
+                    novo = FORA if dependencia.falhas_seguidas >= self.falhas_para_fora else dependencia.estado
+            anterior = dependencia.estado
+            if novo == anterior:
+                return
+            dependencia.estado = novo
+            dependencia.desde = dependencia.verificado_em
+        print(f"🩺 {dependencia.nome}: {anterior} -> {novo}")
+        for fn in self._ouvintes:
+            try:
+                fn(dependencia.nome, anterior, novo)
+            except Exception as e:
+                print(f"⚠️ Erro ao notificar mudança de saúde: {e}")
+
+    def status(self, nome: Optional[str] = None) -> Dict[str, Any]:
+        with self._lock:
+            if nome is not None:
+                dependencia = self._dependencias.get(nome)
+                return dependencia.status() if dependencia else {"estado": DESCONHECIDO, "disponivel": True}
+            return {
+                "ativo": self._thread is not None,
+                "intervalo_segundos": self.intervalo,
+                "rodadas": self.rodadas,
+                "dependencias": {n: d.status() for n, d in self._dependencias.items()},
+            }
+
+
+monitor_saude = MonitorSaude()
@@ -0,0 +1,99 @@
+"""
+Supressão de respostas repetidas para o mesmo número
+
+Com spam do cliente ou reentrega da Evolution, o bot mandava o mesmo "Não entendi.
+Escolha uma opção" ou o mesmo cardápio várias vezes em segundos, cada um com uma
+chamada à Evolution. Aqui cada resposta é identificada por (número, hash do texto);
+uma resposta idêntica para o mesmo número dentro de SUPRESSAO_SEGUNDOS é descartada
+antes de ir para a fila de envio.
+
+A resposta só conta como enviada depois que a Evolution a aceita (confirmar(),
+chamado no envio após o 2xx): um envio que falhou não suprime a repetição que
+o cliente provoca ao mandar a mensagem de novo.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict
+
+SUPRESSAO_SEGUNDOS = float(os.getenv("SUPRESSAO_SEGUNDOS", "10"))  # 0 = desligado
+SUPRESSAO_MAX_ENTRADAS = int(os.getenv("SUPRESSAO_MAX_ENTRADAS", "50000"))
+# Quantos textos distintos guardar na contagem por prévia (para o /envios-suprimidos)
+MAX_PREVIAS = 50
+
+
+def _hash_texto(texto: str) -> bytes:
+    return hashlib.blake2b(texto.encode("utf-8", errors="replace"), digest_size=8).digest()
+
+
+class SupressorRespostas:
+    """Cache (número, hash da resposta) -> expiração.
+    Como a janela é fixa, a ordem de inserção é a ordem de expiração: a limpeza só
+    olha o começo do OrderedDict.
+    """
+
+    def __init__(self, janela_segundos: float = SUPRESSAO_SEGUNDOS, max_entradas: int = SUPRESSAO_MAX_ENTRADAS):
+        self.janela = janela_segundos
+        self.max_entradas = max_entradas
+        self._lock = threading.Lock()
+        self._vistos: "OrderedDict[tuple[str, bytes], float]" = OrderedDict()
+        self.verificadas = 0
+        self.suprimidas = 0
+        self._por_previa: Dict[str, int] = {}
+
+    @property
+    def ativo(self) -> bool:
+        return self.janela > 0
+
+    def _limpar(self, agora: float) -> None:
+        vistos = self._vistos
+        while vistos:
+            chave, expira = next(iter(vistos.items()))
+            if expira > agora and len(vistos) <= self.max_entradas:
+                break
+            vistos.popitem(last=False)
+
+    def deve_suprimir(self, numero: str, texto: str) -> bool:
+        """True se o mesmo texto já foi enviado (confirmado) para o número dentro da janela."""
+        if not self.ativo or not numero or not texto:
+            return False
+        chave = (numero, _hash_texto(texto))
+        agora = time.monotonic()
+        with self._lock:
+            self.verificadas += 1
+            self._limpar(agora)
+            expira = self._vistos.get(chave)
+            if expira is None or expira <= agora:
+                return False
+            self.suprimidas += 1
+            previa = texto.strip().split("\n", 1)[0][:60]
+            if previa in self._por_previa or len(self._por_previa) < MAX_PREVIAS:
+                self._por_previa[previa] = self._por_previa.get(previa, 0) + 1
+            return True
+
+    def confirmar(self, numero: str, texto: str) -> None:
+        """Resposta aceita pela Evolution (2xx): repetições dentro da janela passam a ser suprimidas."""
+        if not self.ativo or not numero or not texto:
+            return
+        chave = (numero, _hash_texto(texto))
+        agora = time.monotonic()
+        with self._lock:
+            self._vistos[chave] = agora + self.janela
+            self._vistos.move_to_end(chave)
+            self._limpar(agora)
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            self._limpar(time.monotonic())
+            return {
+                "janela_segundos": self.janela,
+                "verificadas": self.verificadas,
+                "suprimidas": self.suprimidas,
+                "entradas": len(self._vistos),
+                "por_resposta": dict(sorted(self._por_previa.items(), key=lambda kv: -kv[1])),
+            }
+
+
+supressor_respostas = SupressorRespostas()
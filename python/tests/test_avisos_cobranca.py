@@ -0,0 +1,80 @@
+"""
+Avisos de pagamento/expiração do PIX (nucleo._ao_pagar_cobranca / _ao_expirar_cobranca)
+depois de o cliente seguir conversando.
+
+Uso (na pasta python/):
+    python -m unittest discover tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# Sem diário de saída nem chamadas externas
+os.environ["OUTBOX_ARQUIVO"] = ""
+
+import nucleo  # noqa: E402
+from conversa import FINALIZADO, MENU_PRINCIPAL, Conversa, DadosPix  # noqa: E402
+
+NUMERO = "5511900000099"
+
+
+class AvisosCobrancaTeste(unittest.TestCase):
+    def setUp(self):
+        self.avisos = []
+        self._notificar = nucleo._notificar
+        nucleo._notificar = lambda numero, texto: self.avisos.append((numero, texto))
+        conv = Conversa(FINALIZADO)
+        conv.pix = DadosPix("pix_1", "00020126...", None)
+        nucleo.bot_simples.conversas[NUMERO] = conv
+
+    def tearDown(self):
+        nucleo._notificar = self._notificar
+        nucleo.bot_simples.conversas.pop(NUMERO, None)
+
+    def test_pagamento_depois_de_outra_mensagem(self):
+        nucleo.bot_simples.processar_mensagem(NUMERO, "paguei")
+        self.assertIsNone(nucleo.bot_simples.conversas[NUMERO].get("pix_id"))
+
+        nucleo._ao_pagar_cobranca(NUMERO, "pix_1")
+
+        self.assertEqual(len(self.avisos), 1)
+        self.assertIn("Pagamento confirmado", self.avisos[0][1])
+        # O menu que o cliente abriu com a mensagem continua onde estava
+        self.assertEqual(nucleo.bot_simples.conversas[NUMERO].estado, MENU_PRINCIPAL)
+
+    def test_pagamento_com_pedido_novo_em_andamento(self):
+        nucleo.bot_simples.conversas[NUMERO].pix = DadosPix("pix_2", "00020126...", None)
+
+        nucleo._ao_pagar_cobranca(NUMERO, "pix_1")
+
+        self.assertEqual(len(self.avisos), 1)
+        self.assertEqual(nucleo.bot_simples.conversas[NUMERO].get("pix_id"), "pix_2")
+
+    def test_pagamento_do_pix_atual_encerra_a_conversa(self):
+        nucleo._ao_pagar_cobranca(NUMERO, "pix_1")
+
+        self.assertEqual(len(self.avisos), 1)
+        self.assertNotIn(NUMERO, nucleo.bot_simples.conversas)
+
+    def test_expiracao_depois_de_menu(self):
+        nucleo.bot_simples.processar_mensagem(NUMERO, "menu")
+
+        nucleo._ao_expirar_cobranca(NUMERO, "pix_1")
+
+        self.assertEqual(len(self.avisos), 1)
+        self.assertIn("expirou", self.avisos[0][1])
+        self.assertIn(NUMERO, nucleo.bot_simples.conversas)
+
+    def test_expiracao_ignorada_com_pix_mais_novo(self):
+        nucleo.bot_simples.conversas[NUMERO].pix = DadosPix("pix_2", "00020126...", None)
+
+        nucleo._ao_expirar_cobranca(NUMERO, "pix_1")
+
+        self.assertEqual(self.avisos, [])
+        self.assertEqual(nucleo.bot_simples.conversas[NUMERO].get("pix_id"), "pix_2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,9 +1,15 @@
 from flask import Flask, request, jsonify
-import json
 from datetime import datetime
 import requests
+import json_codec
+from filtro_eventos import contador_descartes, deve_ignorar, ler_corpo_filtrado
+from extracao_streaming import CorpoGrandeDemais, LIMITE_CORPO, verificar_tamanho_declarado
+from gravador import gravador
 
 app = Flask(__name__)
+# Gravação para replay (GRAVACAO=1; ver gravador.py). Ligue aqui ou no App.py, não nos dois
+gravador.origem = "webhook"
+app.config['MAX_CONTENT_LENGTH'] = LIMITE_CORPO or None
 
 class EvolutionWebhookProcessor:
     def __init__(self):
@@ -32,7 +38,7 @@ class EvolutionWebhookProcessor:
             self._process_chat_update(data, instance)
         else:
             print(f"🔍 Evento não tratado: {event_type}")
-            print(f"📦 Dados: {json.dumps(data, indent=2, ensure_ascii=False)}")
+            print(f"📦 Dados: {json_codec.dumps(data, indent=True)}")
         
         # Salvar log
         self._save_log(event_type, instance, data)
@@ -82,7 +88,7 @@ class EvolutionWebhookProcessor:
                     elif 'extendedTextMessage' in message_data:
                         print(f"   [{idx}] 💬 TEXTO: {message_data['extendedTextMessage'].get('text', '')}")
                     else:
-                        print(f"   [{idx}] 📦 MENSAGEM: {json.dumps(message_data, indent=2, ensure_ascii=False)}")
+                        print(f"   [{idx}] 📦 MENSAGEM: {json_codec.dumps(message_data, indent=True)}")
             else:
                 key = data.get('key', {})
                 message_data = data.get('message', {})
@@ -95,14 +101,14 @@ class EvolutionWebhookProcessor:
                 elif 'extendedTextMessage' in message_data:
                     print(f"   💬 TEXTO: {message_data['extendedTextMessage'].get('text', '')}")
                 else:
-                    print(f"   📦 MENSAGEM: {json.dumps(message_data, indent=2, ensure_ascii=False)}")
+                    print(f"   📦 MENSAGEM: {json_codec.dumps(message_data, indent=True)}")
         except Exception as e:
             print(f"   ⚠️ Falha ao processar messages.upsert: {e}")
 
     def _process_chat_update(self, data, instance):
         """Processa atualização de chat"""
         print("💬 ATUALIZAÇÃO DE CHAT:")
-        print(f"   📦 DADOS: {json.dumps(data, indent=2, ensure_ascii=False)}")
+        print(f"   📦 DADOS: {json_codec.dumps(data, indent=True)}")
 
     def _save_log(self, event_type, instance, data):
         """Salva log em arquivo"""
@@ -122,7 +128,7 @@ def forward_to_app(payload, source_path: str = "webhook"):
     try:
         url = "http://localhost:8001/process-event"
         headers = {"Content-Type": "application/json"}
-        resp = requests.post(url, json=payload, headers=headers, timeout=8)
+        resp = requests.post(url, data=json_codec.dumps_bytes(payload), headers=headers, timeout=8)
         if resp.status_code < 300:
             print(f"➡️ Encaminhado para App.py ({url}) [{resp.status_code}]")
         else:
@@ -138,8 +144,15 @@ processor = EvolutionWebhookProcessor()
 def webhook_handler(endpoint="webhook"):
     """Handler principal para Evolution API"""
     try:
+        # Descartar eventos sem mensagens antes do parse/log/encaminhamento
+        verificar_tamanho_declarado(request.content_length)
+        descartado, corpo = ler_corpo_filtrado(request.stream, endpoint)
+        if descartado:
+            return jsonify({"status": "ignored", "event": descartado}), 200
+        gravador.registrar(endpoint or 'webhook', corpo)
+
         if request.is_json:
-            payload = request.get_json()
+            payload = json_codec.loads(corpo) if corpo and corpo.strip() else {}
 
             # Derivar 'event' do path quando não enviado no corpo
             if endpoint and isinstance(payload, dict) and 'event' not in payload:
@@ -152,13 +165,21 @@ def webhook_handler(endpoint="webhook"):
                 derived_event = event_map.get(path, path)
                 payload['event'] = derived_event
 
+            # O campo "event" pode não estar no prefixo lido pelo filtro rápido
+            if isinstance(payload, dict) and deve_ignorar(payload.get('event')):
+                contador_descartes.registrar(payload.get('event'))
+                return jsonify({"status": "ignored", "event": payload.get('event')}), 200
+
             processor.process_event(payload)
             forward_to_app(payload, source_path=endpoint or 'webhook')
         else:
             print("❌ Payload não é JSON")
 
         return jsonify({"status": "success", "message": "Webhook received"}), 200
-    
+
+    except CorpoGrandeDemais as e:
+        print(f"⛔ Corpo rejeitado: {e}")
+        return jsonify({"status": "error", "message": str(e)}), 413
     except Exception as e:
         print(f"❌ Erro: {e}")
         return jsonify({"status": "error"}), 200
@@ -167,6 +188,11 @@ def webhook_handler(endpoint="webhook"):
 def health_check():
     return jsonify({"status": "running", "timestamp": datetime.now().isoformat()})
 
+@app.route('/eventos-descartados', methods=['GET'])
+def eventos_descartados():
+    """Contagem de eventos descartados pelo filtro rápido, por tipo."""
+    return jsonify(contador_descartes.snapshot())
+
 @app.route('/logs', methods=['GET'])
 def show_logs():
     """Mostra logs das mensagens"""